@@ -1,9 +1,9 @@
 # GeminiHandler - Module pour l'intégration Gemini avec Bizzio Data Analyst
 
-from .gemini import BizzioGemini
+from .gemini import BizzioGemini, get_bizzio
 from .prompts import BizzioPrompts
 
-__all__ = ['BizzioGemini', 'BizzioPrompts']
+__all__ = ['BizzioGemini', 'BizzioPrompts', 'get_bizzio']
 
 __version__ = '1.2.0'
 __author__ = 'Linda Olongo'
@@ -0,0 +1,252 @@
+# Index en mémoire des articles pour la recherche floue du Data Analyst Bizzio
+
+import re
+import time
+import bisect
+import threading
+import unicodedata
+from typing import Dict, Any, List, Optional
+
+STOP_WORDS = {'le', 'la', 'les', 'de', 'du', 'des', 'un', 'une', 'l', 'd', 'et',
+              'the', 'of', 'a', 'an', 'and'}
+
+# Intervalle minimal entre deux vérifications de la signature de la table articles
+CHECK_INTERVAL = 30
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules, sans accents, ponctuation remplacée par des espaces"""
+    if not text:
+        return ""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text).split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Mots normalisés sans mots vides (les mots vides sont gardés s'il ne reste rien)"""
+    words = normalize_text(text).split()
+    tokens = [w for w in words if w not in STOP_WORDS]
+    return tokens or words
+
+
+def trigrams(token: str) -> set:
+    """Trigrammes d'un mot encadré d'espaces (même découpage que pg_trgm)"""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Distance de Levenshtein, abandonnée (max_distance + 1) dès qu'elle dépasse le seuil"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class ArticleIndex:
+    """
+    Index des désignations et codes d'articles :
+    mots normalisés → articles, trigrammes → mots (candidats pour les fautes de frappe),
+    vocabulaire trié (préfixes). Les requêtes sont servies sans aller-retour base ni HTTP.
+
+    Le contenu est un instantané immuable remplacé en bloc au rechargement ; le rechargement
+    est déclenché quand la signature de la table (nombre, dernier id, dernière modification)
+    change, vérifiée au plus toutes les CHECK_INTERVAL secondes, ou par invalidate().
+    """
+
+    def __init__(self, connection_factory, check_interval: int = CHECK_INTERVAL):
+        self.connection_factory = connection_factory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._signature = None
+        self._checked_at = 0.0
+
+    # --- chargement ---
+    def _fetch(self, signature_only: bool = False):
+        conn = self.connection_factory()
+        if conn is None:
+            raise RuntimeError("Connexion à la base de données indisponible")
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*), MAX(article_id), MAX(date_modification) FROM articles")
+            signature = tuple(cur.fetchone())
+            rows = None
+            if not signature_only:
+                cur.execute("""
+                    SELECT article_id, designation, prix, type_article, code, nature, classe
+                    FROM articles
+                    WHERE designation IS NOT NULL AND designation != ''
+                """)
+                rows = cur.fetchall()
+            cur.close()
+            return signature, rows
+        finally:
+            conn.close()
+
+    def _build(self, rows) -> Dict[str, Any]:
+        articles = {}
+        postings = {}
+        gram_index = {}
+        for row in rows:
+            article_id = row[0]
+            articles[article_id] = {
+                'id': article_id,
+                'nom': row[1],
+                'prix': float(row[2] or 0),
+                'type': row[3],
+                'code': row[4],
+                'nature': row[5],
+                'classe': row[6],
+                '_normalized': normalize_text(row[1]),
+            }
+            for token in set(tokenize(row[1]) + tokenize(row[4] or '')):
+                postings.setdefault(token, set()).add(article_id)
+
+        for token in postings:
+            for gram in trigrams(token):
+                gram_index.setdefault(gram, set()).add(token)
+
+        return {
+            'articles': articles,
+            'postings': postings,
+            'trigrams': gram_index,
+            'vocabulary': sorted(postings),
+        }
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return
+            try:
+                if self._snapshot is not None:
+                    signature, _ = self._fetch(signature_only=True)
+                    if signature == self._signature:
+                        self._checked_at = time.monotonic()
+                        return
+                signature, rows = self._fetch()
+            except Exception as e:
+                if self._snapshot is None:
+                    raise
+                # Base indisponible : on continue avec l'instantané précédent
+                print(f"⚠️ Rechargement de l'index articles impossible : {e}")
+                self._checked_at = time.monotonic()
+                return
+            self._snapshot = self._build(rows)
+            self._signature = signature
+            self._checked_at = time.monotonic()
+            print(f"✅ Index articles chargé : {len(self._snapshot['articles'])} articles")
+
+    def invalidate(self):
+        """Forcer la vérification de la table au prochain appel"""
+        with self._lock:
+            self._checked_at = 0.0
+            self._signature = None
+
+    # --- recherche ---
+    def _token_matches(self, snapshot, token: str) -> Dict[str, float]:
+        """Mots du vocabulaire proches de `token` → score (1 exact, 0.9 préfixe, < 0.9 faute de frappe)"""
+        matches = {}
+        if token in snapshot['postings']:
+            matches[token] = 1.0
+
+        if len(token) >= 3:
+            vocabulary = snapshot['vocabulary']
+            i = bisect.bisect_left(vocabulary, token)
+            while i < len(vocabulary) and vocabulary[i].startswith(token):
+                matches.setdefault(vocabulary[i], 0.9)
+                i += 1
+
+        if len(token) >= 4:
+            max_distance = 1 if len(token) < 8 else 2
+            grams = trigrams(token)
+            counts = {}
+            for gram in grams:
+                for candidate in snapshot['trigrams'].get(gram, ()):
+                    counts[candidate] = counts.get(candidate, 0) + 1
+            for candidate, shared in counts.items():
+                if candidate in matches or shared * 3 < len(grams):
+                    continue
+                distance = edit_distance(token, candidate, max_distance)
+                if distance <= max_distance:
+                    matches[candidate] = 0.85 * (1 - distance / max(len(token), len(candidate)))
+        return matches
+
+    def search(self, query: str, limit: int = 10, match_any: bool = False) -> List[Dict[str, Any]]:
+        """
+        Articles classés pour `query` (insensible à la casse, aux accents et aux fautes de frappe).
+        Chaque résultat porte `score` et `exact` (tous les mots trouvés tels quels ou en préfixe).
+        Sans `match_any`, tous les mots de la requête doivent correspondre.
+        """
+        self._ensure_loaded()
+        snapshot = self._snapshot
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        best = {}
+        for position, token in enumerate(tokens):
+            for vocab_token, score in self._token_matches(snapshot, token).items():
+                for article_id in snapshot['postings'][vocab_token]:
+                    scores = best.setdefault(article_id, [0.0] * len(tokens))
+                    if score > scores[position]:
+                        scores[position] = score
+
+        normalized_query = ' '.join(tokens)
+        results = []
+        for article_id, scores in best.items():
+            matched = sum(1 for s in scores if s > 0)
+            if not match_any and matched < len(tokens):
+                continue
+            article = snapshot['articles'][article_id]
+            score = sum(scores) / len(tokens)
+            if article['_normalized'].startswith(normalized_query):
+                score += 0.5
+            elif normalized_query in article['_normalized']:
+                score += 0.25
+            result = {k: v for k, v in article.items() if not k.startswith('_')}
+            result['score'] = round(score, 4)
+            result['exact'] = all(s >= 0.9 for s in scores)
+            results.append(result)
+
+        results.sort(key=lambda a: (-a['score'], a['nom']))
+        return results[:limit]
+
+    def random_articles(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """Échantillon aléatoire d'articles de l'index"""
+        import random
+        self._ensure_loaded()
+        articles = list(self._snapshot['articles'].values())
+        sample = random.sample(articles, min(limit, len(articles)))
+        return [{k: v for k, v in a.items() if not k.startswith('_')} for a in sample]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_article_index(connection_factory) -> ArticleIndex:
+    """Index partagé par le processus (toutes les instances de BizzioGemini)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ArticleIndex(connection_factory)
+    return _index
+
+
+def invalidate_article_index():
+    """À appeler après une création / modification / suppression d'article"""
+    if _index is not None:
+        _index.invalidate()
@@ -0,0 +1,216 @@
+# Micro-benchmark du routeur d'intentions : classifieurs séquentiels vs IntentRouter compilé
+#
+#   python GeminiHandler/bench_intent_router.py --runs 200
+#   python GeminiHandler/bench_intent_router.py --corpus prompts.txt   (un message par ligne)
+#   python GeminiHandler/bench_intent_router.py --from-db 500          (derniers messages de data_analyst_messages)
+#
+# Vérifie aussi que les deux implémentations donnent la même intention et les mêmes
+# caractéristiques sur tout le corpus (code de sortie 1 sinon).
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from intent_router import (
+    ADVANCED_TERMS, ARTICLE_KEYWORDS, CAPABILITY_PHRASES, CATALOGUE_KEYWORDS, CATALOGUE_PATTERNS,
+    CATALOGUE_PREFIXES, DATA_KEYWORDS, EDUCATIONAL_KEYWORDS, ENGLISH_WORDS, EXPORT_KEYWORDS,
+    FRENCH_MARKERS, FRENCH_WORDS, MULTIPLE_PRICE_PATTERNS, PRICE_KEYWORDS, PURE_GREETINGS,
+    TECHNICAL_TERMS, TOP_KEYWORDS, TOP_PATTERNS, VAGUE_MESSAGES, IntentRouter
+)
+
+# Questions types posées au Data Analyst (FR/EN, fautes de frappe comprises)
+DEFAULT_CORPUS = [
+    "bonjour",
+    "salut bizzio",
+    "yo",
+    "how are you",
+    "Qui es-tu ?",
+    "que peux tu faire pour moi",
+    "C'est quoi la business intelligence ?",
+    "explique moi ce qu'est un KPI",
+    "Quels sont nos 5 articles les plus vendus ?",
+    "top 10 des prestations ce trimestre",
+    "donne moi le classement des meilleurs livres",
+    "Exporte la liste complète des articles en Excel",
+    "fais moi un graphique des ventes mensuelles",
+    "génère un fichier csv des clients",
+    "quel est le prix de advanced chemistry oxford",
+    "prix du livre advanced level physics",
+    "combien coute le cahier 200 pages",
+    "prix de 5 articles",
+    "price of complete physical geography",
+    "Comment évolue le CA des formations par mois ?",
+    "quelle prestation génère le plus de revenus",
+    "répartition du chiffre d'affaires par catégorie",
+    "show me the best-selling products this quarter",
+    "what are our top performing offers",
+    "analyse la rentabilité de nos prestations",
+    "fais une segmentation des clients par ville",
+    "quelle est la tendance des commandes depuis janvier",
+    "compare les ventes de Dakar et Thiès",
+    "peux-tu me faire une régression sur les ventes en python ?",
+    "clustering et classification des clients avec tensorflow",
+    "il fait beau aujourd'hui",
+    "raconte moi une blague",
+    "ok",
+    "données",
+    "merci beaucoup",
+    "les clients inactifs depuis 3 mois",
+    "Montre-moi les statistiques du mois dernier",
+    "what is the revenue growth trend?",
+    "stats on formations",
+    "nos plus gros clients",
+]
+
+
+# ========================================
+# RÉFÉRENCE : anciens classifieurs séquentiels (un parcours par lexique)
+# ========================================
+
+def legacy_route(message):
+    def is_simple_greeting(m):
+        m = m.lower().strip()
+        return m in PURE_GREETINGS or (len(m.split()) <= 2 and any(w in PURE_GREETINGS for w in m.split()))
+
+    def is_about_capabilities(m):
+        m = m.lower().strip()
+        return any(p in m for p in CAPABILITY_PHRASES)
+
+    def is_educational_question(m):
+        m = m.lower().strip()
+        return any(k in m for k in EDUCATIONAL_KEYWORDS)
+
+    def is_top_request(m):
+        m = m.lower().strip()
+        return any(k in m for k in TOP_KEYWORDS) or any(re.search(p, m) for p in TOP_PATTERNS)
+
+    def is_export_request(m):
+        m = m.lower().strip()
+        return any(k in m for k in EXPORT_KEYWORDS)
+
+    def is_article_price_request(m):
+        m = m.lower().strip()
+        multiple = any(re.search(p, m) for p in MULTIPLE_PRICE_PATTERNS)
+        return any(k in m for k in PRICE_KEYWORDS) and (any(k in m for k in ARTICLE_KEYWORDS) or multiple)
+
+    def is_catalogue_question(m):
+        m = m.lower()
+        if any(k in m for k in CATALOGUE_KEYWORDS):
+            return True
+        if any(m.startswith(q) for q in CATALOGUE_PREFIXES):
+            return True
+        return any(re.search(p, m) for p in CATALOGUE_PATTERNS)
+
+    def is_data_analyst_question(m):
+        m = m.lower()
+        return any(k in m for k in DATA_KEYWORDS)
+
+    def detect_technical_level(m):
+        m = m.lower()
+        advanced = sum(1 for t in ADVANCED_TERMS if t in m)
+        technical = sum(1 for t in TECHNICAL_TERMS if t in m)
+        if advanced >= 2:
+            return 'expert'
+        if technical >= 2 or advanced >= 1:
+            return 'intermediate'
+        return 'beginner'
+
+    def needs_clarification(m):
+        m = m.lower().strip()
+        return len(m) < 5 or m in VAGUE_MESSAGES
+
+    def detect_language(m):
+        m = m.lower()
+        english = sum(1 for w in ENGLISH_WORDS if w in m)
+        french = sum(1 for w in FRENCH_WORDS if w in m)
+        if any(w in m for w in FRENCH_MARKERS):
+            return 'fr'
+        return 'en' if english > french else 'fr'
+
+    classifiers = [
+        ('greeting', is_simple_greeting),
+        ('capabilities', is_about_capabilities),
+        ('educational', is_educational_question),
+        ('top', is_top_request),
+        ('export', is_export_request),
+        ('article_price', is_article_price_request),
+        ('catalogue', is_catalogue_question),
+        ('data_analyst', is_data_analyst_question),
+    ]
+    intent = next((name for name, check in classifiers if check(message)), 'off_topic')
+    return {
+        'intent': intent,
+        'language': detect_language(message),
+        'technical_level': detect_technical_level(message),
+        'needs_clarification': needs_clarification(message),
+    }
+
+
+def load_corpus(args):
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+    if args.from_db:
+        import psycopg2
+        from dotenv import load_dotenv
+        load_dotenv()
+        conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT user_message FROM data_analyst_messages
+                     WHERE message_type = 'user' AND user_message IS NOT NULL
+                  ORDER BY message_id DESC LIMIT %s
+                """, [args.from_db])
+                return [row[0] for row in cur.fetchall()]
+        finally:
+            conn.close()
+    return DEFAULT_CORPUS
+
+
+def timed(label, func, corpus, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        for message in corpus:
+            func(message)
+    elapsed = time.perf_counter() - start
+    per_message = elapsed / (runs * len(corpus)) * 1e6
+    print(f"{label:<32} {per_message:8.2f} µs / message")
+    return per_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du routeur d'intentions Bizzio")
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--corpus', help="Fichier texte, un message par ligne")
+    parser.add_argument('--from-db', type=int, default=0, help="Nombre de messages utilisateur lus en base")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args)
+    router = IntentRouter()
+
+    mismatches = 0
+    for message in corpus:
+        expected = legacy_route(message)
+        got = router._route(message)
+        diff = {k: (v, got[k]) for k, v in expected.items() if got[k] != v}
+        if diff:
+            mismatches += 1
+            print(f"❌ {message!r} : {diff}")
+    print(f"✅ {len(corpus) - mismatches}/{len(corpus)} messages routés à l'identique")
+
+    legacy = timed("classifieurs séquentiels", legacy_route, corpus, args.runs)
+    compiled = timed("IntentRouter (sans mémo)", router._route, corpus, args.runs)
+    cached = timed("IntentRouter (mémorisé)", router.route, corpus, args.runs)
+    print(f"Gain : x{legacy / compiled:.1f} (x{legacy / cached:.0f} pour un message déjà routé)")
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+# Historique des conversations Data Analyst par chat, gardé en mémoire (LRU)
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List
+
+MAX_CHATS = int(os.getenv('BIZZIO_HISTORY_MAX_CHATS', '200'))
+MAX_MESSAGES = int(os.getenv('BIZZIO_HISTORY_MAX_MESSAGES', '20'))
+
+
+class _ChatEntry:
+    """Historique d'un chat + nombre de réponses Bizzio en base qu'il reflète"""
+
+    __slots__ = ('history', 'responses', 'lock')
+
+    def __init__(self, history: List[Dict[str, Any]], responses: int):
+        self.history = history
+        self.responses = responses
+        # Un message à la fois par chat : les ajouts de deux requêtes ne s'entremêlent pas
+        self.lock = threading.Lock()
+
+
+class ChatHistoryStore:
+    """
+    Historiques par chat_id, chargés depuis data_analyst_messages puis tenus à jour en
+    mémoire par le handler.
+
+    Les messages d'un même chat peuvent être traités par n'importe quel worker : avant
+    chaque réutilisation, le nombre de réponses Bizzio en base est comparé à celui que
+    reflète l'historique en mémoire (chargement + échanges traités ici). S'il diffère,
+    un autre worker a répondu entre-temps (ou une réponse n'a pas été enregistrée) et
+    l'historique est rechargé.
+
+    Au plus `max_chats` historiques sont gardés (le moins récemment utilisé est évincé,
+    puis rechargé depuis la base s'il revient) et chacun est limité à ses
+    `max_messages` derniers échanges.
+    """
+
+    def __init__(self, connection_factory, max_chats: int = MAX_CHATS, max_messages: int = MAX_MESSAGES):
+        self.connection_factory = connection_factory
+        self.max_chats = max(1, max_chats)
+        self.max_messages = max(1, max_messages)
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _query(self, chat_id: int, load: bool):
+        """(nombre de réponses Bizzio en base, derniers messages si load) ; (None, []) si la base est indisponible"""
+        conn = self.connection_factory() if self.connection_factory else None
+        if conn is None:
+            return None, []
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT COUNT(*) FROM data_analyst_messages
+                 WHERE chat_id = %s AND message_type = 'bizzio'
+            """, [chat_id])
+            responses = cur.fetchone()[0]
+            rows = []
+            if load:
+                cur.execute("""
+                    SELECT message_type, user_message, bizzio_response, timestamp, analysis_type
+                      FROM data_analyst_messages
+                     WHERE chat_id = %s
+                  ORDER BY message_id DESC
+                     LIMIT %s
+                """, [chat_id, self.max_messages * 2 + 1])
+                rows = cur.fetchall()[::-1]
+            cur.close()
+            return responses, rows
+        except Exception as e:
+            print(f"⚠️ Chargement de l'historique du chat {chat_id} impossible : {e}")
+            return None, []
+        finally:
+            conn.close()
+
+    def _build(self, rows) -> List[Dict[str, Any]]:
+        """Derniers échanges (question utilisateur + réponse Bizzio) d'un chat, dans l'ordre chronologique"""
+        history = []
+        pending = None
+        for message_type, user_message, bizzio_response, timestamp, analysis_type in rows:
+            if message_type == 'user':
+                pending = user_message
+            elif pending is not None:
+                history.append({
+                    'timestamp': timestamp.isoformat() if timestamp else None,
+                    'type': analysis_type or 'history',
+                    'user_message': pending,
+                    'response': bizzio_response or ''
+                })
+                pending = None
+        return history[-self.max_messages:]
+
+    def _entry(self, chat_id: int) -> _ChatEntry:
+        with self._lock:
+            entry = self._chats.get(chat_id)
+            if entry is None:
+                # Jamais chargé : responses = -1 force la lecture au premier accès
+                entry = self._chats[chat_id] = _ChatEntry([], -1)
+            self._chats.move_to_end(chat_id)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+            return entry
+
+    def _refresh(self, chat_id: int, entry: _ChatEntry):
+        """Recharger l'historique si la base contient des réponses qu'il ne reflète pas (verrou du chat tenu)"""
+        responses, _ = self._query(chat_id, load=False)
+        if responses is None or responses == entry.responses:
+            return
+        responses, rows = self._query(chat_id, load=True)
+        if responses is not None:
+            entry.history[:] = self._build(rows)
+            entry.responses = responses
+
+    def get(self, chat_id: int) -> List[Dict[str, Any]]:
+        """Historique (liste modifiable) d'un chat, à jour avec la base"""
+        entry = self._entry(chat_id)
+        with entry.lock:
+            self._refresh(chat_id, entry)
+            return entry.history
+
+    @contextmanager
+    def use(self, chat_id: int):
+        """
+        Historique d'un chat réservé le temps d'un message : vérifié contre la base, puis
+        modifié par le handler sans concurrence. Chaque échange ajouté compte comme une
+        réponse que la route enregistre ensuite en base.
+        """
+        entry = self._entry(chat_id)
+        with entry.lock:
+            self._refresh(chat_id, entry)
+            history = entry.history
+            before = len(history)
+            try:
+                yield history
+            finally:
+                entry.responses += max(len(history) - before, 0)
+                if len(history) > self.max_messages:
+                    del history[:-self.max_messages]
+
+    def forget(self, chat_id: int):
+        """Retirer un chat (supprimé ou renommé côté base)"""
+        with self._lock:
+            self._chats.pop(chat_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'chats': len(self._chats),
+                'max_chats': self.max_chats,
+                'max_messages': self.max_messages
+            }
@@ -0,0 +1,347 @@
+# Exports du Data Analyst (Excel, CSV, graphiques) produits en arrière-plan
+
+import os
+import csv
+import json
+import time
+import uuid
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+EXPORT_DIR = os.getenv('BIZZIO_EXPORT_DIR', os.path.join(os.getcwd(), 'uploads'))
+EXPORT_WORKERS = int(os.getenv('BIZZIO_EXPORT_WORKERS', '1'))
+# Durée de conservation des fichiers générés, et fréquence du nettoyage de uploads/
+EXPORT_RETENTION = int(os.getenv('BIZZIO_EXPORT_RETENTION', str(24 * 3600)))
+CLEANUP_INTERVAL = int(os.getenv('BIZZIO_EXPORT_CLEANUP_INTERVAL', '3600'))
+# Lignes lues par aller-retour sur le curseur serveur
+FETCH_SIZE = 2000
+
+# Préfixes des fichiers produits par Bizzio (les seuls que le nettoyage supprime)
+GENERATED_PREFIXES = ('export_', 'graphique_')
+JOBS_SUBDIR = '.jobs'
+
+# Jeux de données exportables : requête, en-têtes, et nom/prix pour les graphiques.
+# Les prestations sont les articles de type service/formation (il n'y a pas de table dédiée).
+DATASETS = {
+    'articles': {
+        'query': """
+            SELECT article_id, designation, prix, type_article, code, nature, classe
+              FROM articles
+             WHERE designation IS NOT NULL AND designation != ''
+          ORDER BY prix DESC, designation ASC
+        """,
+        'count': "SELECT COUNT(*) FROM articles WHERE designation IS NOT NULL AND designation != ''",
+        'headers': ['ID', 'Nom', 'Prix (FCFA)', 'Type', 'Code', 'Nature', 'Classe'],
+        'keys': ['id', 'nom', 'prix', 'type', 'code', 'nature', 'classe'],
+    },
+    'prestations': {
+        'query': """
+            SELECT article_id, designation, prix, type_article, ville_reference, duree, description
+              FROM articles
+             WHERE type_article IN ('service', 'formation')
+               AND designation IS NOT NULL AND designation != ''
+          ORDER BY prix DESC, designation ASC
+        """,
+        'count': """
+            SELECT COUNT(*) FROM articles
+             WHERE type_article IN ('service', 'formation')
+               AND designation IS NOT NULL AND designation != ''
+        """,
+        'headers': ['ID', 'Nom', 'Tarif (FCFA)', 'Type', 'Ville', 'Durée', 'Description'],
+        'keys': ['id', 'nom', 'prix', 'type', 'ville', 'duree', 'description'],
+    },
+}
+
+EXTENSIONS = {'excel': 'xlsx', 'csv': 'csv', 'visualisation': 'png'}
+
+
+class ExportJobs:
+    """
+    File d'exports exécutés par un pool de threads : submit() rend la main
+    immédiatement avec un identifiant de tâche, le fichier est écrit dans uploads/
+    au fil des lignes lues sur un curseur serveur (jamais toute la table en mémoire).
+
+    L'état de chaque tâche est aussi écrit dans uploads/.jobs/<job_id>.json pour
+    qu'un autre worker gunicorn puisse répondre aux demandes de statut. Les fichiers
+    générés sont supprimés après `retention` secondes.
+    """
+
+    def __init__(self, connection_factory, directory: str = EXPORT_DIR, max_workers: int = EXPORT_WORKERS,
+                 retention: int = EXPORT_RETENTION, cleanup_interval: int = CLEANUP_INTERVAL):
+        self.connection_factory = connection_factory
+        self.directory = directory
+        self.max_workers = max(1, max_workers)
+        self.retention = retention
+        self.cleanup_interval = cleanup_interval
+        self._jobs = {}
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, JOBS_SUBDIR), exist_ok=True)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Un pool (et un nettoyeur) par processus : les threads ne survivent pas au fork
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bizzio-export')
+                    self._pid = os.getpid()
+                    self._jobs = {}
+                    threading.Thread(target=self._cleanup_loop, daemon=True, name='bizzio-export-cleanup').start()
+        return self._executor
+
+    # ========================================
+    # TÂCHES
+    # ========================================
+
+    def submit(self, data_type: str, export_type: str) -> Dict[str, Any]:
+        """Lancer un export ; renvoie l'état initial de la tâche (statut 'pending')"""
+        if data_type not in DATASETS:
+            raise ValueError(f"Jeu de données inconnu : {data_type}")
+        export_type = export_type if export_type in EXTENSIONS else 'excel'
+        job_id = uuid.uuid4().hex[:16]
+        prefix = 'graphique' if export_type == 'visualisation' else 'export'
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"{prefix}_{data_type}_{timestamp}_{job_id[:6]}.{EXTENSIONS[export_type]}"
+
+        job = {
+            'job_id': job_id,
+            'status': 'pending',
+            'export_type': export_type,
+            'data_type': data_type,
+            'filename': filename,
+            'file_url': f"/uploads/{filename}",
+            'rows': 0,
+            'error': None,
+            'created_at': datetime.now().isoformat(),
+            'finished_at': None
+        }
+        executor = self._get_executor()
+        with self._lock:
+            self._jobs[job_id] = job
+        self._save_state(job)
+        executor.submit(self._run, job_id)
+        return dict(job)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """État d'une tâche (mémoire de ce processus, sinon fichier d'état d'un autre worker)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._state_path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def wait(self, job_id: str, timeout: float = 30.0) -> Optional[Dict[str, Any]]:
+        """Attendre la fin d'une tâche (au plus `timeout` secondes) et renvoyer son état"""
+        deadline = time.monotonic() + timeout
+        job = self.status(job_id)
+        while job is not None and job['status'] in ('pending', 'running') and time.monotonic() < deadline:
+            time.sleep(0.2)
+            job = self.status(job_id)
+        return job
+
+    def _update(self, job_id: str, **changes):
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(changes)
+            snapshot = dict(job)
+        self._save_state(snapshot)
+
+    def _run(self, job_id: str):
+        job = self._jobs[job_id]
+        self._update(job_id, status='running')
+        path = os.path.join(self.directory, job['filename'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            if job['export_type'] == 'visualisation':
+                rows = self._write_chart(job['data_type'], tmp_path)
+            elif job['export_type'] == 'csv':
+                rows = self._write_csv(job['data_type'], tmp_path)
+            else:
+                rows = self._write_xlsx(job['data_type'], tmp_path)
+            os.replace(tmp_path, path)
+            self._update(job_id, status='done', rows=rows, finished_at=datetime.now().isoformat())
+        except Exception as e:
+            print(f"❌ Export {job_id} ({job['export_type']} {job['data_type']}) échoué : {e}")
+            self._remove(tmp_path)
+            self._update(job_id, status='failed', error=str(e), finished_at=datetime.now().isoformat())
+
+    # ========================================
+    # LECTURE EN FLUX ET ÉCRITURE DES FICHIERS
+    # ========================================
+
+    def iter_rows(self, data_type: str):
+        """Lignes du jeu de données lues par paquets de FETCH_SIZE sur un curseur serveur"""
+        conn = self.connection_factory() if self.connection_factory else None
+        if conn is None:
+            raise RuntimeError("Connexion à la base de données échouée")
+        try:
+            cur = conn.cursor(name=f"bizzio_export_{uuid.uuid4().hex[:8]}")
+            cur.itersize = FETCH_SIZE
+            cur.execute(DATASETS[data_type]['query'])
+            for row in cur:
+                yield row
+            cur.close()
+        finally:
+            conn.close()
+
+    def preview(self, data_type: str, limit: int = 20) -> Tuple[List[Dict[str, Any]], int]:
+        """Premières lignes (dicts 'nom', 'prix', ...) et nombre total, pour le message et le graphique"""
+        dataset = DATASETS[data_type]
+        conn = self.connection_factory() if self.connection_factory else None
+        if conn is None:
+            raise RuntimeError("Connexion à la base de données échouée")
+        try:
+            cur = conn.cursor()
+            cur.execute(dataset['query'] + " LIMIT %s", [limit])
+            rows = [dict(zip(dataset['keys'], row)) for row in cur.fetchall()]
+            cur.execute(dataset['count'])
+            total = cur.fetchone()[0]
+            cur.close()
+        finally:
+            conn.close()
+        for row in rows:
+            row['prix'] = float(row['prix'] or 0)
+        return rows, total
+
+    def _write_csv(self, data_type: str, path: str) -> int:
+        count = 0
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(DATASETS[data_type]['headers'])
+            for row in self.iter_rows(data_type):
+                writer.writerow(['' if value is None else value for value in row])
+                count += 1
+        return count
+
+    def _write_xlsx(self, data_type: str, path: str) -> int:
+        from openpyxl import Workbook
+
+        # Mode write_only : chaque ligne est sérialisée dès son ajout
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(title=data_type.title())
+        sheet.append(DATASETS[data_type]['headers'])
+        count = 0
+        for row in self.iter_rows(data_type):
+            sheet.append(list(row))
+            count += 1
+        with open(path, 'wb') as f:
+            workbook.save(f)
+        return count
+
+    def _write_chart(self, data_type: str, path: str) -> int:
+        import matplotlib
+        matplotlib.use('Agg')  # Backend non-interactif
+        import matplotlib.pyplot as plt
+
+        top_rows, total = self.preview(data_type, 20)
+        if not top_rows:
+            raise RuntimeError("Aucune donnée à représenter")
+        names = [row['nom'][:15] + '...' if len(row['nom']) > 15 else row['nom'] for row in top_rows]
+        prices = [row['prix'] for row in top_rows]
+
+        figure = plt.figure(figsize=(12, 8))
+        try:
+            bars = plt.bar(range(len(names)), prices, color='skyblue', alpha=0.7)
+            plt.title(f'Prix des {data_type.title()} - Top 20 (sur {total} au total)', fontsize=16, fontweight='bold')
+            plt.xlabel('Articles', fontsize=12)
+            plt.ylabel('Prix (FCFA)', fontsize=12)
+            plt.xticks(range(len(names)), names, rotation=45, ha='right')
+            for bar, price in zip(bars, prices):
+                plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(prices)*0.01,
+                         f'{price:,.0f}', ha='center', va='bottom', fontsize=9)
+            plt.tight_layout()
+            with open(path, 'wb') as f:
+                plt.savefig(f, format='png', dpi=300, bbox_inches='tight')
+        finally:
+            plt.close(figure)
+        return len(top_rows)
+
+    # ========================================
+    # ÉTAT PARTAGÉ ET RÉTENTION
+    # ========================================
+
+    def _state_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, JOBS_SUBDIR, f"{job_id}.json")
+
+    def _save_state(self, job: Dict[str, Any]):
+        path = self._state_path(job['job_id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(job, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ État de l'export {job['job_id']} non enregistré : {e}")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """Supprimer les fichiers générés (et états de tâches) plus vieux que la rétention"""
+        now = now or time.time()
+        removed = 0
+        jobs_dir = os.path.join(self.directory, JOBS_SUBDIR)
+        candidates = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory) if name.startswith(GENERATED_PREFIXES)
+        ] + [os.path.join(jobs_dir, name) for name in os.listdir(jobs_dir)]
+        for path in candidates:
+            try:
+                if now - os.path.getmtime(path) > self.retention:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+
+        cutoff = datetime.fromtimestamp(now - self.retention).isoformat()
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items() if job['finished_at'] and job['finished_at'] < cutoff]:
+                del self._jobs[job_id]
+        return removed
+
+    def _cleanup_loop(self):
+        while True:
+            try:
+                removed = self.cleanup()
+                if removed:
+                    print(f"🧹 Exports Bizzio : {removed} fichier(s) expiré(s) supprimé(s)")
+            except Exception as e:
+                print(f"⚠️ Nettoyage des exports : {e}")
+            time.sleep(self.cleanup_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = {}
+            for job in self._jobs.values():
+                statuses[job['status']] = statuses.get(job['status'], 0) + 1
+        return {'jobs': statuses, 'max_workers': self.max_workers, 'retention': self.retention}
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def get_export_jobs(connection_factory=None) -> ExportJobs:
+    """File d'exports du processus (créée au premier appel)"""
+    global _jobs
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                _jobs = ExportJobs(connection_factory)
+    if connection_factory is not None and _jobs.connection_factory is None:
+        # Créée d'abord par une route de statut (sans accès base)
+        _jobs.connection_factory = connection_factory
+    return _jobs
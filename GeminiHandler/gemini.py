@@ -19,7 +19,8 @@ os.environ['ABSL_LOGGING_VERBOSITY'] = '0'
 
 # Rediriger tous les logs stderr
 import sys
-from contextlib import redirect_stderr
+import threading
+from contextlib import redirect_stderr, contextmanager
 import io
 import logging
 
@@ -34,6 +35,42 @@ try:
 except ImportError:
     from prompts import BizzioPrompts
 
+# Index des articles en mémoire (recherche floue sans appel HTTP)
+try:
+    from .article_index import get_article_index
+except ImportError:
+    from article_index import get_article_index
+
+# Historiques par chat (LRU en mémoire, chargés depuis data_analyst_messages)
+try:
+    from .chat_history import ChatHistoryStore
+except ImportError:
+    from chat_history import ChatHistoryStore
+
+# Routeur d'intentions compilé (un seul passage sur le message)
+try:
+    from .intent_router import get_router
+except ImportError:
+    from intent_router import get_router
+
+# Cache des réponses des intentions déterministes (versions de données + TTL)
+try:
+    from .response_cache import DataVersions, ResponseCache
+except ImportError:
+    from response_cache import DataVersions, ResponseCache
+
+# Exports Excel / CSV / graphiques produits en arrière-plan (fichiers dans uploads/)
+try:
+    from .export_jobs import ExportJobs, get_export_jobs
+except ImportError:
+    from export_jobs import ExportJobs, get_export_jobs
+
+# Pool de connexions partagé avec l'application Flask (absent si le module tourne seul)
+try:
+    import db_pool
+except ImportError:
+    db_pool = None
+
 # Chargement des variables d'environnement
 load_dotenv()
 
@@ -49,8 +86,10 @@ class BizzioDataAccess:
             raise ValueError("❌ DATABASE_URL n'est pas définie dans le fichier .env")
     
     def get_db_connection(self):
-        """Récupère une connexion à la base de données"""
+        """Récupère une connexion à la base de données (empruntée au pool si disponible)"""
         try:
+            if db_pool is not None:
+                return db_pool.get_connection(self.database_url)
             conn = psycopg2.connect(self.database_url)
             return conn
         except Exception as e:
@@ -332,6 +371,9 @@ class BizzioGemini:
         # Initialisation des prompts
         self.prompts = BizzioPrompts()
         
+        # Routeur d'intentions (lexiques compilés, résultat mémorisé par message)
+        self.intent_router = get_router()
+        
         # Initialisation de l'accès aux données réelles
         try:
             self.data_access = BizzioDataAccess()
@@ -340,16 +382,53 @@ class BizzioGemini:
             print(f"⚠️ Accès aux données limité : {e}")
             self.data_access = None
         
+        # Cache des réponses : invalidé par les versions des tables articles / ventes
+        self.response_cache = ResponseCache(
+            DataVersions(self.data_access.get_db_connection if self.data_access else None)
+        )
+        
         # Configuration du logging (silencieux)
         self.setup_logging()
         
-        # Historique des conversations
-        self.conversation_history = []
+        # Historique des conversations : par chat_id (requêtes web) ou local (console)
+        self._default_history = []
+        self._local = threading.local()
+        self.chat_histories = ChatHistoryStore(
+            self.data_access.get_db_connection if self.data_access else None
+        )
         
         print("Bizzio Data Analyst initialisé avec succès !")
         print(f"Modèle utilisé : gemini-2.0-flash-lite (gratuit & économe)")
         print("----")
     
+    @property
+    def conversation_history(self) -> list:
+        """Historique du chat traité par le thread courant (historique local hors chat)"""
+        history = getattr(self._local, 'history', None)
+        return history if history is not None else self._default_history
+    
+    @conversation_history.setter
+    def conversation_history(self, value: list):
+        if getattr(self._local, 'history', None) is not None:
+            self._local.history[:] = value
+        else:
+            self._default_history = value
+    
+    @contextmanager
+    def chat_context(self, chat_id: Optional[int]):
+        """Associe le thread courant à l'historique d'un chat le temps d'un message"""
+        if not chat_id:
+            yield self.conversation_history
+            return
+        previous = getattr(self._local, 'history', None)
+        # Historique vérifié contre la base et réservé à ce thread jusqu'à la fin du message
+        with self.chat_histories.use(chat_id) as history:
+            self._local.history = history
+            try:
+                yield history
+            finally:
+                self._local.history = previous
+    
     def setup_logging(self):
         """Configuration du système de logging (silencieux)"""
         # Créer le dossier logs s'il n'existe pas
@@ -380,24 +459,7 @@ class BizzioGemini:
         Returns:
             True si c'est une question sur les capacités
         """
-        message_lower = message.lower().strip()
-        
-        # Questions directes sur l'identité et les capacités
-        capability_phrases = [
-            'qui es tu', 'qui êtes vous', 'ton nom', 'votre nom', 'bizzio',
-            'que peux tu faire', 'que pouvez vous faire', 'tes capacités', 'vos capacités',
-            'tes compétences', 'vos compétences', 'tes fonctions', 'vos fonctions',
-            'aide moi', 'peux tu m aider', 'pouvez vous m aider',
-            'que sais tu faire', 'que savez vous faire', 'tes services', 'vos services',
-            'présente toi', 'présentez vous', 'raconte moi', 'racontez moi',
-            'comment tu t\'appelle', 'comment tu t\'appelles'  # Gestion des erreurs de frappe
-        ]
-        
-        for phrase in capability_phrases:
-            if phrase in message_lower:
-                return True
-        
-        return False
+        return self.intent_router.route(message)['flags']['capabilities']
     
     def is_educational_question(self, message: str) -> bool:
         """
@@ -409,23 +471,7 @@ class BizzioGemini:
         Returns:
             True si c'est une question éducative
         """
-        message_lower = message.lower().strip()
-        
-        # Mots-clés éducatifs
-        educational_keywords = [
-            'qu\'est-ce que', 'qu\'est ce que', 'c\'est quoi', 'c\'est quoi',
-            'explique', 'définis', 'définition', 'concept', 'notion',
-            'business intelligence', 'bi', 'nlp', 'traitement du langage',
-            'data analysis', 'analyse de données', 'kpi', 'tableau de bord',
-            'reporting', 'statistiques', 'machine learning', 'ia', 'intelligence artificielle',
-            'chatbot', 'conversationnel', 'gestion commerciale', 'crm', 'erp'
-        ]
-        
-        for keyword in educational_keywords:
-            if keyword in message_lower:
-                return True
-        
-        return False
+        return self.intent_router.route(message)['flags']['educational']
     
     def is_top_request(self, user_message: str) -> bool:
         """
@@ -437,35 +483,7 @@ class BizzioGemini:
         Returns:
             True si c'est une demande de top
         """
-        message_lower = user_message.lower().strip()
-        
-        # Mots-clés pour les tops
-        top_keywords = [
-            'top', 'meilleur', 'meilleurs', 'meilleure', 'meilleures',
-            'classement', 'ranking', 'premier', 'premiers', 'première', 'premières',
-            'plus vendu', 'plus vendus', 'plus vendue', 'plus vendues',
-            'mieux vendu', 'mieux vendus', 'mieux vendue', 'mieux vendues',
-            'populaire', 'populaires', 'favori', 'favoris', 'favorite', 'favorites'
-        ]
-        
-        # Patterns pour détecter "top X"
-        import re
-        top_patterns = [
-            r'top \d+',
-            r'meilleur \d+',
-            r'meilleurs \d+',
-            r'premier \d+',
-            r'premiers \d+',
-            r'\d+ meilleur',
-            r'\d+ meilleurs',
-            r'\d+ premier',
-            r'\d+ premiers'
-        ]
-        
-        has_top_keyword = any(keyword in message_lower for keyword in top_keywords)
-        has_top_pattern = any(re.search(pattern, message_lower) for pattern in top_patterns)
-        
-        return has_top_keyword or has_top_pattern
+        return self.intent_router.route(user_message)['flags']['top']
 
     def is_export_request(self, message: str) -> bool:
         """
@@ -477,21 +495,7 @@ class BizzioGemini:
         Returns:
             True si c'est une demande d'export
         """
-        message_lower = message.lower().strip()
-        
-        # Mots-clés d'export
-        export_keywords = [
-            'excel', 'csv', 'export', 'exporter', 'tableau', 'fichier',
-            'télécharger', 'download', 'liste complète', 'liste complete',
-            'visualisation', 'graphique', 'chart', 'graph', 'diagramme',
-            'exporte', 'génère', 'genere', 'crée', 'cree', 'fais'
-        ]
-        
-        for keyword in export_keywords:
-            if keyword in message_lower:
-                return True
-        
-        return False
+        return self.intent_router.route(message)['flags']['export']
     
     def is_article_price_request(self, message: str) -> bool:
         """
@@ -503,41 +507,7 @@ class BizzioGemini:
         Returns:
             True si c'est une demande de prix d'article
         """
-        message_lower = message.lower().strip()
-        
-        # Mots-clés pour les demandes de prix
-        price_keywords = [
-            'prix', 'price', 'coût', 'cout', 'tarif', 'combien',
-            'quel est le prix', 'combien coûte', 'combien coute',
-            'prix de', 'prix du', 'prix de la', 'prix des',
-            'donne moi le prix', 'donne-moi le prix', 'montre moi le prix',
-            'montre-moi le prix', 'affiche le prix', 'affiche-moi le prix'
-        ]
-        
-        # Mots-clés pour les articles (plus généraux)
-        article_keywords = [
-            'article', 'articles', 'produit', 'produits', 'livre', 'livres',
-            'fourniture', 'fournitures', 'service', 'services',
-            'formation', 'formations', 'chimie', 'chemistry', 'oxford', 
-            'advanced', 'physics', 'math', 'mathematics', 'economics',
-            'geography', 'histoire', 'français', 'anglais', 'allemand'
-        ]
-        
-        # Détecter les demandes de prix multiples (ex: "prix de 5 articles")
-        multiple_price_patterns = [
-            r'prix de \d+ articles?',
-            r'prix des \d+ articles?',
-            r'\d+ articles?.*prix',
-            r'prix.*\d+ articles?'
-        ]
-        
-        import re
-        has_multiple_price = any(re.search(pattern, message_lower) for pattern in multiple_price_patterns)
-        
-        has_price_keyword = any(keyword in message_lower for keyword in price_keywords)
-        has_article_keyword = any(keyword in message_lower for keyword in article_keywords)
-        
-        return has_price_keyword and (has_article_keyword or has_multiple_price)
+        return self.intent_router.route(message)['flags']['article_price']
     
     def handle_capabilities_question(self, user_message: str) -> Dict[str, Any]:
         """
@@ -895,21 +865,16 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
             Dict contenant les données des articles
         """
         try:
-            import requests
-            
-            # Appel à l'API pour récupérer des articles aléatoires
-            response = requests.get(f'http://localhost:5001/admin/api/articles/random?limit={limit}')
+            index = self.get_article_index()
+            if index is None:
+                return {"success": False, "error": "Accès aux données indisponible"}
             
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('success'):
-                    return {
-                        "success": True,
-                        "articles": data['articles'],
-                        "total": data['total']
-                    }
-            else:
-                return {"success": False, "error": f"Erreur API articles aléatoires: {response.status_code} - {response.text}"}
+            articles = index.random_articles(limit)
+            return {
+                "success": True,
+                "articles": articles,
+                "total": len(articles)
+            }
             
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -1038,87 +1003,6 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
         
         return ' '.join(corrected_words)
     
-    def generate_excel_file(self, articles: list, data_type: str) -> str:
-        """
-        Génère un fichier Excel réel et retourne l'URL de téléchargement
-        
-        Args:
-            articles: Liste des articles
-            data_type: Type de données (articles ou prestations)
-        
-        Returns:
-            URL du fichier généré ou None si erreur
-        """
-        try:
-            import pandas as pd
-            import os
-            from datetime import datetime
-            
-            # Créer un DataFrame
-            df = pd.DataFrame(articles)
-            
-            # Créer le nom du fichier
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"export_{data_type}_{timestamp}.xlsx"
-            
-            # Créer le dossier uploads s'il n'existe pas
-            uploads_dir = "uploads"
-            if not os.path.exists(uploads_dir):
-                os.makedirs(uploads_dir)
-            
-            filepath = os.path.join(uploads_dir, filename)
-            
-            # Sauvegarder le fichier Excel
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name=data_type.title(), index=False)
-            
-            # Retourner l'URL relative
-            return f"/uploads/{filename}"
-            
-        except Exception as e:
-            print(f"Erreur génération Excel: {e}")
-            return None
-    
-    def generate_csv_file(self, articles: list, data_type: str) -> str:
-        """
-        Génère un fichier CSV réel et retourne l'URL de téléchargement
-        
-        Args:
-            articles: Liste des articles
-            data_type: Type de données (articles ou prestations)
-        
-        Returns:
-            URL du fichier généré ou None si erreur
-        """
-        try:
-            import pandas as pd
-            import os
-            from datetime import datetime
-            
-            # Créer un DataFrame
-            df = pd.DataFrame(articles)
-            
-            # Créer le nom du fichier
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"export_{data_type}_{timestamp}.csv"
-            
-            # Créer le dossier uploads s'il n'existe pas
-            uploads_dir = "uploads"
-            if not os.path.exists(uploads_dir):
-                os.makedirs(uploads_dir)
-            
-            filepath = os.path.join(uploads_dir, filename)
-            
-            # Sauvegarder le fichier CSV
-            df.to_csv(filepath, index=False, encoding='utf-8')
-            
-            # Retourner l'URL relative
-            return f"/uploads/{filename}"
-            
-        except Exception as e:
-            print(f"Erreur génération CSV: {e}")
-            return None
-    
     def generate_varied_export_response(self, export_type: str, language: str, file_url: str, data_result: dict) -> str:
         """
         Génère une réponse variée pour les exports en utilisant Gemini
@@ -1137,7 +1021,7 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
             if language == 'en':
                 if export_type == 'visualisation':
                     prompt = f"""Generate a SHORT, creative response for a successful {export_type} export. 
-                    The chart shows the top 20 items from {len(data_result.get('articles', []))} total items.
+                    The chart shows the top 20 items from {data_result.get('total_articles', len(data_result.get('articles', [])))} total items.
                     Use 1-2 emojis, be enthusiastic but brief. Maximum 2 sentences.
                     
                     Examples of good responses:
@@ -1148,19 +1032,19 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
                     Keep it short and punchy!"""
                 else:
                     prompt = f"""Generate a SHORT, creative response for a successful {export_type} export. 
-                    The file contains {len(data_result.get('articles', []))} items.
+                    The file contains {data_result.get('total_articles', len(data_result.get('articles', [])))} items.
                     Use 1-2 emojis, be enthusiastic but brief. Maximum 2 sentences.
                     
                     Examples of good responses:
                     - "🎉 Brilliant! Your {export_type} export is ready to rock!"
-                    - "✨ Mission accomplished! {len(data_result.get('articles', []))} items exported successfully!"
+                    - "✨ Mission accomplished! {data_result.get('total_articles', len(data_result.get('articles', [])))} items exported successfully!"
                     - "🚀 Boom! Your {export_type} file is locked and loaded!"
                     
                     Keep it short and punchy!"""
             else:
                 if export_type == 'visualisation':
                     prompt = f"""Génère une réponse COURTE et créative pour un export {export_type} réussi.
-                    Le graphique montre le top 20 des éléments sur {len(data_result.get('articles', []))} au total.
+                    Le graphique montre le top 20 des éléments sur {data_result.get('total_articles', len(data_result.get('articles', [])))} au total.
                     Utilise 1-2 emojis, sois enthousiaste mais bref. Maximum 2 phrases.
                     
                     Exemples de bonnes réponses :
@@ -1171,12 +1055,12 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
                     Reste court et percutant !"""
                 else:
                     prompt = f"""Génère une réponse COURTE et créative pour un export {export_type} réussi.
-                    Le fichier contient {len(data_result.get('articles', []))} éléments.
+                    Le fichier contient {data_result.get('total_articles', len(data_result.get('articles', [])))} éléments.
                     Utilise 1-2 emojis, sois enthousiaste mais bref. Maximum 2 phrases.
                     
                     Exemples de bonnes réponses :
                     - "🎉 Parfait ! Votre export {export_type} est prêt à tout casser !"
-                    - "✨ Mission accomplie ! {len(data_result.get('articles', []))} éléments exportés avec succès !"
+                    - "✨ Mission accomplie ! {data_result.get('total_articles', len(data_result.get('articles', [])))} éléments exportés avec succès !"
                     - "🚀 Boom ! Votre fichier {export_type} est chargé et prêt !"
                     
                     Reste court et percutant !"""
@@ -1194,13 +1078,14 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
             else:
                 return f"✅ **Votre fichier {export_type.upper()} est prêt !**\n\n"
 
-    def generate_dynamic_chart(self, articles: list, data_type: str) -> str:
+    def generate_dynamic_chart(self, articles: list, data_type: str, total: Optional[int] = None) -> str:
         """
         Génère un graphique dynamique avec Chart.js
         
         Args:
-            articles: Liste des articles
+            articles: Liste des articles (seuls les 20 premiers sont affichés)
             data_type: Type de données (articles ou prestations)
+            total: Nombre total d'éléments (par défaut len(articles))
         
         Returns:
             HTML du graphique dynamique
@@ -1258,7 +1143,7 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
                         plugins: {{
                             title: {{
                                 display: true,
-                                text: 'Prix des {data_type.title()} - Top 20 (sur {len(articles)} au total)',
+                                text: 'Prix des {data_type.title()} - Top 20 (sur {total or len(articles)} au total)',
                                 font: {{
                                     size: 16,
                                     weight: 'bold'
@@ -1302,72 +1187,6 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
             print(f"Erreur génération graphique dynamique: {e}")
             return f"<p>Erreur lors de la génération du graphique dynamique: {e}</p>"
 
-    def generate_visualization(self, articles: list, data_type: str) -> str:
-        """
-        Génère un graphique réel et retourne l'URL de téléchargement
-        
-        Args:
-            articles: Liste des articles
-            data_type: Type de données (articles ou prestations)
-        
-        Returns:
-            URL du fichier généré ou None si erreur
-        """
-        try:
-            import matplotlib.pyplot as plt
-            import matplotlib
-            matplotlib.use('Agg')  # Backend non-interactif
-            import os
-            from datetime import datetime
-            
-            # Préparer les données pour le graphique
-            if not articles:
-                return None
-            
-            # Prendre les 20 premiers articles pour le graphique (plus représentatif)
-            top_articles = articles[:20]
-            names = [article.get('nom', 'N/A')[:15] + '...' if len(article.get('nom', '')) > 15 else article.get('nom', 'N/A') for article in top_articles]
-            prices = [float(article.get('prix', 0)) for article in top_articles]
-            
-            # Créer le graphique
-            plt.figure(figsize=(12, 8))
-            bars = plt.bar(range(len(names)), prices, color='skyblue', alpha=0.7)
-            
-            # Personnaliser le graphique
-            plt.title(f'Prix des {data_type.title()} - Top 20 (sur {len(articles)} au total)', fontsize=16, fontweight='bold')
-            plt.xlabel('Articles', fontsize=12)
-            plt.ylabel('Prix (FCFA)', fontsize=12)
-            plt.xticks(range(len(names)), names, rotation=45, ha='right')
-            
-            # Ajouter les valeurs sur les barres
-            for i, (bar, price) in enumerate(zip(bars, prices)):
-                plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(prices)*0.01,
-                        f'{price:,.0f}', ha='center', va='bottom', fontsize=9)
-            
-            plt.tight_layout()
-            
-            # Créer le nom du fichier
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"graphique_{data_type}_{timestamp}.png"
-            
-            # Créer le dossier uploads s'il n'existe pas
-            uploads_dir = "uploads"
-            if not os.path.exists(uploads_dir):
-                os.makedirs(uploads_dir)
-            
-            filepath = os.path.join(uploads_dir, filename)
-            
-            # Sauvegarder le graphique
-            plt.savefig(filepath, dpi=300, bbox_inches='tight')
-            plt.close()
-            
-            # Retourner l'URL relative
-            return f"/uploads/{filename}"
-            
-        except Exception as e:
-            print(f"Erreur génération graphique: {e}")
-            return None
-
     def handle_top_request(self, user_message: str) -> Dict[str, Any]:
         """
         Gère les demandes de top (top 5, top 10, etc.)
@@ -1460,6 +1279,14 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
         Returns:
             Dict contenant les données des articles
         """
+        return self.response_cache.get_or_compute(
+            ResponseCache.make_key('top_articles', limit),
+            lambda: self._fetch_top_articles(limit),
+            cacheable=lambda result: result.get('success', False)
+        )
+    
+    def _fetch_top_articles(self, limit: int) -> Dict[str, Any]:
+        """Top des articles depuis l'API de reporting (sans cache)"""
         try:
             import requests
             
@@ -1481,10 +1308,18 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
         except Exception as e:
             return {"success": False, "error": str(e)}
 
+    def get_export_jobs(self) -> ExportJobs:
+        """File d'exports en arrière-plan du processus"""
+        return get_export_jobs(self.data_access.get_db_connection if self.data_access else None)
+
     def handle_export_request(self, user_message: str) -> Dict[str, Any]:
         """
         Gère les demandes d'export (Excel, CSV, visualisations)
         
+        Le fichier est produit en arrière-plan (export_jobs.py) : la réponse part
+        immédiatement avec l'identifiant de la tâche et un lien de téléchargement
+        qui attend la fin de l'export.
+        
         Args:
             user_message: Message de l'utilisateur
         
@@ -1494,6 +1329,7 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
         try:
             language = self.detect_language(user_message)
             response = ""  # Initialiser la variable response
+            job = None
             
             # Détecter le type d'export demandé
             message_lower = user_message.lower()
@@ -1507,70 +1343,54 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
             else:
                 export_type = 'excel'  # Par défaut Excel
             
-            # Récupérer les données selon le type demandé
             if 'prestation' in message_lower or 'service' in message_lower:
-                data_result = self.get_prestations_data(limit=None)  # Pas de limite - TOUS les prestations
                 data_type = 'prestations'
             else:
                 # Par défaut, articles (pour tous les exports) - TOUS les articles
-                data_result = self.get_articles_prices(limit=None)  # Pas de limite - TOUS les articles
                 data_type = 'articles'
             
+            export_jobs = self.get_export_jobs()
+            try:
+                # Seulement le top 20 et le total : le fichier complet est écrit par la tâche
+                top_rows, total = export_jobs.preview(data_type, 20)
+                data_result = {"success": True, "articles": top_rows, "total_articles": total}
+            except Exception as e:
+                data_result = {"success": False, "error": str(e)}
+            
             if not data_result.get('success', False):
                 if language == 'en':
                     response = f"Sorry, I couldn't retrieve the {data_type} data for export. {data_result.get('error', 'Unknown error')}"
                 else:
                     response = f"Désolé, je n'ai pas pu récupérer les données {data_type} pour l'export. {data_result.get('error', 'Erreur inconnue')}"
             else:
-                # Générer le fichier réel
-                if export_type == 'excel':
-                    file_url = self.generate_excel_file(data_result['articles'], data_type)
-                elif export_type == 'csv':
-                    file_url = self.generate_csv_file(data_result['articles'], data_type)
-                elif export_type == 'visualisation':
-                    file_url = self.generate_visualization(data_result['articles'], data_type)
-                else:
-                    file_url = self.generate_excel_file(data_result['articles'], data_type)
+                job = export_jobs.submit(data_type, export_type)
+                job['status_url'] = f"/admin/api/data-analyst/exports/{job['job_id']}"
+                job['download_url'] = f"{job['status_url']}/download"
+                file_url = job['download_url']
                 
-                if file_url:
-                    if language == 'en':
-                        response = f"✅ **Your {export_type.upper()} file is ready!**\n\n"
-                        response += f"📁 **Download:** <a href='{file_url}' target='_blank' style='color: #007bff; text-decoration: underline;'>Click here to download</a>\n\n"
-                        response += f"📊 **Contains:** {len(data_result['articles'])} {data_type}\n"
-                        response += f"• Product names and prices\n"
-                        response += f"• Performance data\n"
-                        response += f"• Strategic recommendations"
-                    else:
-                        # Générer une réponse variée avec Gemini
-                        response = self.generate_varied_export_response(export_type, language, file_url, data_result)
-                        response += f"📁 **Télécharger :** <a href='{file_url}' target='_blank' style='color: #007bff; text-decoration: underline;'>Cliquez ici pour télécharger</a>\n\n"
-                        
-                        # Si c'est une visualisation, afficher le graphique dynamique
-                        if export_type == 'visualisation':
-                            # Générer un graphique dynamique avec Chart.js
-                            chart_html = self.generate_dynamic_chart(data_result['articles'], data_type)
-                            response += f"{chart_html}\n\n"
-                        else:
-                            # Pour Excel et CSV, garder les détails
-                            response += f"📊 **Contient :** {len(data_result['articles'])} {data_type}"
-                            if 'total_articles' in data_result:
-                                response += f" sur {data_result['total_articles']} au total"
-                            response += f"\n"
-                            response += f"• Noms et prix des produits\n"
-                            response += f"• Données de performance\n"
-                            response += f"• Recommandations stratégiques"
+                if language == 'en':
+                    response = f"✅ **Your {export_type.upper()} file is being generated!**\n\n"
+                    response += f"📁 **Download:** <a href='{file_url}' target='_blank' style='color: #007bff; text-decoration: underline;'>Click here to download</a>\n\n"
+                    response += f"📊 **Contains:** {total} {data_type}\n"
+                    response += f"• Product names and prices\n"
+                    response += f"• Performance data\n"
+                    response += f"• Strategic recommendations"
                 else:
-                    if language == 'en':
-                        response = f"Sorry, I couldn't generate the {export_type} file. Please try again."
-                    else:
-                        response = f"Désolé, je n'ai pas pu générer le fichier {export_type}. Veuillez réessayer."
-                
-                # Si response est toujours vide, définir une réponse par défaut
-                if not response:
-                    if language == 'en':
-                        response = f"Export {export_type} completed successfully."
+                    # Générer une réponse variée avec Gemini
+                    response = self.generate_varied_export_response(export_type, language, file_url, data_result)
+                    response += f"📁 **Télécharger :** <a href='{file_url}' target='_blank' style='color: #007bff; text-decoration: underline;'>Cliquez ici pour télécharger</a>\n\n"
+                    
+                    # Si c'est une visualisation, afficher le graphique dynamique
+                    if export_type == 'visualisation':
+                        # Graphique Chart.js construit à partir du top 20 déjà lu
+                        chart_html = self.generate_dynamic_chart(top_rows, data_type, total)
+                        response += f"{chart_html}\n\n"
                     else:
-                        response = f"Export {export_type} terminé avec succès."
+                        # Pour Excel et CSV, garder les détails
+                        response += f"📊 **Contient :** {total} {data_type}\n"
+                        response += f"• Noms et prix des produits\n"
+                        response += f"• Données de performance\n"
+                        response += f"• Recommandations stratégiques"
             
             # Enregistrement
             export_entry = {
@@ -1595,7 +1415,8 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
                 'export_type': export_type,
                 'data_type': data_type,
                 'data': data_result,
-                'file_url': file_url if 'file_url' in locals() else None
+                'file_url': job['download_url'] if job else None,
+                'export_job': job
             }
             
         except Exception as e:
@@ -1610,112 +1431,152 @@ Réponds en {language} de manière claire et professionnelle, en expliquant les
                 'capability_type': 'fallback'
             }
     
-    def chat_with_bizzio(self, user_message: str) -> Dict[str, Any]:
+    def chat_with_bizzio(self, user_message: str, chat_id: Optional[int] = None) -> Dict[str, Any]:
         """
         Première fonctionnalité : Chat avec Bizzio Data Analyst
         
         Args:
             user_message: Message de l'utilisateur
+            chat_id: Chat dont l'historique sert de contexte (historique local si absent)
         
         Returns:
             Dict contenant la réponse de Bizzio
         """
+        with self.chat_context(chat_id):
+            return self._chat_with_bizzio(user_message)
+    
+    def _chat_with_bizzio(self, user_message: str) -> Dict[str, Any]:
+        """Routage du message vers le bon traitement (historique du chat courant)"""
         try:
-            # Détection des salutations simples - PRIORITÉ HAUTE
-            if self.is_simple_greeting(user_message):
-                return self.handle_simple_greeting(user_message)
-            
-            # Détection des questions sur les capacités - PRIORITÉ HAUTE
-            if self.is_about_capabilities(user_message):
-                return self.handle_capabilities_question(user_message)
-            
-            # Détection des questions éducatives - PRIORITÉ HAUTE
-            if self.is_educational_question(user_message):
-                return self.handle_educational_question(user_message)
-            
-            # Détection des demandes de top - PRIORITÉ HAUTE
-            if self.is_top_request(user_message):
-                return self.handle_top_request(user_message)
-            
-            # Détection des demandes d'export - PRIORITÉ HAUTE
-            if self.is_export_request(user_message):
-                return self.handle_export_request(user_message)
-            
-            # Détection des demandes de prix d'articles - PRIORITÉ HAUTE
-            if self.is_article_price_request(user_message):
-                return self.handle_article_price_request(user_message)
-            
-            # Détection automatique des questions catalogue et redirection
-            if self.is_catalogue_question(user_message):
-                return self.analyse_catalogue_products(user_message)
-            
-            # Vérification si c'est une question data analyst
-            if not self.is_data_analyst_question(user_message):
-                return self.handle_non_data_analyst_question(user_message)
-            
-            # Troisième fonctionnalité : Comportement Intelligent
-            # 1. Détection des messages malveillants - mais laisse Bizzio répondre naturellement
-            is_malicious = self.detect_malicious_content(user_message)
-            
-            # 2. Détection du niveau technique et des clarifications nécessaires
-            technical_level = self.detect_technical_level(user_message)
-            needs_clarification = self.needs_clarification(user_message)
-            
-            # Construction du prompt avec comportement intelligent
-            conversation_context = ""
-            if len(self.conversation_history) > 0:
-                recent_conversations = self.conversation_history[-3:]
-                conversation_context = "\n\nContexte de la conversation :\n"
-                for conv in recent_conversations:
-                    conversation_context += f"Utilisateur: {conv['user_message']}\n"
-                    conversation_context += f"Bizzio: {conv['response']}\n"
-            
-            # Ajout des instructions de comportement intelligent
-            malicious_context = "ATTENTION : L'utilisateur semble frustré ou mécontent. Excuse-toi humblement et propose ton aide." if is_malicious else ""
-            
-            intelligent_instructions = f"""
-{self.prompts.get_intelligent_behavior_prompt()}
-
-INFORMATIONS CONTEXTUELLES :
-- Niveau technique détecté : {technical_level}
-- Clarification nécessaire : {needs_clarification}
-- Message utilisateur : {user_message}
-{malicious_context}
-"""
+            routed = self._route_message(user_message)
+            if routed is not None:
+                return routed
             
-            chat_prompt = f"{self.get_system_prompt()}{conversation_context}{intelligent_instructions}"
+            chat_prompt, meta = self._build_chat_prompt(user_message)
             
             # Supprimer les warnings lors de l'appel API
             with redirect_stderr(io.StringIO()):
                 response = self.model.generate_content(chat_prompt)
             
-            # Enregistrement de la conversation
-            conversation_entry = {
-                'timestamp': datetime.now().isoformat(),
-                'type': 'chat',
-                'user_message': user_message,
-                'response': response.text,
-                'model_used': 'gemini-2.0-flash-lite',
-                'technical_level': technical_level,
-                'needs_clarification': needs_clarification,
-                'is_malicious': is_malicious
-            }
-            self.conversation_history.append(conversation_entry)
-            
-            return {
-                'success': True,
-                'response': response.text,
-                'timestamp': conversation_entry['timestamp'],
-                'model_used': 'gemini-2.0-flash-lite',
-                'conversation_id': len(self.conversation_history),
-                'technical_level': technical_level,
-                'needs_clarification': needs_clarification
-            }
+            return self._record_chat(user_message, response.text, meta)
             
         except Exception as e:
             # Gestion des erreurs avec excuses automatiques
             return self.handle_error(e, user_message)
     
+    def stream_chat_with_bizzio(self, user_message: str, chat_id: Optional[int] = None):
+        """
+        Variante en flux de chat_with_bizzio : produit ('chunk', texte) au fil de la génération
+        du modèle puis ('done', résultat) avec le même dictionnaire que chat_with_bizzio.
+        Les réponses des traitements dédiés (prix, top, export...) arrivent en un seul morceau.
+        """
+        with self.chat_context(chat_id):
+            try:
+                routed = self._route_message(user_message)
+                if routed is not None:
+                    yield 'chunk', routed.get('response', '')
+                    yield 'done', routed
+                    return
+                
+                chat_prompt, meta = self._build_chat_prompt(user_message)
+                
+                parts = []
+                with redirect_stderr(io.StringIO()):
+                    response = self.model.generate_content(chat_prompt, stream=True)
+                for chunk in response:
+                    text = getattr(chunk, 'text', '')
+                    if text:
+                        parts.append(text)
+                        yield 'chunk', text
+                
+                yield 'done', self._record_chat(user_message, ''.join(parts), meta)
+                
+            except Exception as e:
+                result = self.handle_error(e, user_message)
+                yield 'chunk', result.get('response', '')
+                yield 'done', result
+    
+    def _route_message(self, user_message: str) -> Optional[Dict[str, Any]]:
+        """Réponse des traitements dédiés, ou None si le message relève du chat général"""
+        # Intention gagnante selon l'ordre de priorité historique :
+        # salutation > capacités > éducatif > top > export > prix > catalogue > data analyst
+        intent = self.intent_router.route(user_message)['intent']
+        handlers = {
+            'greeting': self.handle_simple_greeting,
+            'capabilities': self.handle_capabilities_question,
+            'educational': self.handle_educational_question,
+            'top': self.handle_top_request,
+            'export': self.handle_export_request,
+            'article_price': self.handle_article_price_request,
+            'catalogue': self.analyse_catalogue_products,
+            'off_topic': self.handle_non_data_analyst_question,
+        }
+        handler = handlers.get(intent)
+        return handler(user_message) if handler else None
+    
+    def _build_chat_prompt(self, user_message: str):
+        """Prompt du chat général (comportement intelligent + contexte du chat) → (prompt, meta)"""
+        # Troisième fonctionnalité : Comportement Intelligent
+        # 1. Détection des messages malveillants - mais laisse Bizzio répondre naturellement
+        is_malicious = self.detect_malicious_content(user_message)
+        
+        # 2. Niveau technique et clarifications (déjà calculés par le routeur)
+        route = self.intent_router.route(user_message)
+        technical_level = route['technical_level']
+        needs_clarification = route['needs_clarification']
+        
+        # Construction du prompt avec comportement intelligent
+        conversation_context = ""
+        if len(self.conversation_history) > 0:
+            recent_conversations = self.conversation_history[-3:]
+            conversation_context = "\n\nContexte de la conversation :\n"
+            for conv in recent_conversations:
+                conversation_context += f"Utilisateur: {conv['user_message']}\n"
+                conversation_context += f"Bizzio: {conv['response']}\n"
+        
+        # Ajout des instructions de comportement intelligent
+        malicious_context = "ATTENTION : L'utilisateur semble frustré ou mécontent. Excuse-toi humblement et propose ton aide." if is_malicious else ""
+        
+        intelligent_instructions = f"""
+{self.prompts.get_intelligent_behavior_prompt()}
+
+INFORMATIONS CONTEXTUELLES :
+- Niveau technique détecté : {technical_level}
+- Clarification nécessaire : {needs_clarification}
+- Message utilisateur : {user_message}
+{malicious_context}
+"""
+        
+        chat_prompt = f"{self.get_system_prompt()}{conversation_context}{intelligent_instructions}"
+        meta = {
+            'technical_level': technical_level,
+            'needs_clarification': needs_clarification,
+            'is_malicious': is_malicious
+        }
+        return chat_prompt, meta
+    
+    def _record_chat(self, user_message: str, response_text: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+        """Enregistre un échange du chat général dans l'historique et construit le résultat"""
+        conversation_entry = {
+            'timestamp': datetime.now().isoformat(),
+            'type': 'chat',
+            'user_message': user_message,
+            'response': response_text,
+            'model_used': 'gemini-2.0-flash-lite',
+            **meta
+        }
+        self.conversation_history.append(conversation_entry)
+        
+        return {
+            'success': True,
+            'response': response_text,
+            'timestamp': conversation_entry['timestamp'],
+            'model_used': 'gemini-2.0-flash-lite',
+            'conversation_id': len(self.conversation_history),
+            'technical_level': meta['technical_level'],
+            'needs_clarification': meta['needs_clarification']
+        }
+    
     def handle_error(self, error: Exception, user_message: str) -> Dict[str, Any]:
         """
         Deuxième fonctionnalité : Gestion des erreurs avec excuses et suggestions
@@ -1869,31 +1730,7 @@ Réponds uniquement par "OUI" si le message est inapproprié, "NON" sinon.
         Returns:
             'beginner', 'intermediate', ou 'expert'
         """
-        technical_terms = [
-            'sql', 'python', 'r', 'pandas', 'numpy', 'matplotlib', 'seaborn',
-            'regression', 'correlation', 'variance', 'standard deviation',
-            'machine learning', 'ai', 'algorithm', 'model', 'prediction',
-            'database', 'query', 'join', 'index', 'optimization', 'performance'
-        ]
-        
-        advanced_terms = [
-            'neural network', 'deep learning', 'tensorflow', 'pytorch',
-            'clustering', 'classification', 'feature engineering',
-            'cross-validation', 'hyperparameter', 'gradient descent',
-            'api', 'microservices', 'docker', 'kubernetes', 'scalability'
-        ]
-        
-        message_lower = message.lower()
-        
-        advanced_count = sum(1 for term in advanced_terms if term in message_lower)
-        technical_count = sum(1 for term in technical_terms if term in message_lower)
-        
-        if advanced_count >= 2:
-            return 'expert'
-        elif technical_count >= 2 or advanced_count >= 1:
-            return 'intermediate'
-        else:
-            return 'beginner'
+        return self.intent_router.route(message)['technical_level']
     
     def needs_clarification(self, message: str) -> bool:
         """
@@ -1905,28 +1742,7 @@ Réponds uniquement par "OUI" si le message est inapproprié, "NON" sinon.
         Returns:
             True si des clarifications sont nécessaires
         """
-        vague_indicators = [
-            'ça', 'ça va', 'comment', 'quoi', 'hein', 'ok', 'oui', 'non',
-            'help', 'help me', 'je sais pas', 'je ne comprends pas',
-            'explique', 'comment faire', 'que faire'
-        ]
-        
-        message_lower = message.lower().strip()
-        
-        # Messages très courts sans contexte
-        if len(message_lower) < 5:
-            return True
-        
-        # Messages vagues
-        for indicator in vague_indicators:
-            if message_lower == indicator:
-                return True
-        
-        # Questions sans contexte spécifique
-        if message_lower in ['analyse', 'données', 'data', 'chiffres']:
-            return True
-        
-        return False
+        return self.intent_router.route(message)['needs_clarification']
     
     def is_catalogue_question(self, message: str) -> bool:
         """
@@ -1938,62 +1754,7 @@ Réponds uniquement par "OUI" si le message est inapproprié, "NON" sinon.
         Returns:
             True si c'est une question catalogue
         """
-        message_lower = message.lower()
-        
-        # Mots-clés étendus pour les questions catalogue (français + anglais + variantes)
-        catalogue_keywords = [
-            # Français - variantes étendues
-            'produits', 'articles', 'catalogue', 'prestations',
-            'plus vendus', 'meilleurs', 'top', 'performance',
-            'revenus', 'génère', 'rentabilité', 'catégorie',
-            'répartition', 'évolution', 'mensuel', 'tendance',
-            'offres', 'explosé', 'croissance', 'trimestre',
-            'ventes', 'chiffre', 'ca', 'business', 'commercial',
-            'marché', 'client', 'achat', 'commande',
-            # Anglais - variantes étendues
-            'products', 'items', 'best-selling', 'top-performing',
-            'category', 'categories', 'revenue', 'sales',
-            'month', 'quarter', 'performance', 'offers',
-            'business', 'commercial', 'market', 'client',
-            'purchase', 'order', 'selling', 'profit'
-        ]
-        
-        # Vérifier si au moins un mot-clé catalogue est présent
-        for keyword in catalogue_keywords:
-            if keyword in message_lower:
-                return True
-        
-        # Questions spécifiques étendues (français + anglais + variantes)
-        specific_questions = [
-            # Français - variantes
-            'quels sont nos', 'donne-moi les', 'montre-moi',
-            'quelle prestation', 'comment sont', 'comment évolue',
-            'quels produits', 'quelles prestations', 'nos meilleurs',
-            'top de', 'classement', 'ranking', 'stats', 'statistiques',
-            # Anglais - variantes
-            'what are our', 'show me the', 'which category',
-            'what are the', 'top 10', 'best-selling', 'our best',
-            'ranking of', 'stats on', 'data on', 'analysis of'
-        ]
-        
-        for question in specific_questions:
-            if message_lower.startswith(question):
-                return True
-        
-        # Patterns spécifiques étendus
-        patterns = [
-            'top.*items', 'best.*products', 'category.*perform',
-            'top.*offers', 'quarter.*performance', 'month.*top',
-            'nos.*plus', 'meilleurs.*', 'classement.*',
-            'stats.*', 'data.*', 'analysis.*'
-        ]
-        
-        import re
-        for pattern in patterns:
-            if re.search(pattern, message_lower):
-                return True
-        
-        return False
+        return self.intent_router.route(message)['flags']['catalogue']
     
     
     def is_simple_greeting(self, message: str) -> bool:
@@ -2006,34 +1767,7 @@ Réponds uniquement par "OUI" si le message est inapproprié, "NON" sinon.
         Returns:
             True si c'est UNIQUEMENT une salutation simple
         """
-        message_lower = message.lower().strip()
-        
-        # Salutations PUREMENT simples (sans contexte business)
-        pure_greetings = [
-            # Très courts uniquement
-            'yo', 'hey', 'hi', 'salut', 'coucou', 'hello',
-            # Salutations de base
-            'bonjour', 'bonsoir', 'bonne soirée', 'bon après-midi',
-            'good morning', 'good afternoon', 'good evening',
-            # Questions d'état simples
-            'ça va', 'comment ça va', 'how are you', 'how are you doing'
-        ]
-        
-        # Vérifier si c'est EXACTEMENT une salutation simple
-        if message_lower in pure_greetings:
-            return True
-        
-        # Messages très courts (1-2 mots) qui sont des salutations pures
-        words = message_lower.split()
-        if len(words) <= 2 and any(word in pure_greetings for word in words):
-            return True
-        
-        # EXCLUSION : Si le message contient des mots business, ce n'est PAS une salutation
-        business_keywords = ['prix', 'article', 'prestation', 'performance', 'vente', 'client', 'données', 'analyse', 'liste', 'complet', 'livre', 'chimie', 'oxford']
-        if any(keyword in message_lower for keyword in business_keywords):
-            return False
-        
-        return False
+        return self.intent_router.route(message)['flags']['greeting']
     
     def detect_language(self, message: str) -> str:
         """
@@ -2045,28 +1779,7 @@ Réponds uniquement par "OUI" si le message est inapproprié, "NON" sinon.
         Returns:
             'fr' pour français, 'en' pour anglais
         """
-        message_lower = message.lower()
-        
-        # Mots-clés anglais
-        english_words = ['hello', 'hi', 'hey', 'how', 'what', 'where', 'when', 'why', 'good', 'morning', 'afternoon', 'evening', 'thanks', 'thank you', 'show me', 'give me', 'can you', 'please']
-        
-        # Mots-clés français (plus étendus)
-        french_words = ['salut', 'bonjour', 'bonsoir', 'comment', 'quoi', 'où', 'quand', 'pourquoi', 'merci', 'matin', 'après-midi', 'soir', 'montre', 'donne', 'peux', 'peut', 'liste', 'complet', 'articles', 'prestations', 'prix', 'performance', 'analyse', 'données', 'business', 'ventes', 'clients']
-        
-        english_count = sum(1 for word in english_words if word in message_lower)
-        french_count = sum(1 for word in french_words if word in message_lower)
-        
-        # Si le message contient des mots français spécifiques, priorité au français
-        if any(word in message_lower for word in ['montre-moi', 'donne-moi', 'peux-tu', 'peut-il', 'liste complète', 'articles', 'prestations', 'prix', 'performance']):
-            return 'fr'
-        
-        if english_count > french_count:
-            return 'en'
-        elif french_count > english_count:
-            return 'fr'
-        else:
-            # Par défaut français si ambigu
-            return 'fr'
+        return self.intent_router.route(message)['language']
     
     def handle_simple_greeting(self, user_message: str) -> Dict[str, Any]:
         """
@@ -2178,40 +1891,7 @@ Réponds uniquement par "OUI" si le message est inapproprié, "NON" sinon.
         Returns:
             True si c'est une question data analyst
         """
-        message_lower = message.lower()
-        
-        # Mots-clés pour le domaine data analyst
-        data_keywords = [
-            # Français
-            'données', 'analyse', 'statistiques', 'rapport', 'kpi',
-            'métriques', 'performance', 'ventes', 'chiffre', 'ca',
-            'business', 'commercial', 'clients', 'produits', 'articles',
-            'prestations', 'revenus', 'rentabilité', 'croissance',
-            'tendance', 'évolution', 'comparaison', 'segmentation',
-            # Anglais
-            'data', 'analysis', 'statistics', 'report', 'kpi',
-            'metrics', 'performance', 'sales', 'revenue', 'business',
-            'commercial', 'clients', 'products', 'items', 'services',
-            'profit', 'growth', 'trend', 'evolution', 'comparison',
-            'segmentation'
-        ]
-        
-        # Vérifier si au moins un mot-clé data analyst est présent
-        for keyword in data_keywords:
-            if keyword in message_lower:
-                return True
-        
-        # Questions spécifiques data analyst
-        data_questions = [
-            'analyse', 'données', 'rapport', 'stats', 'métriques',
-            'performance', 'ventes', 'chiffre', 'business', 'commercial'
-        ]
-        
-        for question in data_questions:
-            if question in message_lower:
-                return True
-        
-        return False
+        return self.intent_router.route(message)['flags']['data_analyst']
     
     def handle_non_data_analyst_question(self, user_message: str) -> Dict[str, Any]:
         """
@@ -2307,39 +1987,13 @@ Sois naturel et humain dans ta réponse.
             # Détection de la quantité demandée
             requested_quantity = self.detect_requested_quantity(user_message)
             
-            # Récupération des VRAIES données selon le type d'analyse
-            real_data = self.get_real_catalogue_data(analysis_type, requested_quantity)
-            
-            # Construction du prompt spécialisé avec les vraies données et contexte enrichi
-            enhanced_context = f"""
-QUESTION UTILISATEUR : {user_message}
-TYPE D'ANALYSE DÉTECTÉ : {analysis_type}
-QUANTITÉ DEMANDÉE : {requested_quantity} éléments
-
-CONTEXTE BUSINESS :
-- L'utilisateur cherche des insights sur les performances produits/catalogue
-- Il veut probablement des recommandations actionnables
-- Il s'attend à une analyse professionnelle et humaine
-
-DONNÉES RÉELLES DISPONIBLES :
-{real_data['data_summary']}
-
-DONNÉES DÉTAILLÉES :
-{real_data['detailed_data']}
-
-INSTRUCTIONS SPÉCIALES :
-- COMPRENDS le contexte avant de répondre
-- VARIE ton style de réponse (ne sois pas robotique)
-- Sois PROACTIF dans tes insights
-- Propose des analyses spontanées
-- Montre de l'enthousiasme pour les bonnes performances
-"""
-            
-            catalogue_prompt = f"{self.get_system_prompt()}\n\n{self.prompts.get_catalogue_analysis_prompt(analysis_type, enhanced_context)}"
-            
-            # Génération de la réponse avec Gemini
-            with redirect_stderr(io.StringIO()):
-                response = self.model.generate_content(catalogue_prompt)
+            # Même question sur les mêmes données : réponse déjà générée
+            cache_key = ResponseCache.make_key('catalogue_analysis', analysis_type, requested_quantity, user_message)
+            cached, response_text, data_version = self.response_cache.get(cache_key)
+            if not cached:
+                response_text, data_ok = self._generate_catalogue_analysis(user_message, analysis_type, requested_quantity)
+                if data_ok:
+                    self.response_cache.put(cache_key, response_text, version=data_version)
             
             # Enregistrement de l'analyse
             analysis_entry = {
@@ -2348,7 +2002,7 @@ INSTRUCTIONS SPÉCIALES :
                 'analysis_type': analysis_type,
                 'requested_quantity': requested_quantity,
                 'user_message': user_message,
-                'response': response.text,
+                'response': response_text,
                 'model_used': 'gemini-2.0-flash',
                 'data_sources': self.get_catalogue_data_sources(analysis_type)
             }
@@ -2356,18 +2010,57 @@ INSTRUCTIONS SPÉCIALES :
             
             return {
                 'success': True,
-                'response': response.text,
+                'response': response_text,
                 'timestamp': analysis_entry['timestamp'],
                 'model_used': 'gemini-2.0-flash',
                 'conversation_id': len(self.conversation_history),
                 'analysis_type': analysis_type,
                 'requested_quantity': requested_quantity,
-                'data_sources': analysis_entry['data_sources']
+                'data_sources': analysis_entry['data_sources'],
+                'cached': cached
             }
             
         except Exception as e:
             return self.handle_error(e, user_message)
     
+    def _generate_catalogue_analysis(self, user_message: str, analysis_type: str, requested_quantity: int) -> str:
+        """Analyse catalogue générée par Gemini à partir des données réelles → (texte, données disponibles)"""
+        # Récupération des VRAIES données selon le type d'analyse
+        real_data = self.get_real_catalogue_data(analysis_type, requested_quantity)
+        
+        # Construction du prompt spécialisé avec les vraies données et contexte enrichi
+        enhanced_context = f"""
+QUESTION UTILISATEUR : {user_message}
+TYPE D'ANALYSE DÉTECTÉ : {analysis_type}
+QUANTITÉ DEMANDÉE : {requested_quantity} éléments
+
+CONTEXTE BUSINESS :
+- L'utilisateur cherche des insights sur les performances produits/catalogue
+- Il veut probablement des recommandations actionnables
+- Il s'attend à une analyse professionnelle et humaine
+
+DONNÉES RÉELLES DISPONIBLES :
+{real_data['data_summary']}
+
+DONNÉES DÉTAILLÉES :
+{real_data['detailed_data']}
+
+INSTRUCTIONS SPÉCIALES :
+- COMPRENDS le contexte avant de répondre
+- VARIE ton style de réponse (ne sois pas robotique)
+- Sois PROACTIF dans tes insights
+- Propose des analyses spontanées
+- Montre de l'enthousiasme pour les bonnes performances
+"""
+        
+        catalogue_prompt = f"{self.get_system_prompt()}\n\n{self.prompts.get_catalogue_analysis_prompt(analysis_type, enhanced_context)}"
+        
+        # Génération de la réponse avec Gemini
+        with redirect_stderr(io.StringIO()):
+            response = self.model.generate_content(catalogue_prompt)
+        
+        return response.text, not real_data['data_summary'].startswith('❌')
+    
     def detect_catalogue_analysis_type(self, message: str) -> str:
         """
         Détecte le type d'analyse catalogue demandé par l'utilisateur
@@ -2577,6 +2270,12 @@ ANALYSE ATTENDUE :
         
         return sources_map.get(analysis_type, [])
     
+    def get_article_index(self):
+        """Index des articles partagé par le processus (None sans accès aux données)"""
+        if self.data_access is None:
+            return None
+        return get_article_index(self.data_access.get_db_connection)
+    
     def search_article_by_name(self, article_name: str) -> Dict[str, Any]:
         """
         Recherche un article par nom et retourne son prix avec gestion des erreurs de frappe
@@ -2587,49 +2286,41 @@ ANALYSE ATTENDUE :
         Returns:
             Dict contenant les données de l'article trouvé
         """
+        return self.response_cache.get_or_compute(
+            ResponseCache.make_key('article_price', article_name),
+            lambda: self._search_article_by_name(article_name),
+            scopes=('articles',),
+            cacheable=lambda result: result.get('success', False)
+        )
+    
+    def _search_article_by_name(self, article_name: str) -> Dict[str, Any]:
+        """Recherche dans l'index des articles (sans cache)"""
         try:
-            import requests
+            index = self.get_article_index()
+            if index is None:
+                return {"success": False, "error": "Accès aux données indisponible"}
             
-            # Normaliser le nom de l'article pour gérer les erreurs de frappe
+            # Normaliser le nom de l'article pour gérer les erreurs de frappe connues
             normalized_name = self.normalize_article_name(article_name)
             
-            # Stratégies de recherche multiples
-            search_strategies = [
-                article_name,  # Recherche exacte
-                normalized_name,  # Recherche normalisée
-                ' '.join(normalized_name.split()[:2]) if len(normalized_name.split()) >= 2 else normalized_name,  # 2 premiers mots
-                ' '.join(normalized_name.split()[:1]) if len(normalized_name.split()) >= 1 else normalized_name,  # 1er mot
-            ]
-            
-            # Ajouter des variantes intelligentes
-            keywords = normalized_name.lower().split()
-            for keyword in keywords:
-                if len(keyword) > 3:  # Ignorer les mots trop courts
-                    search_strategies.append(keyword)
-            
-            # Essayer chaque stratégie de recherche
-            for strategy in search_strategies:
+            # Tous les mots doivent correspondre (tels quels, en préfixe ou à une faute de frappe près)
+            for strategy in (article_name, normalized_name):
                 if not strategy or strategy.strip() == '':
                     continue
-                    
-                response = requests.get(f'http://localhost:5001/admin/api/articles/search?q={strategy}')
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('success') and data.get('articles'):
-                        # Retourner le premier article trouvé
-                        article = data['articles'][0]
-                        return {
-                            "success": True,
-                            "article": article,
-                            "found": True,
-                            "original_query": article_name,
-                            "normalized_query": normalized_name,
-                            "search_strategy": strategy,
-                            "typo_corrected": strategy != article_name
-                        }
-            
-            # Recherche intelligente par mots-clés similaires
+                articles = index.search(strategy, limit=5)
+                if articles:
+                    article = articles[0]
+                    return {
+                        "success": True,
+                        "article": article,
+                        "found": True,
+                        "original_query": article_name,
+                        "normalized_query": normalized_name,
+                        "search_strategy": strategy,
+                        "typo_corrected": strategy != article_name or not article['exact']
+                    }
+            
+            # Sinon, articles partageant une partie des mots-clés
             similar_articles = self.find_similar_articles(article_name)
             if similar_articles:
                 return {
@@ -2662,51 +2353,13 @@ ANALYSE ATTENDUE :
             article_name: Nom de l'article recherché
         
         Returns:
-            Liste des articles similaires trouvés
+            Liste des articles similaires trouvés (les plus proches en premier)
         """
         try:
-            import requests
-            
-            # Mots-clés de correspondance intelligente
-            keywords = article_name.lower().split()
-            
-            # Correspondances partielles intelligentes
-            search_terms = []
-            
-            # Recherche intelligente par mots-clés - basée sur la vraie base de données
-            # D'abord essayer une recherche directe avec le nom de l'article
-            search_terms.append(article_name)
-            
-            # Puis essayer des variantes intelligentes
-            if 'advanced' in keywords:
-                search_terms.extend(['advanced', 'advanced level', 'advanced chemistry'])
-            
-            if 'level' in keywords:
-                search_terms.extend(['level', 'advanced level', 'level physics'])
-            
-            if 'oxford' in keywords:
-                search_terms.extend(['oxford', 'chemistry oxford', 'oxford chemistry'])
-            
-            if 'chemistry' in keywords:
-                search_terms.extend(['chemistry', 'advanced chemistry', 'chemistry oxford'])
-            
-            if 'physics' in keywords:
-                search_terms.extend(['physics', 'advanced level physics', 'level physics'])
-            
-            # Recherche par mots-clés généraux
-            for keyword in keywords:
-                if len(keyword) > 3:  # Ignorer les mots trop courts
-                    search_terms.append(keyword)
-            
-            # Essayer chaque terme de recherche
-            for term in search_terms:
-                response = requests.get(f'http://localhost:5001/admin/api/articles/search?q={term}')
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('success') and data.get('articles'):
-                        return data['articles']
-            
-            return []
+            index = self.get_article_index()
+            if index is None:
+                return []
+            return index.search(article_name, limit=10, match_any=True)
             
         except Exception as e:
             return []
@@ -2744,64 +2397,6 @@ ANALYSE ATTENDUE :
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def get_prestations_data(self, limit: int = 50) -> Dict[str, Any]:
-        """
-        Récupère la liste des prestations avec leurs tarifs
-        
-        Args:
-            limit: Nombre de prestations à retourner
-        
-        Returns:
-            Dict contenant les données des prestations
-        """
-        try:
-            conn = self.data_access.get_db_connection()
-            if not conn:
-                return {"success": False, "error": "Connexion à la base de données échouée"}
-            
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Requête pour récupérer les prestations
-            query = """
-                SELECT 
-                    p.prestation_id,
-                    p.nom_prestation,
-                    p.tarif,
-                    p.type_prestation,
-                    p.description
-                FROM prestations p
-                WHERE p.nom_prestation IS NOT NULL AND p.nom_prestation != ''
-                ORDER BY p.tarif DESC, p.nom_prestation ASC
-                LIMIT %s
-            """
-            
-            cur.execute(query, (limit,))
-            results = cur.fetchall()
-            
-            cur.close()
-            conn.close()
-            
-            # Conversion en format utilisable
-            prestations = []
-            for row in results:
-                prestations.append({
-                    'id': row['prestation_id'],
-                    'nom': row['nom_prestation'],
-                    'tarif': float(row['tarif']) if row['tarif'] else 0.0,
-                    'type': row['type_prestation'],
-                    'description': row['description']
-                })
-            
-            return {
-                "success": True,
-                "prestations": prestations,
-                "total_prestations": len(prestations),
-                "limit": limit
-            }
-            
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
     def get_real_catalogue_data(self, analysis_type: str, requested_quantity: int) -> Dict[str, str]:
         """
         Récupère les vraies données du catalogue selon le type d'analyse
@@ -2813,6 +2408,14 @@ ANALYSE ATTENDUE :
         Returns:
             Dict contenant le résumé et les données détaillées
         """
+        return self.response_cache.get_or_compute(
+            ResponseCache.make_key('catalogue_data', analysis_type, requested_quantity),
+            lambda: self._load_real_catalogue_data(analysis_type, requested_quantity),
+            cacheable=lambda data: not data['data_summary'].startswith('❌')
+        )
+    
+    def _load_real_catalogue_data(self, analysis_type: str, requested_quantity: int) -> Dict[str, str]:
+        """Données du catalogue lues en base (sans cache)"""
         if not self.data_access:
             return {
                 "data_summary": "❌ Accès aux données non disponible. Vérifiez la configuration de la base de données.",
@@ -2948,6 +2551,26 @@ ANALYSE ATTENDUE :
         }
 
 
+# Instance partagée par les requêtes d'un même processus (worker gunicorn)
+_instance = None
+_instance_pid = None
+_instance_lock = threading.Lock()
+
+
+def get_bizzio() -> BizzioGemini:
+    """
+    BizzioGemini unique par processus : genai, le modèle, les prompts, l'accès aux données
+    et les historiques de chat ne sont initialisés qu'une fois, au premier message.
+    """
+    global _instance, _instance_pid
+    if _instance is None or _instance_pid != os.getpid():
+        with _instance_lock:
+            if _instance is None or _instance_pid != os.getpid():
+                _instance = BizzioGemini()
+                _instance_pid = os.getpid()
+    return _instance
+
+
 # Interface simple pour tester la première fonctionnalité
 def main():
     """
@@ -0,0 +1,302 @@
+# Routeur d'intentions du Data Analyst Bizzio : une normalisation, un seul passage sur le message
+
+import re
+from functools import lru_cache
+from typing import Dict, Any, Iterable
+
+# ========================================
+# LEXIQUES (correspondance par sous-chaîne, comme les anciens classifieurs is_*)
+# ========================================
+
+CAPABILITY_PHRASES = [
+    'qui es tu', 'qui êtes vous', 'ton nom', 'votre nom', 'bizzio',
+    'que peux tu faire', 'que pouvez vous faire', 'tes capacités', 'vos capacités',
+    'tes compétences', 'vos compétences', 'tes fonctions', 'vos fonctions',
+    'aide moi', 'peux tu m aider', 'pouvez vous m aider',
+    'que sais tu faire', 'que savez vous faire', 'tes services', 'vos services',
+    'présente toi', 'présentez vous', 'raconte moi', 'racontez moi',
+    'comment tu t\'appelle', 'comment tu t\'appelles'
+]
+
+EDUCATIONAL_KEYWORDS = [
+    'qu\'est-ce que', 'qu\'est ce que', 'c\'est quoi',
+    'explique', 'définis', 'définition', 'concept', 'notion',
+    'business intelligence', 'bi', 'nlp', 'traitement du langage',
+    'data analysis', 'analyse de données', 'kpi', 'tableau de bord',
+    'reporting', 'statistiques', 'machine learning', 'ia', 'intelligence artificielle',
+    'chatbot', 'conversationnel', 'gestion commerciale', 'crm', 'erp'
+]
+
+TOP_KEYWORDS = [
+    'top', 'meilleur', 'meilleurs', 'meilleure', 'meilleures',
+    'classement', 'ranking', 'premier', 'premiers', 'première', 'premières',
+    'plus vendu', 'plus vendus', 'plus vendue', 'plus vendues',
+    'mieux vendu', 'mieux vendus', 'mieux vendue', 'mieux vendues',
+    'populaire', 'populaires', 'favori', 'favoris', 'favorite', 'favorites'
+]
+
+TOP_PATTERNS = [
+    r'top \d+', r'meilleur \d+', r'meilleurs \d+', r'premier \d+', r'premiers \d+',
+    r'\d+ meilleur', r'\d+ meilleurs', r'\d+ premier', r'\d+ premiers'
+]
+
+EXPORT_KEYWORDS = [
+    'excel', 'csv', 'export', 'exporter', 'tableau', 'fichier',
+    'télécharger', 'download', 'liste complète', 'liste complete',
+    'visualisation', 'graphique', 'chart', 'graph', 'diagramme',
+    'exporte', 'génère', 'genere', 'crée', 'cree', 'fais'
+]
+
+PRICE_KEYWORDS = [
+    'prix', 'price', 'coût', 'cout', 'tarif', 'combien',
+    'quel est le prix', 'combien coûte', 'combien coute',
+    'prix de', 'prix du', 'prix de la', 'prix des',
+    'donne moi le prix', 'donne-moi le prix', 'montre moi le prix',
+    'montre-moi le prix', 'affiche le prix', 'affiche-moi le prix'
+]
+
+ARTICLE_KEYWORDS = [
+    'article', 'articles', 'produit', 'produits', 'livre', 'livres',
+    'fourniture', 'fournitures', 'service', 'services',
+    'formation', 'formations', 'chimie', 'chemistry', 'oxford',
+    'advanced', 'physics', 'math', 'mathematics', 'economics',
+    'geography', 'histoire', 'français', 'anglais', 'allemand'
+]
+
+MULTIPLE_PRICE_PATTERNS = [
+    r'prix de \d+ articles?', r'prix des \d+ articles?', r'\d+ articles?.*prix', r'prix.*\d+ articles?'
+]
+
+CATALOGUE_KEYWORDS = [
+    'produits', 'articles', 'catalogue', 'prestations',
+    'plus vendus', 'meilleurs', 'top', 'performance',
+    'revenus', 'génère', 'rentabilité', 'catégorie',
+    'répartition', 'évolution', 'mensuel', 'tendance',
+    'offres', 'explosé', 'croissance', 'trimestre',
+    'ventes', 'chiffre', 'ca', 'business', 'commercial',
+    'marché', 'client', 'achat', 'commande',
+    'products', 'items', 'best-selling', 'top-performing',
+    'category', 'categories', 'revenue', 'sales',
+    'month', 'quarter', 'offers', 'market',
+    'purchase', 'order', 'selling', 'profit'
+]
+
+CATALOGUE_PREFIXES = (
+    'quels sont nos', 'donne-moi les', 'montre-moi',
+    'quelle prestation', 'comment sont', 'comment évolue',
+    'quels produits', 'quelles prestations', 'nos meilleurs',
+    'top de', 'classement', 'ranking', 'stats', 'statistiques',
+    'what are our', 'show me the', 'which category',
+    'what are the', 'top 10', 'best-selling', 'our best',
+    'ranking of', 'stats on', 'data on', 'analysis of'
+)
+
+CATALOGUE_PATTERNS = [
+    'top.*items', 'best.*products', 'category.*perform',
+    'top.*offers', 'quarter.*performance', 'month.*top',
+    'nos.*plus', 'meilleurs.*', 'classement.*',
+    'stats.*', 'data.*', 'analysis.*'
+]
+
+DATA_KEYWORDS = [
+    'données', 'analyse', 'statistiques', 'rapport', 'kpi',
+    'métriques', 'performance', 'ventes', 'chiffre', 'ca',
+    'business', 'commercial', 'clients', 'produits', 'articles',
+    'prestations', 'revenus', 'rentabilité', 'croissance',
+    'tendance', 'évolution', 'comparaison', 'segmentation',
+    'data', 'analysis', 'statistics', 'report',
+    'metrics', 'sales', 'revenue', 'products', 'items', 'services',
+    'profit', 'growth', 'trend', 'evolution', 'comparison',
+    # Questions data analyst (ancienne seconde liste)
+    'stats'
+]
+
+PURE_GREETINGS = {
+    'yo', 'hey', 'hi', 'salut', 'coucou', 'hello',
+    'bonjour', 'bonsoir', 'bonne soirée', 'bon après-midi',
+    'good morning', 'good afternoon', 'good evening',
+    'ça va', 'comment ça va', 'how are you', 'how are you doing'
+}
+
+TECHNICAL_TERMS = [
+    'sql', 'python', 'r', 'pandas', 'numpy', 'matplotlib', 'seaborn',
+    'regression', 'correlation', 'variance', 'standard deviation',
+    'machine learning', 'ai', 'algorithm', 'model', 'prediction',
+    'database', 'query', 'join', 'index', 'optimization', 'performance'
+]
+
+ADVANCED_TERMS = [
+    'neural network', 'deep learning', 'tensorflow', 'pytorch',
+    'clustering', 'classification', 'feature engineering',
+    'cross-validation', 'hyperparameter', 'gradient descent',
+    'api', 'microservices', 'docker', 'kubernetes', 'scalability'
+]
+
+VAGUE_MESSAGES = {
+    'ça', 'ça va', 'comment', 'quoi', 'hein', 'ok', 'oui', 'non',
+    'help', 'help me', 'je sais pas', 'je ne comprends pas',
+    'explique', 'comment faire', 'que faire',
+    'analyse', 'données', 'data', 'chiffres'
+}
+
+ENGLISH_WORDS = [
+    'hello', 'hi', 'hey', 'how', 'what', 'where', 'when', 'why', 'good', 'morning', 'afternoon',
+    'evening', 'thanks', 'thank you', 'show me', 'give me', 'can you', 'please'
+]
+
+FRENCH_WORDS = [
+    'salut', 'bonjour', 'bonsoir', 'comment', 'quoi', 'où', 'quand', 'pourquoi', 'merci', 'matin',
+    'après-midi', 'soir', 'montre', 'donne', 'peux', 'peut', 'liste', 'complet', 'articles',
+    'prestations', 'prix', 'performance', 'analyse', 'données', 'business', 'ventes', 'clients'
+]
+
+FRENCH_MARKERS = [
+    'montre-moi', 'donne-moi', 'peux-tu', 'peut-il', 'liste complète', 'articles', 'prestations',
+    'prix', 'performance'
+]
+
+LEXICONS = {
+    'capabilities': CAPABILITY_PHRASES,
+    'educational': EDUCATIONAL_KEYWORDS,
+    'top': TOP_KEYWORDS,
+    'export': EXPORT_KEYWORDS,
+    'price': PRICE_KEYWORDS,
+    'article': ARTICLE_KEYWORDS,
+    'catalogue': CATALOGUE_KEYWORDS,
+    'data': DATA_KEYWORDS,
+    'technical': TECHNICAL_TERMS,
+    'advanced': ADVANCED_TERMS,
+    'english': ENGLISH_WORDS,
+    'french': FRENCH_WORDS,
+    'french_marker': FRENCH_MARKERS,
+}
+
+# Ordre de priorité des intentions (le premier drapeau vrai l'emporte)
+INTENT_ORDER = [
+    'greeting', 'capabilities', 'educational', 'top', 'export',
+    'article_price', 'catalogue', 'data_analyst'
+]
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Expression régulière arborescente (préfixes communs factorisés) reconnaissant le plus long
+    des mots qui commence à la position courante.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class IntentRouter:
+    """
+    Classifieur compilé : tous les lexiques sont fusionnés dans une seule expression
+    (arbre de préfixes, en anticipation pour capter les occurrences qui se chevauchent).
+    Le message est mis en minuscules une fois et parcouru une fois ; chaque mot trouvé
+    donne aussi les mots du lexique qui en sont des préfixes, ce qui reproduit exactement
+    la sémantique « mot in message » des anciens classifieurs.
+
+    route() renvoie l'intention gagnante et les caractéristiques (langue, niveau technique,
+    besoin de clarification, drapeaux). Le résultat est mémorisé par message : les handlers
+    qui redemandent la langue ou un drapeau du même message ne refont pas l'analyse.
+    Le dictionnaire renvoyé est partagé et ne doit pas être modifié.
+    """
+
+    def __init__(self, lexicons: Dict[str, list] = None, cache_size: int = 256):
+        lexicons = lexicons or LEXICONS
+        self.labels_by_word = {}
+        for label, words in lexicons.items():
+            for word in words:
+                self.labels_by_word.setdefault(word, set()).add(label)
+
+        words = sorted(self.labels_by_word)
+        self.scanner = re.compile('(?=(' + _trie_pattern(words) + '))')
+        # Mot le plus long trouvé à une position → (label, mot) de tous ses préfixes présents dans les lexiques
+        self.expansions = {
+            word: tuple((label, prefix) for prefix in words if word.startswith(prefix)
+                        for label in self.labels_by_word[prefix])
+            for word in words
+        }
+        self.top_pattern = re.compile('|'.join(TOP_PATTERNS))
+        self.multiple_price_pattern = re.compile('|'.join(MULTIPLE_PRICE_PATTERNS))
+        self.catalogue_pattern = re.compile('|'.join(CATALOGUE_PATTERNS))
+        self.route = lru_cache(maxsize=cache_size)(self._route)
+
+    def scan(self, message_lower: str) -> Dict[str, set]:
+        """Mots de chaque lexique contenus dans le message (un seul passage)"""
+        hits = {}
+        for word in set(self.scanner.findall(message_lower)):
+            for label, prefix in self.expansions[word]:
+                hits.setdefault(label, set()).add(prefix)
+        return hits
+
+    def _route(self, message: str) -> Dict[str, Any]:
+        lower = message.lower()
+        stripped = lower.strip()
+        hits = self.scan(lower)
+
+        words = stripped.split()
+        greeting = stripped in PURE_GREETINGS or (len(words) <= 2 and any(w in PURE_GREETINGS for w in words))
+
+        flags = {
+            'greeting': greeting,
+            'capabilities': 'capabilities' in hits,
+            'educational': 'educational' in hits,
+            'top': 'top' in hits or bool(self.top_pattern.search(stripped)),
+            'export': 'export' in hits,
+            'article_price': 'price' in hits and (
+                'article' in hits or bool(self.multiple_price_pattern.search(stripped))
+            ),
+            'catalogue': 'catalogue' in hits or lower.startswith(CATALOGUE_PREFIXES)
+                         or bool(self.catalogue_pattern.search(lower)),
+            'data_analyst': 'data' in hits,
+        }
+        intent = next((name for name in INTENT_ORDER if flags[name]), 'off_topic')
+
+        advanced_count = len(hits.get('advanced', ()))
+        technical_count = len(hits.get('technical', ()))
+        if advanced_count >= 2:
+            technical_level = 'expert'
+        elif technical_count >= 2 or advanced_count >= 1:
+            technical_level = 'intermediate'
+        else:
+            technical_level = 'beginner'
+
+        if 'french_marker' in hits:
+            language = 'fr'
+        else:
+            english_count = len(hits.get('english', ()))
+            french_count = len(hits.get('french', ()))
+            language = 'en' if english_count > french_count else 'fr'
+
+        return {
+            'intent': intent,
+            'language': language,
+            'technical_level': technical_level,
+            'needs_clarification': len(stripped) < 5 or stripped in VAGUE_MESSAGES,
+            'flags': flags,
+            'keywords': hits,
+        }
+
+
+_router = None
+
+
+def get_router() -> IntentRouter:
+    """Routeur partagé (compilé une fois par processus)"""
+    global _router
+    if _router is None:
+        _router = IntentRouter()
+    return _router
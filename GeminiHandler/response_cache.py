@@ -0,0 +1,177 @@
+# Cache des réponses du Data Analyst pour les intentions déterministes
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    from .article_index import normalize_text
+except ImportError:
+    from article_index import normalize_text
+
+CACHE_TTL = int(os.getenv('BIZZIO_CACHE_TTL', '600'))
+CACHE_MAX_ENTRIES = int(os.getenv('BIZZIO_CACHE_MAX_ENTRIES', '500'))
+# Intervalle minimal entre deux lectures des versions de données (table analyst_versions, app/db/analyst_cache.sql)
+VERSION_CHECK_INTERVAL = int(os.getenv('BIZZIO_CACHE_VERSION_CHECK', '10'))
+
+SCOPES = ('articles', 'ventes')
+
+
+class DataVersions:
+    """
+    Versions courantes des données ('articles', 'ventes'), lues au plus toutes les
+    `check_interval` secondes : entre deux lectures, le cache ne touche pas à Postgres.
+    Sans la table installée, les versions valent None et seul le TTL s'applique.
+    """
+
+    def __init__(self, connection_factory, check_interval: int = VERSION_CHECK_INTERVAL):
+        self.connection_factory = connection_factory
+        self.check_interval = check_interval
+        self._versions = {}
+        self._checked_at = 0.0
+        self._available = True
+        self._lock = threading.Lock()
+
+    def _fetch(self) -> Dict[str, int]:
+        conn = self.connection_factory() if self.connection_factory else None
+        if conn is None:
+            return {}
+        try:
+            cur = conn.cursor()
+            # Compteurs incrémentés au commit des écritures (jamais en avance sur les données)
+            cur.execute("SELECT scope, version FROM analyst_versions WHERE scope = ANY(%s)", [list(SCOPES)])
+            versions = dict(cur.fetchall())
+            cur.close()
+            return versions
+        except Exception as e:
+            conn.rollback()
+            if self._available:
+                print(f"⚠️ Versions des données indisponibles (install-analyst-cache ?) : {e}")
+            self._available = False
+            return {}
+        finally:
+            conn.close()
+
+    def current(self) -> Dict[str, int]:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._versions
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.check_interval:
+                self._versions = self._fetch()
+                self._checked_at = time.monotonic()
+            return self._versions
+
+    def refresh(self):
+        """Relire les versions au prochain accès (après une écriture faite par ce processus)"""
+        self._checked_at = 0.0
+
+
+class ResponseCache:
+    """
+    Cache LRU à TTL des résultats d'intentions déterministes (top articles, prix d'un article,
+    données et analyses catalogue).
+
+    Clé : intention + paramètres normalisés. Chaque entrée retient la version des données
+    dont elle dépend (`scopes`) : si une écriture sur ces tables a eu lieu depuis, l'entrée
+    est périmée même avant l'expiration du TTL. Les compteurs hits / misses / stales /
+    evictions par intention sont exposés par stats().
+    """
+
+    def __init__(self, versions: DataVersions, ttl: int = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES):
+        self.versions = versions
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    @staticmethod
+    def make_key(intent: str, *params) -> Tuple:
+        """Clé normalisée : les chaînes sont mises en minuscules, sans accents ni ponctuation"""
+        normalized = tuple(normalize_text(p) if isinstance(p, str) else p for p in params)
+        return (intent,) + normalized
+
+    def _count(self, intent: str, metric: str):
+        counters = self._metrics.setdefault(intent, {'hits': 0, 'misses': 0, 'stales': 0, 'stores': 0, 'evictions': 0})
+        counters[metric] += 1
+
+    def _version_of(self, scopes) -> Tuple:
+        current = self.versions.current() if self.versions else {}
+        return tuple(current.get(scope) for scope in scopes)
+
+    def get(self, key: Tuple, scopes=SCOPES):
+        """
+        (True, valeur, version) si une entrée fraîche existe, sinon (False, None, version).
+        `version` est celle des données au moment de la lecture : une valeur calculée après
+        un échec est rangée sous cette version (put(..., version=version)), pas sous celle
+        relue après le calcul, qui peut déjà refléter une écriture que le calcul n'a pas vue.
+        """
+        intent = key[0]
+        version = self._version_of(scopes)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(intent, 'misses')
+                return False, None, version
+            value, entry_version, expires_at = entry
+            if entry_version != version or time.monotonic() >= expires_at:
+                del self._entries[key]
+                self._count(intent, 'stales')
+                self._count(intent, 'misses')
+                return False, None, version
+            self._entries.move_to_end(key)
+            self._count(intent, 'hits')
+            return True, value, version
+
+    def put(self, key: Tuple, value: Any, scopes=SCOPES, ttl: Optional[int] = None, version: Optional[Tuple] = None):
+        """Ranger une valeur sous `version` (celle renvoyée par get() avant le calcul), à défaut la version courante"""
+        if version is None:
+            version = self._version_of(scopes)
+        with self._lock:
+            self._entries[key] = (value, version, time.monotonic() + (ttl or self.ttl))
+            self._entries.move_to_end(key)
+            self._count(key[0], 'stores')
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._count(evicted[0], 'evictions')
+
+    def get_or_compute(self, key: Tuple, compute: Callable[[], Any], scopes=SCOPES,
+                       cacheable: Callable[[Any], bool] = None):
+        """Valeur en cache ou calculée puis mise en cache (si `cacheable(valeur)` l'autorise)"""
+        found, value, version = self.get(key, scopes)
+        if found:
+            return value
+        value = compute()
+        if cacheable is None or cacheable(value):
+            self.put(key, value, scopes, version=version)
+        return value
+
+    def invalidate(self, intent: Optional[str] = None):
+        """Vider le cache (ou les entrées d'une intention)"""
+        with self._lock:
+            if intent is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == intent]:
+                    del self._entries[key]
+        if self.versions:
+            self.versions.refresh()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            intents = {intent: dict(counters) for intent, counters in self._metrics.items()}
+            size = len(self._entries)
+        hits = sum(c['hits'] for c in intents.values())
+        misses = sum(c['misses'] for c in intents.values())
+        return {
+            'entries': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            'intents': intents
+        }
@@ -5,6 +5,11 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_session import Session
 from flask_mail import Mail, Message
 from jinja2 import ChoiceLoader, FileSystemLoader
+import db_pool
+import pdf_renderer
+import notification_hub
+import audit_writer
+import reference_cache
 
 
 # Initialisation de l'application Flask
@@ -36,6 +41,21 @@ mail = Mail(app)
 # Initialiser les dossiers nécessaires pour la production
 config[env].init_app(app)
 
+# Pool de connexions psycopg2 partagé par routes, routes_admin, auth et GeminiHandler
+db_pool.init_app(app)
+
+# Rendu PDF hors requête (pool de processus) + cache disque des documents
+pdf_renderer.init_app(app)
+
+# Notifications poussées (LISTEN/NOTIFY → SSE), compteurs non lus en mémoire par worker
+notification_hub.init_app(app)
+
+# Journal d'actions + notifications écrits par lots hors des requêtes (file bornée, vidée à l'arrêt)
+audit_writer.init_app(app)
+
+# Listes de référence du catalogue en mémoire (TTL + invalidation LISTEN/NOTIFY entre workers)
+reference_cache.init_app(app)
+
 # Initialisation de SQLAlchemy
 try:
     db = SQLAlchemy(app)
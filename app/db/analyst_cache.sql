@@ -0,0 +1,72 @@
+-- ========================================
+-- VERSIONS DES DONNÉES (CACHE DU DATA ANALYST)
+-- ========================================
+-- Un compteur par domaine dans analyst_versions, incrémenté au commit des écritures :
+--   articles : articles, prix_fournitures_ville
+--   ventes   : proformas, proforma_articles, factures, facture_articles
+-- Le cache de réponses de GeminiHandler (response_cache.py) compare la version lue
+-- à celle de l'entrée en cache.
+-- Triggers de contrainte DEFERRABLE INITIALLY DEFERRED : l'incrément a lieu en fin de
+-- transaction, une seule fois par domaine, sur une ligne visible des autres sessions
+-- seulement au commit. Une nouvelle version n'est donc jamais lue avant les données
+-- qu'elle couvre, et le verrou de la ligne n'est tenu que le temps du commit.
+-- Installation : python app/db/maintenance.py install-analyst-cache
+
+CREATE TABLE IF NOT EXISTS analyst_versions (
+    scope TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO analyst_versions (scope) VALUES ('articles'), ('ventes')
+ON CONFLICT (scope) DO NOTHING;
+
+-- Anciennes versions : séquences incrémentées dans la transaction (visibles avant le commit)
+DROP SEQUENCE IF EXISTS analyst_version_articles;
+DROP SEQUENCE IF EXISTS analyst_version_ventes;
+
+CREATE OR REPLACE FUNCTION fn_bump_analyst_version()
+RETURNS trigger AS $$
+BEGIN
+    -- Une fois par domaine et par transaction (réglage local à la transaction)
+    IF current_setting('bizzio.analyst_bumped_' || TG_ARGV[0], true) IS DISTINCT FROM '1' THEN
+        UPDATE analyst_versions SET version = version + 1 WHERE scope = TG_ARGV[0];
+        PERFORM set_config('bizzio.analyst_bumped_' || TG_ARGV[0], '1', true);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_articles_analyst_version ON articles;
+CREATE CONSTRAINT TRIGGER trg_articles_analyst_version
+AFTER INSERT OR UPDATE OR DELETE ON articles
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION fn_bump_analyst_version('articles');
+
+DROP TRIGGER IF EXISTS trg_prix_fournitures_analyst_version ON prix_fournitures_ville;
+CREATE CONSTRAINT TRIGGER trg_prix_fournitures_analyst_version
+AFTER INSERT OR UPDATE OR DELETE ON prix_fournitures_ville
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION fn_bump_analyst_version('articles');
+
+DROP TRIGGER IF EXISTS trg_proformas_analyst_version ON proformas;
+CREATE CONSTRAINT TRIGGER trg_proformas_analyst_version
+AFTER INSERT OR UPDATE OR DELETE ON proformas
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION fn_bump_analyst_version('ventes');
+
+DROP TRIGGER IF EXISTS trg_proforma_articles_analyst_version ON proforma_articles;
+CREATE CONSTRAINT TRIGGER trg_proforma_articles_analyst_version
+AFTER INSERT OR UPDATE OR DELETE ON proforma_articles
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION fn_bump_analyst_version('ventes');
+
+DROP TRIGGER IF EXISTS trg_factures_analyst_version ON factures;
+CREATE CONSTRAINT TRIGGER trg_factures_analyst_version
+AFTER INSERT OR UPDATE OR DELETE ON factures
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION fn_bump_analyst_version('ventes');
+
+DROP TRIGGER IF EXISTS trg_facture_articles_analyst_version ON facture_articles;
+CREATE CONSTRAINT TRIGGER trg_facture_articles_analyst_version
+AFTER INSERT OR UPDATE OR DELETE ON facture_articles
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION fn_bump_analyst_version('ventes');
@@ -0,0 +1,42 @@
+-- ========================================
+-- RECHERCHE D'ARTICLES (TRIGRAMMES + PLEIN TEXTE)
+-- ========================================
+-- Colonnes générées sur articles, indexées en GIN :
+--   search_text   : designation + code + nature + classe, en minuscules et sans accents
+--                   (LIKE '%terme%' et similarité de mots via pg_trgm)
+--   search_vector : même contenu en tsvector français pondéré
+--                   (designation/code > nature > classe)
+-- Requêtes construites par query_filters.article_search_sql (une seule requête classée,
+-- partagée par /admin/api/articles/search, /api/articles et l'export du catalogue).
+-- Installation : python app/db/maintenance.py install-article-search
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() n'est que STABLE (dictionnaire modifiable) : enveloppe IMMUTABLE
+-- à dictionnaire explicite, utilisable dans une colonne générée et un index
+CREATE OR REPLACE FUNCTION f_unaccent(TEXT)
+RETURNS TEXT AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1);
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS search_text TEXT
+    GENERATED ALWAYS AS (
+        lower(f_unaccent(
+            designation || ' ' || code || ' ' ||
+            COALESCE(nature, '') || ' ' || COALESCE(classe, '')
+        ))
+    ) STORED;
+
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('french'::regconfig, f_unaccent(designation)), 'A') ||
+        setweight(to_tsvector('simple'::regconfig, f_unaccent(code)), 'A') ||
+        setweight(to_tsvector('french'::regconfig, f_unaccent(COALESCE(nature, ''))), 'B') ||
+        setweight(to_tsvector('french'::regconfig, f_unaccent(COALESCE(classe, ''))), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_articles_search_trgm ON articles USING GIN (search_text gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_articles_search_vector ON articles USING GIN (search_vector);
+
+ANALYZE articles;
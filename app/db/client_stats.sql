@@ -0,0 +1,207 @@
+-- ========================================
+-- STATISTIQUES PAR CLIENT (MAINTENUES PAR TRIGGERS)
+-- ========================================
+-- Une ligne par client ayant au moins une commande terminée/partielle
+-- (proformas 'termine'/'terminé'/'partiel' + factures de mêmes statuts) :
+--   nb_commandes, montant_total_paye, premiere_commande, derniere_commande, actif
+-- Lue en O(1) par client par le répertoire, l'historique client et le reporting admin.
+-- Prérequis : proforma_totals.sql (les montants des proformas en dépendent).
+-- Installation : python app/db/maintenance.py install-client-stats
+-- Reconstruction complète : python app/db/maintenance.py rebuild-client-stats
+-- Drapeau actif (fenêtre glissante) : python app/db/maintenance.py refresh-client-activity
+
+-- client_id TEXT : même type que clients.client_id, proformas.client_id et factures.client_id
+CREATE TABLE IF NOT EXISTS client_stats (
+    client_id TEXT PRIMARY KEY REFERENCES clients(client_id) ON DELETE CASCADE,
+    nb_commandes INT NOT NULL DEFAULT 0,
+    montant_total_paye NUMERIC NOT NULL DEFAULT 0,
+    premiere_commande DATE,
+    derniere_commande DATE,
+    actif BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_client_stats_montant ON client_stats(montant_total_paye DESC);
+CREATE INDEX IF NOT EXISTS idx_client_stats_derniere ON client_stats(derniere_commande);
+
+-- Fenêtre d'activité par défaut (même valeur que le graphique actifs/inactifs de l'admin)
+CREATE OR REPLACE FUNCTION client_stats_activity_window()
+RETURNS INTERVAL AS $$
+    SELECT INTERVAL '3 months';
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Versions INT d'une installation antérieure (signatures différentes : CREATE OR REPLACE ne les remplace pas)
+DROP FUNCTION IF EXISTS refresh_client_stats(INT);
+DROP FUNCTION IF EXISTS client_stats_source(INT);
+
+-- Commandes terminées/partielles par client (proformas + factures), éventuellement restreintes à un client
+CREATE OR REPLACE FUNCTION client_stats_source(p_client_id TEXT DEFAULT NULL)
+RETURNS TABLE (
+    client_id TEXT,
+    nb_commandes INT,
+    montant_total_paye NUMERIC,
+    premiere_commande DATE,
+    derniere_commande DATE
+) AS $$
+    SELECT s.client_id,
+           SUM(s.nb)::INT,
+           COALESCE(SUM(s.montant), 0),
+           MIN(s.premiere),
+           MAX(s.derniere)
+    FROM (
+        SELECT p.client_id,
+               COUNT(*) AS nb,
+               SUM(COALESCE(pt.total_articles, 0) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)) AS montant,
+               MIN(p.date_creation)::DATE AS premiere,
+               MAX(p.date_creation)::DATE AS derniere
+        FROM proformas p
+        LEFT JOIN proforma_totals pt ON pt.proforma_id = p.proforma_id
+        WHERE p.etat IN ('termine', 'terminé', 'partiel')
+          AND p.client_id IS NOT NULL
+          AND (p_client_id IS NULL OR p.client_id = p_client_id)
+        GROUP BY p.client_id
+
+        UNION ALL
+
+        SELECT f.client_id,
+               COUNT(*),
+               SUM(COALESCE(f.montant_total, 0)),
+               MIN(f.date_facture)::DATE,
+               MAX(f.date_facture)::DATE
+        FROM factures f
+        WHERE f.statut IN ('termine', 'terminé', 'partiel')
+          AND f.client_id IS NOT NULL
+          AND (p_client_id IS NULL OR f.client_id = p_client_id)
+        GROUP BY f.client_id
+    ) s
+    GROUP BY s.client_id;
+$$ LANGUAGE sql STABLE;
+
+-- Recalcul d'un client
+CREATE OR REPLACE FUNCTION refresh_client_stats(p_client_id TEXT)
+RETURNS VOID AS $$
+BEGIN
+    IF p_client_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM client_stats cs
+    WHERE cs.client_id = p_client_id
+      AND NOT EXISTS (SELECT 1 FROM client_stats_source(p_client_id));
+
+    INSERT INTO client_stats (client_id, nb_commandes, montant_total_paye,
+                              premiere_commande, derniere_commande, actif, updated_at)
+    SELECT s.client_id, s.nb_commandes, s.montant_total_paye,
+           s.premiere_commande, s.derniere_commande,
+           COALESCE(s.derniere_commande >= CURRENT_DATE - client_stats_activity_window(), FALSE),
+           CURRENT_TIMESTAMP
+    FROM client_stats_source(p_client_id) s
+    JOIN clients c ON c.client_id = s.client_id
+    ON CONFLICT (client_id) DO UPDATE
+    SET nb_commandes = EXCLUDED.nb_commandes,
+        montant_total_paye = EXCLUDED.montant_total_paye,
+        premiere_commande = EXCLUDED.premiere_commande,
+        derniere_commande = EXCLUDED.derniere_commande,
+        actif = EXCLUDED.actif,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reconstruction complète (backfill)
+CREATE OR REPLACE FUNCTION rebuild_client_stats()
+RETURNS INT AS $$
+DECLARE
+    nb_lignes INT;
+BEGIN
+    DELETE FROM client_stats;
+
+    INSERT INTO client_stats (client_id, nb_commandes, montant_total_paye,
+                              premiere_commande, derniere_commande, actif, updated_at)
+    SELECT s.client_id, s.nb_commandes, s.montant_total_paye,
+           s.premiere_commande, s.derniere_commande,
+           COALESCE(s.derniere_commande >= CURRENT_DATE - client_stats_activity_window(), FALSE),
+           CURRENT_TIMESTAMP
+    FROM client_stats_source() s
+    JOIN clients c ON c.client_id = s.client_id;
+
+    GET DIAGNOSTICS nb_lignes = ROW_COUNT;
+    RETURN nb_lignes;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drapeau actif : seules les lignes qui changent d'état sont mises à jour (tâche planifiée)
+CREATE OR REPLACE FUNCTION refresh_client_activity()
+RETURNS INT AS $$
+DECLARE
+    nb_lignes INT;
+BEGIN
+    UPDATE client_stats
+    SET actif = COALESCE(derniere_commande >= CURRENT_DATE - client_stats_activity_window(), FALSE),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE actif IS DISTINCT FROM COALESCE(derniere_commande >= CURRENT_DATE - client_stats_activity_window(), FALSE);
+
+    GET DIAGNOSTICS nb_lignes = ROW_COUNT;
+    RETURN nb_lignes;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger : proformas (client, statut, montants, date)
+CREATE OR REPLACE FUNCTION fn_proformas_client_stats()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_client_stats(OLD.client_id);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.client_id IS DISTINCT FROM OLD.client_id) THEN
+        PERFORM refresh_client_stats(NEW.client_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_proformas_client_stats ON proformas;
+CREATE TRIGGER trg_proformas_client_stats
+AFTER INSERT OR UPDATE OF client_id, etat, frais, remise, date_creation OR DELETE ON proformas
+FOR EACH ROW EXECUTE FUNCTION fn_proformas_client_stats();
+
+-- Trigger : factures (client, statut, montant, date)
+CREATE OR REPLACE FUNCTION fn_factures_client_stats()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_client_stats(OLD.client_id);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.client_id IS DISTINCT FROM OLD.client_id) THEN
+        PERFORM refresh_client_stats(NEW.client_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_factures_client_stats ON factures;
+CREATE TRIGGER trg_factures_client_stats
+AFTER INSERT OR UPDATE OF client_id, statut, montant_total, date_facture OR DELETE ON factures
+FOR EACH ROW EXECUTE FUNCTION fn_factures_client_stats();
+
+-- Trigger : totaux d'articles d'une proforma (maintenus par proforma_totals.sql)
+CREATE OR REPLACE FUNCTION fn_proforma_totals_client_stats()
+RETURNS trigger AS $$
+DECLARE
+    v_proforma_id INT;
+BEGIN
+    v_proforma_id := CASE WHEN TG_OP = 'DELETE' THEN OLD.proforma_id ELSE NEW.proforma_id END;
+    PERFORM refresh_client_stats(p.client_id)
+    FROM proformas p
+    WHERE p.proforma_id = v_proforma_id
+      AND p.etat IN ('termine', 'terminé', 'partiel');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_proforma_totals_client_stats ON proforma_totals;
+CREATE TRIGGER trg_proforma_totals_client_stats
+AFTER INSERT OR UPDATE OF total_articles OR DELETE ON proforma_totals
+FOR EACH ROW EXECUTE FUNCTION fn_proforma_totals_client_stats();
+
+-- Backfill initial
+SELECT rebuild_client_stats();
@@ -0,0 +1,47 @@
+-- ========================================
+-- INDEX COMPOSITES / COUVRANTS POUR LES FILTRES DE PÉRIODE
+-- ========================================
+-- Les filtres de date sont émis sous forme de plages (query_filters.date_range_conditions) :
+--   p.date_creation >= '2025-01-01' AND p.date_creation < '2026-01-01'
+-- et peuvent donc utiliser la dernière colonne des index ci-dessous.
+-- Créés avec CONCURRENTLY (pas de verrou d'écriture) : une instruction par transaction.
+-- Application : python app/db/maintenance.py install-indexes
+-- Vérification des plans : python app/db/maintenance.py verify-query-plans
+
+-- Listes filtrées par ville + statut + période (reporting, exports)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_proformas_ville_etat_date
+    ON proformas(ville, etat, date_creation);
+
+-- Listes d'un agent (/api/proformas/filter, exports agent) triées par date
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_proformas_ville_agent_date
+    ON proformas(ville, cree_par, date_creation DESC);
+
+-- Filtres de période seuls (toutes villes)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_proformas_date
+    ON proformas(date_creation);
+
+-- Historique client
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_proformas_client
+    ON proformas(client_id);
+
+-- Lignes d'une proforma : couvrant pour les jointures vers articles
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_proforma_articles_proforma
+    ON proforma_articles(proforma_id) INCLUDE (article_id, quantite);
+
+-- Factures filtrées par ville + statut + période
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_factures_ville_statut_date
+    ON factures(ville, statut, date_facture);
+
+-- Lignes d'une facture
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_facture_articles_facture
+    ON facture_articles(facture_id);
+
+-- Pagination par curseur (clés de tri des listes : date + identifiant, nom + identifiant)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_proformas_keyset
+    ON proformas(date_creation DESC, proforma_id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_factures_keyset
+    ON factures((COALESCE(date_facture, DATE '0001-01-01')) DESC, facture_id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_clients_nom_keyset
+    ON clients((COALESCE(nom, '')), client_id);
@@ -0,0 +1,414 @@
+import argparse
+import gzip
+import json
+import re
+import sys
+import psycopg2
+from datetime import date
+from psycopg2 import sql
+from pathlib import Path
+from dotenv import load_dotenv
+import os
+
+# Charger les variables d'environnement
+load_dotenv()
+DATABASE_URL = os.getenv("DATABASE_URL")
+if not DATABASE_URL:
+    raise ValueError("❌ DATABASE_URL manquant dans le fichier .env")
+
+DB_DIR = Path(__file__).resolve().parent
+BASE_DIR = DB_DIR.parents[1]
+
+# Modules partagés avec l'application (query_filters)
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+from query_filters import date_range_conditions
+
+def get_connection():
+    return psycopg2.connect(DATABASE_URL)
+
+def apply_sql_file(filename):
+    """Appliquer un fichier SQL de app/db en une seule transaction (fonctions $$ comprises)"""
+    sql_file = DB_DIR / filename
+    if not sql_file.exists():
+        raise FileNotFoundError(f"❌ Fichier SQL introuvable : {sql_file}")
+
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(sql_file.read_text(encoding="utf-8"))
+        print(f"✅ {filename} appliqué")
+    finally:
+        conn.close()
+
+def apply_sql_statements(filename):
+    """Appliquer un fichier SQL instruction par instruction hors transaction (CREATE INDEX CONCURRENTLY)"""
+    sql_file = DB_DIR / filename
+    if not sql_file.exists():
+        raise FileNotFoundError(f"❌ Fichier SQL introuvable : {sql_file}")
+
+    statements = [
+        stmt.strip() for stmt in sql_file.read_text(encoding="utf-8").split(";")
+        if stmt.strip() and not all(line.strip().startswith("--") for line in stmt.strip().splitlines())
+    ]
+
+    conn = get_connection()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for stmt in statements:
+                cur.execute(stmt)
+        print(f"✅ {filename} appliqué ({len(statements)} instructions)")
+    finally:
+        conn.close()
+
+def representative_queries():
+    """
+    Requêtes filtrées typiques (mêmes prédicats que les routes) pour la vérification des plans,
+    avec la colonne qui doit être servie par un index : (libellé, requête, paramètres, (table, colonne))
+    """
+    annee = 2025
+    proforma_dates, proforma_params = date_range_conditions("p.date_creation", annee=annee)
+    facture_dates, facture_params = date_range_conditions("f.date_facture", annee=annee)
+    mois_dates, mois_params = date_range_conditions("p.date_creation", annee=annee, mois=3)
+
+    return [
+        (
+            "proformas agent + année (/api/proformas/filter)",
+            f"""SELECT p.proforma_id FROM proformas p
+                WHERE p.ville = %s AND p.cree_par = %s AND {' AND '.join(proforma_dates)}
+                ORDER BY p.date_creation DESC LIMIT 20""",
+            ["Dakar", 1] + proforma_params,
+            ("proformas", "date_creation"),
+        ),
+        (
+            "proformas ville + statut + année (reporting)",
+            f"""SELECT p.proforma_id FROM proformas p
+                WHERE p.ville = %s AND p.etat IN ('termine', 'terminé', 'partiel') AND {' AND '.join(proforma_dates)}""",
+            ["Dakar"] + proforma_params,
+            ("proformas", "date_creation"),
+        ),
+        (
+            "proformas toutes villes + mois",
+            f"SELECT p.proforma_id FROM proformas p WHERE {' AND '.join(mois_dates)}",
+            mois_params,
+            ("proformas", "date_creation"),
+        ),
+        (
+            "factures ville + statut + année",
+            f"""SELECT f.facture_id FROM factures f
+                WHERE f.ville = %s AND f.statut IN ('termine', 'partiel') AND {' AND '.join(facture_dates)}""",
+            ["Dakar"] + facture_params,
+            ("factures", "date_facture"),
+        ),
+        (
+            "lignes d'une proforma",
+            """SELECT pa.article_id, pa.quantite FROM proforma_articles pa WHERE pa.proforma_id = %s""",
+            [1],
+            ("proforma_articles", "proforma_id"),
+        ),
+    ]
+
+def find_seq_scans(plan, tables):
+    """Parcourir un plan EXPLAIN (FORMAT JSON) et lister les Seq Scan sur les tables surveillées"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in tables:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(find_seq_scans(child, tables))
+    return found
+
+def find_index_conditions(plan, table):
+    """Conditions d'index (Index Cond, ou Recheck Cond d'un Bitmap Heap Scan) appliquées à une table"""
+    found = []
+    if plan.get("Relation Name") == table:
+        found.extend(plan[key] for key in ("Index Cond", "Recheck Cond") if plan.get(key))
+    for child in plan.get("Plans", []):
+        found.extend(find_index_conditions(child, table))
+    return found
+
+def verify_query_plans():
+    """
+    Vérifier que les filtres de période restent indexables.
+    enable_seqscan = off : le planificateur ne garde un Seq Scan que si aucun index n'est utilisable
+    (prédicat non sargable ou index manquant), indépendamment du volume de données.
+    L'absence de Seq Scan ne suffit pas (un Index Scan sur un autre index filtre la date ligne à
+    ligne) : la colonne attendue doit apparaître dans une Index Cond / Recheck Cond de sa table.
+    """
+    watched = {"proformas", "factures", "proforma_articles"}
+    failures = 0
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET enable_seqscan = off")
+            for label, query, params, (table, column) in representative_queries():
+                cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                seq_scans = find_seq_scans(plan[0]["Plan"], watched)
+                conditions = find_index_conditions(plan[0]["Plan"], table)
+                if seq_scans:
+                    failures += 1
+                    print(f"❌ {label} : Seq Scan sur {', '.join(sorted(set(seq_scans)))}")
+                elif not any(re.search(rf"\b{column}\b", cond) for cond in conditions):
+                    failures += 1
+                    print(f"❌ {label} : {table}.{column} absent des conditions d'index ({'; '.join(conditions) or 'aucune'})")
+                else:
+                    print(f"✅ {label}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+    if failures:
+        raise SystemExit(1)
+
+def rebuild_proforma_totals():
+    """Recalculer entièrement la table proforma_totals"""
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT rebuild_proforma_totals()")
+                nb = cur.fetchone()[0]
+        print(f"✅ proforma_totals reconstruite : {nb} proformas")
+    finally:
+        conn.close()
+
+def refresh_sales_rollup():
+    """Intégrer dans les agrégats de ventes les jours marqués par les triggers (tâche planifiée)"""
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT refresh_sales_rollup_dirty()")
+                nb = cur.fetchone()[0]
+        if nb < 0:
+            print("⏭️ Rafraîchissement déjà en cours dans un autre processus")
+        else:
+            print(f"✅ Agrégats de ventes rafraîchis : {nb} jour(s)")
+    finally:
+        conn.close()
+
+def rebuild_sales_rollup():
+    """Recalculer entièrement sales_daily_facts et sales_monthly_clients"""
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT rebuild_sales_rollup()")
+                nb = cur.fetchone()[0]
+        print(f"✅ Agrégats de ventes reconstruits : {nb} lignes journalières")
+    finally:
+        conn.close()
+
+def rebuild_client_stats():
+    """Recalculer entièrement la table client_stats"""
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT rebuild_client_stats()")
+                nb = cur.fetchone()[0]
+        print(f"✅ client_stats reconstruite : {nb} clients")
+    finally:
+        conn.close()
+
+def refresh_client_activity():
+    """Mettre à jour le drapeau actif des clients (fenêtre glissante, tâche planifiée)"""
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT refresh_client_activity()")
+                nb = cur.fetchone()[0]
+        print(f"✅ Activité clients rafraîchie : {nb} client(s) modifié(s)")
+    finally:
+        conn.close()
+
+# Tables partitionnées par mois (partitions.sql) : (colonne de partition, identifiant)
+PARTITIONED_TABLES = {
+    "logs_actions": ("timestamp", "log_id"),
+    "notifications": ("created_at", "notif_id"),
+}
+# Mois conservés en base (mois courant compris) avant archivage
+RETENTION_MONTHS = {
+    "logs_actions": int(os.getenv("LOGS_RETENTION_MONTHS", 12)),
+    "notifications": int(os.getenv("NOTIFS_RETENTION_MONTHS", 6)),
+}
+ARCHIVE_DIR = Path(os.getenv("PARTITION_ARCHIVE_DIR", BASE_DIR / "archives"))
+
+def ensure_partitions():
+    """Créer les partitions du mois courant et des 3 suivants (tâche planifiée)"""
+    conn = get_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                for table in PARTITIONED_TABLES:
+                    cur.execute("SELECT ensure_monthly_partitions(%s)", [table])
+                    nb = cur.fetchone()[0]
+                    print(f"✅ {table} : {nb} partition(s) créée(s)")
+    finally:
+        conn.close()
+
+def list_monthly_partitions(cur, table):
+    """Partitions <table>_pAAAAMM attachées, avec le premier jour de leur mois"""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY c.relname
+    """, [table])
+    partitions = []
+    for (name,) in cur.fetchall():
+        match = re.fullmatch(rf"{table}_p(\d{{4}})(\d{{2}})", name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return partitions
+
+# Attente maximale du verrou de la table parente au détachement : au-delà, les insertions
+# (logs, notifications, audit_writer) attendraient derrière la demande de verrou
+ARCHIVE_LOCK_TIMEOUT = os.getenv("PARTITION_ARCHIVE_LOCK_TIMEOUT", "5s")
+
+def list_detached_partitions(cur, table):
+    """Partitions <table>_pAAAAMM détachées mais pas encore supprimées (archivage interrompu)"""
+    cur.execute("""
+        SELECT c.relname FROM pg_class c
+        WHERE c.relkind = 'r' AND c.relname ~ %s
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)
+        ORDER BY c.relname
+    """, [rf"^{table}_p\d{{6}}$"])
+    return [name for (name,) in cur.fetchall()]
+
+def detach_partition(conn, table, partition):
+    """
+    Détacher une partition dans une transaction courte : verrou de la table parente pris
+    en premier (même ordre que les écritures, parent puis partition), borné par
+    ARCHIVE_LOCK_TIMEOUT. Les lignes détachées ne sont plus visibles ni modifiables par
+    l'application. Renvoie la borne de la partition (pour la rattacher en cas d'échec).
+    DETACH ... CONCURRENTLY n'est pas utilisable : les tables ont une partition par défaut.
+    """
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT set_config('lock_timeout', %s, true)", [ARCHIVE_LOCK_TIMEOUT])
+            cur.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(sql.Identifier(table)))
+            cur.execute("SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE oid = %s::regclass", [partition])
+            bound = cur.fetchone()[0]
+            cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                sql.Identifier(table), sql.Identifier(partition)))
+            if table == "notifications":
+                # Compteurs non lus relus par les workers (notification_hub)
+                cur.execute("SELECT pg_notify('bizzio_notifications', %s)", [json.dumps({"event": "archived"})])
+    return bound
+
+def reattach_partition(conn, table, partition, bound):
+    """Remettre en place une partition détachée dont l'export a échoué"""
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} ").format(
+                sql.Identifier(table), sql.Identifier(partition)) + sql.SQL(bound))
+            if table == "notifications":
+                cur.execute("SELECT pg_notify('bizzio_notifications', %s)", [json.dumps({"event": "archived"})])
+
+def archive_partition(conn, table, partition, attached=True):
+    """
+    Exporter une partition en JSONL compressé puis la supprimer (une fois le fichier complet sur disque).
+    La partition est d'abord détachée (transaction courte) : l'export lit une table que plus
+    personne n'écrit, sans tenir de verrou sur logs_actions / notifications.
+    """
+    _, id_column = PARTITIONED_TABLES[table]
+    target_dir = ARCHIVE_DIR / table
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target = target_dir / f"{partition}.jsonl.gz"
+    tmp = target_dir / f"{partition}.jsonl.gz.tmp"
+
+    bound = detach_partition(conn, table, partition) if attached else None
+    try:
+        exported = 0
+        with conn:
+            with conn.cursor(name=f"archive_{partition}") as cur:
+                cur.itersize = 5000
+                cur.execute(sql.SQL("SELECT row_to_json(t)::text FROM {} t ORDER BY {}").format(
+                    sql.Identifier(partition), sql.Identifier(id_column)))
+                with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                    for (line,) in cur:
+                        f.write(line + "\n")
+                        exported += 1
+                    f.flush()
+                    os.fsync(f.fileno())
+        os.replace(tmp, target)
+    except Exception:
+        if bound is not None:
+            reattach_partition(conn, table, partition, bound)
+        raise
+
+    with conn:
+        with conn.cursor() as cur:
+            if table == "notifications":
+                cur.execute(sql.SQL(
+                    "DELETE FROM notification_reads WHERE notif_id IN (SELECT notif_id FROM {})"
+                ).format(sql.Identifier(partition)))
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(partition)))
+    return target, exported
+
+def archive_partitions():
+    """Archiver (JSONL.gz dans PARTITION_ARCHIVE_DIR) puis supprimer les partitions au-delà de la rétention"""
+    today = date.today()
+    conn = get_connection()
+    try:
+        for table in PARTITIONED_TABLES:
+            # Premier mois conservé : mois courant moins (rétention - 1)
+            months = today.year * 12 + today.month - 1 - (RETENTION_MONTHS[table] - 1)
+            cutoff = date(months // 12, months % 12 + 1, 1)
+            with conn:
+                with conn.cursor() as cur:
+                    partitions = list_monthly_partitions(cur, table)
+                    leftovers = list_detached_partitions(cur, table)
+            for partition in leftovers:
+                target, exported = archive_partition(conn, table, partition, attached=False)
+                print(f"✅ {partition} (détachée) archivée : {exported} ligne(s) → {target}")
+            expired = [name for name, month in partitions if month < cutoff]
+            if not expired:
+                print(f"⏭️ {table} : aucune partition antérieure à {cutoff:%Y-%m}")
+                continue
+            for partition in expired:
+                target, exported = archive_partition(conn, table, partition)
+                print(f"✅ {partition} archivée : {exported} ligne(s) → {target}")
+    finally:
+        conn.close()
+
+COMMANDS = {
+    "install-proforma-totals": lambda args: apply_sql_file("proforma_totals.sql"),
+    "rebuild-proforma-totals": lambda args: rebuild_proforma_totals(),
+    "install-sales-rollup": lambda args: apply_sql_file("sales_rollup.sql"),
+    "refresh-sales-rollup": lambda args: refresh_sales_rollup(),
+    "rebuild-sales-rollup": lambda args: rebuild_sales_rollup(),
+    "install-indexes": lambda args: apply_sql_statements("indexes.sql"),
+    "install-article-search": lambda args: apply_sql_file("article_search.sql"),
+    "install-analyst-cache": lambda args: apply_sql_file("analyst_cache.sql"),
+    "install-client-stats": lambda args: apply_sql_file("client_stats.sql"),
+    "install-notification-watermarks": lambda args: apply_sql_file("notification_watermarks.sql"),
+    "rebuild-client-stats": lambda args: rebuild_client_stats(),
+    "refresh-client-activity": lambda args: refresh_client_activity(),
+    "verify-query-plans": lambda args: verify_query_plans(),
+    "install-partitions": lambda args: apply_sql_file("partitions.sql"),
+    "ensure-partitions": lambda args: ensure_partitions(),
+    "archive-partitions": lambda args: archive_partitions(),
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance des tables dérivées Bizzio")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+
+    try:
+        COMMANDS[args.command](args)
+    except psycopg2.Error as e:
+        print(f"❌ Erreur PostgreSQL: {e}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+-- ========================================
+-- LECTURE DES NOTIFICATIONS PAR FILIGRANE (WATERMARK)
+-- ========================================
+-- notification_watermarks : pour chaque utilisateur et portée ('global', ou 'city' + ville),
+-- toutes les notifications créées jusqu'à last_read_at sont lues.
+-- notification_reads ne garde plus que les exceptions au-dessus du filigrane :
+--   lecture individuelle (read_at) ou notification masquée par l'utilisateur (hidden).
+-- Non lues = deux comptages de plage sur les index partiels ci-dessous (index-only)
+--            moins les exceptions de l'utilisateur au-dessus du filigrane.
+-- Installation : python app/db/maintenance.py install-notification-watermarks
+-- Ré-exécutable : recalcule les filigranes et compacte à nouveau notification_reads.
+
+CREATE TABLE IF NOT EXISTS notification_watermarks (
+    user_id INT NOT NULL REFERENCES utilisateurs(user_id) ON DELETE CASCADE,
+    scope TEXT NOT NULL CHECK (scope IN ('global','city')),
+    ville TEXT NOT NULL DEFAULT '',  -- '' pour la portée globale
+    last_read_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, scope, ville)
+);
+
+ALTER TABLE notification_reads ADD COLUMN IF NOT EXISTS hidden BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_notifs_global_created
+    ON notifications(created_at) INCLUDE (actor_user_id) WHERE scope = 'global';
+CREATE INDEX IF NOT EXISTS idx_notifs_city_created
+    ON notifications(ville, created_at) INCLUDE (actor_user_id) WHERE scope = 'city';
+
+-- ----------------------------------------
+-- Compactage des lectures existantes
+-- ----------------------------------------
+-- Filigrane = juste avant la plus ancienne notification visible non lue
+-- (ou la plus récente notification de la portée si tout est lu).
+-- GREATEST : un filigrane déjà posé n'est jamais reculé.
+
+INSERT INTO notification_watermarks (user_id, scope, ville, last_read_at)
+SELECT w.user_id, 'global', '', w.last_read_at
+FROM (
+    SELECT u.user_id,
+           COALESCE(
+               (SELECT MIN(n.created_at) - INTERVAL '1 microsecond'
+                  FROM notifications n
+                 WHERE n.scope = 'global' AND n.actor_user_id <> u.user_id
+                   AND NOT EXISTS (
+                       SELECT 1 FROM notification_reads r
+                        WHERE r.notif_id = n.notif_id AND r.user_id = u.user_id AND r.read_at IS NOT NULL
+                   )),
+               (SELECT MAX(n.created_at) FROM notifications n WHERE n.scope = 'global')
+           ) AS last_read_at
+      FROM utilisateurs u
+     WHERE EXISTS (SELECT 1 FROM notification_reads r WHERE r.user_id = u.user_id)
+) w
+WHERE w.last_read_at IS NOT NULL
+ON CONFLICT (user_id, scope, ville)
+DO UPDATE SET last_read_at = GREATEST(notification_watermarks.last_read_at, EXCLUDED.last_read_at);
+
+INSERT INTO notification_watermarks (user_id, scope, ville, last_read_at)
+SELECT w.user_id, 'city', w.ville, w.last_read_at
+FROM (
+    SELECT u.user_id, u.ville,
+           COALESCE(
+               (SELECT MIN(n.created_at) - INTERVAL '1 microsecond'
+                  FROM notifications n
+                 WHERE n.scope = 'city' AND n.ville = u.ville AND n.actor_user_id <> u.user_id
+                   AND NOT EXISTS (
+                       SELECT 1 FROM notification_reads r
+                        WHERE r.notif_id = n.notif_id AND r.user_id = u.user_id AND r.read_at IS NOT NULL
+                   )),
+               (SELECT MAX(n.created_at) FROM notifications n WHERE n.scope = 'city' AND n.ville = u.ville)
+           ) AS last_read_at
+      FROM utilisateurs u
+     WHERE u.ville IS NOT NULL AND u.ville <> ''
+       AND EXISTS (SELECT 1 FROM notification_reads r WHERE r.user_id = u.user_id)
+) w
+WHERE w.last_read_at IS NOT NULL
+ON CONFLICT (user_id, scope, ville)
+DO UPDATE SET last_read_at = GREATEST(notification_watermarks.last_read_at, EXCLUDED.last_read_at);
+
+-- Lectures couvertes par un filigrane : inutiles (les masquages sont conservés)
+DELETE FROM notification_reads r
+ USING notifications n, notification_watermarks w
+ WHERE n.notif_id = r.notif_id
+   AND w.user_id = r.user_id
+   AND NOT r.hidden
+   AND ((n.scope = 'global' AND w.scope = 'global')
+        OR (n.scope = 'city' AND w.scope = 'city' AND w.ville = n.ville))
+   AND n.created_at <= w.last_read_at;
+
+ANALYZE notification_reads;
+ANALYZE notification_watermarks;
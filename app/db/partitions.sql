@@ -0,0 +1,174 @@
+-- ========================================
+-- PARTITIONNEMENT MENSUEL : logs_actions, notifications
+-- ========================================
+-- Une partition par mois (<table>_pAAAAMM) sur logs_actions."timestamp" et
+-- notifications.created_at, plus une partition <table>_default qui reçoit les
+-- lignes d'un mois sans partition (elles y sont reprises à sa création).
+-- Les requêtes bornées par date (filigranes de lecture, liste récente) ne lisent
+-- que les partitions concernées ; les mois anciens sont archivés en JSONL
+-- compressé puis supprimés :
+--   python app/db/maintenance.py install-partitions     (conversion des tables existantes)
+--   python app/db/maintenance.py ensure-partitions      (tâche planifiée : mois courant + 3)
+--   python app/db/maintenance.py archive-partitions     (export + suppression au-delà de la rétention)
+--
+-- Clés primaires (log_id, "timestamp") et (notif_id, created_at) : la clé de
+-- partition doit en faire partie. notification_reads ne peut donc plus référencer
+-- notifications ; ses lignes sont supprimées avec la partition archivée.
+-- Ré-exécutable : les tables déjà partitionnées ne sont pas reconverties.
+
+CREATE OR REPLACE FUNCTION partition_key_column(p_table TEXT)
+RETURNS TEXT AS $$
+    SELECT CASE p_table
+        WHEN 'logs_actions' THEN 'timestamp'
+        WHEN 'notifications' THEN 'created_at'
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Créer la partition du mois de p_month (lignes du mois reprises de la partition par défaut)
+CREATE OR REPLACE FUNCTION ensure_monthly_partition(p_table TEXT, p_month DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+    v_start DATE := date_trunc('month', p_month)::date;
+    v_end DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    v_name TEXT := p_table || '_p' || to_char(p_month, 'YYYYMM');
+    v_key TEXT := partition_key_column(p_table);
+BEGIN
+    IF v_key IS NULL THEN
+        RAISE EXCEPTION 'Table non partitionnée : %', p_table;
+    END IF;
+    IF to_regclass(v_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name, p_table);
+    IF to_regclass(p_table || '_default') IS NOT NULL THEN
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+            p_table || '_default', v_key, v_start, v_key, v_end, v_name
+        );
+    END IF;
+    -- Les index du parent sont créés sur la partition à l'attachement
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', p_table, v_name, v_start, v_end);
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions des mois présents dans la partition par défaut, puis du mois courant à +p_months_ahead
+CREATE OR REPLACE FUNCTION ensure_monthly_partitions(p_table TEXT, p_months_ahead INT DEFAULT 3)
+RETURNS INT AS $$
+DECLARE
+    v_month DATE;
+    v_created INT := 0;
+BEGIN
+    IF to_regclass(p_table || '_default') IS NOT NULL THEN
+        FOR v_month IN EXECUTE format(
+            'SELECT DISTINCT date_trunc(''month'', %I)::date FROM %I',
+            partition_key_column(p_table), p_table || '_default'
+        ) LOOP
+            IF ensure_monthly_partition(p_table, v_month) THEN
+                v_created := v_created + 1;
+            END IF;
+        END LOOP;
+    END IF;
+
+    FOR v_month IN
+        SELECT generate_series(date_trunc('month', CURRENT_DATE),
+                               date_trunc('month', CURRENT_DATE) + make_interval(months => p_months_ahead),
+                               INTERVAL '1 month')::date
+    LOOP
+        IF ensure_monthly_partition(p_table, v_month) THEN
+            v_created := v_created + 1;
+        END IF;
+    END LOOP;
+    RETURN v_created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Convertir une table existante : copie dans une table partitionnée de mêmes colonnes
+CREATE OR REPLACE FUNCTION convert_to_monthly_partitions(p_table TEXT, p_id_column TEXT)
+RETURNS BIGINT AS $$
+DECLARE
+    v_key TEXT := partition_key_column(p_table);
+    v_legacy TEXT := p_table || '_legacy';
+    v_seq TEXT;
+    v_first DATE;
+    v_month DATE;
+    v_fk RECORD;
+    v_rows BIGINT;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = p_table::regclass) = 'p' THEN
+        RETURN 0;  -- déjà partitionnée
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', p_table, v_legacy);
+    v_seq := pg_get_serial_sequence(v_legacy, p_id_column);
+    -- Date inconnue : rangée au premier jour du plus ancien mois réel (archivée en premier),
+    -- sans créer de partitions pour les mois vides qui la précéderaient
+    EXECUTE format('SELECT date_trunc(''month'', MIN(%I))::date FROM %I WHERE %I IS NOT NULL', v_key, v_legacy, v_key)
+        INTO v_first;
+    v_first := COALESCE(v_first, date_trunc('month', CURRENT_DATE)::date);
+    EXECUTE format('UPDATE %I SET %I = %L WHERE %I IS NULL', v_legacy, v_key, v_first, v_key);
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (%I)',
+                   p_table, v_legacy, v_key);
+    EXECUTE format('ALTER TABLE %I ALTER COLUMN %I SET NOT NULL', p_table, v_key);
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', p_table || '_default', p_table);
+
+    FOR v_month IN
+        SELECT generate_series(v_first::timestamptz,
+                               date_trunc('month', CURRENT_DATE),
+                               INTERVAL '1 month')::date
+    LOOP
+        PERFORM ensure_monthly_partition(p_table, v_month);
+    END LOOP;
+
+    EXECUTE format('INSERT INTO %I SELECT * FROM %I', p_table, v_legacy);
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+
+    -- La séquence de l'identifiant suit la nouvelle table ; les clés étrangères vers
+    -- l'ancienne (notification_reads) sont retirées avant sa suppression
+    IF v_seq IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.%I', v_seq, p_table, p_id_column);
+    END IF;
+    FOR v_fk IN
+        SELECT conrelid::regclass AS tbl, conname FROM pg_constraint
+         WHERE confrelid = v_legacy::regclass AND contype = 'f'
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', v_fk.tbl, v_fk.conname);
+    END LOOP;
+    EXECUTE format('DROP TABLE %I', v_legacy);
+
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (%I, %I)', p_table, p_id_column, v_key);
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT convert_to_monthly_partitions('logs_actions', 'log_id');
+SELECT convert_to_monthly_partitions('notifications', 'notif_id');
+
+-- Clés étrangères et index recréés sur les tables partitionnées (propagés aux partitions)
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'logs_actions'::regclass AND conname = 'logs_actions_user_id_fkey') THEN
+        ALTER TABLE logs_actions ADD CONSTRAINT logs_actions_user_id_fkey
+            FOREIGN KEY (user_id) REFERENCES utilisateurs(user_id);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = 'notifications'::regclass AND conname = 'notifications_actor_user_id_fkey') THEN
+        ALTER TABLE notifications ADD CONSTRAINT notifications_actor_user_id_fkey
+            FOREIGN KEY (actor_user_id) REFERENCES utilisateurs(user_id);
+    END IF;
+END $$;
+
+CREATE INDEX IF NOT EXISTS idx_logs_actions_timestamp ON logs_actions("timestamp");
+CREATE INDEX IF NOT EXISTS idx_logs_actions_cible ON logs_actions(cible_type, cible_id, "timestamp");
+CREATE INDEX IF NOT EXISTS idx_notifs_created_at ON notifications(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_notifs_global_created
+    ON notifications(created_at) INCLUDE (actor_user_id) WHERE scope = 'global';
+CREATE INDEX IF NOT EXISTS idx_notifs_city_created
+    ON notifications(ville, created_at) INCLUDE (actor_user_id) WHERE scope = 'city';
+
+SELECT ensure_monthly_partitions('logs_actions');
+SELECT ensure_monthly_partitions('notifications');
+
+ANALYZE logs_actions;
+ANALYZE notifications;
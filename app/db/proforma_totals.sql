@@ -0,0 +1,133 @@
+-- ========================================
+-- TOTAUX PAR PROFORMA (MAINTENUS PAR TRIGGERS)
+-- ========================================
+-- Remplace le calcul répété de
+--   (SELECT SUM(pa.quantite * a.prix) FROM proforma_articles pa JOIN articles a ... WHERE pa.proforma_id = p.proforma_id)
+-- par une lecture par clé primaire :
+--   (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id)
+-- Une proforma sans article n'a pas de ligne (même résultat NULL que le SUM d'origine).
+-- Reconstruction complète : python app/db/maintenance.py rebuild-proforma-totals
+
+CREATE TABLE IF NOT EXISTS proforma_totals (
+    proforma_id INT PRIMARY KEY REFERENCES proformas(proforma_id) ON DELETE CASCADE,
+    total_articles BIGINT,
+    quantite_totale BIGINT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Utilisé par le trigger de changement de prix
+CREATE INDEX IF NOT EXISTS idx_proforma_articles_article ON proforma_articles(article_id);
+
+-- Recalcul d'une proforma
+CREATE OR REPLACE FUNCTION refresh_proforma_total(p_proforma_id INT)
+RETURNS VOID AS $$
+BEGIN
+    IF p_proforma_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- Recalculs d'une même proforma l'un après l'autre : sans ce verrou, deux transactions
+    -- ajoutant des lignes calculent chacune la somme sur leur instantané et la dernière
+    -- validée écrase l'autre. Après l'attente, les requêtes suivantes voient les lignes
+    -- validées entre-temps (nouvel instantané par requête en READ COMMITTED).
+    -- NO KEY UPDATE : compatible avec le FOR KEY SHARE de la clé étrangère de
+    -- proforma_articles, déjà tenu par chaque transaction qui vient d'insérer une ligne.
+    PERFORM 1 FROM proformas WHERE proforma_id = p_proforma_id FOR NO KEY UPDATE;
+
+    IF NOT EXISTS (SELECT 1 FROM proforma_articles WHERE proforma_id = p_proforma_id)
+       OR NOT EXISTS (SELECT 1 FROM proformas WHERE proforma_id = p_proforma_id) THEN
+        DELETE FROM proforma_totals WHERE proforma_id = p_proforma_id;
+        RETURN;
+    END IF;
+
+    INSERT INTO proforma_totals (proforma_id, total_articles, quantite_totale, updated_at)
+    SELECT pa.proforma_id,
+           SUM(pa.quantite * a.prix),
+           SUM(pa.quantite),
+           CURRENT_TIMESTAMP
+    FROM proforma_articles pa
+    LEFT JOIN articles a ON a.article_id = pa.article_id
+    WHERE pa.proforma_id = p_proforma_id
+    GROUP BY pa.proforma_id
+    ON CONFLICT (proforma_id) DO UPDATE
+    SET total_articles = EXCLUDED.total_articles,
+        quantite_totale = EXCLUDED.quantite_totale,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reconstruction complète (backfill)
+CREATE OR REPLACE FUNCTION rebuild_proforma_totals()
+RETURNS INT AS $$
+DECLARE
+    nb_lignes INT;
+BEGIN
+    DELETE FROM proforma_totals;
+
+    INSERT INTO proforma_totals (proforma_id, total_articles, quantite_totale, updated_at)
+    SELECT pa.proforma_id,
+           SUM(pa.quantite * a.prix),
+           SUM(pa.quantite),
+           CURRENT_TIMESTAMP
+    FROM proforma_articles pa
+    JOIN proformas p ON p.proforma_id = pa.proforma_id
+    LEFT JOIN articles a ON a.article_id = pa.article_id
+    GROUP BY pa.proforma_id;
+
+    GET DIAGNOSTICS nb_lignes = ROW_COUNT;
+    RETURN nb_lignes;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger : lignes de proforma ajoutées / modifiées / supprimées
+CREATE OR REPLACE FUNCTION fn_proforma_articles_totals()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_proforma_total(OLD.proforma_id);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.proforma_id IS DISTINCT FROM OLD.proforma_id) THEN
+        PERFORM refresh_proforma_total(NEW.proforma_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_proforma_articles_totals ON proforma_articles;
+CREATE TRIGGER trg_proforma_articles_totals
+AFTER INSERT OR UPDATE OF proforma_id, article_id, quantite OR DELETE ON proforma_articles
+FOR EACH ROW EXECUTE FUNCTION fn_proforma_articles_totals();
+
+-- Trigger : changement de prix d'un article (les totaux utilisent le prix courant)
+CREATE OR REPLACE FUNCTION fn_articles_prix_totals()
+RETURNS trigger AS $$
+BEGIN
+    -- Mêmes verrous que refresh_proforma_total, pris dans l'ordre des identifiants
+    PERFORM 1 FROM proformas
+     WHERE proforma_id IN (SELECT proforma_id FROM proforma_articles WHERE article_id = NEW.article_id)
+     ORDER BY proforma_id
+       FOR NO KEY UPDATE;
+
+    UPDATE proforma_totals pt
+    SET total_articles = s.total_articles,
+        updated_at = CURRENT_TIMESTAMP
+    FROM (
+        SELECT pa.proforma_id, SUM(pa.quantite * a.prix) AS total_articles
+        FROM proforma_articles pa
+        LEFT JOIN articles a ON a.article_id = pa.article_id
+        WHERE pa.proforma_id IN (SELECT proforma_id FROM proforma_articles WHERE article_id = NEW.article_id)
+        GROUP BY pa.proforma_id
+    ) s
+    WHERE pt.proforma_id = s.proforma_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_articles_prix_totals ON articles;
+CREATE TRIGGER trg_articles_prix_totals
+AFTER UPDATE OF prix ON articles
+FOR EACH ROW WHEN (OLD.prix IS DISTINCT FROM NEW.prix)
+EXECUTE FUNCTION fn_articles_prix_totals();
+
+-- Backfill initial
+SELECT rebuild_proforma_totals();
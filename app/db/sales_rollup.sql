@@ -0,0 +1,308 @@
+-- ========================================
+-- AGRÉGATS DE VENTES (REPORTING ADMIN)
+-- ========================================
+-- Faits journaliers jour × ville × agent × type_article × source (proforma/facture).
+-- type_article = '*' : toutes prestations confondues. Pour un type donné, une commande
+-- compte pour son montant complet dès qu'elle contient au moins un article de ce type
+-- (même règle que le filtre EXISTS des requêtes d'origine).
+-- Les clients distincts ne s'additionnent pas : ils sont gardés au grain mensuel.
+-- Ville/agent absents : '' et 0 (les colonnes de clé primaire ne peuvent pas être NULL).
+--
+-- Les triggers ne font que marquer les jours modifiés dans sales_rollup_dirty ;
+-- refresh_sales_rollup_dirty() les intègre (lecture reporting + tâche planifiée) :
+--   python app/db/maintenance.py refresh-sales-rollup
+--   python app/db/maintenance.py rebuild-sales-rollup
+
+CREATE TABLE IF NOT EXISTS sales_daily_facts (
+    jour DATE NOT NULL,
+    ville TEXT NOT NULL DEFAULT '',
+    agent_id INT NOT NULL DEFAULT 0,
+    type_article TEXT NOT NULL DEFAULT '*',
+    source TEXT CHECK (source IN ('proforma', 'facture')) NOT NULL,
+    nb_ventes INT NOT NULL DEFAULT 0,
+    chiffre_affaires BIGINT NOT NULL DEFAULT 0,
+    articles BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (jour, ville, agent_id, type_article, source)
+);
+
+CREATE TABLE IF NOT EXISTS sales_monthly_clients (
+    mois DATE NOT NULL,
+    ville TEXT NOT NULL DEFAULT '',
+    agent_id INT NOT NULL DEFAULT 0,
+    type_article TEXT NOT NULL DEFAULT '*',
+    source TEXT CHECK (source IN ('proforma', 'facture')) NOT NULL,
+    client_id TEXT NOT NULL,
+    PRIMARY KEY (mois, ville, agent_id, type_article, source, client_id)
+);
+
+CREATE TABLE IF NOT EXISTS sales_rollup_dirty (
+    jour DATE PRIMARY KEY,
+    marked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_sales_daily_facts_type_jour ON sales_daily_facts(type_article, jour);
+CREATE INDEX IF NOT EXISTS idx_sales_monthly_clients_type_mois ON sales_monthly_clients(type_article, mois);
+
+-- Commandes vendues (terminées/partielles) d'une période, déclinées par dimension
+CREATE OR REPLACE FUNCTION sales_rollup_source(p_debut DATE, p_fin DATE)
+RETURNS TABLE (
+    jour DATE,
+    ville TEXT,
+    agent_id INT,
+    type_article TEXT,
+    source TEXT,
+    client_id TEXT,
+    ca BIGINT,
+    articles BIGINT
+) AS $$
+    WITH commandes AS (
+        SELECT p.date_creation AS jour,
+               COALESCE(p.ville, '') AS ville,
+               COALESCE(p.cree_par, 0) AS agent_id,
+               'proforma'::text AS source,
+               p.proforma_id AS id,
+               p.client_id,
+               (COALESCE(pt.total_articles, 0) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0))::bigint AS ca,
+               COALESCE(pt.quantite_totale, 0)::bigint AS articles
+        FROM proformas p
+        LEFT JOIN proforma_totals pt ON pt.proforma_id = p.proforma_id
+        WHERE p.etat IN ('termine', 'terminé', 'partiel')
+        AND p.date_creation >= p_debut AND p.date_creation <= p_fin
+
+        UNION ALL
+
+        SELECT f.date_facture,
+               COALESCE(f.ville, ''),
+               COALESCE(f.cree_par, 0),
+               'facture'::text,
+               f.facture_id,
+               f.client_id,
+               COALESCE(f.montant_total, 0)::bigint,
+               0::bigint
+        FROM factures f
+        WHERE f.statut IN ('termine', 'partiel')
+        AND f.date_facture >= p_debut AND f.date_facture <= p_fin
+    ),
+    types AS (
+        SELECT DISTINCT c.source, c.id, a.type_article
+        FROM commandes c
+        JOIN proforma_articles pa ON c.source = 'proforma' AND pa.proforma_id = c.id
+        JOIN articles a ON a.article_id = pa.article_id
+        UNION
+        SELECT DISTINCT c.source, c.id, a.type_article
+        FROM commandes c
+        JOIN facture_articles fa ON c.source = 'facture' AND fa.facture_id = c.id
+        JOIN articles a ON a.article_id = fa.article_id
+    )
+    SELECT c.jour, c.ville, c.agent_id, '*'::text, c.source, c.client_id, c.ca, c.articles
+    FROM commandes c
+    UNION ALL
+    SELECT c.jour, c.ville, c.agent_id, t.type_article, c.source, c.client_id, c.ca, c.articles
+    FROM commandes c
+    JOIN types t ON t.source = c.source AND t.id = c.id
+$$ LANGUAGE sql STABLE;
+
+-- Recalcul d'une période (bornes incluses)
+CREATE OR REPLACE FUNCTION refresh_sales_rollup(p_debut DATE, p_fin DATE)
+RETURNS VOID AS $$
+DECLARE
+    v_mois_debut DATE := date_trunc('month', p_debut)::date;
+    v_mois_fin DATE := (date_trunc('month', p_fin) + INTERVAL '1 month - 1 day')::date;
+BEGIN
+    DELETE FROM sales_daily_facts WHERE jour >= p_debut AND jour <= p_fin;
+
+    INSERT INTO sales_daily_facts (jour, ville, agent_id, type_article, source, nb_ventes, chiffre_affaires, articles)
+    SELECT s.jour, s.ville, s.agent_id, s.type_article, s.source, COUNT(*), SUM(s.ca), SUM(s.articles)
+    FROM sales_rollup_source(p_debut, p_fin) s
+    GROUP BY s.jour, s.ville, s.agent_id, s.type_article, s.source;
+
+    DELETE FROM sales_monthly_clients WHERE mois >= v_mois_debut AND mois <= v_mois_fin;
+
+    INSERT INTO sales_monthly_clients (mois, ville, agent_id, type_article, source, client_id)
+    SELECT DISTINCT date_trunc('month', s.jour)::date, s.ville, s.agent_id, s.type_article, s.source, s.client_id
+    FROM sales_rollup_source(v_mois_debut, v_mois_fin) s
+    WHERE s.client_id IS NOT NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Intégration incrémentale des jours marqués. Retourne le nombre de jours traités,
+-- ou -1 si un autre processus est déjà en train de rafraîchir.
+CREATE OR REPLACE FUNCTION refresh_sales_rollup_dirty()
+RETURNS INT AS $$
+DECLARE
+    v_jour DATE;
+    v_mois DATE;
+    v_nb INT := 0;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('sales_rollup')) THEN
+        RETURN -1;
+    END IF;
+
+    CREATE TEMP TABLE IF NOT EXISTS tmp_sales_rollup_dirty (jour DATE) ON COMMIT DROP;
+    TRUNCATE tmp_sales_rollup_dirty;
+    WITH pris AS (DELETE FROM sales_rollup_dirty RETURNING jour)
+    INSERT INTO tmp_sales_rollup_dirty SELECT jour FROM pris;
+
+    -- Faits journaliers : jour par jour
+    FOR v_jour IN SELECT DISTINCT jour FROM tmp_sales_rollup_dirty LOOP
+        DELETE FROM sales_daily_facts WHERE jour = v_jour;
+        INSERT INTO sales_daily_facts (jour, ville, agent_id, type_article, source, nb_ventes, chiffre_affaires, articles)
+        SELECT s.jour, s.ville, s.agent_id, s.type_article, s.source, COUNT(*), SUM(s.ca), SUM(s.articles)
+        FROM sales_rollup_source(v_jour, v_jour) s
+        GROUP BY s.jour, s.ville, s.agent_id, s.type_article, s.source;
+        v_nb := v_nb + 1;
+    END LOOP;
+
+    -- Clients distincts : une fois par mois touché
+    FOR v_mois IN SELECT DISTINCT date_trunc('month', jour)::date FROM tmp_sales_rollup_dirty LOOP
+        DELETE FROM sales_monthly_clients WHERE mois = v_mois;
+        INSERT INTO sales_monthly_clients (mois, ville, agent_id, type_article, source, client_id)
+        SELECT DISTINCT v_mois, s.ville, s.agent_id, s.type_article, s.source, s.client_id
+        FROM sales_rollup_source(v_mois, (v_mois + INTERVAL '1 month - 1 day')::date) s
+        WHERE s.client_id IS NOT NULL;
+    END LOOP;
+
+    RETURN v_nb;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Reconstruction complète (backfill)
+CREATE OR REPLACE FUNCTION rebuild_sales_rollup()
+RETURNS INT AS $$
+DECLARE
+    v_debut DATE;
+    v_fin DATE;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('sales_rollup'));
+
+    SELECT LEAST(MIN(d), CURRENT_DATE), GREATEST(MAX(d), CURRENT_DATE) INTO v_debut, v_fin
+    FROM (
+        SELECT date_creation AS d FROM proformas
+        UNION ALL
+        SELECT date_facture FROM factures
+    ) dates;
+
+    DELETE FROM sales_rollup_dirty;
+    DELETE FROM sales_daily_facts;
+    DELETE FROM sales_monthly_clients;
+    PERFORM refresh_sales_rollup(v_debut, v_fin);
+
+    RETURN (SELECT COUNT(*) FROM sales_daily_facts);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ========================================
+-- MARQUAGE DES JOURS MODIFIÉS
+-- ========================================
+CREATE OR REPLACE FUNCTION mark_sales_day_dirty(p_jour DATE)
+RETURNS VOID AS $$
+BEGIN
+    IF p_jour IS NOT NULL THEN
+        -- DO UPDATE (et non DO NOTHING) : le marqueur reste verrouillé jusqu'au commit de
+        -- l'écriture, le DELETE de refresh_sales_rollup_dirty() l'attend au lieu de
+        -- consommer le jour avant que la modification soit visible
+        INSERT INTO sales_rollup_dirty (jour) VALUES (p_jour)
+        ON CONFLICT (jour) DO UPDATE SET marked_at = CURRENT_TIMESTAMP;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_sales_dirty_proformas()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM mark_sales_day_dirty(OLD.date_creation);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM mark_sales_day_dirty(NEW.date_creation);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_sales_dirty_factures()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM mark_sales_day_dirty(OLD.date_facture);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM mark_sales_day_dirty(NEW.date_facture);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_sales_dirty_proforma_articles()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM mark_sales_day_dirty((SELECT date_creation FROM proformas WHERE proforma_id = OLD.proforma_id));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM mark_sales_day_dirty((SELECT date_creation FROM proformas WHERE proforma_id = NEW.proforma_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION fn_sales_dirty_facture_articles()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM mark_sales_day_dirty((SELECT date_facture FROM factures WHERE facture_id = OLD.facture_id));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM mark_sales_day_dirty((SELECT date_facture FROM factures WHERE facture_id = NEW.facture_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Prix ou type d'un article : tous les jours où il a été vendu
+CREATE OR REPLACE FUNCTION fn_sales_dirty_articles()
+RETURNS trigger AS $$
+BEGIN
+    INSERT INTO sales_rollup_dirty (jour)
+    SELECT DISTINCT p.date_creation
+    FROM proforma_articles pa
+    JOIN proformas p ON p.proforma_id = pa.proforma_id
+    WHERE pa.article_id = NEW.article_id AND p.date_creation IS NOT NULL
+    UNION
+    SELECT DISTINCT f.date_facture
+    FROM facture_articles fa
+    JOIN factures f ON f.facture_id = fa.facture_id
+    WHERE fa.article_id = NEW.article_id AND f.date_facture IS NOT NULL
+    ON CONFLICT (jour) DO UPDATE SET marked_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_sales_dirty_proformas ON proformas;
+CREATE TRIGGER trg_sales_dirty_proformas
+AFTER INSERT OR UPDATE OR DELETE ON proformas
+FOR EACH ROW EXECUTE FUNCTION fn_sales_dirty_proformas();
+
+DROP TRIGGER IF EXISTS trg_sales_dirty_factures ON factures;
+CREATE TRIGGER trg_sales_dirty_factures
+AFTER INSERT OR UPDATE OR DELETE ON factures
+FOR EACH ROW EXECUTE FUNCTION fn_sales_dirty_factures();
+
+DROP TRIGGER IF EXISTS trg_sales_dirty_proforma_articles ON proforma_articles;
+CREATE TRIGGER trg_sales_dirty_proforma_articles
+AFTER INSERT OR UPDATE OR DELETE ON proforma_articles
+FOR EACH ROW EXECUTE FUNCTION fn_sales_dirty_proforma_articles();
+
+DROP TRIGGER IF EXISTS trg_sales_dirty_facture_articles ON facture_articles;
+CREATE TRIGGER trg_sales_dirty_facture_articles
+AFTER INSERT OR UPDATE OR DELETE ON facture_articles
+FOR EACH ROW EXECUTE FUNCTION fn_sales_dirty_facture_articles();
+
+DROP TRIGGER IF EXISTS trg_sales_dirty_articles ON articles;
+CREATE TRIGGER trg_sales_dirty_articles
+AFTER UPDATE OF prix, type_article ON articles
+FOR EACH ROW WHEN (OLD.prix IS DISTINCT FROM NEW.prix OR OLD.type_article IS DISTINCT FROM NEW.type_article)
+EXECUTE FUNCTION fn_sales_dirty_articles();
+
+-- Backfill initial
+SELECT rebuild_sales_rollup();
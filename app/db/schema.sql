@@ -1,4 +1,5 @@
 -- Réinitialisation : suppression des tables si elles existent
+DROP TABLE IF EXISTS notification_watermarks CASCADE;
 DROP TABLE IF EXISTS notification_reads CASCADE;
 DROP TABLE IF EXISTS notifications CASCADE;
 DROP TABLE IF EXISTS commandes_articles_historique CASCADE;
@@ -175,9 +176,9 @@ CREATE TABLE IF NOT EXISTS stock (
     date_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- 14. Logs des actions
+-- 14. Logs des actions (partitions mensuelles, voir partitions.sql)
 CREATE TABLE IF NOT EXISTS logs_actions (
-    log_id SERIAL PRIMARY KEY,
+    log_id SERIAL,
     user_id INT REFERENCES utilisateurs(user_id),
     action TEXT,
     cible_id TEXT,
@@ -185,12 +186,14 @@ CREATE TABLE IF NOT EXISTS logs_actions (
     ville TEXT,
     payload_avant JSONB,
     payload_apres JSONB,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (log_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+CREATE TABLE IF NOT EXISTS logs_actions_default PARTITION OF logs_actions DEFAULT;
 
--- 15. Notifications (internes style Facebook)
+-- 15. Notifications (internes style Facebook, partitions mensuelles)
 CREATE TABLE IF NOT EXISTS notifications (
-    notif_id SERIAL PRIMARY KEY,
+    notif_id SERIAL,
     scope TEXT CHECK (scope IN ('global','city')) NOT NULL,
     ville TEXT,
     actor_user_id INT NOT NULL REFERENCES utilisateurs(user_id),
@@ -198,17 +201,30 @@ CREATE TABLE IF NOT EXISTS notifications (
     resource_type TEXT NOT NULL,
     resource_id TEXT,
     message TEXT NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (notif_id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE IF NOT EXISTS notifications_default PARTITION OF notifications DEFAULT;
 
--- 16. Lectures de notifications (qui a lu quoi)
+-- 16. Lectures de notifications : exceptions au-dessus du filigrane (lecture individuelle ou masquage)
+-- Pas de clé étrangère vers notifications (partitionnée) : lignes supprimées à l'archivage
 CREATE TABLE IF NOT EXISTS notification_reads (
-    notif_id INT NOT NULL REFERENCES notifications(notif_id) ON DELETE CASCADE,
+    notif_id INT NOT NULL,
     user_id INT NOT NULL REFERENCES utilisateurs(user_id) ON DELETE CASCADE,
     read_at TIMESTAMP,
+    hidden BOOLEAN NOT NULL DEFAULT FALSE,
     PRIMARY KEY (notif_id, user_id)
 );
 
+-- 17. Filigranes de lecture : tout ce qui est créé jusqu'à last_read_at est lu
+CREATE TABLE IF NOT EXISTS notification_watermarks (
+    user_id INT NOT NULL REFERENCES utilisateurs(user_id) ON DELETE CASCADE,
+    scope TEXT NOT NULL CHECK (scope IN ('global','city')),
+    ville TEXT NOT NULL DEFAULT '',
+    last_read_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, scope, ville)
+);
+
 -- ========================================
 -- INDEX POUR OPTIMISER LES PERFORMANCES
 -- ========================================
@@ -222,14 +238,33 @@ CREATE INDEX idx_commandes_articles_historique ON commandes_articles_historique(
 CREATE INDEX idx_factures_client ON factures(client_id);
 CREATE INDEX idx_factures_date ON factures(date_facture DESC);
 
+-- Index pour les filtres de période (plages de dates, voir indexes.sql)
+CREATE INDEX IF NOT EXISTS idx_proformas_ville_etat_date ON proformas(ville, etat, date_creation);
+CREATE INDEX IF NOT EXISTS idx_proformas_ville_agent_date ON proformas(ville, cree_par, date_creation DESC);
+CREATE INDEX IF NOT EXISTS idx_proformas_date ON proformas(date_creation);
+CREATE INDEX IF NOT EXISTS idx_proformas_client ON proformas(client_id);
+CREATE INDEX IF NOT EXISTS idx_proforma_articles_proforma ON proforma_articles(proforma_id) INCLUDE (article_id, quantite);
+CREATE INDEX IF NOT EXISTS idx_factures_ville_statut_date ON factures(ville, statut, date_facture);
+CREATE INDEX IF NOT EXISTS idx_facture_articles_facture ON facture_articles(facture_id);
+CREATE INDEX IF NOT EXISTS idx_proformas_keyset ON proformas(date_creation DESC, proforma_id DESC);
+CREATE INDEX IF NOT EXISTS idx_factures_keyset ON factures((COALESCE(date_facture, DATE '0001-01-01')) DESC, facture_id DESC);
+CREATE INDEX IF NOT EXISTS idx_clients_nom_keyset ON clients((COALESCE(nom, '')), client_id);
+
 -- Index pour les clients
 CREATE INDEX idx_clients_telephone ON clients(telephone);
 CREATE INDEX idx_clients_ville ON clients(ville);
 
+-- Index pour le journal d'actions
+CREATE INDEX IF NOT EXISTS idx_logs_actions_timestamp ON logs_actions(timestamp);
+CREATE INDEX IF NOT EXISTS idx_logs_actions_cible ON logs_actions(cible_type, cible_id, timestamp);
+
 -- Index pour les notifications
 CREATE INDEX IF NOT EXISTS idx_notifs_created_at ON notifications(created_at DESC);
-CREATE INDEX IF NOT EXISTS idx_notifs_scope_ville ON notifications(scope, ville);
 CREATE INDEX IF NOT EXISTS idx_notif_reads_user ON notification_reads(user_id);
+CREATE INDEX IF NOT EXISTS idx_notifs_global_created
+    ON notifications(created_at) INCLUDE (actor_user_id) WHERE scope = 'global';
+CREATE INDEX IF NOT EXISTS idx_notifs_city_created
+    ON notifications(ville, created_at) INCLUDE (actor_user_id) WHERE scope = 'city';
 
 -- ========================================
 -- CONTRAINTES SUPPLÉMENTAIRES
@@ -238,4 +273,16 @@ CREATE INDEX IF NOT EXISTS idx_notif_reads_user ON notification_reads(user_id);
 -- Contraintes pour l'historique
 ALTER TABLE commandes_historique ADD CONSTRAINT chk_montant_positif CHECK (montant_total >= 0);
 ALTER TABLE commandes_articles_historique ADD CONSTRAINT chk_quantite_positive CHECK (quantite > 0);
-ALTER TABLE commandes_articles_historique ADD CONSTRAINT chk_prix_positif CHECK (prix_unitaire >= 0);
\ No newline at end of file
+ALTER TABLE commandes_articles_historique ADD CONSTRAINT chk_prix_positif CHECK (prix_unitaire >= 0);
+
+-- ========================================
+-- TABLES DÉRIVÉES (fonctions/triggers plpgsql, à appliquer après ce fichier)
+-- ========================================
+-- python app/db/maintenance.py install-proforma-totals
+-- python app/db/maintenance.py install-sales-rollup
+-- python app/db/maintenance.py install-client-stats (après install-proforma-totals)
+-- python app/db/maintenance.py install-indexes (bases existantes)
+-- python app/db/maintenance.py install-article-search (extensions pg_trgm + unaccent)
+-- python app/db/maintenance.py install-analyst-cache
+-- python app/db/maintenance.py install-notification-watermarks (bases existantes : compacte notification_reads)
+-- python app/db/maintenance.py install-partitions (partitions mensuelles de logs_actions / notifications)
@@ -0,0 +1,242 @@
+# Journal d'actions et notifications en écriture différée : file en mémoire → thread d'écriture par lots
+
+import os
+import time
+import queue
+import atexit
+import threading
+
+from psycopg2.extras import execute_values
+
+import db_pool
+import notification_hub
+
+# Évènement de journal : un appel à log_action() (timestamp = instant de l'action)
+LOG_INSERT_SQL = """
+    INSERT INTO logs_actions (user_id, action, cible_id, cible_type, ville, payload_avant, payload_apres, timestamp)
+    VALUES %s
+"""
+LOG_TEMPLATE = "(%s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, CURRENT_TIMESTAMP - make_interval(secs => %s))"
+
+NOTIF_INSERT_SQL = """
+    INSERT INTO notifications (scope, ville, actor_user_id, action, resource_type, resource_id, message, created_at)
+    VALUES %s
+    RETURNING notif_id
+"""
+NOTIF_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)"
+
+NOTIF_FIELDS = ("scope", "ville", "actor_user_id", "action", "resource_type", "resource_id", "message")
+LOG_FIELDS = ("user_id", "action", "cible_id", "cible_type", "ville", "payload_avant", "payload_apres")
+
+_STOP = object()
+
+
+class AuditWriter:
+    """
+    Un écrivain par processus (worker gunicorn) :
+    - les routes déposent des lignes déjà résolues (utilisateur, ville, message)
+      dans une file bornée, sans attendre la base ;
+    - un thread regroupe jusqu'à `batch_size` lignes (ou ce qui est arrivé en
+      `flush_interval` secondes) et les écrit en un INSERT multi-lignes par table,
+      sur une seule connexion du pool et un seul commit ;
+    - file pleine, thread arrêté ou write-behind désactivé : écriture synchrone
+      dans le thread appelant (rien n'est perdu, la route attend simplement) ;
+    - à l'arrêt du processus la file est vidée avant la fermeture des pools.
+    """
+
+    def __init__(self, dsn, max_queue=5000, batch_size=200, flush_interval=0.5, enabled=True):
+        self.dsn = dsn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._written = 0
+        self._sync_writes = 0
+        self._failed = 0
+
+    # --- dépôt des évènements (thread de la requête) ---
+    def log(self, *, user_id, action, cible_id, cible_type, ville, payload_avant=None, payload_apres=None):
+        """Ligne logs_actions ; payload_* déjà sérialisés en JSON (ou None)."""
+        self._submit(("log", {
+            "user_id": user_id, "action": action, "cible_id": cible_id, "cible_type": cible_type,
+            "ville": ville, "payload_avant": payload_avant, "payload_apres": payload_apres,
+        }, time.time()))
+
+    def notify(self, *, scope, ville, actor_user_id, action, resource_type, resource_id, message):
+        """Ligne notifications, publiée aux onglets ouverts (LISTEN/NOTIFY) une fois écrite."""
+        self._submit(("notif", {
+            "scope": scope, "ville": ville, "actor_user_id": actor_user_id, "action": action,
+            "resource_type": resource_type, "resource_id": resource_id, "message": message,
+        }, time.time()))
+
+    def _submit(self, event):
+        if self.enabled and not self._stopping and self._ensure_started():
+            try:
+                self._queue.put_nowait(event)
+                return
+            except queue.Full:
+                print("[AUDIT] file pleine : écriture synchrone")
+        with self._lock:
+            self._sync_writes += 1
+        self._write([event])
+
+    def _ensure_started(self):
+        """Thread d'écriture démarré une fois par processus (les threads ne survivent pas au fork)."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return True
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return True
+            if self._pid != os.getpid():
+                # File héritée du parent : ses évènements appartiennent au parent
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            try:
+                self._thread = threading.Thread(target=self._run, daemon=True, name="bizzio-audit-writer")
+                self._thread.start()
+            except RuntimeError as e:
+                print(f"[AUDIT] thread d'écriture indisponible : {e}")
+                self._thread = None
+                return False
+        return True
+
+    # --- thread d'écriture ---
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            if event is _STOP:
+                return
+            batch = [event]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stop = True
+                    break
+                batch.append(event)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        """Écrire un lot (un commit) ; en cas d'échec, ligne par ligne pour isoler la ligne fautive."""
+        try:
+            self._insert(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                print(f"[AUDIT ERROR] évènement perdu ({batch[0][0]}) : {e}")
+                with self._lock:
+                    self._failed += 1
+                return
+            print(f"[AUDIT WARNING] lot de {len(batch)} refusé, reprise ligne par ligne : {e}")
+            for event in batch:
+                self._write([event])
+
+    def _insert(self, batch):
+        now = time.time()
+        logs = [
+            tuple(data[f] for f in LOG_FIELDS) + (max(now - queued_at, 0.0),)
+            for kind, data, queued_at in batch if kind == "log"
+        ]
+        notifs = [data for kind, data, _ in batch if kind == "notif"]
+
+        conn = db_pool.get_connection(self.dsn)
+        try:
+            cur = conn.cursor()
+            if logs:
+                execute_values(cur, LOG_INSERT_SQL, logs, template=LOG_TEMPLATE, page_size=len(logs))
+            if notifs:
+                rows = [tuple(data[f] for f in NOTIF_FIELDS) for data in notifs]
+                ids = execute_values(cur, NOTIF_INSERT_SQL, rows, template=NOTIF_TEMPLATE,
+                                     page_size=len(rows), fetch=True)
+                # RETURNING suit l'ordre de VALUES : chaque notification publiée avec son id
+                for (notif_id,), data in zip(ids, notifs):
+                    notification_hub.publish(cur, 'created', notif_id=notif_id, scope=data["scope"],
+                                             ville=data["ville"], actor_user_id=data["actor_user_id"],
+                                             resource_type=data["resource_type"], message=data["message"])
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        with self._lock:
+            self._written += len(batch)
+
+    # --- arrêt / supervision ---
+    def shutdown(self, timeout=10.0):
+        """Vider la file puis arrêter le thread (appelé à la sortie du processus)."""
+        self._stopping = True
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid() and thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+        # Reliquat (thread bloqué ou jamais démarré) : écrit ici
+        remaining = []
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _STOP:
+                remaining.append(event)
+        for start in range(0, len(remaining), self.batch_size):
+            self._write(remaining[start:start + self.batch_size])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "running": self._thread is not None and self._thread.is_alive(),
+                "queued": self._queue.qsize(),
+                "max_queue": self._queue.maxsize,
+                "written": self._written,
+                "sync_writes": self._sync_writes,
+                "failed": self._failed,
+            }
+
+
+_writer = None
+
+
+def init_app(app):
+    """Créer l'écrivain à partir de app.config (thread démarré au premier évènement)."""
+    global _writer
+    _writer = AuditWriter(
+        app.config.get("SQLALCHEMY_DATABASE_URI") or os.getenv("DATABASE_URL"),
+        max_queue=app.config.get("AUDIT_QUEUE_MAX", 5000),
+        batch_size=app.config.get("AUDIT_BATCH_SIZE", 200),
+        flush_interval=app.config.get("AUDIT_FLUSH_INTERVAL", 0.5),
+        enabled=app.config.get("AUDIT_WRITE_BEHIND", True),
+    )
+    app.extensions["audit_writer"] = _writer
+
+
+def get_writer() -> AuditWriter:
+    if _writer is None:
+        raise RuntimeError("❌ audit_writer.init_app(app) n'a pas été appelé")
+    return _writer
+
+
+def _shutdown():
+    if _writer is not None:
+        _writer.shutdown()
+
+
+# Enregistré après db_pool (importé plus haut) : atexit l'exécute avant la fermeture des pools
+atexit.register(_shutdown)
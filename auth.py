@@ -1,4 +1,4 @@
-import psycopg2
+import db_pool
 from flask import current_app
 from werkzeug.security import check_password_hash
 import re
@@ -26,7 +26,7 @@ def authenticate_user(Utilisateur, email, password):
 
             # Vérification avec PostgreSQL crypt()
             try:
-                conn = psycopg2.connect(current_app.config['SQLALCHEMY_DATABASE_URI'])
+                conn = db_pool.get_connection(current_app.config['SQLALCHEMY_DATABASE_URI'])
                 cursor = conn.cursor()
                 cursor.execute("SELECT crypt(%s, %s) = %s", (password, user.mot_de_passe, user.mot_de_passe))
                 result = cursor.fetchone()
@@ -19,6 +19,16 @@ class Config:
         'pool_timeout': 20,
         'max_overflow': 0
     }
+
+    # Pool psycopg2 partagé (par worker gunicorn : 2 workers × DB_POOL_MAXCONN connexions max)
+    DB_POOL_MINCONN = int(os.getenv('DB_POOL_MINCONN', 1))
+    DB_POOL_MAXCONN = int(os.getenv('DB_POOL_MAXCONN', 5))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 20))
+    DB_POOL_RECYCLE = float(os.getenv('DB_POOL_RECYCLE', 300))
+
+    # Agrégats de ventes : rafraîchissement opportuniste à la lecture reporting (la tâche planifiée fait le reste)
+    SALES_ROLLUP_REFRESH_INTERVAL = int(os.getenv('SALES_ROLLUP_REFRESH_INTERVAL', 60))  # secondes, par worker
+    SALES_ROLLUP_REFRESH_TIMEOUT = float(os.getenv('SALES_ROLLUP_REFRESH_TIMEOUT', 2))  # secondes
     
     # Validation des variables d'environnement
     if not SQLALCHEMY_DATABASE_URI:
@@ -58,6 +68,28 @@ class Config:
     
     # Configuration PDF
     PDF_FONT_PATH = os.path.join(os.getcwd(), 'app', 'static', 'fonts')
+    PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(os.getcwd(), 'pdf_cache'))
+    PDF_CACHE_MAX_ENTRIES = int(os.getenv('PDF_CACHE_MAX_ENTRIES', 500))
+    PDF_RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', 2))  # Processus de rendu par worker gunicorn
+    PDF_RENDER_WAIT = float(os.getenv('PDF_RENDER_WAIT', 30))  # Attente max avant réponse 202
+    PDF_RENDER_TIMEOUT = float(os.getenv('PDF_RENDER_TIMEOUT', 60))  # Attente max d'un rendu dans un export groupé
+    PDF_BULK_MAX_DOCUMENTS = int(os.getenv('PDF_BULK_MAX_DOCUMENTS', 300))  # Export groupé (ZIP / PDF fusionné)
+
+    # Notifications poussées (SSE) : chaque flux occupe un thread gunicorn (--threads 16),
+    # au-delà de NOTIF_STREAM_MAX par worker les onglets repassent en polling
+    NOTIF_STREAM_MAX = int(os.getenv('NOTIF_STREAM_MAX', 8))
+    NOTIF_STREAM_KEEPALIVE = float(os.getenv('NOTIF_STREAM_KEEPALIVE', 25))
+    NOTIF_STREAM_LIFETIME = int(os.getenv('NOTIF_STREAM_LIFETIME', 300))
+
+    # Journal d'actions / notifications en écriture différée (AUDIT_WRITE_BEHIND=false : synchrone)
+    AUDIT_WRITE_BEHIND = os.getenv('AUDIT_WRITE_BEHIND', 'True').lower() == 'true'
+    AUDIT_QUEUE_MAX = int(os.getenv('AUDIT_QUEUE_MAX', 5000))  # au-delà : écriture synchrone
+    AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 200))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 0.5))  # secondes
+
+    # Listes de référence (années, natures, classes, formations, fournitures par ville) en mémoire
+    REFERENCE_CACHE_TTL = int(os.getenv('REFERENCE_CACHE_TTL', 300))  # secondes
+    REFERENCE_CACHE_MAX_ENTRIES = int(os.getenv('REFERENCE_CACHE_MAX_ENTRIES', 500))  # par partition
     
     # Configuration des logs
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -70,6 +102,7 @@ class Config:
         os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         os.makedirs(os.path.dirname(app.config['LOG_FILE']), exist_ok=True)
+        os.makedirs(app.config['PDF_CACHE_DIR'], exist_ok=True)
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -87,6 +120,8 @@ class ProductionConfig(Config):
         'max_overflow': 10,
         'pool_size': 20
     }
+    DB_POOL_MINCONN = int(os.getenv('DB_POOL_MINCONN', 2))
+    DB_POOL_MAXCONN = int(os.getenv('DB_POOL_MAXCONN', 10))
 
 class TestingConfig(Config):
     TESTING = True
@@ -0,0 +1,275 @@
+# Pool de connexions psycopg2 partagé par toute l'application
+
+import os
+import time
+import atexit
+import weakref
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(Exception):
+    """Levée quand aucune connexion n'est disponible dans le délai imparti."""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    Connexion psycopg2 dont close() rend la connexion au pool au lieu de
+    couper la session TCP. Le code existant (cur.close(); conn.close())
+    fonctionne donc sans modification.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+        self._checked_out = False
+        self._created_at = time.monotonic()
+        self._last_used = self._created_at
+
+    def close(self):
+        pool = self._pool
+        if pool is not None and self._checked_out:
+            pool.release(self)
+        elif pool is None:
+            super().close()
+
+    def _discard(self):
+        """Fermer réellement la connexion (hors pool)."""
+        self._pool = None
+        finalizer = getattr(self, "_finalizer", None)
+        if finalizer is not None:
+            finalizer.detach()  # place déjà rendue par l'appelant (_drop / close_all)
+        try:
+            psycopg2.extensions.connection.close(self)
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Pool thread-safe : emprunt bloquant avec timeout, vérification de santé
+    des connexions restées inactives et recyclage des connexions trop anciennes.
+    Un pool est propre à un processus (un par worker gunicorn).
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=5, timeout=20, recycle=300, ping_after=30):
+        self.dsn = dsn
+        self.minconn = max(0, int(minconn))
+        self.maxconn = max(1, int(maxconn))
+        self.timeout = float(timeout)
+        self.recycle = float(recycle)
+        self.ping_after = float(ping_after)
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+
+    # --- cycle de vie des connexions ---
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=PooledConnection)
+        conn._pool = self
+        # Connexion empruntée puis abandonnée sans close() (chemin d'erreur) : sa place
+        # est rendue quand le garbage collector la détruit, sinon le pool s'épuiserait
+        conn._finalizer = weakref.finalize(conn, self._reclaim, os.getpid())
+        conn._finalizer.atexit = False
+        return conn
+
+    def _reclaim(self, pid):
+        with self._cond:
+            if pid != self._pid:
+                return  # connexion du processus parent (avant fork)
+            self._size = max(0, self._size - 1)
+            self._cond.notify()
+        print(f"⚠️ Connexion non rendue au pool récupérée ({self._size}/{self.maxconn} utilisées)")
+
+    def _check_fork(self):
+        # Après un fork, les sockets appartiennent au processus parent : on les oublie
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._idle = []
+            self._size = 0
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if self.recycle and now - conn._created_at > self.recycle:
+            return False
+        if now - conn._last_used > self.ping_after:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except Exception:
+                return False
+        return True
+
+    def acquire(self, timeout=None):
+        """Emprunter une connexion (bloque jusqu'à `timeout` secondes si le pool est plein)."""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                self._check_fork()
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"Aucune connexion disponible après {self.timeout:.0f}s "
+                            f"({self._size}/{self.maxconn} utilisées)"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn):
+                self._drop(conn)
+                continue
+
+            conn._checked_out = True
+            return conn
+
+    def release(self, conn):
+        """Rendre une connexion au pool (appelé par PooledConnection.close())."""
+        conn._checked_out = False
+        if conn.closed or os.getpid() != self._pid:
+            self._drop(conn)
+            return
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except Exception:
+            self._drop(conn)
+            return
+        conn._last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def _drop(self, conn):
+        conn._discard()
+        with self._cond:
+            self._size = max(0, self._size - 1)
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            conn._discard()
+
+    def stats(self):
+        with self._cond:
+            return {"size": self._size, "idle": len(self._idle), "max": self.maxconn}
+
+    def warm_up(self):
+        """Ouvrir `minconn` connexions d'avance pour éviter la latence du premier appel."""
+        conns = []
+        try:
+            for _ in range(self.minconn):
+                conns.append(self.acquire())
+        except Exception as e:
+            print(f"⚠️ Pré-chauffage du pool incomplet : {e}")
+        for conn in conns:
+            conn.close()
+
+
+# === API MODULE : UN POOL PAR DSN ET PAR PROCESSUS ===
+_pools = {}
+_pools_lock = threading.Lock()
+_settings = {
+    "minconn": int(os.getenv("DB_POOL_MINCONN", 1)),
+    "maxconn": int(os.getenv("DB_POOL_MAXCONN", 5)),
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", 20)),
+    "recycle": float(os.getenv("DB_POOL_RECYCLE", 300)),
+}
+
+
+def init_app(app):
+    """Configurer le pool depuis app.config et pré-ouvrir les connexions minimales."""
+    _settings.update({
+        "minconn": app.config.get("DB_POOL_MINCONN", _settings["minconn"]),
+        "maxconn": app.config.get("DB_POOL_MAXCONN", _settings["maxconn"]),
+        "timeout": app.config.get("DB_POOL_TIMEOUT", _settings["timeout"]),
+        "recycle": app.config.get("DB_POOL_RECYCLE", _settings["recycle"]),
+    })
+    dsn = app.config.get("SQLALCHEMY_DATABASE_URI")
+    if dsn and dsn.startswith("postgres"):
+        get_pool(dsn).warm_up()
+
+
+def get_pool(dsn: Optional[str] = None) -> ConnectionPool:
+    dsn = dsn or os.getenv("DATABASE_URL")
+    if not dsn:
+        raise ValueError("❌ DATABASE_URL n'est pas défini pour le pool de connexions")
+    pool = _pools.get(dsn)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(dsn)
+            if pool is None:
+                pool = ConnectionPool(dsn, **_settings)
+                _pools[dsn] = pool
+    return pool
+
+
+def get_connection(dsn: Optional[str] = None):
+    """Remplaçant direct de psycopg2.connect() : conn.close() rend la connexion au pool."""
+    return get_pool(dsn).acquire()
+
+
+@contextmanager
+def borrow(dsn: Optional[str] = None, commit: bool = False):
+    """
+    Emprunter une connexion le temps d'un bloc `with`.
+    Rollback en cas d'exception, commit optionnel en sortie normale.
+    """
+    conn = get_connection(dsn)
+    try:
+        yield conn
+        if commit:
+            conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        conn.close()
+
+
+@contextmanager
+def borrow_cursor(dsn: Optional[str] = None, commit: bool = False, cursor_factory=None):
+    """Variante de borrow() qui fournit directement un curseur."""
+    with borrow(dsn, commit=commit) as conn:
+        cur = conn.cursor(cursor_factory=cursor_factory) if cursor_factory else conn.cursor()
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+
+@atexit.register
+def close_all_pools():
+    for pool in list(_pools.values()):
+        pool.close_all()
@@ -0,0 +1,358 @@
+# Notifications poussées : LISTEN/NOTIFY Postgres → compteurs non lus en mémoire → flux SSE
+
+import os
+import json
+import time
+import queue
+import select
+import threading
+from typing import Optional
+
+import psycopg2
+import psycopg2.extensions
+
+import db_pool
+
+CHANNEL = "bizzio_notifications"
+
+# Filigranes de lecture de l'utilisateur (app/db/notification_watermarks.sql) :
+# wm.global_at / wm.city_at, -infinity si l'utilisateur n'a jamais tout marqué comme lu.
+# Params nommés : user_id, ville
+WATERMARKS_CTE = """
+    WITH wm AS (
+        SELECT COALESCE(MAX(last_read_at) FILTER (WHERE scope = 'global'), '-infinity'::timestamp) AS global_at,
+               COALESCE(MAX(last_read_at) FILTER (WHERE scope = 'city' AND ville = %(ville)s), '-infinity'::timestamp) AS city_at
+          FROM notification_watermarks
+         WHERE user_id = %(user_id)s
+    )
+"""
+
+# Non lues visibles par un utilisateur : comptages de plage au-dessus des filigranes
+# (index partiels idx_notifs_*_created) moins les exceptions de notification_reads.
+# Bornes en sous-requêtes scalaires : connues à l'exécution, elles écartent les
+# partitions mensuelles antérieures au filigrane (partitions.sql).
+UNREAD_COUNT_SQL = WATERMARKS_CTE + """
+    SELECT
+        (SELECT COUNT(*) FROM notifications n
+          WHERE n.scope = 'global' AND n.created_at > (SELECT global_at FROM wm)
+            AND n.actor_user_id <> %(user_id)s)
+      + (SELECT COUNT(*) FROM notifications n
+          WHERE n.scope = 'city' AND n.ville = %(ville)s AND n.created_at > (SELECT city_at FROM wm)
+            AND n.actor_user_id <> %(user_id)s)
+      - (SELECT COUNT(*) FROM notification_reads r JOIN notifications n ON n.notif_id = r.notif_id, wm
+          WHERE r.user_id = %(user_id)s AND n.actor_user_id <> %(user_id)s
+            AND n.created_at > (SELECT LEAST(global_at, city_at) FROM wm)
+            AND ((n.scope = 'global' AND n.created_at > wm.global_at)
+                 OR (n.scope = 'city' AND n.ville = %(ville)s AND n.created_at > wm.city_at)))
+"""
+
+
+def unread_count_query(cur, user_id, ville):
+    cur.execute(UNREAD_COUNT_SQL, {"user_id": user_id, "ville": ville})
+    return int(cur.fetchone()[0] or 0)
+
+
+def publish(cur, event, **payload):
+    """
+    Émettre un évènement sur le canal (dans la transaction de `cur` : livré au commit).
+    event : 'created' (notif_id, scope, ville, actor_user_id, message),
+            'count' (user_id, ville, count), 'deleted' (notif_id, scope, ville, actor_user_id),
+            'archived' (partition supprimée par maintenance.py archive-partitions),
+            'reference' (partitions) : voir reference_cache.
+    """
+    payload["event"] = event
+    if "message" in payload and payload["message"]:
+        payload["message"] = payload["message"][:500]  # NOTIFY : 8000 octets max
+    cur.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps(payload, default=str)])
+
+
+def _sees(scope, ville, actor_user_id, user_id, user_ville):
+    """Même règle de visibilité que UNREAD_COUNT_SQL."""
+    if actor_user_id == user_id:
+        return False
+    return scope == "global" or (scope == "city" and ville == user_ville)
+
+
+class Subscription:
+    """Un onglet abonné : file d'évènements SSE déjà formatés."""
+
+    def __init__(self, user_id, ville, maxsize=100):
+        self.user_id = user_id
+        self.ville = ville
+        self.events = queue.Queue(maxsize=maxsize)
+
+    def push(self, event, data):
+        try:
+            self.events.put_nowait(f"event: {event}\ndata: {json.dumps(data)}\n\n")
+        except queue.Full:
+            pass  # onglet qui ne lit plus : l'évènement suivant portera le bon compteur
+
+
+class NotificationHub:
+    """
+    Un hub par processus (worker gunicorn) :
+    - un thread écoute le canal Postgres sur une connexion dédiée (hors pool) ;
+    - les compteurs non lus par (utilisateur, ville) sont chargés une fois puis
+      ajustés en mémoire à chaque notification créée, et remplacés par la valeur
+      envoyée par les routes de lecture (mark_read, mark_all_read, delete) ;
+    - les onglets abonnés reçoivent le compteur et les nouvelles notifications
+      sans aucune requête SQL tant qu'il ne se passe rien.
+    Tant que l'écoute n'est pas établie, les compteurs sont relus en base.
+    """
+
+    def __init__(self, dsn, max_streams=8, keepalive=25.0):
+        self.dsn = dsn
+        self.max_streams = max_streams
+        self.keepalive = keepalive
+        self._counts = {}
+        # Clés en cours de lecture en base → [lectures en cours, évènements reçus pendant la lecture]
+        self._loading = {}
+        self._subscribers = {}
+        self._listeners = {}
+        self._lock = threading.Lock()
+        self._listening = False
+        self._thread = None
+        self._pid = None
+
+    # --- écoute du canal ---
+    def start(self):
+        """Démarrer le thread d'écoute (une fois par processus : les threads ne survivent pas au fork)."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._counts = {}
+            self._loading = {}
+            self._subscribers = {}
+            self._listening = False
+            self._thread = threading.Thread(target=self._listen_loop, daemon=True, name="bizzio-notify-listener")
+            self._thread.start()
+
+    def _listen_loop(self):
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {CHANNEL}")
+                self._listening = True
+                backoff = 1.0
+                # Évènements manqués pendant la coupure : compteurs relus
+                self._resync()
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        cur.execute("SELECT 1")  # garder la session vivante
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        try:
+                            self._dispatch(json.loads(notification.payload))
+                        except Exception as e:
+                            print(f"[NOTIF HUB] évènement ignoré : {e}")
+            except Exception as e:
+                print(f"[NOTIF HUB] écoute interrompue : {e}")
+            finally:
+                self._listening = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def add_listener(self, event, callback):
+        """
+        Appeler `callback(payload)` pour chaque évènement `event` reçu sur le canal
+        (thread d'écoute). 'resync' est émis à chaque (re)connexion : des évènements
+        ont pu être manqués.
+        """
+        self._listeners.setdefault(event, []).append(callback)
+
+    def _emit(self, payload):
+        for callback in self._listeners.get(payload.get("event"), ()):
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"[NOTIF HUB] écouteur {payload.get('event')} en échec : {e}")
+
+    def _dispatch(self, payload):
+        event = payload.get("event")
+        self._emit(payload)
+        if event == "created":
+            with self._lock:
+                targets = []
+                for key in self._loading:
+                    if _sees(payload.get("scope"), payload.get("ville"), payload.get("actor_user_id"), *key):
+                        self._touch(key)
+                for key in list(self._counts):
+                    user_id, ville = key
+                    if _sees(payload.get("scope"), payload.get("ville"), payload.get("actor_user_id"), user_id, ville):
+                        self._counts[key] += 1
+                        targets.append((key, self._counts[key]))
+            for key, count in targets:
+                self._broadcast(key, "count", {"count": count})
+                self._broadcast(key, "notification", {
+                    "notif_id": payload.get("notif_id"),
+                    "message": payload.get("message"),
+                    "resource_type": payload.get("resource_type"),
+                })
+        elif event == "count":
+            key = (payload.get("user_id"), payload.get("ville"))
+            count = int(payload.get("count") or 0)
+            with self._lock:
+                self._touch(key)
+                self._counts[key] = count
+            self._broadcast(key, "count", {"count": count})
+        elif event == "deleted":
+            # Suppression visible par tous : compteurs concernés relus
+            with self._lock:
+                for key in self._loading:
+                    if _sees(payload.get("scope"), payload.get("ville"), payload.get("actor_user_id"), *key):
+                        self._touch(key)
+                keys = [
+                    key for key in self._counts
+                    if _sees(payload.get("scope"), payload.get("ville"), payload.get("actor_user_id"), *key)
+                ]
+            self._recount(keys)
+        elif event == "archived":
+            # Anciennes notifications supprimées en bloc : tous les compteurs relus
+            self._resync()
+
+    def _resync(self):
+        self._emit({"event": "resync"})
+        with self._lock:
+            self._counts = {}
+            for key in self._loading:
+                self._touch(key)
+            keys = list(self._subscribers)
+        self._recount(keys)
+
+    def _recount(self, keys):
+        if not keys:
+            return
+        conn = db_pool.get_connection(self.dsn)
+        try:
+            cur = conn.cursor()
+            for key in keys:
+                count = self._load_count(key, cur)
+                self._broadcast(key, "count", {"count": count})
+            cur.close()
+        finally:
+            conn.close()
+
+    def _touch(self, key):
+        """Évènement reçu pour une clé en cours de lecture (self._lock tenu) : la valeur lue est douteuse."""
+        state = self._loading.get(key)
+        if state is not None:
+            state[1] += 1
+
+    def _load_count(self, key, cur=None, attempts=3):
+        """
+        Lire un compteur en base et le garder en mémoire (si l'écoute est active).
+        La clé est déclarée en lecture avant la requête : un évènement qui la touche
+        pendant ce temps peut manquer à la valeur lue ou y être déjà compté, la lecture
+        est alors refaite. Après `attempts` lectures perturbées la clé est laissée hors
+        mémoire (relue au prochain accès).
+        """
+        count = None
+        for _ in range(attempts):
+            with self._lock:
+                state = self._loading.setdefault(key, [0, 0])
+                state[0] += 1
+                version = state[1]
+            count = None
+            stable = False
+            try:
+                if cur is not None:
+                    count = unread_count_query(cur, *key)
+                else:
+                    conn = db_pool.get_connection(self.dsn)
+                    try:
+                        c = conn.cursor()
+                        count = unread_count_query(c, *key)
+                        c.close()
+                    finally:
+                        conn.close()
+            finally:
+                with self._lock:
+                    state[0] -= 1
+                    if not state[0]:
+                        self._loading.pop(key, None)
+                    stable = count is not None and state[1] == version
+                    if stable and self._listening:
+                        self._counts[key] = count
+            if stable:
+                return count
+        with self._lock:
+            self._counts.pop(key, None)
+        return count
+
+    def _broadcast(self, key, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            subscription.push(event, data)
+
+    # --- API utilisée par les routes ---
+    def unread_count(self, user_id, ville, cur=None) -> int:
+        """Compteur en mémoire si l'écoute est active, sinon (ou au premier accès) lu en base."""
+        self.start()
+        key = (user_id, ville)
+        with self._lock:
+            if self._listening and key in self._counts:
+                return self._counts[key]
+        return self._load_count(key, cur)
+
+    def subscribe(self, user_id, ville) -> Optional[Subscription]:
+        """Abonner un onglet (None si le processus a atteint max_streams)."""
+        self.start()
+        with self._lock:
+            if sum(len(s) for s in self._subscribers.values()) >= self.max_streams:
+                return None
+            subscription = Subscription(user_id, ville)
+            self._subscribers.setdefault((user_id, ville), []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        key = (subscription.user_id, subscription.ville)
+        with self._lock:
+            subscribers = self._subscribers.get(key, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers:
+                self._subscribers.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "listening": self._listening,
+                "counters": len(self._counts),
+                "streams": sum(len(s) for s in self._subscribers.values()),
+                "max_streams": self.max_streams,
+            }
+
+
+_hub = None
+
+
+def init_app(app):
+    """Créer le hub à partir de app.config (l'écoute démarre au premier usage)."""
+    global _hub
+    _hub = NotificationHub(
+        app.config.get("SQLALCHEMY_DATABASE_URI") or os.getenv("DATABASE_URL"),
+        max_streams=app.config.get("NOTIF_STREAM_MAX", 8),
+        keepalive=app.config.get("NOTIF_STREAM_KEEPALIVE", 25),
+    )
+    app.extensions["notification_hub"] = _hub
+
+
+def get_hub() -> NotificationHub:
+    if _hub is None:
+        raise RuntimeError("❌ notification_hub.init_app(app) n'a pas été appelé")
+    return _hub
@@ -0,0 +1,485 @@
+# Rendu PDF hors des workers gunicorn : pool de processus + cache disque des documents
+
+import io
+import os
+import time
+import zipfile
+import atexit
+import hashlib
+import threading
+import mimetypes
+import multiprocessing
+from urllib.parse import urlsplit
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+
+
+def static_path(static_folder, name):
+    """Chemin d'un fichier de app/static (refus des chemins sortant du dossier)."""
+    if not static_folder:
+        raise ValueError(f"Dossier static inconnu pour {name}")
+    root = os.path.realpath(static_folder)
+    filename = os.path.realpath(os.path.join(root, name))
+    if not filename.startswith(root + os.sep):
+        raise ValueError(f"Feuille de style hors de app/static : {name}")
+    return filename
+
+
+class WarmRenderer:
+    """
+    Moteur WeasyPrint long-vivant (un par processus de rendu) : configuration
+    des polices, feuilles de style partagées, fichiers de app/static et images
+    décodées sont chargés une fois puis réutilisés d'un document à l'autre.
+    """
+
+    def __init__(self, static_folder=None, static_url_path="/static"):
+        from weasyprint.text.fonts import FontConfiguration
+
+        self.static_folder = static_folder
+        self.static_url_path = static_url_path.rstrip("/") + "/"
+        self.font_config = FontConfiguration()
+        self._stylesheets = {}
+        self._resources = {}
+        self._image_cache = {}
+
+    def stylesheet(self, name):
+        """Feuille de style de app/static (ex. "css/pdf/proforma.css") analysée une seule fois par processus."""
+        from weasyprint import CSS
+
+        css = self._stylesheets.get(name)
+        if css is None:
+            css = CSS(filename=static_path(self.static_folder, name), font_config=self.font_config,
+                      url_fetcher=self.url_fetcher)
+            self._stylesheets[name] = css
+        return css
+
+    def url_fetcher(self, url):
+        """Servir /static/... depuis le disque (sans requête HTTP vers l'application), en mémoire après le premier accès."""
+        from weasyprint import default_url_fetcher
+
+        resource = self._resources.get(url)
+        if resource is not None:
+            return dict(resource)
+
+        path = urlsplit(url).path
+        if self.static_folder and path.startswith(self.static_url_path):
+            relative = path[len(self.static_url_path):]
+            filename = os.path.realpath(os.path.join(self.static_folder, relative))
+            if filename.startswith(os.path.realpath(self.static_folder) + os.sep) and os.path.isfile(filename):
+                with open(filename, "rb") as f:
+                    resource = {
+                        "string": f.read(),
+                        "mime_type": mimetypes.guess_type(filename)[0],
+                        "redirected_url": url,
+                        "filename": os.path.basename(filename),
+                    }
+                self._resources[url] = resource
+                return dict(resource)
+
+        return default_url_fetcher(url)
+
+    def render(self, html_content, base_url=None, stylesheets=()):
+        """PDF d'un document ; `stylesheets` : feuilles partagées de app/static, déjà analysées après le premier rendu."""
+        from weasyprint import HTML
+
+        document = HTML(string=html_content, base_url=base_url, url_fetcher=self.url_fetcher)
+        return document.write_pdf(
+            stylesheets=[self.stylesheet(css) for css in stylesheets],
+            font_config=self.font_config,
+            cache=self._image_cache,
+        )
+
+    def warm_up(self):
+        """Premier rendu à vide : initialise Pango/fontconfig hors du chemin des requêtes."""
+        self.render("<html><body><p>Bizzio</p><table><tr><td>0</td></tr></table></body></html>")
+
+
+_renderer = None
+
+
+def _init_render_worker(static_folder, static_url_path):
+    """Initialiseur des processus du pool : moteur chargé et préchauffé avant le premier document."""
+    global _renderer
+    _renderer = WarmRenderer(static_folder, static_url_path)
+    try:
+        _renderer.warm_up()
+    except Exception as e:
+        print(f"⚠️ Préchauffage du moteur PDF: {e}")
+
+
+def render_html_to_pdf(html_content, base_url=None, stylesheets=()):
+    """Rendu exécuté dans un processus du pool (fonction picklable)."""
+    global _renderer
+    if _renderer is None:
+        _renderer = WarmRenderer()
+    return _renderer.render(html_content, base_url, stylesheets)
+
+
+class DocumentCache:
+    """
+    Cache disque des PDF, partagé par les workers gunicorn.
+    Clé : proforma_id + type de document + empreinte du HTML rendu et des
+    feuilles de style. Toute modification de la proforma (articles, statut,
+    client...) ou du CSS déployé change la clé : l'ancienne entrée est
+    remplacée au prochain rendu.
+    """
+
+    def __init__(self, directory, max_entries=500):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(proforma_id, document_type, html_content, stylesheets_digest=""):
+        digest = hashlib.sha256((html_content + stylesheets_digest).encode("utf-8")).hexdigest()[:24]
+        return f"{proforma_id}_{document_type}_{digest}"
+
+    def _path(self, key, suffix=".pdf"):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, None)  # Ordre LRU pour l'élagage
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, pdf_bytes):
+        """Écriture atomique, puis suppression des versions précédentes du même document."""
+        prefix = key.rsplit("_", 1)[0] + "_"
+        tmp_path = self._path(key, f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, self._path(key))
+
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(".pdf") and name != key + ".pdf":
+                self._remove(name)
+        self._prune()
+
+    def invalidate(self, proforma_id):
+        """Supprimer tous les documents d'une proforma (suppression, changement hors HTML)."""
+        prefix = f"{proforma_id}_"
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix):
+                self._remove(name)
+
+    # Marqueurs « rendu en cours » visibles par les autres workers
+    def mark_pending(self, key):
+        with open(self._path(key, ".pending"), "w") as f:
+            f.write(str(time.time()))
+
+    def clear_pending(self, key):
+        self._remove(key + ".pending")
+
+    def is_pending(self, key, max_age=120):
+        try:
+            return time.time() - os.path.getmtime(self._path(key, ".pending")) < max_age
+        except FileNotFoundError:
+            return False
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def _prune(self):
+        entries = [
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory) if name.endswith(".pdf")
+        ]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class PdfRenderService:
+    """
+    Soumet les rendus à un pool de processus borné (les rafales de PDF ne
+    monopolisent ni le GIL ni les workers de l'API) et dédoublonne les rendus
+    identiques en cours.
+    """
+
+    def __init__(self, cache, max_workers=2, static_folder=None, static_url_path="/static", render_timeout=60.0):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.render_timeout = render_timeout
+        self.static_folder = static_folder
+        self.static_url_path = static_url_path
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._stylesheet_digests = {}
+
+    def _get_executor(self):
+        # Un pool par processus : un pool hérité d'un fork n'est pas utilisable
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_render_worker,
+                        initargs=(self.static_folder, self.static_url_path),
+                    )
+                    self._pid = os.getpid()
+                    self._inflight = {}
+        return self._executor
+
+    def _make_key(self, proforma_id, document_type, html_content, stylesheets):
+        """Clé de cache d'un document : HTML + contenu des feuilles de style (lu une fois par processus)."""
+        digests = []
+        for name in stylesheets:
+            digest = self._stylesheet_digests.get(name)
+            if digest is None:
+                with open(static_path(self.static_folder, name), "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+                self._stylesheet_digests[name] = digest
+            digests.append(digest)
+        return self.cache.make_key(proforma_id, document_type, html_content, "".join(digests))
+
+    def submit(self, key, html_content, base_url=None, stylesheets=()):
+        """Lancer (ou rejoindre) le rendu d'un document ; le résultat est écrit dans le cache."""
+        executor = self._get_executor()
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            self.cache.mark_pending(key)
+            future = executor.submit(render_html_to_pdf, html_content, base_url, tuple(stylesheets))
+            self._inflight[key] = future
+
+        def _done(fut, key=key):
+            try:
+                if fut.exception() is None:
+                    self.cache.put(key, fut.result())
+                else:
+                    print(f"❌ Rendu PDF {key} échoué: {fut.exception()}")
+            finally:
+                self.cache.clear_pending(key)
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+        future.add_done_callback(_done)
+        return future
+
+    def render(self, html_content, base_url=None, stylesheets=(), timeout=None):
+        """Rendu sans cache (rapports, documents ponctuels) dans le pool préchauffé."""
+        future = self._get_executor().submit(render_html_to_pdf, html_content, base_url, tuple(stylesheets))
+        return future.result(timeout=timeout)
+
+    def document_future(self, proforma_id, document_type, html_content, base_url=None, stylesheets=()):
+        """Future du PDF d'un document, déjà résolue si le cache le contient (exports groupés)."""
+        key = self._make_key(proforma_id, document_type, html_content, stylesheets)
+        pdf = self.cache.get(key)
+        if pdf is not None:
+            future = Future()
+            future.set_result(pdf)
+            return future
+        return self.submit(key, html_content, base_url, stylesheets)
+
+    def get_or_render(self, proforma_id, document_type, html_content, base_url=None, stylesheets=(), wait=30.0):
+        """
+        Renvoie (statut, octets) :
+        - ("cached", pdf)   document déjà rendu pour ce contenu
+        - ("rendered", pdf) rendu terminé dans le délai d'attente
+        - ("pending", None) rendu en cours, à redemander plus tard
+        """
+        key = self._make_key(proforma_id, document_type, html_content, stylesheets)
+        pdf = self.cache.get(key)
+        if pdf is not None:
+            return "cached", pdf
+
+        if key not in self._inflight and self.cache.is_pending(key):
+            # Rendu lancé par un autre worker : attendre le fichier
+            deadline = time.monotonic() + wait
+            while time.monotonic() < deadline:
+                pdf = self.cache.get(key)
+                if pdf is not None:
+                    return "cached", pdf
+                if not self.cache.is_pending(key):
+                    break
+                time.sleep(0.2)
+            else:
+                return "pending", None
+
+        future = self.submit(key, html_content, base_url, stylesheets)
+        if wait <= 0:
+            return "pending", None
+        try:
+            return "rendered", future.result(timeout=wait)
+        except FutureTimeout:
+            return "pending", None
+
+    def document_result(self, future):
+        """Attendre un rendu au plus render_timeout secondes (FutureTimeout sinon, rendu en file annulé)."""
+        try:
+            return future.result(timeout=self.render_timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise FutureTimeout(f"rendu non terminé après {self.render_timeout:g} s")
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class _ZipOutput(io.RawIOBase):
+    """Flux non « seekable » : zipfile écrit alors des descripteurs de données et l'archive peut être envoyée au fil de l'eau."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """Générateur d'octets d'une archive ZIP à partir d'un itérable (nom, octets), sans la tenir en mémoire."""
+    output = _ZipOutput()
+    # PDF déjà compressés : stockage simple
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+            chunk = output.drain()
+            if chunk:
+                yield chunk
+    chunk = output.drain()
+    if chunk:
+        yield chunk
+
+
+def merge_pdfs(documents):
+    """Fusionner plusieurs PDF (dans l'ordre donné) en un seul document."""
+    from PyPDF2 import PdfWriter
+
+    writer = PdfWriter()
+    for data in documents:
+        writer.append(io.BytesIO(data))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+_service = None
+
+
+def init_app(app):
+    """Créer le service de rendu à partir de app.config (pool démarré au premier rendu)."""
+    global _service
+    cache = DocumentCache(
+        app.config.get("PDF_CACHE_DIR", os.path.join(os.getcwd(), "pdf_cache")),
+        max_entries=app.config.get("PDF_CACHE_MAX_ENTRIES", 500),
+    )
+    _service = PdfRenderService(
+        cache,
+        max_workers=app.config.get("PDF_RENDER_WORKERS", 2),
+        render_timeout=app.config.get("PDF_RENDER_TIMEOUT", 60.0),
+        static_folder=app.static_folder,
+        static_url_path=app.static_url_path or "/static",
+    )
+    app.extensions["pdf_renderer"] = _service
+
+
+def get_service() -> PdfRenderService:
+    if _service is None:
+        raise RuntimeError("❌ pdf_renderer.init_app(app) n'a pas été appelé")
+    return _service
+
+
+def _shutdown():
+    if _service is not None:
+        _service.shutdown()
+
+
+atexit.register(_shutdown)
+
+
+# ========================================
+# BENCHMARK : rendu à froid vs moteur préchauffé
+# python pdf_renderer.py [--runs 10] [--html document.html]
+# ========================================
+
+SAMPLE_STYLESHEET = "css/pdf/proforma.css"
+
+SAMPLE_HTML = """
+<html><head>%s</head><body class="document-proforma"><div class="container"><div class="content">
+    <div class="header"><img src="/static/image/logo1.png" style="height: 60px"><div class="invoice-info"><h1>PROFORMA</h1></div></div>
+    <table class="items-table"><tr><th>Code</th><th>Désignation</th><th>Qté</th><th>Total</th></tr>%s</table>
+</div></div></body></html>
+"""
+
+
+def _benchmark(runs, body_html, static_folder):
+    import statistics
+    from weasyprint import HTML
+
+    base_url = "http://localhost/"
+    with open(static_path(static_folder, SAMPLE_STYLESHEET), encoding="utf-8") as f:
+        inline_html = body_html.replace("<head></head>", f"<head><style>{f.read()}</style></head>", 1)
+
+    def timed(fn):
+        start = time.perf_counter()
+        fn()
+        return (time.perf_counter() - start) * 1000
+
+    # Ancien chemin : objet HTML neuf, CSS <style> du template, polices et ressources rechargés à chaque document
+    cold = [timed(lambda: HTML(string=inline_html, base_url=base_url,
+                               url_fetcher=WarmRenderer(static_folder).url_fetcher).write_pdf())
+            for _ in range(runs)]
+
+    # Moteur préchauffé, même CSS qu'en <style> mais passée en feuille partagée (analysée au premier rendu)
+    renderer = WarmRenderer(static_folder)
+    warm_up_ms = timed(renderer.warm_up)
+    warm_inline = [timed(lambda: renderer.render(inline_html, base_url)) for _ in range(runs)]
+    warm = [timed(lambda: renderer.render(body_html, base_url, (SAMPLE_STYLESHEET,))) for _ in range(runs)]
+
+    print(f"📊 {runs} rendus par série")
+    print(f"   Préchauffage          : {warm_up_ms:8.1f} ms (une fois par processus)")
+    for label, values in (("À froid", cold), ("Préchauffé, <style>", warm_inline), ("Préchauffé, CSS partagé", warm)):
+        print(f"   {label:<23} : médiane {statistics.median(values):8.1f} ms | moyenne {statistics.mean(values):8.1f} ms")
+    gain = 1 - statistics.median(warm) / statistics.median(cold)
+    print(f"✅ Gain médian : {gain:.0%}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark du rendu PDF (à froid vs préchauffé)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--html", help=f"Fichier HTML à rendre, <head></head> vide : {SAMPLE_STYLESHEET} y est injectée pour le rendu à froid (par défaut : proforma de 40 lignes)")
+    parser.add_argument("--static", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "static"))
+    args = parser.parse_args()
+
+    if args.html:
+        with open(args.html, encoding="utf-8") as f:
+            html = f.read()
+    else:
+        rows = "".join(
+            f"<tr><td>ART{i:03d}</td><td>Article {i}</td><td>{i % 5 + 1}</td><td>{i * 1500}</td></tr>"
+            for i in range(40)
+        )
+        html = SAMPLE_HTML % ("", rows)
+
+    _benchmark(args.runs, html, args.static)
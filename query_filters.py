@@ -0,0 +1,167 @@
+# Construction de filtres SQL réutilisables (prédicats compatibles index)
+
+import base64
+import json
+from datetime import date, datetime
+
+QUARTER_MONTHS = {'Q1': [1, 2, 3], 'Q2': [4, 5, 6], 'Q3': [7, 8, 9], 'Q4': [10, 11, 12]}
+
+
+def period_bounds(annee, trimestre=None, mois=None):
+    """
+    Bornes [debut, fin[ d'une période année / trimestre / mois.
+    Le mois l'emporte sur le trimestre, comme dans les filtres du reporting.
+    """
+    annee = int(annee)
+    if mois:
+        mois = int(mois)
+        debut = date(annee, mois, 1)
+        fin = date(annee + 1, 1, 1) if mois == 12 else date(annee, mois + 1, 1)
+        return debut, fin
+    months = QUARTER_MONTHS.get(trimestre or '')
+    if months:
+        debut = date(annee, months[0], 1)
+        fin = date(annee + 1, 1, 1) if months[-1] == 12 else date(annee, months[-1] + 1, 1)
+        return debut, fin
+    return date(annee, 1, 1), date(annee + 1, 1, 1)
+
+
+def date_range_conditions(column, annee=None, trimestre=None, mois=None):
+    """
+    Filtres de période sur `column` → (conditions, params).
+
+    Avec une année, on émet une plage `column >= debut AND column < fin`
+    (utilisable par un index sur la colonne) au lieu de EXTRACT(...) = ....
+    Sans année, un mois/trimestre désigne ce mois sur toutes les années :
+    seul EXTRACT(MONTH ...) peut l'exprimer.
+    """
+    conditions = []
+    params = []
+
+    if annee:
+        if mois and trimestre:
+            # Mois et trimestre cumulés : mois hors trimestre → aucun résultat
+            months = QUARTER_MONTHS.get(trimestre, [])
+            if months and int(mois) not in months:
+                return ["FALSE"], []
+        debut, fin = period_bounds(annee, trimestre, mois)
+        conditions.append(f"{column} >= %s AND {column} < %s")
+        params.extend([debut, fin])
+        return conditions, params
+
+    months = QUARTER_MONTHS.get(trimestre or '')
+    if months:
+        placeholders = ','.join(['%s'] * len(months))
+        conditions.append(f"EXTRACT(MONTH FROM {column}) IN ({placeholders})")
+        params.extend(months)
+    if mois:
+        conditions.append(f"EXTRACT(MONTH FROM {column}) = %s")
+        params.append(int(mois))
+    return conditions, params
+
+
+# ========================================
+# PAGINATION PAR CURSEUR (KEYSET)
+# ========================================
+
+def encode_cursor(values):
+    """Jeton opaque (base64 url-safe) à partir des valeurs de la clé de tri de la dernière ligne"""
+    payload = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Valeurs de la clé de tri contenues dans un jeton ; ValueError si le jeton est invalide"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Curseur invalide: {e}")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Curseur invalide")
+    return values
+
+
+def keyset_condition(columns, values, descending=True):
+    """
+    Condition « après le curseur » pour un tri sur `columns` (même sens pour toutes les colonnes).
+    La comparaison de lignes (a, b) < (x, y) est résolue par un seul parcours d'index.
+    """
+    placeholders = ', '.join(['%s'] * len(columns))
+    operator = '<' if descending else '>'
+    return f"({', '.join(columns)}) {operator} ({placeholders})", list(values)
+
+
+def estimate_row_count(cur, query, params):
+    """Nombre de lignes estimé par le planificateur (total approximatif, sans exécuter la requête)"""
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan'].get('Plan Rows', 0))
+
+
+# ========================================
+# CLIENTS + STATISTIQUES MAINTENUES (client_stats)
+# ========================================
+
+def clients_with_orders_query(where_sql, order_sql, limit_sql):
+    """
+    Page de clients avec nb_commandes et montant_total_paye (proformas + factures terminées/partielles).
+
+    Les compteurs sont lus dans client_stats (maintenue par triggers, app/db/client_stats.sql) :
+    une lecture par clé primaire par client de la page, sans agrégation des commandes.
+    Paramètres attendus : ceux de `where_sql` puis ceux de `limit_sql`.
+    """
+    return f"""
+        WITH page_clients AS (
+            SELECT c.client_id, c.nom, c.telephone, c.telephone_secondaire,
+                   c.adresse, c.ville, c.pays
+            FROM clients c
+            WHERE 1=1 {where_sql}
+            ORDER BY {order_sql}
+            {limit_sql}
+        )
+        SELECT c.client_id, c.nom, c.telephone, c.telephone_secondaire,
+               c.adresse, c.ville, c.pays,
+               COALESCE(cs.nb_commandes, 0) AS nb_commandes,
+               COALESCE(cs.montant_total_paye, 0) AS montant_total_paye
+        FROM page_clients c
+        LEFT JOIN client_stats cs ON cs.client_id = c.client_id
+        ORDER BY {order_sql}
+    """
+
+
+# ========================================
+# RECHERCHE D'ARTICLES (pg_trgm + tsvector, app/db/article_search.sql)
+# ========================================
+
+def escape_like(term):
+    """Échapper les métacaractères de LIKE (\\, %, _) d'un terme saisi"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def article_search_sql(term, alias='a', match_any=False):
+    """
+    Recherche d'articles insensible à la casse et aux accents → (condition, params, rank_sql, rank_params).
+
+    Une ligne correspond si le terme est contenu dans search_text (LIKE, index trigrammes),
+    s'il ressemble à un mot de search_text (faute de frappe, opérateur <%) ou si ses mots
+    correspondent au tsvector français. `match_any` accepte les articles ne contenant qu'un
+    des mots (saisie semi-automatique) ; sinon tous les mots sont requis.
+    Le score place en tête les désignations commençant par le terme, puis la similarité
+    trigramme et le rang plein texte.
+    """
+    tsquery = "plainto_tsquery('french', f_unaccent(%s))"
+    if match_any:
+        tsquery = f"replace({tsquery}::text, '&', '|')::tsquery"
+
+    pattern = escape_like(term)
+    condition = f"""({alias}.search_text LIKE '%%' || lower(f_unaccent(%s)) || '%%'
+            OR lower(f_unaccent(%s)) <%% {alias}.search_text
+            OR {alias}.search_vector @@ {tsquery})"""
+    rank_sql = f"""(CASE WHEN {alias}.search_text LIKE lower(f_unaccent(%s)) || '%%' THEN 1 ELSE 0 END
+            + word_similarity(lower(f_unaccent(%s)), {alias}.search_text)
+            + ts_rank({alias}.search_vector, {tsquery}))"""
+    return condition, [pattern, term, term], rank_sql, [pattern, term, term]
@@ -0,0 +1,142 @@
+# Données de référence du catalogue (années, natures, classes, formations, villes, fournitures) en mémoire par processus
+
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+import notification_hub
+
+# Partition des données communes à toutes les villes ; les autres partitions sont des noms de ville
+GLOBAL = "*"
+
+
+class ReferenceCache:
+    """
+    Cache à TTL des listes de référence lues à chaque rendu du tableau de bord et à
+    chaque frappe dans les formulaires de proforma.
+
+    Les entrées sont rangées par partition : GLOBAL pour le catalogue commun, une
+    partition par ville pour les fournitures et leurs prix. Une écriture sur le
+    catalogue invalide GLOBAL et les villes touchées :
+    - dans ce processus, après le commit (invalidate) ;
+    - dans les autres workers, par l'évènement 'reference' publié dans la transaction
+      (publish_invalidation) et relayé par le thread d'écoute de notification_hub.
+    Le TTL borne l'écart si un évènement est manqué (écoute coupée, écriture hors application).
+
+    Un seul chargement à la fois par clé ; une valeur chargée pendant une invalidation
+    de sa partition est renvoyée mais pas conservée. Les valeurs sont partagées entre
+    requêtes : ne pas les modifier.
+    """
+
+    def __init__(self, ttl: int = 300, max_entries: int = 500, on_use: Optional[Callable[[], None]] = None):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.on_use = on_use
+        self._partitions = {}
+        self._generations = {}
+        self._epoch = 0
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _token(self, partition):
+        return (self._epoch, self._generations.get(partition, 0))
+
+    def _lookup(self, partition, key):
+        entry = self._partitions.get(partition, {}).get(key)
+        if entry is not None and time.monotonic() < entry[1]:
+            return True, entry[0]
+        return False, None
+
+    def get_or_load(self, key, loader: Callable[[], Any], partition: str = GLOBAL):
+        """Valeur en mémoire, ou chargée par `loader()` puis conservée `ttl` secondes"""
+        if self.on_use is not None:
+            self.on_use()
+        with self._lock:
+            found, value = self._lookup(partition, key)
+            if found:
+                self._metrics['hits'] += 1
+                return value
+            # Verrou de chargement partagé par les threads qui attendent cette clé, retiré après le dernier
+            loading = self._loading.setdefault((partition, key), [threading.Lock(), 0])
+            loading[1] += 1
+
+        try:
+            with loading[0]:
+                # Chargée entre-temps par un autre thread ?
+                with self._lock:
+                    found, value = self._lookup(partition, key)
+                    if found:
+                        self._metrics['hits'] += 1
+                        return value
+                    self._metrics['misses'] += 1
+                    token = self._token(partition)
+
+                value = loader()
+
+                with self._lock:
+                    if self._token(partition) == token:
+                        entries = self._partitions.setdefault(partition, {})
+                        entries[key] = (value, time.monotonic() + self.ttl)
+                        if len(entries) > self.max_entries:
+                            now = time.monotonic()
+                            for stale in [k for k, (_, expires_at) in entries.items() if expires_at <= now] or [next(iter(entries))]:
+                                del entries[stale]
+            return value
+        finally:
+            with self._lock:
+                loading[1] -= 1
+                if not loading[1]:
+                    self._loading.pop((partition, key), None)
+
+    def invalidate(self, *partitions):
+        """Vider les partitions données (toutes si aucune)"""
+        with self._lock:
+            if not partitions:
+                self._partitions.clear()
+                self._epoch += 1
+            for partition in partitions:
+                self._partitions.pop(partition, None)
+                self._generations[partition] = self._generations.get(partition, 0) + 1
+            self._metrics['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses = self._metrics['hits'], self._metrics['misses']
+            return {
+                'partitions': {p: len(entries) for p, entries in self._partitions.items()},
+                'ttl': self.ttl,
+                'hits': hits,
+                'misses': misses,
+                'invalidations': self._metrics['invalidations'],
+                'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            }
+
+
+def publish_invalidation(cur, *partitions):
+    """Prévenir les autres workers (livré au commit de la transaction de `cur`)."""
+    notification_hub.publish(cur, 'reference', partitions=[p for p in partitions if p])
+
+
+_cache = None
+
+
+def init_app(app):
+    """Créer le cache et le brancher sur l'écoute LISTEN/NOTIFY (après notification_hub.init_app)."""
+    global _cache
+    hub = notification_hub.get_hub()
+    _cache = ReferenceCache(
+        ttl=app.config.get("REFERENCE_CACHE_TTL", 300),
+        max_entries=app.config.get("REFERENCE_CACHE_MAX_ENTRIES", 500),
+        on_use=hub.start,
+    )
+    hub.add_listener("reference", lambda payload: _cache.invalidate(*(payload.get("partitions") or ())))
+    # Écoute (re)établie : des invalidations ont pu être manquées
+    hub.add_listener("resync", lambda payload: _cache.invalidate())
+    app.extensions["reference_cache"] = _cache
+
+
+def get_cache() -> ReferenceCache:
+    if _cache is None:
+        raise RuntimeError("❌ reference_cache.init_app(app) n'a pas été appelé")
+    return _cache
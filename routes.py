@@ -1,7 +1,7 @@
 # Flask core
 from flask import (
     render_template, redirect, url_for, request,
-    session, flash, jsonify, send_file, current_app, make_response, g
+    session, flash, jsonify, send_file, current_app, make_response, g, Response
 )
 
 # Python standard library
@@ -10,6 +10,7 @@ import re, hashlib
 import math
 import uuid
 import time
+import queue
 import csv
 import random
 import string
@@ -36,6 +37,7 @@ import calendar
 
 from flask_mail import Mail, Message
 import os
+import sys
 
 # PDF LIBRARIES - ESSAYER WEASYPRINT D'ABORD, PUIS PDFKIT EN FALLBACK
 try:
@@ -51,8 +53,21 @@ except ImportError:
         PDF_ENGINE = None
         print("❌ No PDF engine available. Install WeasyPrint or PDFKit")
 
+# CSS de proforma_template.html (app/static) : analysée une fois par processus de rendu
+PROFORMA_PDF_STYLESHEETS = ("css/pdf/proforma.css",)
+
 # Local imports
 from auth import authenticate_user, get_user_info
+import db_pool
+import pdf_renderer
+import notification_hub
+import audit_writer
+import reference_cache
+from streaming_export import export_filename, stream_export
+from query_filters import (
+    article_search_sql, clients_with_orders_query, date_range_conditions, decode_cursor,
+    encode_cursor, estimate_row_count, keyset_condition
+)
 
 # Variables qui seront initialisées par app.py
 app = None
@@ -93,8 +108,8 @@ def init_routes(flask_app, database, models, mail_instance):
 
     # === FONCTION UTILITAIRE : CONNEXION BD ===
     def get_db_connection():
-        conn = psycopg2.connect(current_app.config['SQLALCHEMY_DATABASE_URI'])
-        return conn
+        # Connexion empruntée au pool partagé : conn.close() la rend au pool
+        return db_pool.get_connection(current_app.config['SQLALCHEMY_DATABASE_URI'])
 
     # === HOOKS & HELPERS SCOPÉS À LA REQUÊTE ===
     @app.before_request
@@ -132,6 +147,16 @@ def init_routes(flask_app, database, models, mail_instance):
         if dt.tzinfo is None:
             return dt.replace(tzinfo=timezone.utc).isoformat().replace('+00:00', 'Z')
         return dt.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+    def _invalidate_article_index():
+        """Forcer le rechargement de l'index d'articles du Data Analyst après une écriture sur le catalogue"""
+        # Index créé au premier message Bizzio : rien à faire s'il n'est pas chargé dans ce
+        # processus (et pas d'import de GeminiHandler, qui charge le SDK Gemini). Les autres
+        # workers voient le changement à leur prochaine vérification de la table articles.
+        article_index = sys.modules.get('GeminiHandler.article_index')
+        if article_index is not None:
+            article_index.invalidate_article_index()
     
     
     # === NOTIFICATIONS — HELPERS + API ===
@@ -139,14 +164,10 @@ def init_routes(flask_app, database, models, mail_instance):
     def _create_notification(*, scope: str, ville: Optional[str], actor_user_id: int,
                             action: str, resource_type: str, resource_id: Optional[str],
                             message: str):
-        """Insère une notification en base (table notifications)."""
-        conn = get_db_connection(); cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO notifications (scope, ville, actor_user_id, action, resource_type, resource_id, message, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
-        """, [scope, ville, actor_user_id, action, resource_type, resource_id, message])
-        conn.commit()
-        cur.close(); conn.close()
+        """Met la notification en file d'écriture (table notifications, publiée aux onglets après écriture)."""
+        audit_writer.get_writer().notify(scope=scope, ville=ville, actor_user_id=actor_user_id,
+                                         action=action, resource_type=resource_type,
+                                         resource_id=resource_id, message=message)
 
     # Envoi d'une notification (NE LOG PAS pour éviter les boucles)
     def notify(*, action: str, resource_type: str, resource_id: Optional[str],
@@ -178,20 +199,56 @@ def init_routes(flask_app, database, models, mail_instance):
         ville = g.current_city
         if not user_id:
             return jsonify({"count": 0})
-        conn = get_db_connection(); cur = conn.cursor()
-        cur.execute("""
-            SELECT COUNT(*)
-            FROM notifications n
-            LEFT JOIN notification_reads r
-            ON r.notif_id = n.notif_id AND r.user_id = %s
-            WHERE (n.scope = 'global' OR (n.scope = 'city' AND n.ville = %s))
-            AND n.actor_user_id <> %s
-            AND (r.read_at IS NULL)
-        """, [user_id, ville, user_id])
-        count = cur.fetchone()[0] or 0
-        cur.close(); conn.close()
+        # Compteur en mémoire tenu à jour par LISTEN/NOTIFY (lu en base au premier accès)
+        count = notification_hub.get_hub().unread_count(user_id, ville)
         return jsonify({"count": int(count)})
 
+    @app.route("/api/notifs/stream", methods=["GET"])
+    def api_notifs_stream():
+        """
+        Flux SSE des notifications de l'utilisateur :
+          count        → {count} à l'ouverture puis à chaque changement
+          notification → {notif_id, message, resource_type} à chaque nouvelle notification
+        Le flux est fermé après NOTIF_STREAM_LIFETIME secondes (EventSource se reconnecte).
+        """
+        user_id = g.user_id
+        ville = g.current_city
+        if not user_id:
+            return jsonify({"success": False, "message": "Non autorisé"}), 401
+
+        hub = notification_hub.get_hub()
+        subscription = hub.subscribe(user_id, ville)
+        if subscription is None:
+            # Trop de flux ouverts sur ce worker : le client repasse en polling
+            return jsonify({"success": False, "message": "Flux indisponible"}), 503
+        try:
+            count = hub.unread_count(user_id, ville)
+        except Exception:
+            hub.unsubscribe(subscription)
+            raise
+        lifetime = current_app.config.get('NOTIF_STREAM_LIFETIME', 300)
+
+        def generate():
+            try:
+                yield "retry: 5000\n\n"
+                yield f"event: count\ndata: {json.dumps({'count': count})}\n\n"
+                deadline = time.monotonic() + lifetime
+                while time.monotonic() < deadline:
+                    try:
+                        yield subscription.events.get(timeout=hub.keepalive)
+                    except queue.Empty:
+                        yield ": ping\n\n"
+            finally:
+                hub.unsubscribe(subscription)
+
+        response = Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        # Client parti avant le premier évènement : abonnement retiré quand même
+        response.call_on_close(lambda: hub.unsubscribe(subscription))
+        return response
+
     @app.route("/api/notifs/list", methods=["GET"])
     def api_notifs_list():
         """
@@ -208,35 +265,39 @@ def init_routes(flask_app, database, models, mail_instance):
         before_id = request.args.get("before_id")
 
         pivot_clause = ""
-        params = [user_id, ville]
+        params = {"user_id": user_id, "ville": ville, "limit": limit + 1}
+        conn = get_db_connection(); cur = conn.cursor()
         if before_id:
-            conn = get_db_connection(); cur = conn.cursor()
             cur.execute("SELECT created_at FROM notifications WHERE notif_id = %s", [before_id])
             row = cur.fetchone()
-            cur.close(); conn.close()
             if row:
-                pivot_clause = "AND n.created_at < %s"
-                params.append(row[0])
+                pivot_clause = "AND n.created_at < %(pivot)s"
+                params["pivot"] = row[0]
 
-        unread_clause = "AND (r.read_at IS NULL)" if only_unread else ""
+        # Non lue = au-dessus du filigrane de sa portée et sans exception (lecture/masquage)
+        unread_expr = "(r.notif_id IS NULL AND n.created_at > CASE WHEN n.scope = 'global' THEN wm.global_at ELSE wm.city_at END)"
+        # Borne connue à l'exécution : seules les partitions postérieures au filigrane sont lues
+        unread_clause = (f"AND {unread_expr} AND n.created_at > (SELECT LEAST(global_at, city_at) FROM wm)"
+                         if only_unread else "")
 
-        conn = get_db_connection(); cur = conn.cursor()
-        cur.execute(f"""
+        cur.execute(notification_hub.WATERMARKS_CTE + f"""
             SELECT n.notif_id, n.scope, n.ville, n.actor_user_id, u.nom_utilisateur,
                 n.action, n.resource_type, n.resource_id, n.message,
-                n.created_at, (r.read_at IS NULL) AS is_unread
+                n.created_at, {unread_expr} AS is_unread
             FROM notifications n
+            CROSS JOIN wm
             LEFT JOIN notification_reads r
-            ON r.notif_id = n.notif_id AND r.user_id = %s
+            ON r.notif_id = n.notif_id AND r.user_id = %(user_id)s
             LEFT JOIN utilisateurs u
             ON u.user_id = n.actor_user_id
-            WHERE (n.scope = 'global' OR (n.scope = 'city' AND n.ville = %s))
-            AND n.actor_user_id <> %s
+            WHERE (n.scope = 'global' OR (n.scope = 'city' AND n.ville = %(ville)s))
+            AND n.actor_user_id <> %(user_id)s
+            AND NOT COALESCE(r.hidden, FALSE)
             {pivot_clause}
             {unread_clause}
             ORDER BY n.created_at DESC
-            LIMIT %s
-        """, [user_id, ville, user_id] + params[2:] + [limit + 1])
+            LIMIT %(limit)s
+        """, params)
         rows = cur.fetchall()
         cur.close(); conn.close()
 
@@ -290,28 +351,48 @@ def init_routes(flask_app, database, models, mail_instance):
             ON CONFLICT (notif_id, user_id)
             DO UPDATE SET read_at = EXCLUDED.read_at
         """, [notif_id, g.user_id])
+        # Nouveau compteur poussé aux autres onglets de l'utilisateur
+        count = notification_hub.unread_count_query(cur, g.user_id, g.current_city)
+        notification_hub.publish(cur, 'count', user_id=g.user_id, ville=g.current_city, count=count)
         conn.commit(); cur.close(); conn.close()
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "count": count})
 
     @app.route("/api/notifs/mark_all_read", methods=["POST"])
     def api_notifs_mark_all_read():
         if not g.user_id:
             return jsonify({"ok": False}), 400
         conn = get_db_connection(); cur = conn.cursor()
+        # Filigranes avancés jusqu'à la dernière notification de chaque portée (jamais reculés)
         cur.execute("""
-            INSERT INTO notification_reads (notif_id, user_id, read_at)
-            SELECT n.notif_id, %s, NOW()
-            FROM notifications n
-            WHERE (n.scope='global' OR (n.scope='city' AND n.ville=%s))
-            ON CONFLICT (notif_id, user_id)
-            DO UPDATE SET read_at = EXCLUDED.read_at
-        """, [g.user_id, g.current_city])
+            INSERT INTO notification_watermarks (user_id, scope, ville, last_read_at)
+            SELECT %(user_id)s, 'global', '', MAX(created_at)
+              FROM notifications WHERE scope = 'global'
+            HAVING MAX(created_at) IS NOT NULL
+            UNION ALL
+            SELECT %(user_id)s, 'city', %(ville)s, MAX(created_at)
+              FROM notifications WHERE scope = 'city' AND ville = %(ville)s
+            HAVING MAX(created_at) IS NOT NULL
+            ON CONFLICT (user_id, scope, ville)
+            DO UPDATE SET last_read_at = GREATEST(notification_watermarks.last_read_at, EXCLUDED.last_read_at)
+        """, {"user_id": g.user_id, "ville": g.current_city})
+        # Lectures individuelles désormais couvertes par les filigranes (masquages conservés)
+        cur.execute("""
+            DELETE FROM notification_reads r
+             USING notifications n, notification_watermarks w
+             WHERE r.user_id = %s AND NOT r.hidden
+               AND n.notif_id = r.notif_id
+               AND w.user_id = r.user_id
+               AND ((n.scope = 'global' AND w.scope = 'global')
+                    OR (n.scope = 'city' AND w.scope = 'city' AND w.ville = n.ville))
+               AND n.created_at <= w.last_read_at
+        """, [g.user_id])
+        notification_hub.publish(cur, 'count', user_id=g.user_id, ville=g.current_city, count=0)
         conn.commit(); cur.close(); conn.close()
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "count": 0})
 
     @app.route("/api/notifs/delete", methods=["POST"])
     def api_notifs_delete():
-        """Supprimer une notification pour l'utilisateur actuel."""
+        """Supprimer (masquer) une notification pour l'utilisateur actuel."""
         data = request.get_json(force=True) or {}
         notif_id = data.get("notif_id")
         if not notif_id or not g.user_id:
@@ -331,8 +412,15 @@ def init_routes(flask_app, database, models, mail_instance):
             cur.close(); conn.close()
             return jsonify({"ok": False, "error": "Notification non trouvée"}), 404
         
-        # Supprimer la notification (cascade supprimera aussi les notification_reads)
-        cur.execute("DELETE FROM notifications WHERE notif_id = %s", [notif_id])
+        # Exception « masquée » pour cet utilisateur seulement (les autres la voient toujours)
+        cur.execute("""
+            INSERT INTO notification_reads (notif_id, user_id, read_at, hidden)
+            VALUES (%s, %s, NOW(), TRUE)
+            ON CONFLICT (notif_id, user_id)
+            DO UPDATE SET hidden = TRUE, read_at = COALESCE(notification_reads.read_at, EXCLUDED.read_at)
+        """, [notif_id, g.user_id])
+        count = notification_hub.unread_count_query(cur, g.user_id, g.current_city)
+        notification_hub.publish(cur, 'count', user_id=g.user_id, ville=g.current_city, count=count)
         conn.commit(); cur.close(); conn.close()
         
         return jsonify({"ok": True})
@@ -345,20 +433,14 @@ def init_routes(flask_app, database, models, mail_instance):
         """
         Écrit le log ET, si applicable, déclenche une notification.
         """
-        # 1) Écrire le log (inchangé)
+        # 1) Log mis en file (écrit par lots hors requête, contexte résolu ici)
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO logs_actions (user_id, action, cible_id, cible_type, ville, payload_avant, payload_apres, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s::jsonb, %s::jsonb, CURRENT_TIMESTAMP)
-            """, [
-                g.user_id, action, str(cible_id), cible_type, city_param(),
-                json.dumps(payload_avant) if payload_avant is not None else None,
-                json.dumps(payload_apres)  if payload_apres  is not None else None
-            ])
-            conn.commit()
-            cur.close(); conn.close()
+            audit_writer.get_writer().log(
+                user_id=g.user_id, action=action, cible_id=str(cible_id), cible_type=cible_type,
+                ville=city_param(),
+                payload_avant=json.dumps(payload_avant) if payload_avant is not None else None,
+                payload_apres=json.dumps(payload_apres) if payload_apres is not None else None
+            )
         except Exception as e:
             print(f"[LOG WARNING] {e}")
 
@@ -812,8 +894,9 @@ def init_routes(flask_app, database, models, mail_instance):
     # Générer PDF proforma
     def generate_proforma_pdf(data):
         try:
-            html_content = render_template('proforma_template.html', **data)
-            pdf = HTML(string=html_content).write_pdf()
+            html_content = render_template('proforma_template.html', **data, pdf_stylesheets=PROFORMA_PDF_STYLESHEETS)
+            pdf = pdf_renderer.get_service().render(html_content, base_url=request.url_root,
+                                                    stylesheets=PROFORMA_PDF_STYLESHEETS)
             return pdf
         except Exception as e:
             print(f"Erreur generate_proforma_pdf: {e}")
@@ -823,8 +906,9 @@ def init_routes(flask_app, database, models, mail_instance):
     def generate_facture_pdf(data):
         try:
             # Utiliser le même template pour l'instant
-            html_content = render_template('proforma_template.html', **data)
-            pdf = HTML(string=html_content).write_pdf()
+            html_content = render_template('proforma_template.html', **data, pdf_stylesheets=PROFORMA_PDF_STYLESHEETS)
+            pdf = pdf_renderer.get_service().render(html_content, base_url=request.url_root,
+                                                    stylesheets=PROFORMA_PDF_STYLESHEETS)
             return pdf
         except Exception as e:
             print(f"Erreur generate_facture_pdf: {e}")
@@ -834,8 +918,9 @@ def init_routes(flask_app, database, models, mail_instance):
     def generate_bon_livraison_pdf(data):
         try:
             # Utiliser le même template pour l'instant
-            html_content = render_template('proforma_template.html', **data)
-            pdf = HTML(string=html_content).write_pdf()
+            html_content = render_template('proforma_template.html', **data, pdf_stylesheets=PROFORMA_PDF_STYLESHEETS)
+            pdf = pdf_renderer.get_service().render(html_content, base_url=request.url_root,
+                                                    stylesheets=PROFORMA_PDF_STYLESHEETS)
             return pdf
         except Exception as e:
             print(f"Erreur generate_bon_livraison_pdf: {e}")
@@ -1078,10 +1163,7 @@ def init_routes(flask_app, database, models, mail_instance):
             try:
                 cur.execute("""
                     SELECT COALESCE(SUM(
-                        (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id)
+                        COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                         + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                     ), 0)
                     FROM proformas p
@@ -1190,10 +1272,7 @@ def init_routes(flask_app, database, models, mail_instance):
             # 1) CA ventes (proformas terminées)
             cur.execute("""
                 SELECT COALESCE(SUM(
-                    (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                    FROM proforma_articles pa 
-                    JOIN articles a ON a.article_id = pa.article_id 
-                    WHERE pa.proforma_id = p.proforma_id)
+                    COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                     + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                 ), 0)
                 FROM proformas p
@@ -1273,10 +1352,7 @@ def init_routes(flask_app, database, models, mail_instance):
             # 1) CA précédent
             cur.execute("""
                 SELECT COALESCE(SUM(
-                    (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                    FROM proforma_articles pa 
-                    JOIN articles a ON a.article_id = pa.article_id 
-                    WHERE pa.proforma_id = p.proforma_id)
+                    COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                     + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                 ), 0)
                 FROM proformas p
@@ -1412,7 +1488,7 @@ def init_routes(flask_app, database, models, mail_instance):
 
     # Récupérer les années disponibles dynamiquement depuis les proformas et factures
     def get_available_years():
-        try:
+        def load():
             conn = get_db_connection()
             cur = conn.cursor()
             
@@ -1429,14 +1505,18 @@ def init_routes(flask_app, database, models, mail_instance):
             """)
             
             years = [int(row[0]) for row in cur.fetchall()]
+            cur.close()
+            conn.close()
+            return years
+
+        try:
+            # Liste en cache partagée : copiée avant d'y ajouter l'année actuelle
+            years = list(reference_cache.get_cache().get_or_load('available_years', load))
             
             # Ajouter l'année actuelle si pas présente
             current_year = datetime.now().year
             if current_year not in years:
                 years.insert(0, current_year)
-            
-            cur.close()
-            conn.close()
             return years
             
         except Exception as e:
@@ -1444,148 +1524,118 @@ def init_routes(flask_app, database, models, mail_instance):
             return [datetime.now().year]
 
     
+    # Calculer la tendance (%) d'un indicateur par rapport à la période précédente
+    def calculate_kpi_trend(current, previous):
+        if current == 0:
+            return 0  # ✅ Si valeur actuelle = 0, toujours afficher 0%
+        elif previous == 0 and current > 0:
+            return 100  # Nouvelle apparition
+        else:
+            return round(((current - previous) / previous) * 100, 1)
+
+    # Moteur KPI : tous les indicateurs pour N périodes en une seule requête groupée
+    def get_kpi_data_for_periods(ville, periods):
+        """
+        periods : liste de tuples (date_debut, date_fin), bornes incluses.
+        Retourne une liste de dicts KPI dans le même ordre que `periods`.
+        """
+        empty = {"chiffre_affaires": 0, "factures": 0, "devis": 0, "a_traiter": 0}
+        if not periods:
+            return []
+
+        values_sql = ", ".join(["(%s, %s::date, %s::date)"] * len(periods))
+        params = []
+        for idx, (date_debut, date_fin) in enumerate(periods):
+            params.extend([idx, date_debut, date_fin])
+
+        conn = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute(f"""
+                WITH periodes(idx, debut, fin) AS (VALUES {values_sql}),
+                kpi_proformas AS (
+                    SELECT per.idx,
+                        COALESCE(SUM(COALESCE(t.total_articles, 0) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0))
+                            FILTER (WHERE p.etat = 'termine'), 0) AS ca_terminees,
+                        COUNT(*) FILTER (WHERE p.etat IN ('termine', 'partiel')) AS factures,
+                        COALESCE(SUM(
+                            CASE
+                                WHEN p.etat IN ('en_attente', 'en_cours') THEN
+                                    COALESCE(t.total_articles, 0) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
+                                ELSE COALESCE(p.montant_restant, 0)
+                            END
+                        ) FILTER (WHERE p.etat IN ('en_attente', 'en_cours', 'partiel')), 0) AS devis,
+                        COUNT(*) FILTER (WHERE p.etat IN ('en_attente', 'en_cours', 'partiel')) AS a_traiter
+                    FROM periodes per
+                    LEFT JOIN proformas p
+                        ON p.ville = %s
+                        AND p.date_creation >= per.debut AND p.date_creation <= per.fin
+                    LEFT JOIN proforma_totals t ON t.proforma_id = p.proforma_id
+                    GROUP BY per.idx
+                ),
+                kpi_factures AS (
+                    SELECT per.idx, COALESCE(SUM(f.montant_total), 0) AS ca_partielles
+                    FROM periodes per
+                    LEFT JOIN factures f
+                        ON f.ville = %s
+                        AND f.statut = 'partiel'
+                        AND f.date_facture >= per.debut AND f.date_facture <= per.fin
+                    GROUP BY per.idx
+                )
+                SELECT kp.idx, kp.ca_terminees + kf.ca_partielles, kp.factures, kp.devis, kp.a_traiter
+                FROM kpi_proformas kp
+                JOIN kpi_factures kf ON kf.idx = kp.idx
+                ORDER BY kp.idx
+            """, params + [ville, ville])
+
+            results = [dict(empty) for _ in periods]
+            for idx, chiffre_affaires, factures, devis, a_traiter in cur.fetchall():
+                results[idx] = {
+                    "chiffre_affaires": chiffre_affaires or 0,
+                    "factures": factures or 0,
+                    "devis": devis or 0,
+                    "a_traiter": a_traiter or 0
+                }
+            cur.close()
+            return results
+
+        except Exception as e:
+            print(f"❌ Erreur get_kpi_data_for_periods: {e}")
+            return [dict(empty) for _ in periods]
+        finally:
+            if conn:
+                conn.close()
+
+    # Périodes du dashboard : année en cours (à date) et mois précédent
+    def get_dashboard_kpi_periods():
+        today = datetime.now().date()
+        prev_month_end = today.replace(day=1) - timedelta(days=1)
+        prev_month_start = prev_month_end.replace(day=1)
+        return [(today.replace(month=1, day=1), today), (prev_month_start, prev_month_end)]
+
+    # KPIs courants + précédents + tendances en un seul aller-retour
+    def get_kpi_overview(ville, user_id):
+        current_kpis, prev_kpis = get_kpi_data_for_periods(ville, get_dashboard_kpi_periods())
+        trends = {key: calculate_kpi_trend(current_kpis[key], prev_kpis[key]) for key in current_kpis}
+        return {"current": current_kpis, "previous": prev_kpis, "trends": trends}
+
     # Calculer les tendances des KPIs vs mois précédent
     def calculate_kpi_trends(ville, user_id):
         try:
-            # Mois actuel
-            current_kpis = get_kpi_data(ville, user_id)
-            
-            # Mois précédent
-            prev_month_start = (datetime.now().replace(day=1) - timedelta(days=1)).replace(day=1)
-            prev_month_end = datetime.now().replace(day=1) - timedelta(days=1)
-            
-            prev_kpis = get_kpi_data(ville, user_id, prev_month_start, prev_month_end)
-            
-            # Calculer les pourcentages
-            def calculate_trend(current, previous):
-                if current == 0:
-                    return 0  # ✅ Si valeur actuelle = 0, toujours afficher 0%
-                elif previous == 0 and current > 0:
-                    return 100  # Nouvelle apparition
-                else:
-                    return round(((current - previous) / previous) * 100, 1)
-            
-            return {
-                "chiffre_affaires": calculate_trend(current_kpis['chiffre_affaires'], prev_kpis['chiffre_affaires']),
-                "factures": calculate_trend(current_kpis['factures'], prev_kpis['factures']),
-                "devis": calculate_trend(current_kpis['devis'], prev_kpis['devis']),
-                "a_traiter": calculate_trend(current_kpis['a_traiter'], prev_kpis['a_traiter'])
-            }
-            
+            return get_kpi_overview(ville, user_id)["trends"]
         except Exception as e:
             print(f"Erreur calculate_kpi_trends: {e}")
             return {"chiffre_affaires": 0, "factures": 0, "devis": 0, "a_traiter": 0}
    
     # Fonction de calcul des indicateurs de performance (KPI) par ville et utilisateur sur une période donnée
     def get_kpi_data(ville, user_id, date_debut=None, date_fin=None):
-        try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
-            # Dates par défaut - Utiliser une période plus large pour inclure toutes les données
-            if not date_debut:
-                date_debut = datetime.now().replace(month=1, day=1).date()  # Début de l'année
-            if not date_fin:
-                date_fin = datetime.now().date()
-            
-            print(f"🔍 DEBUG KPI - Ville: {ville}, User: {user_id}")
-            print(f"🔍 DEBUG KPI - Période: {date_debut} à {date_fin}")
-            
-            # Chiffre d'affaires (terminées)
-            cur.execute("""
-                SELECT COALESCE(SUM(
-                    (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                    FROM proforma_articles pa 
-                    JOIN articles a ON a.article_id = pa.article_id 
-                    WHERE pa.proforma_id = p.proforma_id)
-                    + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
-                ), 0)
-                FROM proformas p
-                WHERE p.ville = %s
-                AND p.etat = 'termine'
-                AND p.date_creation >= %s AND p.date_creation <= %s
-            """, [ville, date_debut, date_fin])
-            result_terminees = cur.fetchone()
-            ca_terminees = result_terminees[0] if result_terminees else 0
-            
-            # Chiffre d'affaires (factures partielles)
-            cur.execute("""
-                SELECT COALESCE(SUM(f.montant_total), 0)
-                FROM factures f
-                WHERE f.ville = %s
-                AND f.statut = 'partiel'
-                AND f.date_facture >= %s AND f.date_facture <= %s
-            """, [ville, date_debut, date_fin])
-            result_partielles = cur.fetchone()
-            ca_partielles = result_partielles[0] if result_partielles else 0
-            
-            chiffre_affaires = ca_terminees + ca_partielles
-            
-            # Factures (nb terminées + partielles)
-            cur.execute("""
-                SELECT COUNT(*)
-                FROM proformas p
-                WHERE p.ville = %s
-                AND p.etat IN ('termine', 'partiel')
-                AND p.date_creation >= %s AND p.date_creation <= %s
-            """, [ville, date_debut, date_fin])
-            result_factures = cur.fetchone()
-            factures = result_factures[0] if result_factures else 0
-            
-            # Devis (en_attente/en_cours + montant_restant des partiels)
-            cur.execute("""
-                SELECT COALESCE(SUM(
-                    CASE 
-                        WHEN p.etat IN ('en_attente', 'en_cours') THEN
-                            (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                            FROM proforma_articles pa 
-                            JOIN articles a ON a.article_id = pa.article_id 
-                            WHERE pa.proforma_id = p.proforma_id)
-                            + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
-                        WHEN p.etat = 'partiel' THEN
-                            COALESCE(p.montant_restant, 0)
-                        ELSE 0
-                    END
-                ), 0)
-                FROM proformas p
-                WHERE p.ville = %s
-                AND p.etat IN ('en_attente', 'en_cours', 'partiel')
-                AND p.date_creation >= %s AND p.date_creation <= %s
-            """, [ville, date_debut, date_fin])
-            result_devis = cur.fetchone()
-            devis = result_devis[0] if result_devis else 0
-            
-            # À traiter (nb en_attente/en_cours/partiel)
-            cur.execute("""
-                SELECT COUNT(*)
-                FROM proformas p
-                WHERE p.ville = %s
-                AND p.etat IN ('en_attente', 'en_cours', 'partiel')
-                AND p.date_creation >= %s AND p.date_creation <= %s
-            """, [ville, date_debut, date_fin])
-            result_a_traiter = cur.fetchone()
-            a_traiter = result_a_traiter[0] if result_a_traiter else 0
-            
-            cur.close()
-            conn.close()
-            
-            return {
-                "chiffre_affaires": chiffre_affaires,
-                "factures": factures,
-                "devis": devis,
-                "a_traiter": a_traiter
-            }
-            
-        except Exception as e:
-            print(f"❌ Erreur get_kpi_data: {e}")
-            cur.close()
-            conn.close()
-            return {
-                "chiffre_affaires": 0,
-                "factures": 0,
-                "devis": 0,
-                "a_traiter": 0
-            }
+        # Dates par défaut - Utiliser une période plus large pour inclure toutes les données
+        if not date_debut:
+            date_debut = datetime.now().replace(month=1, day=1).date()  # Début de l'année
+        if not date_fin:
+            date_fin = datetime.now().date()
+        return get_kpi_data_for_periods(ville, [(date_debut, date_fin)])[0]
 
     # Récupérer les proformas formatées pour l'affichage
     def get_proformas_by_user_formatted(ville, user_id):
@@ -1616,10 +1666,7 @@ def init_routes(flask_app, database, models, mail_instance):
                     LOWER(p.etat) as etat,
                     COALESCE(u.nom_utilisateur, 'Utilisateur supprimé') as created_by,
                     COALESCE(
-                        (SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id), 0
+                        (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                     ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0) as total_ttc,
                     COALESCE(p.montant_paye, 0) as montant_paye,
                     COALESCE(p.montant_restant, 0) as montant_restant
@@ -1687,7 +1734,7 @@ def init_routes(flask_app, database, models, mail_instance):
 
     # Récupérer les classes disponibles pour les livres
     def get_classes_livres():
-        try:
+        def load():
             conn = get_db_connection()
             cur = conn.cursor()
             
@@ -1704,6 +1751,9 @@ def init_routes(flask_app, database, models, mail_instance):
             cur.close()
             conn.close()
             return classes
+
+        try:
+            return reference_cache.get_cache().get_or_load('classes_livres', load)
             
         except Exception as e:
             print(f"Erreur get_classes_livres: {e}")
@@ -1712,7 +1762,7 @@ def init_routes(flask_app, database, models, mail_instance):
     # Récupérer toutes les formations disponibles
     def get_formations_disponibles():
         """Récupérer les types de formations disponibles"""
-        try:
+        def load():
             conn = get_db_connection()
             cur = conn.cursor()
             
@@ -1734,6 +1784,9 @@ def init_routes(flask_app, database, models, mail_instance):
             cur.close()
             conn.close()
             return formations
+
+        try:
+            return reference_cache.get_cache().get_or_load('formations', load)
             
         except Exception as e:
             print(f"❌ Erreur get_formations_disponibles: {e}")
@@ -1741,7 +1794,7 @@ def init_routes(flask_app, database, models, mail_instance):
 
     # Récupérer les villes disponibles pour les fournitures
     def get_villes_fournitures():
-        try:
+        def load():
             conn = get_db_connection()
             cur = conn.cursor()
             
@@ -1756,6 +1809,9 @@ def init_routes(flask_app, database, models, mail_instance):
             cur.close()
             conn.close()
             return villes
+
+        try:
+            return reference_cache.get_cache().get_or_load('villes_fournitures', load)
             
         except Exception as e:
             print(f"Erreur get_villes_fournitures: {e}")
@@ -1763,7 +1819,7 @@ def init_routes(flask_app, database, models, mail_instance):
 
     # Récupérer les natures disponibles pour les livres
     def get_natures_disponibles():
-        try:
+        def load():
             conn = get_db_connection()
             cur = conn.cursor()
             
@@ -1780,6 +1836,9 @@ def init_routes(flask_app, database, models, mail_instance):
             cur.close()
             conn.close()
             return natures
+
+        try:
+            return reference_cache.get_cache().get_or_load('natures', load)
             
         except Exception as e:
             print(f"Erreur get_natures_disponibles: {e}")
@@ -1945,8 +2004,9 @@ def init_routes(flask_app, database, models, mail_instance):
             # Code existant...
             available_years = get_available_years()
             selected_year = request.args.get('year', datetime.now().year, type=int)
-            kpi_data = get_kpi_data(ville, user_id)
-            kpi_trends = calculate_kpi_trends(ville, user_id)
+            kpi_overview = get_kpi_overview(ville, user_id)
+            kpi_data = kpi_overview['current']
+            kpi_trends = kpi_overview['trends']
             
             # ✅ RÉCUPÉRATION AVEC DEBUG RENFORCÉ
             print(f"🔍 Fetching proformas for user {user_id} in ville {ville}")
@@ -2034,10 +2094,7 @@ def init_routes(flask_app, database, models, mail_instance):
                         COUNT(CASE WHEN p.etat = 'termine' THEN 1 END) as nb_factures,
                         SUM(
                             CASE WHEN p.etat = 'termine' THEN
-                                (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                                FROM proforma_articles pa 
-                                JOIN articles a ON a.article_id = pa.article_id 
-                                WHERE pa.proforma_id = p.proforma_id)
+                                COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                                 + COALESCE(p.frais, 0)
                                 - COALESCE(p.remise, 0)
                             ELSE 0 END
@@ -2187,27 +2244,30 @@ def init_routes(flask_app, database, models, mail_instance):
             if not nature:
                 return jsonify({"success": False, "message": "Nature manquante"}), 400
 
-            print(f"🔍 DEBUG: Getting classes for nature '{nature}'")
+            def load():
+                conn = get_db_connection()
+                cur = conn.cursor()
+                
+                # Requête optimisée pour les classes
+                cur.execute("""
+                    SELECT DISTINCT classe 
+                    FROM articles 
+                    WHERE type_article = 'livre' 
+                    AND LOWER(TRIM(COALESCE(nature, ''))) = LOWER(TRIM(%s))
+                    AND classe IS NOT NULL 
+                    AND classe != ''
+                    ORDER BY classe
+                """, [nature])
+                
+                classes = [row[0] for row in cur.fetchall() if row[0]]
+                
+                cur.close()
+                conn.close()
+                return classes
 
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
-            # Requête optimisée pour les classes
-            cur.execute("""
-                SELECT DISTINCT classe 
-                FROM articles 
-                WHERE type_article = 'livre' 
-                AND LOWER(TRIM(COALESCE(nature, ''))) = LOWER(TRIM(%s))
-                AND classe IS NOT NULL 
-                AND classe != ''
-                ORDER BY classe
-            """, [nature])
-            
-            classes = [row[0] for row in cur.fetchall() if row[0]]
-            print(f"🔍 DEBUG: Found {len(classes)} classes for nature '{nature}': {classes}")
-            
-            cur.close()
-            conn.close()
+            # Même clé pour toutes les casses / espaces (comparaison LOWER(TRIM()) en SQL)
+            classes = reference_cache.get_cache().get_or_load(
+                ('classes_by_nature', nature.strip().lower()), load)
             
             return jsonify({
                 "success": True,
@@ -2239,39 +2299,41 @@ def init_routes(flask_app, database, models, mail_instance):
                     "message": "Nature et classe obligatoires"
                 }), 400
 
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
-            # Requête pour récupérer les livres par nature + classe
-            cur.execute("""
-                SELECT article_id, code, designation, prix, nature, classe
-                FROM articles 
-                WHERE type_article = 'livre' 
-                AND LOWER(TRIM(COALESCE(nature, ''))) = LOWER(TRIM(%s))
-                AND LOWER(TRIM(COALESCE(classe, ''))) = LOWER(TRIM(%s))
-                AND designation IS NOT NULL
-                AND designation != ''
-                ORDER BY designation
-            """, [nature, classe])
-            
-            livres = []
-            rows = cur.fetchall()
-            print(f"🔍 DEBUG: Found {len(rows)} books")
-            
-            for row in rows:
-                article_id, code, designation, prix, nature_db, classe_db = row
+            def load():
+                conn = get_db_connection()
+                cur = conn.cursor()
                 
-                livres.append({
-                    'article_id': article_id,
-                    'code': code or f"LIV{article_id:05d}",
-                    'designation': designation,
-                    'prix': int(prix) if prix else 0,
-                    'nature': nature_db,
-                    'classe': classe_db
-                })
-            
-            cur.close()
-            conn.close()
+                # Requête pour récupérer les livres par nature + classe
+                cur.execute("""
+                    SELECT article_id, code, designation, prix, nature, classe
+                    FROM articles 
+                    WHERE type_article = 'livre' 
+                    AND LOWER(TRIM(COALESCE(nature, ''))) = LOWER(TRIM(%s))
+                    AND LOWER(TRIM(COALESCE(classe, ''))) = LOWER(TRIM(%s))
+                    AND designation IS NOT NULL
+                    AND designation != ''
+                    ORDER BY designation
+                """, [nature, classe])
+                
+                livres = []
+                for row in cur.fetchall():
+                    article_id, code, designation, prix, nature_db, classe_db = row
+                    
+                    livres.append({
+                        'article_id': article_id,
+                        'code': code or f"LIV{article_id:05d}",
+                        'designation': designation,
+                        'prix': int(prix) if prix else 0,
+                        'nature': nature_db,
+                        'classe': classe_db
+                    })
+                
+                cur.close()
+                conn.close()
+                return livres
+
+            livres = reference_cache.get_cache().get_or_load(
+                ('livres_by_nature_classe', nature.strip().lower(), classe.strip().lower()), load)
             
             return jsonify({
                 "success": True,
@@ -2293,29 +2355,38 @@ def init_routes(flask_app, database, models, mail_instance):
             return jsonify({"success": False, "message": "Non autorisé"}), 401
 
         try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
-            cur.execute("""
-                SELECT a.article_id, a.code, a.designation, pv.prix
-                FROM prix_fournitures_ville pv
-                JOIN articles a ON a.article_id = pv.article_id
-                WHERE pv.ville = %s 
-                AND a.type_article = 'fourniture'
-                ORDER BY a.designation
-            """, [ville])
-            
-            fournitures = []
-            for row in cur.fetchall():
-                fournitures.append({
-                    'article_id': row[0],
-                    'code': row[1],
-                    'designation': row[2],
-                    'prix': row[3]
-                })
-            
-            cur.close()
-            conn.close()
+            def load():
+                conn = get_db_connection()
+                cur = conn.cursor()
+                
+                cur.execute("""
+                    SELECT a.article_id, a.code, a.designation, pv.prix
+                    FROM prix_fournitures_ville pv
+                    JOIN articles a ON a.article_id = pv.article_id
+                    WHERE pv.ville = %s 
+                    AND a.type_article = 'fourniture'
+                    ORDER BY a.designation
+                """, [ville])
+                
+                fournitures = []
+                for row in cur.fetchall():
+                    fournitures.append({
+                        'article_id': row[0],
+                        'code': row[1],
+                        'designation': row[2],
+                        'prix': row[3]
+                    })
+                
+                cur.close()
+                conn.close()
+                return fournitures
+
+            # Partition de la ville : invalidée seule quand ses prix changent.
+            # Seules les villes ayant des prix ont une partition (nombre de partitions borné)
+            if ville in get_villes_fournitures():
+                fournitures = reference_cache.get_cache().get_or_load('fournitures', load, partition=ville)
+            else:
+                fournitures = []
             
             return jsonify({
                 "success": True,
@@ -3068,10 +3139,7 @@ def init_routes(flask_app, database, models, mail_instance):
                     # Récupérer les montants actuels
                     cur.execute("""
                         SELECT COALESCE(montant_paye, 0), COALESCE(montant_restant, 0),
-                               COALESCE((SELECT SUM(pa.quantite * a.prix) 
-                                        FROM proforma_articles pa 
-                                        JOIN articles a ON a.article_id = pa.article_id 
-                                        WHERE pa.proforma_id = p.proforma_id) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0)
+                               COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0)
                         FROM proformas p
                         WHERE proforma_id = %s AND ville = %s
                     """, [proforma_id, ville])
@@ -3369,17 +3437,11 @@ def init_routes(flask_app, database, models, mail_instance):
                     p.proforma_id, p.date_creation, p.frais, p.remise, p.commentaire, p.etat,
                     c.nom, c.telephone, c.adresse, c.ville, c.pays,
                     COALESCE((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
+                        SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
                     ), 0) as sous_total,
 
                     COALESCE((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
+                        SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
                     ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0) as total_ttc
                 FROM proformas p
                 LEFT JOIN clients c ON c.client_id = p.client_id
@@ -3452,248 +3514,238 @@ def init_routes(flask_app, database, models, mail_instance):
             return jsonify({"success": False, "message": f"Erreur: {str(e)}"}), 500
         
     
-    @app.route('/api/proforma/<int:proforma_id>/download/<document_type>')
-    def api_download_document(proforma_id, document_type):
+    def fetch_document_rows(cur, proforma_ids, ville):
         """
-        Télécharger un document (proforma/facture/bon de livraison) en PDF
-        AVEC VALIDATION COMPLÈTE DU STATUT
+        En-têtes (proforma + client) et lignes d'articles de plusieurs proformas d'une ville,
+        en deux requêtes quel que soit leur nombre : ({id: en-tête}, {id: [lignes]}).
         """
-        # Vérification de l'authentification
-        if 'user_id' not in session:
-            print(f"❌ Accès non autorisé pour le téléchargement de {document_type}")
-            return jsonify({"success": False, "message": "Non autorisé"}), 401
-
-        # Validation du type de document
-        valid_document_types = ['proforma', 'facture', 'bon']
-        if document_type not in valid_document_types:
-            print(f"❌ Type de document invalide: {document_type}")
-            return jsonify({
-                "success": False, 
-                "message": f"Type de document invalide: {document_type}. Types autorisés: {', '.join(valid_document_types)}"
-            }), 400
-
-        try:
-            ville = session['ville']
-            user_id = session['user_id']
-            
-            print(f"🔍 DEBUG: Téléchargement {document_type} pour proforma {proforma_id}")
-            print(f"🔍 DEBUG: User {user_id}, Ville {ville}")
-            
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
-            # RÉCUPÉRATION DE LA PROFORMA AVEC TOUTES LES DONNÉES
-            # Permettre le téléchargement des proformas de tous les utilisateurs de la même ville
-            cur.execute("""
-                SELECT 
-                    p.proforma_id, p.date_creation, p.adresse_livraison, 
-                    p.frais, p.remise, p.etat, p.commentaire,
-                    c.nom, c.telephone, c.adresse, c.ville, c.pays
-                FROM proformas p
-                LEFT JOIN clients c ON c.client_id = p.client_id
-                WHERE p.proforma_id = %s AND p.ville = %s
-            """, [proforma_id, ville])
-            
-            proforma_row = cur.fetchone()
-            if not proforma_row:
-                cur.close()
-                conn.close()
-                print(f"❌ Proforma {proforma_id} non trouvée pour user {user_id} ville {ville}")
-                return jsonify({"success": False, "message": "Proforma non trouvée"}), 404
-            
-            print(f"✅ Proforma {proforma_id} trouvée avec statut: {proforma_row[5]}")
-            
-            # ✅ VALIDATION CRITIQUE DU STATUT ET DU TYPE DE DOCUMENT
-            etat = proforma_row[5] or 'en_attente'  # Statut par défaut si NULL
-            allowed_docs = get_allowed_documents_by_status(etat)
-
-            print(f"🔍 DEBUG: Proforma {proforma_id} - Statut: '{etat}', Document demandé: '{document_type}'")
-            print(f"🔍 DEBUG: Documents autorisés pour ce statut: {allowed_docs}")
-
-            # ✅ VALIDATION AVEC MESSAGES D'ERREUR DÉTAILLÉS
-            if document_type not in allowed_docs:
-                error_messages = {
-                    'en_attente': "Seule la proforma est disponible pour une commande en attente",
-                    'en_cours': "Erreur: Document non autorisé malgré le statut en cours",
-                    'partiel': "Erreur: Document non autorisé malgré le statut partiel", 
-                    'termine': "Aucun document n'est disponible - la commande est terminée"
-                }
-                
-                error_msg = error_messages.get(etat, f"Document {document_type} non autorisé pour le statut {etat}")
-                
-                print(f"❌ VALIDATION FAILED: {error_msg}")
-                cur.close()
-                conn.close()
-                return jsonify({
-                    "success": False, 
-                    "message": error_msg,
-                    "status": etat,
-                    "allowed_documents": allowed_docs,
-                    "requested_document": document_type
-                }), 400
-
-            # ✅ PROTECTION SPÉCIALE POUR LE STATUT "TERMINÉ"
-            if etat == 'termine':
-                print(f"❌ TÉLÉCHARGEMENT BLOQUÉ: Commande terminée, aucun document disponible")
-                cur.close()
-                conn.close()
-                return jsonify({
-                    "success": False,
-                    "message": "La commande est terminée. Aucun document n'est disponible pour téléchargement.",
-                    "status": "termine",
-                    "allowed_documents": [],
-                    "requested_document": document_type
-                }), 400
-
-            print(f"✅ Document {document_type} autorisé pour le statut {etat}")
-                    
-            # RÉCUPÉRER LES ARTICLES AVEC DÉTAILS ET QUANTITÉS LIVRÉES
+        # Permettre le téléchargement des proformas de tous les utilisateurs de la même ville
+        cur.execute("""
+            SELECT 
+                p.proforma_id, p.date_creation, p.adresse_livraison, 
+                p.frais, p.remise, p.etat, p.commentaire,
+                c.nom, c.telephone, c.adresse, c.ville, c.pays
+            FROM proformas p
+            LEFT JOIN clients c ON c.client_id = p.client_id
+            WHERE p.proforma_id = ANY(%s) AND p.ville = %s
+        """, [list(proforma_ids), ville])
+        headers = {row[0]: row for row in cur.fetchall()}
+
+        lines = {proforma_id: [] for proforma_id in headers}
+        if headers:
+            # ARTICLES AVEC DÉTAILS ET QUANTITÉS LIVRÉES
             cur.execute("""
                 SELECT 
+                    pa.proforma_id,
                     a.code, a.designation, a.prix, a.type_article,
                     pa.quantite, COALESCE(pa.statut_livraison, 'non_livré') as statut_livraison,
                     COALESCE(pa.quantite_livree, 0) as quantite_livree
                 FROM proforma_articles pa
                 JOIN articles a ON a.article_id = pa.article_id
-                WHERE pa.proforma_id = %s
-                ORDER BY a.type_article, a.designation
-            """, [proforma_id])
-            
-            articles_rows = cur.fetchall()
-            
-            cur.close()
-            conn.close()
-            
-            # CONSTRUIRE LES DONNÉES POUR LE TEMPLATE
-            pdf_data = {
-                'proforma_id': proforma_row[0],
-                'date_creation': proforma_row[1],
-                'adresse_livraison': proforma_row[2],
-                'frais': proforma_row[3] or 0,
-                'remise': proforma_row[4] or 0,
-                'etat': proforma_row[5],
-                'commentaire': proforma_row[6],
-                'client': {
-                    'nom': proforma_row[7] or "Client inconnu",
-                    'telephone': proforma_row[8] or "Non renseigné",
-                    'adresse': proforma_row[9] or "Non renseignée",
-                    'ville': proforma_row[10] or "Non renseignée",
-                    'pays': proforma_row[11] or "Cameroun"
-                },
-                'articles': [],
-                'document_type': document_type
+                WHERE pa.proforma_id = ANY(%s)
+                ORDER BY pa.proforma_id, a.type_article, a.designation
+            """, [list(headers)])
+            for row in cur.fetchall():
+                lines[row[0]].append(row[1:])
+        return headers, lines
+
+    def build_document_data(cur, proforma_id, ville, document_type, prefetched=None):
+        """
+        Données du template proforma_template.html pour un document (proforma/facture/bon),
+        avec validation du statut et filtrage des articles selon le type de document.
+        Retourne (pdf_data, None) ou (None, (payload_erreur, code_http)).
+        Partagé par le téléchargement unitaire et l'export groupé (`prefetched` : résultat de
+        fetch_document_rows pour toutes les proformas exportées).
+        """
+        headers, lines = prefetched or fetch_document_rows(cur, [proforma_id], ville)
+        proforma_row = headers.get(proforma_id)
+        if not proforma_row:
+            print(f"❌ Proforma {proforma_id} non trouvée pour la ville {ville}")
+            return None, ({"success": False, "message": "Proforma non trouvée"}, 404)
+        
+        # ✅ VALIDATION CRITIQUE DU STATUT ET DU TYPE DE DOCUMENT
+        etat = proforma_row[5] or 'en_attente'  # Statut par défaut si NULL
+        allowed_docs = get_allowed_documents_by_status(etat)
+
+        print(f"🔍 DEBUG: Proforma {proforma_id} - Statut: '{etat}', Document demandé: '{document_type}'")
+
+        # ✅ VALIDATION AVEC MESSAGES D'ERREUR DÉTAILLÉS
+        if document_type not in allowed_docs:
+            error_messages = {
+                'en_attente': "Seule la proforma est disponible pour une commande en attente",
+                'en_cours': "Erreur: Document non autorisé malgré le statut en cours",
+                'partiel': "Erreur: Document non autorisé malgré le statut partiel", 
+                'termine': "Aucun document n'est disponible - la commande est terminée"
             }
             
-            # TRAITER LES ARTICLES SELON LE TYPE DE DOCUMENT
-            sous_total = 0
-            articles_filtered = []
-
-            print(f"🔍 DEBUG: Filtrage des articles pour {document_type} avec statut {etat}")
+            error_msg = error_messages.get(etat, f"Document {document_type} non autorisé pour le statut {etat}")
+            
+            print(f"❌ VALIDATION FAILED: {error_msg}")
+            return None, ({
+                "success": False, 
+                "message": error_msg,
+                "status": etat,
+                "allowed_documents": allowed_docs,
+                "requested_document": document_type
+            }, 400)
 
-            for i, article in enumerate(articles_rows):
-                code, designation, prix_unitaire, type_article, quantite, statut_livraison, quantite_livree = article
-                
-                # ✅ LOGIQUE DE FILTRAGE SELON LE TYPE DE DOCUMENT ET LE STATUT
-                include_article = True
+        # ✅ PROTECTION SPÉCIALE POUR LE STATUT "TERMINÉ"
+        if etat == 'termine':
+            print(f"❌ TÉLÉCHARGEMENT BLOQUÉ: Commande terminée, aucun document disponible")
+            return None, ({
+                "success": False,
+                "message": "La commande est terminée. Aucun document n'est disponible pour téléchargement.",
+                "status": "termine",
+                "allowed_documents": [],
+                "requested_document": document_type
+            }, 400)
                 
-                if document_type == 'bon':
-                    if etat == 'partiel':
-                        # Pour bon de livraison partiel, prendre les articles livrés ET partiellement livrés
-                        if statut_livraison in ['livré', 'partiellement_livré']:
-                            include_article = True
-                            # Pour les articles partiellement livrés, afficher la quantité livrée
-                            if statut_livraison == 'partiellement_livré':
-                                quantite_affichee = quantite_livree
-                            else:
-                                quantite_affichee = quantite
-                            print(f"🔍 DEBUG: Article {i+1} '{designation}' inclus (statut: {statut_livraison}, qty: {quantite_affichee})")
-                        else:
-                            include_article = False
-                            print(f"🔍 DEBUG: Article {i+1} '{designation}' exclu (statut: {statut_livraison})")
-                    elif etat in ['en_cours']:
-                        # Pour bon de livraison complet, prendre tous les articles
-                        quantite_affichee = quantite
-                        print(f"🔍 DEBUG: Article {i+1} '{designation}' inclus (bon complet)")
-                else:
-                    # Pour proforma, toujours inclure tous les articles
-                    # Pour facture partielle, ne prendre que les articles livrés
-                    if document_type == 'facture' and etat == 'partiel':
-                        if statut_livraison in ['livré', 'partiellement_livré']:
-                            include_article = True
-                            print(f"🔍 DEBUG: Article {i+1} '{designation}' inclus (facture partielle, statut: {statut_livraison})")
-                        else:
-                            include_article = False
-                            print(f"🔍 DEBUG: Article {i+1} '{designation}' exclu (facture partielle, statut: {statut_livraison})")
-                    else:
-                        include_article = True
-                        print(f"🔍 DEBUG: Article {i+1} '{designation}' inclus ({document_type})")
+        articles_rows = lines.get(proforma_id, [])
+        
+        # CONSTRUIRE LES DONNÉES POUR LE TEMPLATE
+        pdf_data = {
+            'proforma_id': proforma_row[0],
+            'date_creation': proforma_row[1],
+            'adresse_livraison': proforma_row[2],
+            'frais': proforma_row[3] or 0,
+            'remise': proforma_row[4] or 0,
+            'etat': proforma_row[5],
+            'commentaire': proforma_row[6],
+            'client': {
+                'nom': proforma_row[7] or "Client inconnu",
+                'telephone': proforma_row[8] or "Non renseigné",
+                'adresse': proforma_row[9] or "Non renseignée",
+                'ville': proforma_row[10] or "Non renseignée",
+                'pays': proforma_row[11] or "Cameroun"
+            },
+            'articles': [],
+            'document_type': document_type
+        }
+        
+        # TRAITER LES ARTICLES SELON LE TYPE DE DOCUMENT
+        sous_total = 0
+        articles_filtered = []
+
+        for article in articles_rows:
+            code, designation, prix_unitaire, type_article, quantite, statut_livraison, quantite_livree = article
+            
+            # ✅ LOGIQUE DE FILTRAGE SELON LE TYPE DE DOCUMENT ET LE STATUT
+            include_article = True
+            qty_to_use = quantite
+            
+            if document_type == 'bon' and etat == 'partiel':
+                # Bon de livraison partiel : articles livrés ET partiellement livrés (quantité livrée pour ces derniers)
+                include_article = statut_livraison in ['livré', 'partiellement_livré']
+                if statut_livraison == 'partiellement_livré':
+                    qty_to_use = quantite_livree
+            elif document_type == 'facture' and etat == 'partiel':
+                # Facture partielle : seulement les articles livrés
+                include_article = statut_livraison in ['livré', 'partiellement_livré']
+            
+            if include_article:
+                # Calculer le total pour cet article
+                total_article = prix_unitaire * qty_to_use
+                sous_total += total_article
                 
-                if include_article:
-                    # Utiliser la quantité correcte selon le contexte
-                    qty_to_use = quantite_affichee if 'quantite_affichee' in locals() else quantite
-                    
-                    # Calculer le total pour cet article
-                    total_article = prix_unitaire * qty_to_use
-                    sous_total += total_article
-                    
-                    articles_filtered.append({
-                        'code': code or f"ART{len(articles_filtered)+1:03d}",
-                        'designation': designation,
-                        'prix_unitaire': float(prix_unitaire) if prix_unitaire else 0,
-                        'type_article': type_article.title() if type_article else "Service",
-                        'quantite': int(qty_to_use) if qty_to_use else 1,
-                        'statut_livraison': statut_livraison,
-                        'total': float(total_article)
-                    })
+                articles_filtered.append({
+                    'code': code or f"ART{len(articles_filtered)+1:03d}",
+                    'designation': designation,
+                    'prix_unitaire': float(prix_unitaire) if prix_unitaire else 0,
+                    'type_article': type_article.title() if type_article else "Service",
+                    'quantite': int(qty_to_use) if qty_to_use else 1,
+                    'statut_livraison': statut_livraison,
+                    'total': float(total_article)
+                })
 
-            print(f"🔍 DEBUG: {len(articles_filtered)} articles retenus sur {len(articles_rows)} total")
-            print(f"🔍 DEBUG: Sous-total calculé: {sous_total}")
-            
-            # Injecter les articles filtrés dans le template
-            pdf_data['articles'] = articles_filtered
-            
-            # Vérification qu'il y a des articles à afficher
-            if not articles_filtered:
-                print(f"⚠️ WARNING: Aucun article à afficher pour {document_type} avec statut {etat}")
-                if document_type == 'bon' and etat == 'partiel':
-                    return jsonify({
-                        "success": False,
-                        "message": "Aucun article n'a été marqué comme livré pour ce bon de livraison partiel"
-                    }), 400
+        print(f"🔍 DEBUG: {len(articles_filtered)} articles retenus sur {len(articles_rows)} total")
+        
+        # Injecter les articles filtrés dans le template
+        pdf_data['articles'] = articles_filtered
+        
+        # Vérification qu'il y a des articles à afficher
+        if not articles_filtered:
+            print(f"⚠️ WARNING: Aucun article à afficher pour {document_type} avec statut {etat}")
+            if document_type == 'bon' and etat == 'partiel':
+                return None, ({
+                    "success": False,
+                    "message": "Aucun article n'a été marqué comme livré pour ce bon de livraison partiel"
+                }, 400)
+        
+        # CALCULS FINANCIERS
+        remise_percent = pdf_data['remise']
+        remise_montant = (sous_total * remise_percent) / 100 if remise_percent > 0 else 0
+        total_ttc = sous_total - remise_montant + pdf_data['frais']
+        
+        pdf_data.update({
+            'sous_total': float(sous_total),
+            'remise_montant': float(remise_montant),
+            'total_ttc': float(total_ttc),
+            'montant_lettre': convert_number_to_words(total_ttc)
+        })
+        
+        # ✅ DÉFINITION DU TITRE SELON LE TYPE DE DOCUMENT
+        if document_type == 'facture':
+            pdf_data['document_title'] = 'FACTURE PARTIELLE' if etat == 'partiel' else 'FACTURE'
+        elif document_type == 'bon':
+            pdf_data['document_title'] = 'BON DE LIVRAISON PARTIEL' if etat == 'partiel' else 'BON DE LIVRAISON'
+        else:
+            pdf_data['document_title'] = 'PROFORMA'
+
+        return pdf_data, None
+
+    def document_filename(document_type, proforma_id):
+        filename_prefixes = {
+            'proforma': 'PROFORMA',
+            'facture': 'FACTURE', 
+            'bon': 'BON_LIVRAISON'
+        }
+        return f"{filename_prefixes.get(document_type, 'DOCUMENT')}_{proforma_id:05d}.pdf"
+
+    @app.route('/api/proforma/<int:proforma_id>/download/<document_type>')
+    def api_download_document(proforma_id, document_type):
+        """
+        Télécharger un document (proforma/facture/bon de livraison) en PDF
+        AVEC VALIDATION COMPLÈTE DU STATUT
+        """
+        # Vérification de l'authentification
+        if 'user_id' not in session:
+            print(f"❌ Accès non autorisé pour le téléchargement de {document_type}")
+            return jsonify({"success": False, "message": "Non autorisé"}), 401
+
+        # Validation du type de document
+        valid_document_types = ['proforma', 'facture', 'bon']
+        if document_type not in valid_document_types:
+            print(f"❌ Type de document invalide: {document_type}")
+            return jsonify({
+                "success": False, 
+                "message": f"Type de document invalide: {document_type}. Types autorisés: {', '.join(valid_document_types)}"
+            }), 400
+
+        try:
+            ville = session['ville']
+            user_id = session['user_id']
             
-            # CALCULS FINANCIERS
-            remise_percent = pdf_data['remise']
-            remise_montant = (sous_total * remise_percent) / 100 if remise_percent > 0 else 0
-            total_ttc = sous_total - remise_montant + pdf_data['frais']
+            print(f"🔍 DEBUG: Téléchargement {document_type} pour proforma {proforma_id}")
+            print(f"🔍 DEBUG: User {user_id}, Ville {ville}")
             
-            pdf_data.update({
-                'sous_total': float(sous_total),
-                'remise_montant': float(remise_montant),
-                'total_ttc': float(total_ttc),
-                'montant_lettre': convert_number_to_words(total_ttc)
-            })
+            conn = get_db_connection()
+            cur = conn.cursor()
+            try:
+                pdf_data, error = build_document_data(cur, proforma_id, ville, document_type)
+            finally:
+                cur.close()
+                conn.close()
             
-            # ✅ DÉFINITION DU TITRE SELON LE TYPE DE DOCUMENT
-            if document_type == 'facture':
-                if etat == 'partiel':
-                    pdf_data['document_title'] = 'FACTURE PARTIELLE'
-                else:
-                    pdf_data['document_title'] = 'FACTURE'
-            elif document_type == 'bon':
-                if etat == 'partiel':
-                    pdf_data['document_title'] = 'BON DE LIVRAISON PARTIEL'
-                else:
-                    pdf_data['document_title'] = 'BON DE LIVRAISON'
-            else:
-                pdf_data['document_title'] = 'PROFORMA'
-
-            pdf_data['document_type'] = document_type
+            if error:
+                payload, status_code = error
+                return jsonify(payload), status_code
 
             print(f"📄 Generating {document_type} with title: {pdf_data['document_title']}")
 
-            # Génération du HTML avec le template unifié
+            # Génération du HTML avec le template unifié (CSS partagée passée à WeasyPrint, liée pour pdfkit)
+            pdf_stylesheets = PROFORMA_PDF_STYLESHEETS if PDF_ENGINE == "weasyprint" else ()
             try:
-                html_content = render_template('proforma_template.html', **pdf_data)
+                html_content = render_template('proforma_template.html', **pdf_data, pdf_stylesheets=pdf_stylesheets)
                 print(f"✅ Template rendered successfully for {document_type}")
             except Exception as e:
                 print(f"❌ Template rendering failed for {document_type}: {e}")
@@ -3701,22 +3753,34 @@ def init_routes(flask_app, database, models, mail_instance):
             
             # GÉNÉRER LE PDF SELON L'ENGINE DISPONIBLE
             try:
-                filename_prefixes = {
-                    'proforma': 'PROFORMA',
-                    'facture': 'FACTURE', 
-                    'bon': 'BON_LIVRAISON'
-                }
-                filename = f"{filename_prefixes.get(document_type, 'DOCUMENT')}_{proforma_id:05d}.pdf"
+                filename = document_filename(document_type, proforma_id)
                 
                 if PDF_ENGINE == "weasyprint":
-                    base_url = request.url_root
-                    pdf_file = HTML(string=html_content, base_url=base_url).write_pdf()
+                    # Rendu dans le pool de processus, servi depuis le cache tant que le contenu ne change pas
+                    # ?wait=0 : ne pas attendre, redemander l'URL après le Retry-After
+                    wait = 0 if request.args.get('wait') == '0' else current_app.config.get('PDF_RENDER_WAIT', 30)
+                    status, pdf_file = pdf_renderer.get_service().get_or_render(
+                        proforma_id, document_type, html_content,
+                        base_url=request.url_root, stylesheets=pdf_stylesheets, wait=wait
+                    )
+                    
+                    if pdf_file is None:
+                        print(f"⏳ PDF en cours de génération: {filename}")
+                        response = jsonify({
+                            "success": True,
+                            "status": "pending",
+                            "message": "Document en cours de génération, réessayez dans quelques secondes"
+                        })
+                        response.status_code = 202
+                        response.headers['Retry-After'] = '2'
+                        return response
                     
                     response = make_response(pdf_file)
                     response.headers['Content-Type'] = 'application/pdf'
                     response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+                    response.headers['X-Document-Cache'] = 'hit' if status == 'cached' else 'miss'
                     
-                    print(f"✅ PDF généré avec WeasyPrint: {filename}")
+                    print(f"✅ PDF {'servi depuis le cache' if status == 'cached' else 'généré avec WeasyPrint'}: {filename}")
                     return response
                     
                 elif PDF_ENGINE == "pdfkit":
@@ -3750,8 +3814,8 @@ def init_routes(flask_app, database, models, mail_instance):
                 import traceback
                 traceback.print_exc()
                 
-                # Fallback: retourner le HTML directement
-                response = make_response(html_content)
+                # Fallback: retourner le HTML directement (avec sa feuille de style liée)
+                response = make_response(render_template('proforma_template.html', **pdf_data))
                 response.headers['Content-Type'] = 'text/html'
                 return response
                 
@@ -3764,6 +3828,139 @@ def init_routes(flask_app, database, models, mail_instance):
                 "message": f"Erreur serveur: {str(e)}"
             }), 500
             
+    @app.route('/api/proformas/documents/export')
+    def api_bulk_export_documents():
+        """
+        Export groupé de documents (ZIP ou PDF fusionné) selon ville, période, statut et type.
+        Les documents sont rendus en parallèle dans le pool de rendu ; le ZIP est envoyé
+        au fil de l'eau, chaque PDF étant ajouté dès qu'il est prêt.
+        """
+        if 'user_id' not in session:
+            return jsonify({"success": False, "message": "Non autorisé"}), 401
+
+        if PDF_ENGINE != "weasyprint":
+            return jsonify({"success": False, "message": "L'export groupé nécessite WeasyPrint"}), 500
+
+        document_type = request.args.get('document_type', 'proforma')
+        if document_type not in ['proforma', 'facture', 'bon']:
+            return jsonify({"success": False, "message": f"Type de document invalide: {document_type}"}), 400
+
+        output_format = request.args.get('format', 'zip')
+        if output_format not in ['zip', 'pdf']:
+            return jsonify({"success": False, "message": "Format invalide (zip ou pdf)"}), 400
+
+        # Un agent exporte sa ville ; un admin peut en choisir une autre
+        ville = session['ville']
+        if session.get('role') == 'admin' and request.args.get('ville'):
+            ville = request.args.get('ville')
+        etat = request.args.get('etat', '')
+        max_documents = current_app.config.get('PDF_BULK_MAX_DOCUMENTS', 300)
+
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            try:
+                query = "SELECT p.proforma_id FROM proformas p WHERE p.ville = %s"
+                params = [ville]
+                if etat:
+                    query += " AND p.etat = %s"
+                    params.append(etat)
+                period_conditions, period_params = date_range_conditions(
+                    "p.date_creation",
+                    annee=request.args.get('annee'),
+                    trimestre=request.args.get('trimestre'),
+                    mois=request.args.get('mois'),
+                )
+                for condition in period_conditions:
+                    query += " AND " + condition
+                params.extend(period_params)
+                query += " ORDER BY p.date_creation, p.proforma_id LIMIT %s"
+                cur.execute(query, params + [max_documents + 1])
+                proforma_ids = [row[0] for row in cur.fetchall()]
+
+                if not proforma_ids:
+                    return jsonify({"success": False, "message": "Aucune proforma ne correspond aux filtres"}), 404
+                if len(proforma_ids) > max_documents:
+                    return jsonify({
+                        "success": False,
+                        "message": f"Trop de documents (plus de {max_documents}). Affinez les filtres."
+                    }), 400
+
+                # Mêmes règles de statut et de filtrage d'articles que le téléchargement unitaire
+                documents = []
+                skipped = []
+                prefetched = fetch_document_rows(cur, proforma_ids, ville)
+                for proforma_id in proforma_ids:
+                    pdf_data, error = build_document_data(cur, proforma_id, ville, document_type, prefetched)
+                    if error:
+                        skipped.append(f"PRO{proforma_id:05d}: {error[0]['message']}")
+                        continue
+                    documents.append((
+                        proforma_id,
+                        document_filename(document_type, proforma_id),
+                        render_template('proforma_template.html', **pdf_data,
+                                        pdf_stylesheets=PROFORMA_PDF_STYLESHEETS)
+                    ))
+            finally:
+                cur.close()
+                conn.close()
+
+            if not documents:
+                return jsonify({
+                    "success": False,
+                    "message": "Aucun document disponible pour ces proformas",
+                    "skipped": skipped
+                }), 400
+
+            service = pdf_renderer.get_service()
+            base_url = request.url_root
+            futures = {
+                service.document_future(proforma_id, document_type, html_content, base_url,
+                                        PROFORMA_PDF_STYLESHEETS): filename
+                for proforma_id, filename, html_content in documents
+            }
+            export_name = f"{document_type.upper()}_{ville}_{datetime.now().strftime('%Y%m%d_%H%M')}"
+
+            if output_format == 'pdf':
+                # Fusion dans l'ordre chronologique : tous les rendus doivent être terminés
+                ordered = []
+                for future, filename in futures.items():
+                    try:
+                        ordered.append(service.document_result(future))
+                    except Exception as e:
+                        skipped.append(f"{filename}: {e}")
+                if not ordered:
+                    return jsonify({"success": False, "message": "Aucun document n'a pu être généré", "skipped": skipped}), 500
+
+                response = make_response(pdf_renderer.merge_pdfs(ordered))
+                response.headers['Content-Type'] = 'application/pdf'
+                response.headers['Content-Disposition'] = f'attachment; filename="{export_name}.pdf"'
+                return response
+
+            def zip_entries():
+                # Ordre de soumission : chaque attente est bornée par le délai de rendu du service
+                for future, filename in futures.items():
+                    try:
+                        yield filename, service.document_result(future)
+                    except Exception as e:
+                        print(f"❌ Export groupé - {filename}: {e}")
+                        skipped.append(f"{filename}: {e}")
+                if skipped:
+                    yield "documents_non_exportes.txt", "\n".join(skipped).encode("utf-8")
+
+            print(f"📦 Export groupé {document_type}: {len(documents)} documents ({ville})")
+            return Response(
+                pdf_renderer.stream_zip(zip_entries()),
+                mimetype='application/zip',
+                headers={'Content-Disposition': f'attachment; filename="{export_name}.zip"'}
+            )
+
+        except ValueError as e:
+            return jsonify({"success": False, "message": f"Filtre invalide: {e}"}), 400
+        except Exception as e:
+            print(f"❌ Erreur api_bulk_export_documents: {e}")
+            return jsonify({"success": False, "message": f"Erreur serveur: {str(e)}"}), 500
+            
     @app.route('/api/proforma/<int:proforma_id>/partial-amounts')
     def api_get_partial_amounts(proforma_id):
         """Récupérer les montants payé et restant pour une proforma partielle"""
@@ -3783,10 +3980,7 @@ def init_routes(flask_app, database, models, mail_instance):
                     COALESCE(p.montant_paye, 0) as montant_paye,
                     COALESCE(p.montant_restant, 0) as montant_restant,
                     COALESCE(
-                        (SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id)
+                        (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id)
                         + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0
                     ) as total_ttc
                 FROM proformas p
@@ -4066,9 +4260,6 @@ def init_routes(flask_app, database, models, mail_instance):
             user_id = session['user_id']
             current_year = datetime.now().year
             
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
             # Dates pour l'année sélectionnée
             if year == current_year:
                 date_debut = datetime(year, 1, 1).date()
@@ -4084,9 +4275,6 @@ def init_routes(flask_app, database, models, mail_instance):
             if year != current_year:
                 kpi_data['a_traiter'] = 0
             
-            cur.close()
-            conn.close()
-            
             return jsonify({
                 "success": True,
                 "kpi": kpi_data,
@@ -4114,11 +4302,15 @@ def init_routes(flask_app, database, models, mail_instance):
             status = request.args.get('status', '')
             year = request.args.get('year', datetime.now().year, type=int)
             page = request.args.get('page', 1, type=int)
+            # Pagination par curseur : ?cursor= (vide pour la première page), total=exact|approx optionnel
+            cursor = request.args.get('cursor')
+            total_mode = request.args.get('total', '')
+            after = decode_cursor(cursor, 2) if cursor else None
             
             conn = get_db_connection()
             cur = conn.cursor()
             
-            # Construction de la requête de base
+            # Construction de la requête de base (le total par fenêtre n'est utile qu'en mode page)
             base_query = """
                 SELECT 
                     p.proforma_id,
@@ -4127,54 +4319,79 @@ def init_routes(flask_app, database, models, mail_instance):
                     LOWER(p.etat) as etat,
                     u.nom_utilisateur,
                     COALESCE(
-                        (SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id)
+                        (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id)
                         + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0
-                    ) as total_ttc
+                    ) as total_ttc,
+                    COALESCE(p.montant_paye, 0) as montant_paye_reel,
+                    {total_column} as total_count
                 FROM proformas p
                 LEFT JOIN clients c ON c.client_id = p.client_id
                 LEFT JOIN utilisateurs u ON u.user_id = p.cree_par
                 WHERE p.ville = %s AND p.cree_par = %s
             """
+            count_query = "SELECT COUNT(*) FROM proformas p WHERE p.ville = %s AND p.cree_par = %s"
             params = [ville, user_id]
             
-            # Ajouter les filtres
+            # Ajouter les filtres (communs à la liste et au comptage de secours)
+            filters_sql = ""
             if status:
-                base_query += " AND p.etat = %s"
+                filters_sql += " AND p.etat = %s"
                 params.append(status)
                 
             if year:
-                base_query += " AND EXTRACT(YEAR FROM p.date_creation) = %s"
-                params.append(year)
+                year_conditions, year_params = date_range_conditions("p.date_creation", annee=year)
+                filters_sql += " AND " + " AND ".join(year_conditions)
+                params.extend(year_params)
             
             # Pagination
             rows_per_page = 20
             offset = (page - 1) * rows_per_page
-            
-            # Compter le total
-            count_query = f"SELECT COUNT(*) FROM ({base_query}) AS sub"
-            cur.execute(count_query, params)
-            total_count = cur.fetchone()[0]
-            
-            # Récupérer les données paginées
-            paginated_query = f"{base_query} ORDER BY p.date_creation DESC LIMIT %s OFFSET %s"
-            params.extend([rows_per_page, offset])
-            cur.execute(paginated_query, params)
-            
-            proformas = cur.fetchall()
+            order_by = " ORDER BY p.date_creation DESC, p.proforma_id DESC"
+            next_cursor = None
+            
+            if cursor is not None:
+                # Keyset : reprise après (date_creation, proforma_id) de la dernière ligne vue
+                keyset_sql = ""
+                keyset_params = []
+                if after:
+                    condition, keyset_params = keyset_condition(["p.date_creation", "p.proforma_id"], after)
+                    keyset_sql = " AND " + condition
+                
+                cursor_query = base_query.format(total_column="NULL") + filters_sql + keyset_sql + order_by + " LIMIT %s"
+                cur.execute(cursor_query, params + keyset_params + [rows_per_page + 1])
+                proformas = cur.fetchall()
+                
+                if len(proformas) > rows_per_page:
+                    proformas = proformas[:rows_per_page]
+                    next_cursor = encode_cursor([proformas[-1][1], proformas[-1][0]])
+                
+                if total_mode == 'exact':
+                    cur.execute(count_query + filters_sql, params)
+                    total_count = cur.fetchone()[0]
+                elif total_mode == 'approx':
+                    total_count = estimate_row_count(cur, count_query.replace("COUNT(*)", "1") + filters_sql, params)
+                else:
+                    total_count = None
+            else:
+                # Page + total en un seul aller-retour (COUNT(*) OVER () calculé avant LIMIT/OFFSET)
+                paginated_query = base_query.format(total_column="COUNT(*) OVER ()") + filters_sql + order_by + " LIMIT %s OFFSET %s"
+                cur.execute(paginated_query, params + [rows_per_page, offset])
+                
+                proformas = cur.fetchall()
+                
+                if proformas:
+                    total_count = proformas[0][7]
+                elif page > 1:
+                    # Page au-delà de la fin : aucune ligne ne porte le total
+                    cur.execute(count_query + filters_sql, params)
+                    total_count = cur.fetchone()[0]
+                else:
+                    total_count = 0
             
             # Formater les données
             formatted_proformas = []
             for p in proformas:
-                proforma_id, date_creation, client_nom, etat, created_by, total_ttc = p
-                
-                # Récupérer le montant payé réel depuis la base de données
-                cur.execute("""
-                    SELECT montant_paye FROM proformas WHERE proforma_id = %s
-                """, [proforma_id])
-                montant_paye_reel = cur.fetchone()[0] or 0
+                proforma_id, date_creation, client_nom, etat, created_by, total_ttc, montant_paye_reel, _ = p
                 
                 montant_paye = calculate_montant_paye_from_etat(etat, total_ttc, montant_paye_reel)
                 
@@ -4193,6 +4410,18 @@ def init_routes(flask_app, database, models, mail_instance):
             cur.close()
             conn.close()
             
+            if cursor is not None:
+                return jsonify({
+                    "success": True,
+                    "proformas": formatted_proformas,
+                    "pagination": {
+                        "next_cursor": next_cursor,
+                        "has_more": next_cursor is not None,
+                        "total": total_count,
+                        "total_is_estimate": total_mode == 'approx'
+                    }
+                })
+            
             # Calculer pagination
             total_pages = max(1, math.ceil(total_count / rows_per_page))
             
@@ -4206,6 +4435,8 @@ def init_routes(flask_app, database, models, mail_instance):
                 }
             })
             
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
         except Exception as e:
             print(f"Erreur api_filter_proformas: {e}")
             return jsonify({
@@ -4346,9 +4577,6 @@ def init_routes(flask_app, database, models, mail_instance):
             status = request.args.get('status', '')
             year = request.args.get('year', '', type=str)
             
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
             # Construction de la requête
             query = """
                 SELECT 
@@ -4358,10 +4586,7 @@ def init_routes(flask_app, database, models, mail_instance):
                     c.telephone,
                     LOWER(p.etat) as etat,
                     COALESCE(
-                        (SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id)
+                        (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id)
                         + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0
                     ) as total_ttc
                 FROM proformas p
@@ -4375,50 +4600,29 @@ def init_routes(flask_app, database, models, mail_instance):
                 params.append(status)
                 
             if year:
-                query += " AND EXTRACT(YEAR FROM p.date_creation) = %s"
-                params.append(int(year))
+                year_conditions, year_params = date_range_conditions("p.date_creation", annee=year)
+                query += " AND " + " AND ".join(year_conditions)
+                params.extend(year_params)
             
             query += " ORDER BY p.date_creation DESC"
             
-            cur.execute(query, params)
-            proformas = cur.fetchall()
-            
-            # Créer le CSV
-            import csv
-            from io import StringIO
-            
-            output = StringIO()
-            writer = csv.writer(output)
-            
-            # En-têtes
-            writer.writerow([
-                'Numéro Proforma', 'Date', 'Client', 'Téléphone', 
-                'Statut', 'Montant Total (FCFA)'
-            ])
-            
-            # Données
-            for p in proformas:
-                writer.writerow([
+            def format_row(p):
+                return [
                     f"PRO{p[0]:05d}",
                     p[1].strftime('%d/%m/%Y'),
                     p[2] or "Client supprimé",
                     p[3] or "-",
                     p[4],
                     f"{int(p[5]):,}".replace(',', ' ')
-                ])
-            
-            cur.close()
-            conn.close()
-            
-            # Préparer la réponse
-            output.seek(0)
-            
-            from flask import make_response
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv'
-            response.headers['Content-Disposition'] = f'attachment; filename=proformas_export_{datetime.now().strftime("%Y%m%d")}.csv'
-            
-            return response
+                ]
+            
+            # Lignes lues sur un curseur serveur et envoyées au fil de l'eau
+            return stream_export(
+                get_db_connection(), query, params,
+                ['Numéro Proforma', 'Date', 'Client', 'Téléphone', 'Statut', 'Montant Total (FCFA)'],
+                format_row, export_filename('proformas_export'),
+                fmt=request.args.get('format'), sheet_title='Proformas'
+            )
             
         except Exception as e:
             print(f"Erreur api_export_proformas: {e}")
@@ -4484,57 +4688,69 @@ def init_routes(flask_app, database, models, mail_instance):
         rows_per_page = 50  # 50 clients par page
         offset = (page - 1) * rows_per_page
 
+        # Pagination par curseur (?cursor=, vide pour la première page) ; total=exact|approx optionnel
+        cursor = request.args.get('cursor')
+        total_mode = request.args.get('total', '')
+        try:
+            after = decode_cursor(cursor, 2) if cursor else None
+        except ValueError as e:
+            # Comme api_filter_proformas : un curseur périmé ne doit pas ramener en silence à la page 1
+            return jsonify({"success": False, "message": str(e)}), 400
+
         conn = get_db_connection()
         cur = conn.cursor()
 
         try:
-            # 1. Récupération des clients avec nb_commandes dynamique (proformas + factures terminées)
-            base_query = """
-                SELECT c.client_id, c.nom, c.telephone, c.telephone_secondaire,
-                    c.adresse, c.ville, c.pays,
-                    COALESCE(
-                        COUNT(CASE WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN p.proforma_id END) +
-                        COUNT(CASE WHEN f.statut IN ('termine', 'terminé', 'partiel') THEN f.facture_id END), 0
-                    ) AS nb_commandes,
-                    COALESCE(
-                        SUM(CASE WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN
-                            COALESCE(
-                                (SELECT SUM(pa.quantite * a.prix) 
-                                FROM proforma_articles pa 
-                                JOIN articles a ON a.article_id = pa.article_id 
-                                WHERE pa.proforma_id = p.proforma_id), 0
-                            ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
-                        ELSE 0 END) +
-                        SUM(CASE WHEN f.statut IN ('termine', 'terminé', 'partiel') THEN f.montant_total ELSE 0 END), 0
-                    ) AS montant_total_paye
-                FROM clients c
-                LEFT JOIN proformas p ON p.client_id = c.client_id
-                LEFT JOIN factures f ON f.client_id = c.client_id
-                WHERE 1=1
-            """
+            # 1. Page de clients, puis nb_commandes / montant payé agrégés séparément (proformas, factures)
+            filters_sql = ""
             params = []
 
             if search:
-                base_query += " AND (LOWER(c.nom) LIKE LOWER(%s) OR c.telephone LIKE %s)"
+                filters_sql += " AND (LOWER(c.nom) LIKE LOWER(%s) OR c.telephone LIKE %s)"
                 params.extend([f"%{search}%", f"%{search}%"])
 
             if ville_filter:
-                base_query += " AND c.ville = %s"
+                filters_sql += " AND c.ville = %s"
                 params.append(ville_filter)
 
-            base_query += " GROUP BY c.client_id"
-
-            # Comptage total pour pagination
-            count_query = f"SELECT COUNT(*) FROM ({base_query}) AS sub"
-            cur.execute(count_query, params)
-            total_clients = cur.fetchone()[0]
-            total_pages = math.ceil(total_clients / rows_per_page) if total_clients > 0 else 1
+            # Une ligne par client : le comptage ne porte que sur clients
+            count_query = f"SELECT COUNT(*) FROM clients c WHERE 1=1 {filters_sql}"
+
+            next_cursor = None
+            if cursor is not None:
+                # Keyset sur (nom, client_id) : coût constant quelle que soit la profondeur
+                keyset_sql = ""
+                keyset_params = []
+                if after:
+                    condition, keyset_params = keyset_condition(["COALESCE(c.nom, '')", "c.client_id"], after, descending=False)
+                    keyset_sql = " AND " + condition
+
+                cursor_query = clients_with_orders_query(filters_sql + keyset_sql, "COALESCE(c.nom, ''), c.client_id", "LIMIT %s")
+                cur.execute(cursor_query, params + keyset_params + [rows_per_page + 1])
+                clients = cur.fetchall()
+
+                if len(clients) > rows_per_page:
+                    clients = clients[:rows_per_page]
+                    next_cursor = encode_cursor([clients[-1][1] or '', clients[-1][0]])
+
+                if total_mode == 'exact':
+                    cur.execute(count_query, params)
+                    total_clients = cur.fetchone()[0]
+                elif total_mode == 'approx':
+                    total_clients = estimate_row_count(cur, count_query.replace("COUNT(*)", "1"), params)
+                else:
+                    total_clients = None
+                total_pages = math.ceil(total_clients / rows_per_page) if total_clients else 1
+            else:
+                # Comptage total pour pagination
+                cur.execute(count_query, params)
+                total_clients = cur.fetchone()[0]
+                total_pages = math.ceil(total_clients / rows_per_page) if total_clients > 0 else 1
 
-            # Requête paginée
-            paginated_query = f"{base_query} ORDER BY c.nom LIMIT %s OFFSET %s"
-            params.extend([rows_per_page, offset])
-            cur.execute(paginated_query, params)
-            clients = cur.fetchall()
+                # Requête paginée
+                paginated_query = clients_with_orders_query(filters_sql, "c.nom", "LIMIT %s OFFSET %s")
+                cur.execute(paginated_query, params + [rows_per_page, offset])
+                clients = cur.fetchall()
 
             # 2. Liste des villes distinctes
             cur.execute("SELECT DISTINCT ville FROM clients WHERE ville IS NOT NULL AND ville != '' AND LOWER(ville) != 'nan' ORDER BY ville")
@@ -4553,10 +4769,7 @@ def init_routes(flask_app, database, models, mail_instance):
             # 2. KPI Chiffre d'affaires MOIS ACTUEL
             cur.execute("""
                 SELECT COALESCE(SUM(
-                    (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                    FROM proforma_articles pa 
-                    JOIN articles a ON a.article_id = pa.article_id 
-                    WHERE pa.proforma_id = p.proforma_id)
+                    COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                     + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                 ), 0)
                 FROM proformas p
@@ -4568,10 +4781,7 @@ def init_routes(flask_app, database, models, mail_instance):
             # Et aussi pour le CA mois précédent
             cur.execute("""
                 SELECT COALESCE(SUM(
-                    (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                    FROM proforma_articles pa 
-                    JOIN articles a ON a.article_id = pa.article_id 
-                    WHERE pa.proforma_id = p.proforma_id)
+                    COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                     + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                 ), 0)
                 FROM proformas p
@@ -4662,6 +4872,8 @@ def init_routes(flask_app, database, models, mail_instance):
                 kpi_new_clients_trend=kpi_new_clients_trend,
                 total_pages=total_pages,
                 current_page=page,
+                next_cursor=next_cursor,
+                total_clients=total_clients,
                 search=search,
                 ville_filter=ville_filter,
                 periode_info=f"Période: {mois_actuel_debut.strftime('%B %Y')}"
@@ -5084,10 +5296,7 @@ def init_routes(flask_app, database, models, mail_instance):
                     p.date_creation as date,
                     p.etat as statut,
                     COALESCE(
-                        (SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id), 0
+                        (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                     ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0) as total_ttc
                 FROM proformas p
                 WHERE p.client_id = %s
@@ -5110,6 +5319,46 @@ def init_routes(flask_app, database, models, mail_instance):
             proformas = cur.fetchall()
             history = []
 
+            # Articles de toutes les commandes affichées en deux requêtes (au lieu d'une par commande)
+            articles_by_order = {}
+            proforma_ids = [p[1] for p in proformas if p[0] == 'proforma']
+            facture_ids = [p[1] for p in proformas if p[0] == 'facture']
+            if proforma_ids:
+                cur.execute("""
+                    SELECT pa.proforma_id, a.designation, pa.quantite, a.prix
+                    FROM proforma_articles pa
+                    JOIN articles a ON a.article_id = pa.article_id
+                    WHERE pa.proforma_id = ANY(%s)
+                    ORDER BY a.designation
+                """, [proforma_ids])
+                for order_id, designation, quantite, prix in cur.fetchall():
+                    articles_by_order.setdefault(('proforma', order_id), []).append({
+                        "nom": designation,
+                        "quantite": quantite,
+                        "prix": prix
+                    })
+            if facture_ids:
+                cur.execute("""
+                    SELECT fa.facture_id, a.designation, fa.quantite, fa.prix_unitaire
+                    FROM facture_articles fa
+                    JOIN articles a ON a.article_id = fa.article_id
+                    WHERE fa.facture_id = ANY(%s)
+                    ORDER BY a.designation
+                """, [facture_ids])
+                for order_id, designation, quantite, prix in cur.fetchall():
+                    articles_by_order.setdefault(('facture', order_id), []).append({
+                        "nom": designation,
+                        "quantite": quantite,
+                        "prix": prix
+                    })
+
+            # Statistiques du client (maintenues par triggers dans client_stats)
+            cur.execute("""
+                SELECT nb_commandes, montant_total_paye, premiere_commande, derniere_commande, actif
+                FROM client_stats WHERE client_id = %s
+            """, [client_id])
+            stats_row = cur.fetchone()
+
             valid_statuses = ['en_attente', 'en_cours', 'partiel', 'termine', 'terminé']
 
             for p in proformas:
@@ -5128,44 +5377,7 @@ def init_routes(flask_app, database, models, mail_instance):
                 # Formatage date
                 date_str = date_commande.strftime('%d/%m/%Y') if date_commande else "Date inconnue"
 
-                # Récupérer les articles selon le type de commande
-                articles = []
-                if type_commande == 'proforma':
-                    # Récupérer les articles de la proforma
-                    cur.execute("""
-                        SELECT a.designation, pa.quantite, a.prix
-                        FROM proforma_articles pa
-                        JOIN articles a ON a.article_id = pa.article_id
-                        WHERE pa.proforma_id = %s
-                        ORDER BY a.designation
-                    """, [id_commande])
-
-                    articles_rows = cur.fetchall()
-                    for row in articles_rows:
-                        designation, quantite, prix = row
-                        articles.append({
-                            "nom": designation,
-                            "quantite": quantite,
-                            "prix": prix
-                        })
-                else:
-                    # Récupérer les articles de la facture
-                    cur.execute("""
-                        SELECT a.designation, fa.quantite, fa.prix_unitaire
-                        FROM facture_articles fa
-                        JOIN articles a ON a.article_id = fa.article_id
-                        WHERE fa.facture_id = %s
-                        ORDER BY a.designation
-                    """, [id_commande])
-
-                    articles_rows = cur.fetchall()
-                    for row in articles_rows:
-                        designation, quantite, prix = row
-                        articles.append({
-                            "nom": designation,
-                            "quantite": quantite,
-                            "prix": prix
-                        })
+                articles = articles_by_order.get((type_commande, id_commande), [])
 
                 # Si aucun article trouvé, afficher "Commande sans détail"
                 if not articles:
@@ -5195,7 +5407,14 @@ def init_routes(flask_app, database, models, mail_instance):
             return jsonify({
                 "success": True, 
                 "client_nom": client_row[0], 
-                "history": history
+                "history": history,
+                "stats": {
+                    "nb_commandes": stats_row[0] if stats_row else 0,
+                    "montant_total_paye": float(stats_row[1]) if stats_row else 0,
+                    "premiere_commande": stats_row[2].strftime('%d/%m/%Y') if stats_row and stats_row[2] else None,
+                    "derniere_commande": stats_row[3].strftime('%d/%m/%Y') if stats_row and stats_row[3] else None,
+                    "actif": bool(stats_row[4]) if stats_row else False
+                }
             })
 
         except Exception as e:
@@ -5216,9 +5435,6 @@ def init_routes(flask_app, database, models, mail_instance):
             search = request.args.get('search', '')
             ville_filter = request.args.get('ville', '')
             
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
             # Construction de la requête
             query = """
                 SELECT c.nom, c.telephone, c.telephone_secondaire,
@@ -5241,25 +5457,8 @@ def init_routes(flask_app, database, models, mail_instance):
             
             query += " GROUP BY c.client_id ORDER BY c.nom"
             
-            cur.execute(query, params)
-            clients = cur.fetchall()
-            
-            # Créer le CSV
-            import csv
-            from io import StringIO
-            
-            output = StringIO()
-            writer = csv.writer(output)
-            
-            # En-têtes
-            writer.writerow([
-                'Nom', 'Téléphone Principal', 'Téléphone Secondaire', 
-                'Adresse', 'Ville', 'Pays', 'Nb Commandes', 'Total Versements (FCFA)'
-            ])
-            
-            # Données
-            for c in clients:
-                writer.writerow([
+            def format_row(c):
+                return [
                     c[0] or "Non renseigné",
                     c[1] or "-",
                     c[2] or "-",
@@ -5268,19 +5467,16 @@ def init_routes(flask_app, database, models, mail_instance):
                     c[5] or "-",
                     c[6],
                     f"{int(c[7]):,}".replace(',', ' ') if c[7] else "0"
-                ])
-            
-            cur.close()
-            conn.close()
-            
-            # Préparer la réponse
-            output.seek(0)
-            
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv'
-            response.headers['Content-Disposition'] = f'attachment; filename=clients_export_{datetime.now().strftime("%Y%m%d")}.csv'
-            
-            return response
+                ]
+            
+            # Lignes lues sur un curseur serveur et envoyées au fil de l'eau
+            return stream_export(
+                get_db_connection(), query, params,
+                ['Nom', 'Téléphone Principal', 'Téléphone Secondaire',
+                 'Adresse', 'Ville', 'Pays', 'Nb Commandes', 'Total Versements (FCFA)'],
+                format_row, export_filename('clients_export'),
+                fmt=request.args.get('format'), sheet_title='Clients'
+            )
             
         except Exception as e:
             print(f"Erreur api_export_clients: {e}")
@@ -5678,10 +5874,15 @@ def init_routes(flask_app, database, models, mail_instance):
                 """
                 params = []
 
-            # Filtres de recherche
+            # Filtres de recherche (index trigrammes + plein texte, classement par pertinence)
+            order_sql = "a.designation"
             if search:
-                query += " AND (a.designation ILIKE %s OR a.code ILIKE %s)"
-                params.extend([f"%{search}%", f"%{search}%"])
+                search_condition, search_params, rank_sql, rank_params = article_search_sql(search)
+                query = query.replace("FROM articles a", f", {rank_sql} AS search_rank\n                    FROM articles a", 1)
+                params = rank_params + params
+                query += f" AND {search_condition}"
+                params.extend(search_params)
+                order_sql = "search_rank DESC, a.designation"
 
             # Filtre par type (sauf si déjà géré pour fournitures)
             if article_type and article_type != 'fourniture':
@@ -5699,19 +5900,19 @@ def init_routes(flask_app, database, models, mail_instance):
 
             # Group by adapté selon le type de requête
             if article_type == 'fourniture':
-                query += """
+                query += f"""
                     GROUP BY a.article_id, a.code, a.designation, pv.prix, a.type_article, 
                             a.nature, a.classe, a.ville_reference, a.type_mission, 
                             a.duree, a.capacite_max, a.description, pv.ville
-                    ORDER BY a.designation
+                    ORDER BY {order_sql}
                     LIMIT %s OFFSET %s
                 """
             else:
-                query += """
+                query += f"""
                     GROUP BY a.article_id, a.code, a.designation, a.prix, a.type_article, 
                             a.nature, a.classe, a.ville_reference, a.type_mission, 
                             a.duree, a.capacite_max, a.description
-                    ORDER BY a.designation
+                    ORDER BY {order_sql}
                     LIMIT %s OFFSET %s
                 """
             
@@ -5741,8 +5942,8 @@ def init_routes(flask_app, database, models, mail_instance):
                 count_params = []
 
             if search:
-                count_query += " AND (a.designation ILIKE %s OR a.code ILIKE %s)"
-                count_params.extend([f"%{search}%", f"%{search}%"])
+                count_query += f" AND {search_condition}"
+                count_params.extend(search_params)
 
             if article_type and article_type != 'fourniture':
                 count_query += " AND a.type_article = %s"
@@ -5829,6 +6030,12 @@ def init_routes(flask_app, database, models, mail_instance):
             
             existing_code = result[0]
 
+            # Villes dont la liste de fournitures contient l'article (partitions du cache à invalider)
+            cur.execute("SELECT DISTINCT ville FROM prix_fournitures_ville WHERE article_id = %s", [article_id])
+            villes_touchees = {row[0] for row in cur.fetchall()}
+            if data.get('ville'):
+                villes_touchees.add(data['ville'])
+
             # Mise à jour COMPLÈTE avec tous les nouveaux champs (sans modifier le code)
             update_query = """
                 UPDATE articles 
@@ -5841,7 +6048,8 @@ def init_routes(flask_app, database, models, mail_instance):
                     type_mission = %s,
                     duree = %s,
                     capacite_max = %s,
-                    description = %s
+                    description = %s,
+                    date_modification = CURRENT_TIMESTAMP
                 WHERE article_id = %s
                 RETURNING article_id
             """
@@ -5875,9 +6083,12 @@ def init_routes(flask_app, database, models, mail_instance):
                         VALUES (%s, %s, %s)
                     """, [article_id, data['ville'], int(data['prix'])])
 
+            reference_cache.publish_invalidation(cur, reference_cache.GLOBAL, *villes_touchees)
             conn.commit()
             cur.close()
             conn.close()
+            reference_cache.get_cache().invalidate(reference_cache.GLOBAL, *villes_touchees)
+            _invalidate_article_index()
 
             if not updated_article:
                 return jsonify({"success": False, "message": "Article non trouvé"}), 404
@@ -5922,15 +6133,19 @@ def init_routes(flask_app, database, models, mail_instance):
                 }), 400
 
             # Supprimer les prix par ville d'abord
-            cur.execute("DELETE FROM prix_fournitures_ville WHERE article_id = %s", [article_id])
+            cur.execute("DELETE FROM prix_fournitures_ville WHERE article_id = %s RETURNING ville", [article_id])
+            villes_touchees = {row[0] for row in cur.fetchall()}
 
             # Puis supprimer l'article
             cur.execute("DELETE FROM articles WHERE article_id = %s RETURNING article_id", [article_id])
             deleted = cur.fetchone()
 
+            reference_cache.publish_invalidation(cur, reference_cache.GLOBAL, *villes_touchees)
             conn.commit()
             cur.close()
             conn.close()
+            reference_cache.get_cache().invalidate(reference_cache.GLOBAL, *villes_touchees)
+            _invalidate_article_index()
 
             if not deleted:
                 return jsonify({"success": False, "message": "Article non trouvé"}), 404
@@ -5962,9 +6177,6 @@ def init_routes(flask_app, database, models, mail_instance):
             article_type = request.args.get('type', '').strip()
             ville = request.args.get('ville', '').strip()
 
-            conn = get_db_connection()
-            cur = conn.cursor()
-
             # Requête similaire à api_articles mais sans pagination
             query = """
                 SELECT 
@@ -5988,8 +6200,9 @@ def init_routes(flask_app, database, models, mail_instance):
             params = []
 
             if search:
-                query += " AND a.designation ILIKE %s"
-                params.append(f"%{search}%")
+                search_condition, search_params, _, _ = article_search_sql(search)
+                query += f" AND {search_condition}"
+                params.extend(search_params)
 
             if article_type:
                 query += " AND a.type_article = %s"
@@ -6004,59 +6217,23 @@ def init_routes(flask_app, database, models, mail_instance):
                 ORDER BY a.designation
             """
 
-            cur.execute(query, params)
-            articles = cur.fetchall()
-
-            cur.close()
-            conn.close()
-
-            # Créer le CSV en mémoire
-            output = io.StringIO()
-            writer = csv.writer(output)
-            
-            # En-têtes en fonction du type
+            # En-têtes et colonnes en fonction du type
             if not article_type or article_type == 'livre':
                 headers = ["ID", "Code", "Désignation", "Prix (FCFA)", "Type", "Classe", "Commandes", "Montant total"]
+                format_row = lambda a: [a[0], a[1], a[2], a[3], a[4], a[6] or '', a[8], a[9] or 0]
             elif article_type == 'fourniture':
                 headers = ["ID", "Code", "Désignation", "Prix (FCFA)", "Type", "Ville", "Commandes", "Montant total"]
-            elif article_type == 'formation':
-                headers = ["ID", "Code", "Désignation", "Type", "Souscrits", "Montant total"]
-            elif article_type == 'service':
+                format_row = lambda a: [a[0], a[1], a[2], a[3], a[4], a[7] or '', a[8], a[9] or 0]
+            else:
+                # formation, service
                 headers = ["ID", "Code", "Désignation", "Type", "Souscrits", "Montant total"]
+                format_row = lambda a: [a[0], a[1], a[2], a[4], a[8], a[9] or 0]
 
-            
-            writer.writerow(headers)
-
-            # Écrire les données
-            for article in articles:
-                if not article_type or article_type == 'livre':
-                    row = [
-                        article[0], article[1], article[2], article[3],
-                        article[4], article[6] or '', article[8], article[9] or 0
-                    ]
-                elif article_type == 'fourniture':
-                    row = [
-                        article[0], article[1], article[2], article[3],
-                        article[7] or '', article[8], article[9] or 0
-                    ]
-                elif article_type == 'formation':
-                    row = [
-                        article[0], article[1], article[2], 
-                        article[8], article[9] or 0
-                    ]
-                elif article_type == 'service':
-                    row = [
-                        article[0], article[1], article[2], article[4],
-                        article[8], article[9] or 0
-                    ]
-                
-                writer.writerow(row)
-
-            # Créer la réponse avec le CSV
-            response = make_response(output.getvalue())
-            response.headers['Content-Disposition'] = 'attachment; filename=articles.csv'
-            response.headers['Content-type'] = 'text/csv'
-            return response
+            # Lignes lues sur un curseur serveur et envoyées au fil de l'eau
+            return stream_export(
+                get_db_connection(), query, params, headers, format_row, 'articles',
+                fmt=request.args.get('format'), sheet_title='Articles'
+            )
 
         except Exception as e:
             print(f"Erreur export_articles: {e}")
@@ -6164,9 +6341,13 @@ def init_routes(flask_app, database, models, mail_instance):
             cur.execute(insert_query, insert_params)
             article_id = cur.fetchone()[0]
 
+            # Nouvel article sans prix par ville : seul le catalogue commun change
+            reference_cache.publish_invalidation(cur, reference_cache.GLOBAL)
             conn.commit()
             cur.close()
             conn.close()
+            reference_cache.get_cache().invalidate(reference_cache.GLOBAL)
+            _invalidate_article_index()
 
             # Log global → création article
             try:
@@ -6363,10 +6544,7 @@ def init_routes(flask_app, database, models, mail_instance):
                 SELECT 
                     c.nom,
                     SUM(
-                        (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id)
+                        COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                         + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                     ) as montant_total,
                     COUNT(p.proforma_id) as nb_commandes
@@ -6378,10 +6556,7 @@ def init_routes(flask_app, database, models, mail_instance):
                 AND p.ville = %s
                 GROUP BY c.client_id, c.nom
                 HAVING SUM(
-                    (SELECT COALESCE(SUM(pa.quantite * a.prix), 0) 
-                    FROM proforma_articles pa 
-                    JOIN articles a ON a.article_id = pa.article_id 
-                    WHERE pa.proforma_id = p.proforma_id)
+                    COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                     + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                 ) > 0
                 ORDER BY montant_total DESC
@@ -6442,6 +6617,9 @@ def init_routes(flask_app, database, models, mail_instance):
             statut = request.args.get('statut', '')
             rows_per_page = 50
             offset = (page - 1) * rows_per_page
+            # Pagination par curseur : ?cursor= (vide pour la première page)
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, 3) if cursor else None
 
             conn = get_db_connection()
             cur = conn.cursor()
@@ -6468,19 +6646,14 @@ def init_routes(flask_app, database, models, mail_instance):
             where_clause_proforma = "WHERE " + " AND ".join(where_conditions_proforma)
             where_clause_facture = "WHERE " + " AND ".join(where_conditions_facture)
 
-            # Compter le total (proformas + factures)
-            count_query = f"""
-                SELECT 
-                    (SELECT COUNT(*) FROM proformas p LEFT JOIN clients c ON c.client_id = p.client_id {where_clause_proforma}) +
-                    (SELECT COUNT(*) FROM factures f LEFT JOIN clients c ON c.client_id = f.client_id {where_clause_facture})
-            """
-            # Utiliser les paramètres séparés pour chaque requête
-            cur.execute(count_query, params_proforma + params_facture)
-            total_count = cur.fetchone()[0]
-            total_pages = math.ceil(total_count / rows_per_page) if total_count > 0 else 1
+            # Le total (proformas + factures) est tiré du résumé calculé plus bas avec les mêmes filtres
 
-            # Récupérer les proformas ET factures avec pagination
-            query = f"""
+            # Clé de tri stable (date, type, id) ; date absente des anciennes factures ramenée au plus ancien
+            proforma_sort_date = "p.date_creation"
+            facture_sort_date = "COALESCE(f.date_facture, DATE '0001-01-01')"
+
+            # Récupérer les proformas ET factures
+            proforma_select = f"""
                 SELECT 
                     p.proforma_id as id,
                     'proforma' as type,
@@ -6489,18 +6662,15 @@ def init_routes(flask_app, database, models, mail_instance):
                     LOWER(p.etat) as etat,
                     COALESCE(u.nom_utilisateur, 'Utilisateur supprimé') as created_by,
                     COALESCE((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
-                    ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0) as total_ttc
+                        SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
+                    ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0) as total_ttc,
+                    {proforma_sort_date} as sort_date
                 FROM proformas p
                 LEFT JOIN clients c ON c.client_id = p.client_id
                 LEFT JOIN utilisateurs u ON u.user_id = p.cree_par
                 {where_clause_proforma}
-                
-                UNION ALL
-                
+            """
+            facture_select = f"""
                 SELECT 
                     f.facture_id as id,
                     'facture' as type,
@@ -6508,82 +6678,109 @@ def init_routes(flask_app, database, models, mail_instance):
                     COALESCE(c.nom, 'Client supprimé') as client_nom,
                     LOWER(f.statut) as etat,
                     COALESCE(f.agent, 'N/A') as created_by,
-                    f.montant_total as total_ttc
+                    f.montant_total as total_ttc,
+                    {facture_sort_date} as sort_date
                 FROM factures f
                 LEFT JOIN clients c ON c.client_id = f.client_id
                 {where_clause_facture}
-                
-                ORDER BY date_creation DESC
-                LIMIT %s OFFSET %s
             """
-            
-            cur.execute(query, params_proforma + params_facture + [rows_per_page, offset])
-            commandes_data = cur.fetchall()
 
-            # Calculer les totaux pour le résumé - inclure TOUTES les commandes de la ville, pas seulement celles de l'utilisateur
-            summary_where_conditions_proforma = ["p.ville = %s", "p.etat NOT IN ('en_cours', 'en_attente')"]
-            summary_where_conditions_facture = ["f.ville = %s"]
-            summary_params_proforma = [ville]
-            summary_params_facture = [ville]
-            
-            if search:
-                summary_where_conditions_proforma.append("(c.nom ILIKE %s OR c.telephone ILIKE %s OR CAST(p.proforma_id AS TEXT) LIKE %s)")
-                summary_where_conditions_facture.append("(c.nom ILIKE %s OR c.telephone ILIKE %s OR CAST(f.facture_id AS TEXT) LIKE %s)")
-                search_param = f"%{search}%"
-                summary_params_proforma.extend([search_param, search_param, search_param])
-                summary_params_facture.extend([search_param, search_param, search_param])
-
-            if statut:
-                summary_where_conditions_proforma.append("p.etat = %s")
-                summary_where_conditions_facture.append("f.statut = %s")
-                summary_params_proforma.append(statut)
-                summary_params_facture.append(statut)
-            
-            summary_where_clause_proforma = "WHERE " + " AND ".join(summary_where_conditions_proforma)
-            summary_where_clause_facture = "WHERE " + " AND ".join(summary_where_conditions_facture)
-            
-            summary_query = f"""
-                SELECT 
-                    'proforma' as type,
-                    COUNT(*) as total_count,
-                    COALESCE(SUM((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
-                    ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)), 0) as montant_total
-                FROM proformas p 
-                LEFT JOIN clients c ON c.client_id = p.client_id 
-                {summary_where_clause_proforma}
+            next_cursor = None
+            if cursor is not None:
+                # Keyset : chaque branche ne lit que les lignes après le curseur, déjà triées et limitées
+                keyset_proforma = ""
+                keyset_facture = ""
+                keyset_params_proforma = []
+                keyset_params_facture = []
+                if after:
+                    condition, values = keyset_condition([proforma_sort_date, "'proforma'", "p.proforma_id"], after)
+                    keyset_proforma = f" AND {proforma_sort_date} <= %s AND {condition}"
+                    keyset_params_proforma = [after[0]] + values
+                    condition, values = keyset_condition([facture_sort_date, "'facture'", "f.facture_id"], after)
+                    keyset_facture = f" AND {facture_sort_date} <= %s AND {condition}"
+                    keyset_params_facture = [after[0]] + values
+
+                query = f"""
+                    ({proforma_select}{keyset_proforma} ORDER BY {proforma_sort_date} DESC, p.proforma_id DESC LIMIT %s)
+                    UNION ALL
+                    ({facture_select}{keyset_facture} ORDER BY {facture_sort_date} DESC, f.facture_id DESC LIMIT %s)
+                    ORDER BY sort_date DESC, type DESC, id DESC
+                    LIMIT %s
+                """
+                cur.execute(query, params_proforma + keyset_params_proforma + [rows_per_page + 1]
+                            + params_facture + keyset_params_facture + [rows_per_page + 1, rows_per_page + 1])
+                commandes_data = cur.fetchall()
+
+                if len(commandes_data) > rows_per_page:
+                    commandes_data = commandes_data[:rows_per_page]
+                    last = commandes_data[-1]
+                    next_cursor = encode_cursor([last[7], last[1], last[0]])
+            else:
+                query = f"""
+                    {proforma_select}
+                    UNION ALL
+                    {facture_select}
+                    ORDER BY date_creation DESC
+                    LIMIT %s OFFSET %s
+                """
+                cur.execute(query, params_proforma + params_facture + [rows_per_page, offset])
+                commandes_data = cur.fetchall()
+
+            # Résumé (COUNT/SUM sur toutes les lignes filtrées) : pagination par page, ou première
+            # page du curseur seulement ; les pages suivantes gardent celui de la première
+            total_count = total_amount = total_pages = summary = None
+            if not after:
+                # Mêmes filtres que la liste : TOUTES les commandes de la ville, pas seulement celles de l'utilisateur
+                summary_query = f"""
+                    SELECT 
+                        'proforma' as type,
+                        COUNT(*) as total_count,
+                        COALESCE(SUM((
+                            SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
+                        ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)), 0) as montant_total
+                    FROM proformas p 
+                    LEFT JOIN clients c ON c.client_id = p.client_id 
+                    {where_clause_proforma}
                 
-                UNION ALL
+                    UNION ALL
                 
-                SELECT 
-                    'facture' as type,
-                    COUNT(*) as total_count,
-                    COALESCE(SUM(f.montant_total), 0) as montant_total
-                FROM factures f 
-                LEFT JOIN clients c ON c.client_id = f.client_id 
-                {summary_where_clause_facture}
-            """
-            cur.execute(summary_query, summary_params_proforma + summary_params_facture)
-            summary_data = cur.fetchall()
-            
-            total_proformas = 0
-            total_factures = 0
-            montant_proformas = 0
-            montant_factures = 0
-            
-            for row in summary_data:
-                if row[0] == 'proforma':
-                    total_proformas = row[1]
-                    montant_proformas = float(row[2])
-                else:
-                    total_factures = row[1]
-                    montant_factures = float(row[2])
+                    SELECT 
+                        'facture' as type,
+                        COUNT(*) as total_count,
+                        COALESCE(SUM(f.montant_total), 0) as montant_total
+                    FROM factures f 
+                    LEFT JOIN clients c ON c.client_id = f.client_id 
+                    {where_clause_facture}
+                """
+                cur.execute(summary_query, params_proforma + params_facture)
+                summary_data = cur.fetchall()
+            
+                total_proformas = 0
+                total_factures = 0
+                montant_proformas = 0
+                montant_factures = 0
+            
+                for row in summary_data:
+                    if row[0] == 'proforma':
+                        total_proformas = row[1]
+                        montant_proformas = float(row[2])
+                    else:
+                        total_factures = row[1]
+                        montant_factures = float(row[2])
 
-            total_count = total_proformas + total_factures
-            total_amount = montant_proformas + montant_factures
+                total_count = total_proformas + total_factures
+                total_pages = math.ceil(total_count / rows_per_page) if total_count > 0 else 1
+                total_amount = montant_proformas + montant_factures
+                summary = {
+                    "proformas": {
+                        "count": total_proformas,
+                        "total_amount": montant_proformas
+                    },
+                    "factures": {
+                        "count": total_factures,
+                        "total_amount": montant_factures
+                    }
+                }
 
             cur.close()
             conn.close()
@@ -6604,18 +6801,13 @@ def init_routes(flask_app, database, models, mail_instance):
                 "total_amount": total_amount,
                 "total_pages": total_pages,
                 "current_page": page,
-                "summary": {
-                    "proformas": {
-                        "count": total_proformas,
-                        "total_amount": montant_proformas
-                    },
-                    "factures": {
-                        "count": total_factures,
-                        "total_amount": montant_factures
-                    }
-                }
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None,
+                "summary": summary
             })
 
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
         except Exception as e:
             print(f"❌ Erreur api_ventes_commandes: {e}")
             return jsonify({
@@ -6648,10 +6840,7 @@ def init_routes(flask_app, database, models, mail_instance):
                     p.remise,
                     p.frais,
                     COALESCE((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
+                        SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
                     ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0) as total_ttc
                 FROM proformas p
                 LEFT JOIN clients c ON c.client_id = p.client_id
@@ -6917,9 +7106,6 @@ def init_routes(flask_app, database, models, mail_instance):
             search = request.args.get('search', '')
             statut = request.args.get('statut', '')
 
-            conn = get_db_connection()
-            cur = conn.cursor()
-
             # Construction des conditions WHERE
             where_conditions_proforma = ["p.ville = %s", "p.etat NOT IN ('en_cours', 'en_attente')"]
             where_conditions_facture = ["f.ville = %s"]
@@ -6949,10 +7135,7 @@ def init_routes(flask_app, database, models, mail_instance):
                     LOWER(p.etat) as etat,
                     COALESCE(u.nom_utilisateur, 'Utilisateur supprimé') as created_by,
                     COALESCE((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
+                        SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
                     ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0) as total_ttc
                 FROM proformas p
                 LEFT JOIN clients c ON c.client_id = p.client_id
@@ -6973,47 +7156,28 @@ def init_routes(flask_app, database, models, mail_instance):
                 LEFT JOIN clients c ON c.client_id = f.client_id
                 {where_clause_facture}
                 
-                ORDER BY date_facture DESC
+                ORDER BY date_creation DESC
             """
             
-            cur.execute(query, params)
-            commandes_data = cur.fetchall()
-
-            cur.close()
-            conn.close()
-
-            # Créer le CSV
-            import csv
-            from io import StringIO
-            
-            output = StringIO()
-            writer = csv.writer(output)
-            
-            # En-têtes
-            writer.writerow(['N°', 'Type', 'Date', 'Client', 'Statut', 'Agent', 'Total (FCFA)'])
-            
-            # Données
-            for row in commandes_data:
+            def format_row(row):
                 numero = f"PRO{row[0]:05d}" if row[1] == 'proforma' else f"FAC{row[0]:05d}"
-                date_str = row[2].strftime('%d/%m/%Y') if row[2] else ""
-                writer.writerow([
+                return [
                     numero,
                     row[1].upper(),
-                    date_str,
+                    row[2].strftime('%d/%m/%Y') if row[2] else "",
                     row[3] or "N/A",
                     row[4] or "termine",
                     row[5] or "N/A",
-                    f"{float(row[6]):,.0f}"
-                ])
-
-            # Préparer la réponse
-            output.seek(0)
-            from flask import make_response
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-            response.headers['Content-Disposition'] = f'attachment; filename=commandes_{ville}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-            
-            return response
+                    f"{float(row[6] or 0):,.0f}"
+                ]
+
+            # Lignes lues sur un curseur serveur et envoyées au fil de l'eau
+            return stream_export(
+                get_db_connection(), query, params,
+                ['N°', 'Type', 'Date', 'Client', 'Statut', 'Agent', 'Total (FCFA)'],
+                format_row, export_filename(f'commandes_{ville}', with_time=True),
+                fmt=request.args.get('format'), sheet_title='Commandes'
+            )
 
         except Exception as e:
             print(f"❌ Erreur api_export_commandes: {e}")
@@ -7036,9 +7200,6 @@ def init_routes(flask_app, database, models, mail_instance):
             search = request.args.get('search', '')
             statut = request.args.get('statut', '')
             
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
             # Construction de la requête
             query = """
                 SELECT 
@@ -7049,10 +7210,7 @@ def init_routes(flask_app, database, models, mail_instance):
                     LOWER(p.etat) as etat,
                     COALESCE(u.nom_utilisateur, 'Utilisateur supprimé') as created_by,
                     COALESCE(
-                        (SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id)
+                        (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id)
                         + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0
                     ) as total_ttc
                 FROM proformas p
@@ -7065,7 +7223,7 @@ def init_routes(flask_app, database, models, mail_instance):
             
             if search:
                 query += " AND (c.nom ILIKE %s OR c.telephone ILIKE %s OR CAST(p.proforma_id AS TEXT) LIKE %s)"
-                params.extend([f"%{search}%", f"%{search}%"])
+                params.extend([f"%{search}%", f"%{search}%", f"%{search}%"])
                 
             if statut:
                 query += " AND p.etat = %s"
@@ -7073,26 +7231,9 @@ def init_routes(flask_app, database, models, mail_instance):
             
             query += " ORDER BY p.date_creation DESC"
             
-            cur.execute(query, params)
-            factures = cur.fetchall()
-            
-            # Créer le CSV
-            import csv
-            from io import StringIO
-            
-            output = StringIO()
-            writer = csv.writer(output)
-            
-            # En-têtes
-            writer.writerow([
-                'Numéro Facture', 'Date', 'Client', 'Téléphone', 
-                'Statut', 'Agent', 'Montant Total (FCFA)'
-            ])
-            
-            # Données
-            for f in factures:
+            def format_row(f):
                 proforma_id, date_creation, client_nom, client_telephone, etat, created_by, total_ttc = f
-                writer.writerow([
+                return [
                     f"PRO{proforma_id:05d}",
                     date_creation.strftime('%d/%m/%Y') if date_creation else "",
                     client_nom,
@@ -7100,20 +7241,15 @@ def init_routes(flask_app, database, models, mail_instance):
                     'Terminé' if etat == 'termine' else 'Partiel',
                     created_by,
                     f"{int(total_ttc):,}".replace(',', ' ') if total_ttc else "0"
-                ])
-            
-            cur.close()
-            conn.close()
-            
-            # Préparer la réponse
-            output.seek(0)
-            
-            from flask import make_response
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv'
-            response.headers['Content-Disposition'] = f'attachment; filename=factures_export_{datetime.now().strftime("%Y%m%d")}.csv'
-            
-            return response
+                ]
+            
+            # Lignes lues sur un curseur serveur et envoyées au fil de l'eau
+            return stream_export(
+                get_db_connection(), query, params,
+                ['Numéro Facture', 'Date', 'Client', 'Téléphone', 'Statut', 'Agent', 'Montant Total (FCFA)'],
+                format_row, export_filename('factures_export'),
+                fmt=request.args.get('format'), sheet_title='Factures'
+            )
             
         except Exception as e:
             print(f"❌ Erreur api_export_factures: {e}")
@@ -1,7 +1,8 @@
  # Flask core
 from flask import (
     render_template, redirect, url_for, request,
-    session, flash, jsonify, send_file, current_app, make_response, g, abort
+    session, flash, jsonify, send_file, current_app, make_response, g, abort,
+    Response, stream_with_context
 )
 
 # Python standard library
@@ -14,6 +15,8 @@ import time
 import csv
 import random
 import string
+import sys
+import threading
 from datetime import datetime, timedelta
 from io import BytesIO, StringIO
 from pathlib import Path
@@ -51,9 +54,19 @@ except ImportError:
     except ImportError:
         PDF_ENGINE = None
         print("❌ No PDF engine available. Install WeasyPrint or PDFKit")
+
+# CSS de reporting_template.html (app/static) : analysée une fois par processus de rendu
+REPORTING_PDF_STYLESHEETS = ("css/pdf/reporting.css",)
         
 # Local imports
-from auth import authenticate_user, get_user_info 
+from auth import authenticate_user, get_user_info
+import db_pool
+import pdf_renderer
+from streaming_export import export_filename, stream_export
+from query_filters import (
+    article_search_sql, clients_with_orders_query, date_range_conditions, decode_cursor,
+    encode_cursor, estimate_row_count, keyset_condition
+)
 
 # Variables qui seront initialisées par app.py
 app = None
@@ -105,8 +118,8 @@ def init_admin_routes(flask_app, database, models, mail_instance):
     
     # === FONCTION UTILITAIRE : CONNEXION BD ===
     def get_db_connection():
-        conn = psycopg2.connect(current_app.config['SQLALCHEMY_DATABASE_URI'])
-        return conn
+        # Connexion empruntée au pool partagé : conn.close() la rend au pool
+        return db_pool.get_connection(current_app.config['SQLALCHEMY_DATABASE_URI'])
 
     # --- helper simple ---
     def _require_admin():
@@ -345,10 +358,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
             cur.execute("""
                 WITH proformas_ca AS (
                     SELECT 
-                        COALESCE((SELECT SUM(pa.quantite * a.prix)
-                                  FROM proforma_articles pa
-                                  JOIN articles a ON a.article_id = pa.article_id
-                                  WHERE pa.proforma_id = p.proforma_id), 0)
+                        COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                         + COALESCE(p.frais,0) - COALESCE(p.remise,0) AS total
                     FROM proformas p
                     WHERE p.etat IN ('termine','terminé','partiel')
@@ -1060,10 +1070,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     p.date_creation as date,
                     p.etat as statut,
                     COALESCE(
-                        (SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id), 0
+                        (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                     ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0) as total_ttc
                 FROM proformas p
                 WHERE p.client_id = %s
@@ -1192,9 +1199,6 @@ def init_admin_routes(flask_app, database, models, mail_instance):
             search = request.args.get('search', '')
             ville_filter = request.args.get('ville', '')
             
-            conn = get_db_connection()
-            cur = conn.cursor()
-            
             # Construction de la requête
             query = """
                 SELECT c.nom, c.telephone, c.telephone_secondaire,
@@ -1217,25 +1221,8 @@ def init_admin_routes(flask_app, database, models, mail_instance):
             
             query += " GROUP BY c.client_id ORDER BY c.nom"
             
-            cur.execute(query, params)
-            clients = cur.fetchall()
-            
-            # Créer le CSV
-            import csv
-            from io import StringIO
-            
-            output = StringIO()
-            writer = csv.writer(output)
-            
-            # En-têtes
-            writer.writerow([
-                'Nom', 'Téléphone Principal', 'Téléphone Secondaire', 
-                'Adresse', 'Ville', 'Pays', 'Nb Commandes', 'Total Versements (FCFA)'
-            ])
-            
-            # Données
-            for c in clients:
-                writer.writerow([
+            def format_row(c):
+                return [
                     c[0] or "Non renseigné",
                     c[1] or "-",
                     c[2] or "-",
@@ -1244,19 +1231,16 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     c[5] or "-",
                     c[6],
                     f"{int(c[7]):,}".replace(',', ' ') if c[7] else "0"
-                ])
-            
-            cur.close()
-            conn.close()
-            
-            # Préparer la réponse
-            output.seek(0)
-            
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv'
-            response.headers['Content-Disposition'] = f'attachment; filename=clients_export_{datetime.now().strftime("%Y%m%d")}.csv'
-            
-            return response
+                ]
+            
+            # Lignes lues sur un curseur serveur et envoyées au fil de l'eau
+            return stream_export(
+                get_db_connection(), query, params,
+                ['Nom', 'Téléphone Principal', 'Téléphone Secondaire',
+                 'Adresse', 'Ville', 'Pays', 'Nb Commandes', 'Total Versements (FCFA)'],
+                format_row, export_filename('clients_export'),
+                fmt=request.args.get('format'), sheet_title='Clients'
+            )
             
         except Exception as e:
             print(f"Erreur api_export_clients: {e}")
@@ -1281,45 +1265,22 @@ def init_admin_routes(flask_app, database, models, mail_instance):
         conn = get_db_connection()
         cur = conn.cursor()
         try:
-            # Base query Clients + nb_commandes + montant_total_paye
-            base_query = """
-                SELECT c.client_id, c.nom, c.telephone, c.telephone_secondaire,
-                    c.adresse, c.ville, c.pays,
-                    COALESCE(
-                        COUNT(CASE WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN p.proforma_id END) +
-                        COUNT(CASE WHEN f.statut IN ('termine', 'terminé', 'partiel') THEN f.facture_id END), 0
-                    ) AS nb_commandes,
-                    COALESCE(
-                        SUM(CASE WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN
-                            COALESCE(
-                                (SELECT SUM(pa.quantite * a.prix) 
-                                    FROM proforma_articles pa 
-                                    JOIN articles a ON a.article_id = pa.article_id 
-                                    WHERE pa.proforma_id = p.proforma_id), 0
-                            ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
-                        ELSE 0 END) +
-                        SUM(CASE WHEN f.statut IN ('termine', 'terminé', 'partiel') THEN f.montant_total ELSE 0 END), 0
-                    ) AS montant_total_paye
-                FROM clients c
-                LEFT JOIN proformas p ON p.client_id = c.client_id
-                LEFT JOIN factures f ON f.client_id = c.client_id
-                WHERE 1=1
-            """
+            # Page de clients + nb_commandes / montant_total_paye (proformas et factures agrégées séparément)
+            filters_sql = ""
             params = []
             if search:
-                base_query += " AND (LOWER(c.nom) LIKE LOWER(%s) OR c.telephone LIKE %s)"
+                filters_sql += " AND (LOWER(c.nom) LIKE LOWER(%s) OR c.telephone LIKE %s)"
                 params.extend([f"%{search}%", f"%{search}%"])
             if ville_filter:
-                base_query += " AND c.ville = %s"
+                filters_sql += " AND c.ville = %s"
                 params.append(ville_filter)
-            base_query += " GROUP BY c.client_id"
 
-            # Pagination
-            cur.execute(f"SELECT COUNT(*) FROM ({base_query}) AS sub", params)
+            # Pagination (une ligne par client : comptage sur clients seuls)
+            cur.execute(f"SELECT COUNT(*) FROM clients c WHERE 1=1 {filters_sql}", params)
             total_clients = cur.fetchone()[0] or 0
             total_pages = math.ceil(total_clients / rows_per_page) if total_clients > 0 else 1
 
-            cur.execute(f"{base_query} ORDER BY c.nom LIMIT %s OFFSET %s", params + [rows_per_page, offset])
+            cur.execute(clients_with_orders_query(filters_sql, "c.nom", "LIMIT %s OFFSET %s"), params + [rows_per_page, offset])
             clients_rows = cur.fetchall()
 
             # Villes
@@ -1341,28 +1302,19 @@ def init_admin_routes(flask_app, database, models, mail_instance):
             kpi_total_clients_raw = cur.fetchone()[0] or 0
 
             # CA GLOBAL (proformas terminées + factures terminées) - TOUS LES UTILISATEURS SECRÉTAIRES
+            # Proformas et factures sommées séparément (pas de jointure par client qui multiplie les lignes)
             cur.execute("""
-                SELECT COALESCE(SUM(
-                    CASE 
-                        WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN
-                            COALESCE(
-                                (SELECT SUM(pa.quantite * a.prix) 
-                                FROM proforma_articles pa 
-                                JOIN articles a ON a.article_id = pa.article_id 
-                                WHERE pa.proforma_id = p.proforma_id), 0
-                            ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
-                        ELSE 0
-                    END
-                ), 0) +
-                COALESCE(SUM(
-                    CASE 
-                        WHEN f.statut IN ('termine', 'terminé', 'partiel') THEN f.montant_total 
-                        ELSE 0 
-                    END
-                ), 0)
-                FROM proformas p
-                FULL OUTER JOIN factures f ON f.client_id = p.client_id
-                WHERE (p.etat IN ('termine', 'terminé', 'partiel') OR f.statut IN ('termine', 'terminé', 'partiel'))
+                SELECT
+                    (SELECT COALESCE(SUM(
+                        COALESCE(pt.total_articles, 0) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
+                     ), 0)
+                     FROM proformas p
+                     LEFT JOIN proforma_totals pt ON pt.proforma_id = p.proforma_id
+                     WHERE p.etat IN ('termine', 'terminé', 'partiel'))
+                    +
+                    (SELECT COALESCE(SUM(f.montant_total), 0)
+                     FROM factures f
+                     WHERE f.statut IN ('termine', 'terminé', 'partiel'))
             """)
             kpi_ca_total = int(cur.fetchone()[0] or 0)
 
@@ -1477,10 +1429,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                 WITH proformas_m AS (
                     SELECT to_char(date_trunc('month', p.date_creation), 'YYYY-MM') AS ym,
                            p.client_id,
-                           COALESCE((SELECT SUM(pa.quantite * a.prix)
-                                     FROM proforma_articles pa
-                                     JOIN articles a ON a.article_id = pa.article_id
-                                     WHERE pa.proforma_id = p.proforma_id), 0)
+                           COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                            + COALESCE(p.frais,0) - COALESCE(p.remise,0) AS total
                     FROM proformas p
                     WHERE p.date_creation >= %s AND p.date_creation < %s + interval '1 month'
@@ -1512,10 +1461,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                 WITH union_m AS (
                     SELECT to_char(date_trunc('month', p.date_creation), 'YYYY-MM') AS ym,
                            p.client_id,
-                           COALESCE((SELECT SUM(pa.quantite * a.prix)
-                                     FROM proforma_articles pa
-                                     JOIN articles a ON a.article_id = pa.article_id
-                                     WHERE pa.proforma_id = p.proforma_id), 0)
+                           COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                            + COALESCE(p.frais,0) - COALESCE(p.remise,0) AS total
                     FROM proformas p
                     WHERE p.date_creation >= %s AND p.date_creation < %s + interval '1 month'
@@ -1595,22 +1541,14 @@ def init_admin_routes(flask_app, database, models, mail_instance):
         cur = conn.cursor()
         try:
             # MODE B: Ratio parmi les clients ayant déjà commandé au moins une fois
+            # (dernière commande lue dans client_stats, maintenue par triggers)
             cur.execute("""
-                WITH last_orders AS (
-                    SELECT c.client_id,
-                           GREATEST(
-                               COALESCE((SELECT MAX(p.date_creation) FROM proformas p WHERE p.client_id=c.client_id AND p.etat IN ('termine','terminé','partiel')), '1900-01-01'),
-                               COALESCE((SELECT MAX(f.date_facture)  FROM factures  f WHERE f.client_id=c.client_id AND f.statut IN ('termine','terminé','partiel')), '1900-01-01')
-                           ) AS last_order
-                    FROM clients c
-                ), buyers_only AS (
-                    SELECT * FROM last_orders WHERE last_order > '1900-01-01'
-                )
                 SELECT
-                    COUNT(CASE WHEN last_order >= %s THEN 1 END) AS actifs,
-                    COUNT(CASE WHEN last_order < %s THEN 1 END)  AS inactifs
-                FROM buyers_only
-            """, [cutoff, cutoff])
+                    COUNT(*) FILTER (WHERE derniere_commande >= %s) AS actifs,
+                    COUNT(*) FILTER (WHERE derniere_commande < %s)  AS inactifs
+                FROM client_stats
+                WHERE nb_commandes > 0 AND derniere_commande IS NOT NULL
+            """, [cutoff.date(), cutoff.date()])
             row = cur.fetchone()
             actifs = int(row[0] or 0)
             inactifs = int(row[1] or 0)
@@ -1663,10 +1601,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     CASE 
                         WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN
                             COALESCE(
-                                (SELECT SUM(pa.quantite * a.prix) 
-                                FROM proforma_articles pa 
-                                JOIN articles a ON a.article_id = pa.article_id 
-                                WHERE pa.proforma_id = p.proforma_id), 0
+                                (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                             ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                         ELSE 0
                     END
@@ -2033,26 +1968,37 @@ def init_admin_routes(flask_app, database, models, mail_instance):
         statut = request.args.get('statut', '', type=str)
         per_page = 50
         offset = (page - 1) * per_page
+        # Pagination par curseur : ?cursor= (vide pour la première page), total=exact|approx optionnel
+        cursor = request.args.get('cursor')
+        total_mode = request.args.get('total', '')
+        try:
+            after = decode_cursor(cursor, 3) if cursor else None
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
         conn = get_db_connection()
         cur = conn.cursor()
         try:
-            # Construire la requête avec filtres
+            # Construire la requête avec filtres (paramètres séparés par branche de l'UNION)
             where_conditions_proforma = []
             where_conditions_facture = []
-            params = []
+            params_proforma = []
+            params_facture = []
             
             if search:
                 where_conditions_proforma.append("(c.nom ILIKE %s OR c.telephone ILIKE %s)")
                 where_conditions_facture.append("(c.nom ILIKE %s OR c.telephone ILIKE %s)")
                 search_param = f"%{search}%"
-                params.extend([search_param, search_param, search_param, search_param])
+                params_proforma.extend([search_param, search_param])
+                params_facture.extend([search_param, search_param])
             
             if statut:
                 where_conditions_proforma.append("p.etat = %s")
                 where_conditions_facture.append("f.statut = %s")
-                params.extend([statut, statut])
+                params_proforma.append(statut)
+                params_facture.append(statut)
             
+            params = params_proforma + params_facture
             where_clause_proforma = "WHERE " + " AND ".join(where_conditions_proforma) if where_conditions_proforma else ""
             where_clause_facture = "WHERE " + " AND ".join(where_conditions_facture) if where_conditions_facture else ""
             
@@ -2062,12 +2008,23 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     (SELECT COUNT(*) FROM proformas p LEFT JOIN clients c ON c.client_id = p.client_id {where_clause_proforma}) +
                     (SELECT COUNT(*) FROM factures f LEFT JOIN clients c ON c.client_id = f.client_id {where_clause_facture})
             """
-            cur.execute(count_query, params)
-            total_count = cur.fetchone()[0]
+            if cursor is None or total_mode == 'exact':
+                cur.execute(count_query, params)
+                total_count = cur.fetchone()[0]
+            elif total_mode == 'approx':
+                total_count = (
+                    estimate_row_count(cur, f"SELECT 1 FROM proformas p LEFT JOIN clients c ON c.client_id = p.client_id {where_clause_proforma}", params_proforma)
+                    + estimate_row_count(cur, f"SELECT 1 FROM factures f LEFT JOIN clients c ON c.client_id = f.client_id {where_clause_facture}", params_facture)
+                )
+            else:
+                total_count = None
+
+            # Clé de tri stable (date, type, id) ; date absente des anciennes factures ramenée au plus ancien
+            proforma_sort_date = "p.date_creation"
+            facture_sort_date = "COALESCE(f.date_facture, DATE '0001-01-01')"
 
-            # Récupérer les proformas ET factures avec pagination
             # Union des proformas et factures
-            query = f"""
+            proforma_select = f"""
                 SELECT 
                     p.proforma_id as id,
                     'proforma' as type,
@@ -2078,18 +2035,15 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     p.etat,
                     COALESCE(u.nom_utilisateur, 'N/A') as agent_nom,
                     COALESCE((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
-                    ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0) as total_ttc
+                        SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
+                    ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0) as total_ttc,
+                    {proforma_sort_date} as sort_date
                 FROM proformas p
                 LEFT JOIN clients c ON c.client_id = p.client_id
                 LEFT JOIN utilisateurs u ON u.user_id = p.cree_par
                 {where_clause_proforma}
-                
-                UNION ALL
-                
+            """
+            facture_select = f"""
                 SELECT 
                     f.facture_id as id,
                     'facture' as type,
@@ -2099,19 +2053,57 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     f.ville,
                     f.statut as etat,
                     COALESCE(f.agent, 'N/A') as agent_nom,
-                    f.montant_total as total_ttc
+                    f.montant_total as total_ttc,
+                    {facture_sort_date} as sort_date
                 FROM factures f
                 LEFT JOIN clients c ON c.client_id = f.client_id
                 {where_clause_facture}
-                
-                ORDER BY date_creation DESC
-                LIMIT %s OFFSET %s
             """
+
+            next_cursor = None
+            if cursor is not None:
+                # Keyset : chaque branche ne lit que les lignes après le curseur, déjà triées et limitées
+                proforma_and = " AND " if where_conditions_proforma else " WHERE "
+                facture_and = " AND " if where_conditions_facture else " WHERE "
+                keyset_proforma = ""
+                keyset_facture = ""
+                keyset_params_proforma = []
+                keyset_params_facture = []
+                if after:
+                    condition, values = keyset_condition([proforma_sort_date, "'proforma'", "p.proforma_id"], after)
+                    keyset_proforma = f"{proforma_and}{proforma_sort_date} <= %s AND {condition}"
+                    keyset_params_proforma = [after[0]] + values
+                    condition, values = keyset_condition([facture_sort_date, "'facture'", "f.facture_id"], after)
+                    keyset_facture = f"{facture_and}{facture_sort_date} <= %s AND {condition}"
+                    keyset_params_facture = [after[0]] + values
+
+                query = f"""
+                    ({proforma_select}{keyset_proforma} ORDER BY {proforma_sort_date} DESC, p.proforma_id DESC LIMIT %s)
+                    UNION ALL
+                    ({facture_select}{keyset_facture} ORDER BY {facture_sort_date} DESC, f.facture_id DESC LIMIT %s)
+                    ORDER BY sort_date DESC, type DESC, id DESC
+                    LIMIT %s
+                """
+                cur.execute(query, params_proforma + keyset_params_proforma + [per_page + 1]
+                            + params_facture + keyset_params_facture + [per_page + 1, per_page + 1])
+                commandes_data = cur.fetchall()
+
+                if len(commandes_data) > per_page:
+                    commandes_data = commandes_data[:per_page]
+                    last = commandes_data[-1]
+                    next_cursor = encode_cursor([last[9], last[1], last[0]])
+            else:
+                query = f"""
+                    {proforma_select}
+                    UNION ALL
+                    {facture_select}
+                    ORDER BY date_creation DESC
+                    LIMIT %s OFFSET %s
+                """
+                cur.execute(query, params + [per_page, offset])
+                commandes_data = cur.fetchall()
             
-            cur.execute(query, params + [per_page, offset])
-            commandes_data = cur.fetchall()
-            
-            total_pages = (total_count + per_page - 1) // per_page
+            total_pages = (total_count + per_page - 1) // per_page if total_count is not None else None
 
             # Calculer les totaux pour le résumé (toutes les données, pas seulement la page courante)
             # Proformas = statuts 'en_attente' et 'en_cours'
@@ -2121,10 +2113,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     'proforma' as type,
                     COUNT(*) as count,
                     COALESCE(SUM((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
+                        SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
                     ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)), 0) as total
                 FROM proformas p
                 LEFT JOIN clients c ON c.client_id = p.client_id
@@ -2172,8 +2161,11 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     "total_ttc": float(row[8])
                 } for row in commandes_data],
                 "total_count": total_count,
+                "total_is_estimate": cursor is not None and total_mode == 'approx',
                 "total_pages": total_pages,
                 "current_page": page,
+                "next_cursor": next_cursor,
+                "has_more": next_cursor is not None,
                 "summary": {
                     "proformas": {
                         "count": total_proformas,
@@ -2215,16 +2207,10 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     c.telephone as client_telephone,
                     c.adresse as client_adresse,
                     COALESCE((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
+                        SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
                     ), 0) as sous_total,
                     COALESCE((
-                        SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id
+                        SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id
                     ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0), 0) as total_ttc
                 FROM proformas p
                 LEFT JOIN clients c ON c.client_id = p.client_id
@@ -2483,10 +2469,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                     CASE 
                         WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN
                             COALESCE(
-                                (SELECT SUM(pa.quantite * a.prix) 
-                                FROM proforma_articles pa 
-                                JOIN articles a ON a.article_id = pa.article_id 
-                                WHERE pa.proforma_id = p.proforma_id), 0
+                                (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                             ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                         ELSE 0
                     END
@@ -2509,10 +2492,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                 """
                 WITH p_all AS (
                     SELECT p.proforma_id, p.cree_par,
-                           COALESCE((SELECT SUM(pa.quantite * a.prix)
-                                    FROM proforma_articles pa
-                                    JOIN articles a ON a.article_id = pa.article_id
-                                    WHERE pa.proforma_id = p.proforma_id), 0)
+                           COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                            + COALESCE(p.frais,0) - COALESCE(p.remise,0) AS total,
                            p.etat
                     FROM proformas p
@@ -2576,10 +2556,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                 """
                 WITH p30 AS (
                     SELECT p.proforma_id, p.cree_par,
-                           COALESCE((SELECT SUM(pa.quantite * a.prix)
-                                    FROM proforma_articles pa
-                                    JOIN articles a ON a.article_id = pa.article_id
-                                    WHERE pa.proforma_id = p.proforma_id), 0)
+                           COALESCE((SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0)
                            + COALESCE(p.frais,0) - COALESCE(p.remise,0) AS total,
                            p.etat
                     FROM proformas p
@@ -2791,7 +2768,6 @@ def init_admin_routes(flask_app, database, models, mail_instance):
             return jsonify({"success": False, "message": "Non autorisé"}), 401
         ville = request.args.get('ville','')
         search = request.args.get('search','')
-        conn = get_db_connection(); cur = conn.cursor()
         try:
             base = "SELECT nom_utilisateur, email, ville, role, actif FROM utilisateurs WHERE 1=1"
             params=[]
@@ -2799,22 +2775,14 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                 base += " AND (LOWER(nom_utilisateur) LIKE LOWER(%s) OR LOWER(email) LIKE LOWER(%s))"; params.extend([f"%{search}%", f"%{search}%"])
             if ville:
                 base += " AND ville = %s"; params.append(ville)
-            cur.execute(base + " ORDER BY nom_utilisateur", params)
-            rows = cur.fetchall()
-            output = StringIO(); writer = csv.writer(output)
-            writer.writerow(['Nom','Email','Ville','Rôle','Actif'])
-            for r in rows:
-                writer.writerow([r[0] or '-', r[1] or '-', r[2] or '-', r[3] or '-', 'Oui' if r[4] else 'Non'])
-            output.seek(0)
-            resp = make_response(output.getvalue())
-            resp.headers['Content-Type'] = 'text/csv'
-            resp.headers['Content-Disposition'] = f'attachment; filename=staff_{datetime.now().strftime("%Y%m%d")}.csv'
-            return resp
+            return stream_export(
+                get_db_connection(), base + " ORDER BY nom_utilisateur", params,
+                ['Nom','Email','Ville','Rôle','Actif'],
+                lambda r: [r[0] or '-', r[1] or '-', r[2] or '-', r[3] or '-', 'Oui' if r[4] else 'Non'],
+                export_filename('staff'), fmt=request.args.get('format'), sheet_title='Staff'
+            )
         except Exception as e:
             return jsonify({"success": False, "message": str(e)}), 500
-        finally:
-            try: cur.close(); conn.close()
-            except Exception: pass
 
     @app.route('/admin/api/staff/<int:user_id>', methods=['PUT'])
     def admin_api_staff_update(user_id):
@@ -2969,6 +2937,71 @@ def init_admin_routes(flask_app, database, models, mail_instance):
             if 'conn' in locals(): conn.rollback(); cur.close(); conn.close()
             return jsonify({"success": False, "message": str(e)}), 500
 
+    def _loaded_bizzio():
+        """Instance Bizzio du processus si elle existe déjà (sans charger Gemini)"""
+        gemini_module = sys.modules.get('GeminiHandler.gemini')
+        return gemini_module._instance if gemini_module is not None else None
+
+    def _forget_chat_history(chat_id):
+        """Oublier l'historique en mémoire d'un chat supprimé (si Bizzio est déjà chargé)"""
+        bizzio = _loaded_bizzio()
+        if bizzio is not None:
+            bizzio.chat_histories.forget(chat_id)
+
+    @app.route('/admin/api/data-analyst/cache', methods=['GET', 'DELETE'])
+    def admin_api_da_cache():
+        """Statistiques du cache de réponses de Bizzio (DELETE : vider le cache de ce processus)"""
+        user, resp = _require_admin()
+        if resp: return resp
+        bizzio = _loaded_bizzio()
+        if bizzio is None:
+            return jsonify({"success": True, "loaded": False, "stats": None})
+        if request.method == 'DELETE':
+            bizzio.response_cache.invalidate()
+        return jsonify({
+            "success": True,
+            "loaded": True,
+            "pid": os.getpid(),
+            "stats": bizzio.response_cache.stats(),
+            "chat_histories": bizzio.chat_histories.stats()
+        })
+
+    @app.route('/admin/api/data-analyst/exports/<job_id>', methods=['GET'])
+    def admin_api_da_export_status(job_id):
+        """État d'un export lancé depuis le chat (pending, running, done, failed)"""
+        user, resp = _require_admin()
+        if resp: return resp
+        from GeminiHandler.export_jobs import get_export_jobs
+        job = get_export_jobs().status(job_id)
+        if job is None:
+            return jsonify({"success": False, "message": "Export introuvable ou expiré"}), 404
+        return jsonify({"success": True, "job": job})
+
+    @app.route('/admin/api/data-analyst/exports/<job_id>/download', methods=['GET'])
+    def admin_api_da_export_download(job_id):
+        """Fichier d'un export : attend la fin de la tâche (202 si elle est encore en cours)"""
+        user, resp = _require_admin()
+        if resp: return resp
+        from GeminiHandler.export_jobs import get_export_jobs
+        export_jobs = get_export_jobs()
+        wait = 0 if request.args.get('wait') == '0' else 30
+        job = export_jobs.wait(job_id, timeout=wait)
+        if job is None:
+            return jsonify({"success": False, "message": "Export introuvable ou expiré"}), 404
+        if job['status'] == 'failed':
+            return jsonify({"success": False, "message": job['error'], "job": job}), 500
+        if job['status'] != 'done':
+            response = jsonify({"success": True, "pending": True, "job": job})
+            response.status_code = 202
+            response.headers['Retry-After'] = '2'
+            return response
+        path = os.path.join(export_jobs.directory, job['filename'])
+        if not os.path.exists(path):
+            return jsonify({"success": False, "message": "Fichier expiré"}), 410
+        if job['export_type'] == 'visualisation':
+            return send_file(path, mimetype='image/png')
+        return send_file(path, as_attachment=True, download_name=job['filename'])
+
     @app.route('/admin/api/data-analyst/sessions/<int:chat_id>', methods=['DELETE'])
     def admin_api_da_sessions_delete(chat_id):
         user, resp = _require_admin();
@@ -2980,6 +3013,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                 conn.rollback(); cur.close(); conn.close()
                 return jsonify({"success": False, "message": "Chat introuvable"}), 404
             conn.commit(); cur.close(); conn.close()
+            _forget_chat_history(chat_id)
             return jsonify({"success": True})
         except Exception as e:
             if 'conn' in locals(): conn.rollback(); cur.close(); conn.close()
@@ -3030,6 +3064,63 @@ def init_admin_routes(flask_app, database, models, mail_instance):
             if 'conn' in locals(): cur.close(); conn.close()
             return jsonify({"success": False, "message": str(e)}), 500
 
+    def _generate_chat_title(bizzio, user_message):
+        """Titre court d'une conversation à partir de sa première question (appel Gemini)"""
+        try:
+            # Générer un titre professionnel et accrocheur via Gemini
+            title_prompt = f"""Analyse cette question et génère un titre professionnel en une phrase courte (max 35 caractères) qui résume l'intention business:
+
+Question: "{user_message}"
+
+Règles:
+- Titre en français uniquement
+- Pas de deux-points (:)
+- Pas de ponctuation finale
+- Style professionnel et informatif
+- Éviter les interjections courtes (yo, salut, etc.)
+
+Réponds uniquement par le titre, sans guillemets ni explications."""
+            
+            title_response = bizzio.model.generate_content(title_prompt)
+            session_name = title_response.text.strip()
+            
+            # Nettoyer le titre
+            session_name = session_name.replace('"', '').replace("'", '').strip()
+            if session_name.endswith(':'):
+                session_name = session_name[:-1].strip()
+            if session_name.endswith('.') or session_name.endswith('!'):
+                session_name = session_name[:-1].strip()
+            
+            # Fallback si titre trop court ou vide
+            if not session_name or len(session_name) < 4:
+                # Extraire les mots clés principaux
+                words = user_message.lower().split()
+                key_words = [w for w in words if len(w) > 3 and w not in ['quels', 'sont', 'nos', 'les', 'plus', 'pour', 'avec', 'dans', 'sur', 'par']]
+                if key_words:
+                    session_name = ' '.join(key_words[:3]).title()
+                else:
+                    session_name = user_message[:35]
+        except Exception as e:
+            print(f"Erreur génération titre: {e}")
+            session_name = user_message[:35]
+        return session_name
+
+    def _save_chat_title(chat_id, user_id, session_name):
+        conn = get_db_connection(); cur = conn.cursor()
+        try:
+            cur.execute("""
+                UPDATE data_analyst_chats 
+                   SET session_name = %s, updated_at = CURRENT_TIMESTAMP
+                 WHERE chat_id = %s AND user_id = %s
+            """, [session_name, chat_id, user_id])
+            conn.commit()
+        finally:
+            cur.close(); conn.close()
+
+    def _sse(event, payload):
+        """Événement server-sent events (données JSON)"""
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
     # API d'envoi d'un message (sauvegarde + appel Gemini)
     @app.route("/admin/api/data-analyst/chat", methods=["POST"])
     def admin_api_data_analyst_chat():
@@ -3046,6 +3137,7 @@ def init_admin_routes(flask_app, database, models, mail_instance):
                 return jsonify({"success": False, "error": "Message vide"}), 400
             chat_id = data.get('chat_id')
             session_name = data.get('session_name', 'Nouvelle conversation')
+            stream = bool(data.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
             conn = get_db_connection(); cur = conn.cursor()
             # Créer une session si nécessaire
             if not chat_id:
@@ -3056,69 +3148,33 @@ def init_admin_routes(flask_app, database, models, mail_instance):
             _ = cur.fetchone()[0]
             
             # Import du module Gemini
-            from GeminiHandler.gemini import BizzioGemini
+            from GeminiHandler.gemini import get_bizzio
+            
+            # Instance partagée du processus (initialisée au premier message)
+            bizzio = get_bizzio()
             
-            # Initialisation de Bizzio
-            bizzio = BizzioGemini()
+            if stream:
+                # La connexion est rendue au pool avant la génération (plusieurs secondes)
+                cur.execute("SELECT session_name FROM data_analyst_chats WHERE chat_id = %s", [chat_id])
+                current_name = cur.fetchone()[0]
+                conn.commit(); cur.close(); conn.close()
+                return _stream_chat_response(bizzio, user, user_message, chat_id, current_name)
             
-            # Envoi du message à Bizzio
-            result = bizzio.chat_with_bizzio(user_message)
+            # Envoi du message à Bizzio avec l'historique de ce chat comme contexte
+            result = bizzio.chat_with_bizzio(user_message, chat_id=chat_id)
             
             if result['success']:
                 # Sauvegarder la réponse de Bizzio
                 cur.execute("SELECT add_chat_message(%s, %s, %s, %s, %s)", [chat_id, 'bizzio', None, result['response'], None])
                 _ = cur.fetchone()[0]
                 
-                # Si c'est le premier message, générer un titre accrocheur via Gemini
-                session_name = None
                 cur.execute("SELECT session_name FROM data_analyst_chats WHERE chat_id = %s", [chat_id])
                 current_name = cur.fetchone()[0]
-                if current_name == 'Nouvelle conversation':
-                    try:
-                        # Générer un titre professionnel et accrocheur via Gemini
-                        title_prompt = f"""Analyse cette question et génère un titre professionnel en une phrase courte (max 35 caractères) qui résume l'intention business:
-
-Question: "{user_message}"
-
-Règles:
-- Titre en français uniquement
-- Pas de deux-points (:)
-- Pas de ponctuation finale
-- Style professionnel et informatif
-- Éviter les interjections courtes (yo, salut, etc.)
-
-Réponds uniquement par le titre, sans guillemets ni explications."""
-                        
-                        title_response = bizzio.model.generate_content(title_prompt)
-                        session_name = title_response.text.strip()
-                        
-                        # Nettoyer le titre
-                        session_name = session_name.replace('"', '').replace("'", '').strip()
-                        if session_name.endswith(':'):
-                            session_name = session_name[:-1].strip()
-                        if session_name.endswith('.') or session_name.endswith('!'):
-                            session_name = session_name[:-1].strip()
-                        
-                        # Fallback si titre trop court ou vide
-                        if not session_name or len(session_name) < 4:
-                            # Extraire les mots clés principaux
-                            words = user_message.lower().split()
-                            key_words = [w for w in words if len(w) > 3 and w not in ['quels', 'sont', 'nos', 'les', 'plus', 'pour', 'avec', 'dans', 'sur', 'par']]
-                            if key_words:
-                                session_name = ' '.join(key_words[:3]).title()
-                            else:
-                                session_name = user_message[:35]
-                    except Exception as e:
-                        print(f"Erreur génération titre: {e}")
-                        session_name = user_message[:35]
-                    
-                    cur.execute("""
-                        UPDATE data_analyst_chats 
-                           SET session_name = %s, updated_at = CURRENT_TIMESTAMP
-                         WHERE chat_id = %s AND user_id = %s
-                    """, [session_name, chat_id, user.user_id])
-                
                 conn.commit(); cur.close(); conn.close()
+
+                # Premier message : titre généré en arrière-plan (visible au prochain loadSessions)
+                if current_name == 'Nouvelle conversation':
+                    _start_title_thread(bizzio, user.user_id, user_message, chat_id)
                 return jsonify({
                     "success": True,
                     "response": result['response'],
@@ -3126,7 +3182,8 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                     "model_used": result['model_used'],
                     "conversation_id": result['conversation_id'],
                     "chat_id": chat_id,
-                    "session_name": session_name or current_name
+                    "session_name": current_name,
+                    "export_job": result.get('export_job')
                 })
             else:
                 conn.rollback(); cur.close(); conn.close()
@@ -3142,6 +3199,85 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                 "error": "Erreur interne du serveur"
             }), 500
 
+    def _start_title_thread(bizzio, user_id, user_message, chat_id, holder=None):
+        """Générer et enregistrer le titre d'une nouvelle conversation dans un thread (holder['session_name'] = titre)"""
+        holder = holder if holder is not None else {}
+
+        def build_title():
+            with app.app_context():
+                title = _generate_chat_title(bizzio, user_message)
+                try:
+                    _save_chat_title(chat_id, user_id, title)
+                except Exception as e:
+                    print(f"Erreur enregistrement titre (chat {chat_id}): {e}")
+                holder['session_name'] = title
+
+        thread = threading.Thread(target=build_title, daemon=True)
+        thread.start()
+        return thread
+
+    def _stream_chat_response(bizzio, user, user_message, chat_id, current_name):
+        """
+        Réponse en server-sent events :
+          meta  → {chat_id, session_name} immédiatement
+          chunk → {delta} à chaque morceau produit par le modèle
+          done  → même contenu que la réponse JSON, une fois la réponse enregistrée
+          title → {session_name} pour une nouvelle conversation, généré en arrière-plan
+        """
+        user_id = user.user_id
+
+        def generate():
+            yield _sse("meta", {"chat_id": chat_id, "session_name": current_name})
+
+            result = None
+            for kind, payload in bizzio.stream_chat_with_bizzio(user_message, chat_id=chat_id):
+                if kind == 'chunk':
+                    if payload:
+                        yield _sse("chunk", {"delta": payload})
+                else:
+                    result = payload
+
+            if not result or not result.get('success'):
+                yield _sse("error", {"success": False, "error": "Erreur lors du traitement du message"})
+                return
+
+            # Réponse complète enregistrée en fin de flux
+            try:
+                conn = get_db_connection(); cur = conn.cursor()
+                cur.execute("SELECT add_chat_message(%s, %s, %s, %s, %s)", [chat_id, 'bizzio', None, result['response'], None])
+                _ = cur.fetchone()[0]
+                conn.commit(); cur.close(); conn.close()
+            except Exception as e:
+                print(f"Erreur enregistrement réponse Bizzio (chat {chat_id}): {e}")
+                if 'conn' in locals(): conn.rollback(); cur.close(); conn.close()
+
+            # Titre généré après la réponse, hors du chemin critique
+            title_holder = {}
+            title_thread = None
+            if current_name == 'Nouvelle conversation':
+                title_thread = _start_title_thread(bizzio, user_id, user_message, chat_id, title_holder)
+
+            yield _sse("done", {
+                "success": True,
+                "response": result['response'],
+                "timestamp": result['timestamp'],
+                "model_used": result['model_used'],
+                "conversation_id": result['conversation_id'],
+                "chat_id": chat_id,
+                "session_name": current_name,
+                "export_job": result.get('export_job')
+            })
+
+            if title_thread is not None:
+                title_thread.join(timeout=15)
+                if 'session_name' in title_holder:
+                    yield _sse("title", {"chat_id": chat_id, "session_name": title_holder['session_name']})
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
     # Onglet: Reporting
     @app.route("/admin/reporting", methods=["GET"])
     def admin_reporting():
@@ -3290,112 +3426,44 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
             conn = get_db_connection()
             cur = conn.cursor()
             
-            # Construire les conditions WHERE et paramètres séparément pour chaque table
-            proforma_conditions = []
-            facture_conditions = []
-            proforma_params = []
-            facture_params = []
-            
-            # Filtre par année
-            if filters.get('annee'):
-                proforma_conditions.append("EXTRACT(YEAR FROM p.date_creation) = %s")
-                facture_conditions.append("EXTRACT(YEAR FROM f.date_facture) = %s")
-                proforma_params.append(filters['annee'])
-                facture_params.append(filters['annee'])
-            
-            # Filtre par trimestre
-            if filters.get('trimestre'):
-                quarter_map = {'Q1': [1,2,3], 'Q2': [4,5,6], 'Q3': [7,8,9], 'Q4': [10,11,12]}
-                months = quarter_map.get(filters['trimestre'], [])
-                if months:
-                    placeholders = ','.join(['%s'] * len(months))
-                    proforma_conditions.append(f"EXTRACT(MONTH FROM p.date_creation) IN ({placeholders})")
-                    facture_conditions.append(f"EXTRACT(MONTH FROM f.date_facture) IN ({placeholders})")
-                    proforma_params.extend(months)
-                    facture_params.extend(months)
-            
-            # Filtre par mois
-            if filters.get('mois'):
-                proforma_conditions.append("EXTRACT(MONTH FROM p.date_creation) = %s")
-                facture_conditions.append("EXTRACT(MONTH FROM f.date_facture) = %s")
-                proforma_params.append(filters['mois'])
-                facture_params.append(filters['mois'])
-            
-            # Filtre par ville
-            if filters.get('ville'):
-                proforma_conditions.append("p.ville = %s")
-                # Pour les factures, filtrer strictement par ville
-                facture_conditions.append("f.ville = %s")
-                proforma_params.append(filters['ville'])
-                facture_params.append(filters['ville'])
-            
-            # Filtre par type de prestation (articles)
-            if filters.get('type_prestation'):
-                proforma_conditions.append("EXISTS (SELECT 1 FROM proforma_articles pa JOIN articles a ON a.article_id = pa.article_id WHERE pa.proforma_id = p.proforma_id AND a.type_article = %s)")
-                facture_conditions.append("EXISTS (SELECT 1 FROM facture_articles fa JOIN articles a ON a.article_id = fa.article_id WHERE fa.facture_id = f.facture_id AND a.type_article = %s)")
-                proforma_params.append(filters['type_prestation'])
-                facture_params.append(filters['type_prestation'])
-            
-            # Filtre par agent
-            if filters.get('agent'):
-                proforma_conditions.append("p.cree_par = %s")
-                # Pour les factures, inclure celles sans agent pour les anciennes factures
-                facture_conditions.append("(f.cree_par = %s OR f.cree_par IS NULL)")
-                proforma_params.append(filters['agent'])
-                facture_params.append(filters['agent'])
+            refresh_sales_rollup(cur)
+            where_faits, params_faits = build_sales_rollup_conditions(filters)
+            where_clients, params_clients = build_sales_rollup_conditions(filters, date_column="mois")
             
-            # Requête pour les données mensuelles - utiliser la même logique que les KPIs
+            # Données mensuelles lues dans les agrégats (clients distincts au grain mensuel)
             sparklines_query = f"""
-                WITH all_data AS (
+                WITH faits AS (
                     SELECT 
-                        TO_CHAR(p.date_creation, 'YYYY-MM') as mois,
-                        COALESCE(
-                            (SELECT SUM(pa.quantite * a.prix) 
-                            FROM proforma_articles pa 
-                            JOIN articles a ON a.article_id = pa.article_id 
-                            WHERE pa.proforma_id = p.proforma_id), 0
-                        ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0) AS ca,
-                        p.proforma_id AS id,
-                        p.client_id,
-                        (SELECT SUM(pa.quantite) FROM proforma_articles pa WHERE pa.proforma_id = p.proforma_id) AS articles
-                    FROM proformas p
-                    WHERE p.etat IN ('termine', 'partiel')
-            """
-                    
-            if proforma_conditions:
-                sparklines_query += " AND " + " AND ".join(proforma_conditions)
-                    
-            sparklines_query += """
-                    UNION ALL
+                        TO_CHAR(jour, 'YYYY-MM') AS mois,
+                        SUM(chiffre_affaires) AS chiffre_affaires,
+                        SUM(nb_ventes) AS ventes,
+                        SUM(articles) AS articles
+                    FROM sales_daily_facts
+                    WHERE {where_faits}
+                    GROUP BY TO_CHAR(jour, 'YYYY-MM')
+                ),
+                clients AS (
                     SELECT 
-                        TO_CHAR(f.date_facture, 'YYYY-MM') as mois,
-                        COALESCE(f.montant_total, 0) AS ca,
-                        f.facture_id AS id,
-                        f.client_id,
-                        0 AS articles
-                    FROM factures f
-                    WHERE f.statut IN ('termine', 'partiel')
-            """
-            
-            if facture_conditions:
-                sparklines_query += " AND " + " AND ".join(facture_conditions)
-            
-            sparklines_query += """
+                        TO_CHAR(mois, 'YYYY-MM') AS mois,
+                        COUNT(DISTINCT client_id) AS clients
+                    FROM sales_monthly_clients
+                    WHERE {where_clients}
+                    GROUP BY TO_CHAR(mois, 'YYYY-MM')
                 )
                 SELECT 
-                    mois,
-                    SUM(ca) AS chiffre_affaires,
-                    COUNT(DISTINCT id) AS ventes,
-                    COUNT(DISTINCT client_id) AS clients,
-                    SUM(articles) AS articles
-                FROM all_data
-                GROUP BY mois
-                ORDER BY mois DESC
+                    f.mois,
+                    f.chiffre_affaires,
+                    f.ventes,
+                    COALESCE(c.clients, 0) AS clients,
+                    f.articles
+                FROM faits f
+                LEFT JOIN clients c ON c.mois = f.mois
+                ORDER BY f.mois DESC
                 LIMIT 12
             """
             
             # Combiner tous les paramètres
-            all_params = proforma_params + facture_params
+            all_params = params_faits + params_clients
             
             try:
                 cur.execute(sparklines_query, all_params)
@@ -3479,8 +3547,9 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
             proforma_params = []
             
             if annee:
-                proforma_conditions.append("EXTRACT(YEAR FROM p.date_creation) = %s")
-                proforma_params.append(annee)
+                year_conditions, year_params = date_range_conditions("p.date_creation", annee=annee)
+                proforma_conditions.extend(year_conditions)
+                proforma_params.extend(year_params)
             
             if ville:
                 proforma_conditions.append("p.ville = %s")
@@ -3503,10 +3572,7 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                     c.telephone as client_telephone,
                     p.ville,
                     u.nom_utilisateur as agent_nom,
-                    (SELECT SUM(pa.quantite * a.prix) + COALESCE(p.frais,0) - COALESCE(p.remise,0)
-                              FROM proforma_articles pa
-                              JOIN articles a ON a.article_id = pa.article_id
-                              WHERE pa.proforma_id = p.proforma_id) AS montant,
+                    (SELECT pt.total_articles + COALESCE(p.frais,0) - COALESCE(p.remise,0) FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id) AS montant,
                     p.etat,
                     p.proforma_id,
                     'proforma' as type_doc
@@ -3524,8 +3590,9 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
             facture_params = []
             
             if annee:
-                facture_conditions.append("EXTRACT(YEAR FROM f.date_facture) = %s")
-                facture_params.append(annee)
+                year_conditions, year_params = date_range_conditions("f.date_facture", annee=annee)
+                facture_conditions.extend(year_conditions)
+                facture_params.extend(year_params)
             
             if ville:
                 # Pour les factures, filtrer par ville OU inclure celles sans ville (anciennes factures)
@@ -3640,8 +3707,9 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
             facture_params = []
             
             if annee:
-                facture_conditions.append("EXTRACT(YEAR FROM f.date_facture) = %s")
-                facture_params.append(annee)
+                year_conditions, year_params = date_range_conditions("f.date_facture", annee=annee)
+                facture_conditions.extend(year_conditions)
+                facture_params.extend(year_params)
             
             if ville:
                 # Pour les factures, filtrer par ville ou inclure celles sans ville si "Toutes"
@@ -3777,11 +3845,13 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                 nombre_ventes=kpis['ventes'],
                 nombre_clients=kpis['nouveaux_clients'],
                 clients_uniques=kpis['nouveaux_clients'],
-                agent_selectionne=agent_nom  # Passer le nom de l'agent pour affichage conditionnel
+                agent_selectionne=agent_nom,  # Passer le nom de l'agent pour affichage conditionnel
+                pdf_stylesheets=REPORTING_PDF_STYLESHEETS
             )
             
-            # Générer le PDF
-            pdf_content = HTML(string=html_content).write_pdf()
+            # Générer le PDF (moteur préchauffé du pool de rendu)
+            pdf_content = pdf_renderer.get_service().render(html_content, base_url=request.url_root,
+                                                            stylesheets=REPORTING_PDF_STYLESHEETS)
             
             # Créer la réponse
             response = make_response(pdf_content)
@@ -3855,14 +3925,11 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                     SELECT 
                         TO_CHAR(p.date_creation, 'YYYY-MM') as mois,
                         COALESCE(
-                            (SELECT SUM(pa.quantite * a.prix) 
-                            FROM proforma_articles pa 
-                            JOIN articles a ON a.article_id = pa.article_id 
-                            WHERE pa.proforma_id = p.proforma_id), 0
+                            (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                         ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0) AS ca,
                         p.proforma_id AS id,
                         p.client_id,
-                        (SELECT SUM(pa.quantite) FROM proforma_articles pa WHERE pa.proforma_id = p.proforma_id) AS articles
+                        (SELECT pt.quantite_totale FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id) AS articles
                     FROM proformas p
                     WHERE p.etat IN ('termine', 'partiel')
                     {where_clause.replace('COALESCE(p.date_creation, f.date_facture)', 'p.date_creation').replace('COALESCE(p.ville, f.ville)', 'p.ville').replace('(p.cree_par = %s OR f.agent = (SELECT nom_utilisateur FROM utilisateurs WHERE user_id = %s))', 'p.cree_par = %s')}
@@ -4024,10 +4091,7 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                         CASE 
                             WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN
                                 COALESCE(
-                                    (SELECT SUM(pa.quantite * a.prix) 
-                                    FROM proforma_articles pa 
-                                    JOIN articles a ON a.article_id = pa.article_id 
-                                    WHERE pa.proforma_id = p.proforma_id), 0
+                                    (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                                 ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                             ELSE 0
                         END
@@ -4125,14 +4189,16 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
             conn = get_db_connection()
             cur = conn.cursor()
             
-            # Requête pour les ventes par ville (factures seulement)
+            refresh_sales_rollup(cur)
+            
+            # Requête pour les ventes par ville (factures seulement, depuis les agrégats)
             query = """
                 SELECT 
-                    ville,
-                    COUNT(*) as nb_commandes,
-                    SUM(montant_total) as ca_total
-                FROM factures 
-                WHERE statut != 'annule'
+                    NULLIF(ville, '') AS ville,
+                    SUM(nb_ventes) as nb_commandes,
+                    SUM(chiffre_affaires) as ca_total
+                FROM sales_daily_facts
+                WHERE source = 'facture' AND type_article = '*'
                 GROUP BY ville
                 ORDER BY nb_commandes DESC
                 LIMIT 10
@@ -4261,24 +4327,23 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
             conn = get_db_connection()
             cur = conn.cursor()
             
-            # Recherche d'articles par nom (insensible à la casse et tolérante aux erreurs)
-            # D'abord essayer une recherche exacte
-            query = """
+            # Recherche classée en une requête (index trigrammes + plein texte, sans accents) :
+            # les articles ne contenant qu'une partie des mots arrivent après les correspondances complètes
+            condition, condition_params, rank_sql, rank_params = article_search_sql(search_term, match_any=True)
+            query = f"""
                 SELECT 
-                    article_id,
-                    designation,
-                    prix,
-                    type_article,
-                    code
-                FROM articles 
-                WHERE LOWER(designation) LIKE LOWER(%s)
-                ORDER BY designation ASC
+                    a.article_id,
+                    a.designation,
+                    a.prix,
+                    a.type_article,
+                    a.code,
+                    {rank_sql} AS score
+                FROM articles a
+                WHERE {condition}
+                ORDER BY score DESC, a.designation ASC
                 LIMIT 10
             """
-            
-            # Recherche insensible à la casse
-            search_pattern = f'%{search_term.lower()}%'
-            cur.execute(query, (search_pattern,))
+            cur.execute(query, rank_params + condition_params)
             results = cur.fetchall()
             
             articles = []
@@ -4291,46 +4356,6 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                     'code': row[4]
                 })
             
-            # Si pas de résultats, essayer une recherche plus large
-            if not articles:
-                # Recherche par mots-clés individuels
-                words = search_term.split()
-                if len(words) >= 2:
-                    # Essayer avec les 2 premiers mots
-                    short_term = ' '.join(words[:2])
-                    short_pattern = f'%{short_term.lower()}%'
-                    cur.execute(query, (short_pattern,))
-                    results = cur.fetchall()
-                    
-                    for row in results:
-                        articles.append({
-                            'id': row[0],
-                            'nom': row[1],
-                            'prix': float(row[2]),
-                            'type': row[3],
-                            'code': row[4]
-                        })
-                
-                # Si toujours pas de résultats, essayer une recherche par mots individuels
-                if not articles:
-                    for word in words:
-                        if len(word) > 3:  # Ignorer les mots trop courts
-                            word_pattern = f'%{word.lower()}%'
-                            cur.execute(query, (word_pattern,))
-                            results = cur.fetchall()
-                            
-                            for row in results:
-                                articles.append({
-                                    'id': row[0],
-                                    'nom': row[1],
-                                    'prix': float(row[2]),
-                                    'type': row[3],
-                                    'code': row[4]
-                                })
-                            
-                            if articles:  # Arrêter dès qu'on trouve quelque chose
-                                break
-            
             return jsonify({
                 "success": True,
                 "articles": articles,
@@ -4596,52 +4621,18 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
             conn = get_db_connection()
             cur = conn.cursor()
             
-            # Requête pour les meilleurs clients (proformas + factures terminées)
+            # Meilleurs clients (proformas + factures terminées) lus dans client_stats
             query = """
-                WITH all_clients AS (
-                    -- Proformas terminées/partielles
-                    SELECT 
-                        c.client_id,
-                        c.nom,
-                        COUNT(p.proforma_id) as nb_commandes,
-                        SUM(
-                            COALESCE(
-                                (SELECT SUM(pa.quantite * a.prix) 
-                                FROM proforma_articles pa 
-                                JOIN articles a ON a.article_id = pa.article_id 
-                                WHERE pa.proforma_id = p.proforma_id), 0
-                            ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
-                        ) as ca_total
-                    FROM proformas p
-                    JOIN clients c ON c.client_id = p.client_id
-                    WHERE p.etat IN ('termine', 'partiel')
-                    AND LOWER(c.nom) NOT LIKE '%boutique%'
-                    AND LOWER(c.nom) NOT LIKE '%vente%'
-                    GROUP BY c.client_id, c.nom
-                    
-                    UNION ALL
-                    
-                    -- Factures terminées/partielles
-                    SELECT 
-                        c.client_id,
-                        c.nom,
-                        COUNT(f.facture_id) as nb_commandes,
-                        SUM(COALESCE(f.montant_total, 0)) as ca_total
-                    FROM factures f
-                    JOIN clients c ON c.client_id = f.client_id
-                    WHERE f.statut IN ('termine', 'partiel')
-                    AND LOWER(c.nom) NOT LIKE '%boutique%'
-                    AND LOWER(c.nom) NOT LIKE '%vente%'
-                    GROUP BY c.client_id, c.nom
-                )
                 SELECT 
-                    nom,
-                    SUM(nb_commandes) as total_commandes,
-                    SUM(ca_total) as total_ca
-                FROM all_clients
-                GROUP BY client_id, nom
-                HAVING SUM(ca_total) > 0
-                ORDER BY total_ca DESC, total_commandes DESC
+                    c.nom,
+                    cs.nb_commandes as total_commandes,
+                    cs.montant_total_paye as total_ca
+                FROM client_stats cs
+                JOIN clients c ON c.client_id = cs.client_id
+                WHERE cs.montant_total_paye > 0
+                AND LOWER(c.nom) NOT LIKE '%boutique%'
+                AND LOWER(c.nom) NOT LIKE '%vente%'
+                ORDER BY cs.montant_total_paye DESC, cs.nb_commandes DESC
                 LIMIT 5
             """
             
@@ -4744,10 +4735,7 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                         CASE 
                             WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN
                                 COALESCE(
-                                    (SELECT SUM(pa.quantite * a.prix) 
-                                    FROM proforma_articles pa 
-                                    JOIN articles a ON a.article_id = pa.article_id 
-                                    WHERE pa.proforma_id = p.proforma_id), 0
+                                    (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                                 ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                             ELSE 0
                         END
@@ -4781,10 +4769,7 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                         CASE 
                             WHEN p.etat IN ('termine', 'terminé', 'partiel') THEN
                                 COALESCE(
-                                    (SELECT SUM(pa.quantite * a.prix) 
-                                    FROM proforma_articles pa 
-                                    JOIN articles a ON a.article_id = pa.article_id 
-                                    WHERE pa.proforma_id = p.proforma_id), 0
+                                    (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                                 ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0)
                             ELSE 0
                         END
@@ -4862,200 +4847,88 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                 "message": f"Erreur: {str(e)}"
             }), 500
 
+    # === AGRÉGATS DE VENTES (app/db/sales_rollup.sql) ===
+    _sales_rollup_refresh = {'at': 0.0}
+
+    def refresh_sales_rollup(cur):
+        """
+        Intégrer les jours modifiés avant une lecture reporting, au plus une fois par
+        SALES_ROLLUP_REFRESH_INTERVAL secondes et par worker, et en temps borné
+        (SALES_ROLLUP_REFRESH_TIMEOUT) : au-delà, la tâche planifiée s'en charge.
+        """
+        now = time.monotonic()
+        if now - _sales_rollup_refresh['at'] < current_app.config.get('SALES_ROLLUP_REFRESH_INTERVAL', 60):
+            return
+        _sales_rollup_refresh['at'] = now
+        timeout_ms = int(current_app.config.get('SALES_ROLLUP_REFRESH_TIMEOUT', 2) * 1000)
+        try:
+            cur.execute("SELECT set_config('statement_timeout', %s, true)", [f"{timeout_ms}ms"])
+            cur.execute("SELECT refresh_sales_rollup_dirty()")
+            cur.connection.commit()
+        except Exception as e:
+            cur.connection.rollback()
+            print(f"⚠️ Rafraîchissement des agrégats de ventes: {e}")
+
+    def build_sales_rollup_conditions(filters, date_column="jour"):
+        """Filtres reporting → conditions sur sales_daily_facts / sales_monthly_clients"""
+        conditions = ["type_article = %s"]
+        params = [filters.get('type_prestation') or '*']
+
+        # Filtre de période (plage de dates dès qu'une année est fournie)
+        period_conditions, period_params = date_range_conditions(
+            date_column,
+            annee=filters.get('annee'),
+            trimestre=filters.get('trimestre'),
+            mois=filters.get('mois'),
+        )
+        conditions.extend(period_conditions)
+        params.extend(period_params)
+
+        # Filtre par ville
+        if filters.get('ville'):
+            conditions.append("ville = %s")
+            params.append(filters['ville'])
+
+        # Filtre par agent (factures sans agent incluses pour les anciennes factures)
+        if filters.get('agent'):
+            conditions.append("(agent_id = %s::int OR (source = 'facture' AND agent_id = 0))")
+            params.append(filters['agent'])
+
+        return " AND ".join(conditions), params
+
     def calculate_reporting_kpis(cur, filters):
-        """Calculer les KPIs avec filtres - version simplifiée"""
+        """Calculer les KPIs avec filtres à partir des agrégats journaliers"""
         try:
-            # Construire les conditions WHERE et paramètres séparément pour chaque table
-            proforma_conditions = []
-            facture_conditions = []
-            proforma_params = []
-            facture_params = []
-            
-            # Filtre par année
-            if filters.get('annee'):
-                proforma_conditions.append("EXTRACT(YEAR FROM p.date_creation) = %s")
-                facture_conditions.append("EXTRACT(YEAR FROM f.date_facture) = %s")
-                proforma_params.append(filters['annee'])
-                facture_params.append(filters['annee'])
-            
-            # Filtre par trimestre
-            if filters.get('trimestre'):
-                quarter_map = {'Q1': [1,2,3], 'Q2': [4,5,6], 'Q3': [7,8,9], 'Q4': [10,11,12]}
-                months = quarter_map.get(filters['trimestre'], [])
-                if months:
-                    placeholders = ','.join(['%s'] * len(months))
-                    proforma_conditions.append(f"EXTRACT(MONTH FROM p.date_creation) IN ({placeholders})")
-                    facture_conditions.append(f"EXTRACT(MONTH FROM f.date_facture) IN ({placeholders})")
-                    proforma_params.extend(months)
-                    facture_params.extend(months)
-            
-            # Filtre par mois
-            if filters.get('mois'):
-                proforma_conditions.append("EXTRACT(MONTH FROM p.date_creation) = %s")
-                facture_conditions.append("EXTRACT(MONTH FROM f.date_facture) = %s")
-                proforma_params.append(filters['mois'])
-                facture_params.append(filters['mois'])
-            
-            # Filtre par ville
-            if filters.get('ville'):
-                proforma_conditions.append("p.ville = %s")
-                # Pour les factures, filtrer strictement par ville
-                facture_conditions.append("f.ville = %s")
-                proforma_params.append(filters['ville'])
-                facture_params.append(filters['ville'])
-            
-            # Filtre par type de prestation (articles)
-            if filters.get('type_prestation'):
-                proforma_conditions.append("EXISTS (SELECT 1 FROM proforma_articles pa JOIN articles a ON a.article_id = pa.article_id WHERE pa.proforma_id = p.proforma_id AND a.type_article = %s)")
-                facture_conditions.append("EXISTS (SELECT 1 FROM facture_articles fa JOIN articles a ON a.article_id = fa.article_id WHERE fa.facture_id = f.facture_id AND a.type_article = %s)")
-                proforma_params.append(filters['type_prestation'])
-                facture_params.append(filters['type_prestation'])
-            
-            # Filtre par agent
-            if filters.get('agent'):
-                proforma_conditions.append("p.cree_par = %s")
-                # Pour les factures, inclure celles sans agent pour les anciennes factures
-                facture_conditions.append("(f.cree_par = %s OR f.cree_par IS NULL)")
-                proforma_params.append(filters['agent'])
-                facture_params.append(filters['agent'])
-            
-            # 1) Chiffre d'Affaires (Proformas + Factures)
-            ca_query = """
-                WITH all_ca AS (
-                    SELECT COALESCE(
-                        (SELECT SUM(pa.quantite * a.prix) 
-                        FROM proforma_articles pa 
-                        JOIN articles a ON a.article_id = pa.article_id 
-                        WHERE pa.proforma_id = p.proforma_id), 0
-                    ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0) AS ca
-                    FROM proformas p
-                    WHERE p.etat IN ('termine', 'terminé', 'partiel')
-            """
-                    
-            if proforma_conditions:
-                ca_query += " AND " + " AND ".join(proforma_conditions)
-            ca_query += """
-                    UNION ALL
-                    SELECT COALESCE(f.montant_total, 0) AS ca
-                    FROM factures f
-                    WHERE f.statut IN ('termine', 'partiel')
-            """
-            
-            if facture_conditions:
-                ca_query += " AND " + " AND ".join(facture_conditions)
-            
-            ca_query += """
-                )
-                SELECT COALESCE(SUM(ca), 0) AS chiffre_affaires
-                FROM all_ca
-            """
-            
-            # Combiner tous les paramètres
-            all_params = proforma_params + facture_params
-            
-            print(f"🔍 DEBUG KPIs - Requête CA: {ca_query}")
-            print(f"🔍 DEBUG KPIs - Paramètres: {all_params}")
-            
-            cur.execute(ca_query, all_params)
-            result = cur.fetchone()
-            ca_total = result[0] if result and result[0] is not None else 0
-            print(f"🔍 DEBUG KPIs - CA calculé: {ca_total}")
-            
-            # 2) Nombre de Ventes (Proformas + Factures)
-            ventes_query = """
-                WITH all_ventes AS (
-                    SELECT p.proforma_id AS id
-                    FROM proformas p
-                    WHERE p.etat IN ('termine', 'terminé', 'partiel')
-            """
-                    
-            if proforma_conditions:
-                ventes_query += " AND " + " AND ".join(proforma_conditions)
-            ventes_query += """
-                    UNION ALL
-                    SELECT f.facture_id AS id
-                    FROM factures f
-                    WHERE f.statut IN ('termine', 'partiel')
-            """
-            
-            if facture_conditions:
-                ventes_query += " AND " + " AND ".join(facture_conditions)
-            
-            ventes_query += """
-                )
-                SELECT COUNT(DISTINCT id) AS ventes
-                FROM all_ventes
-            """
-            
-            cur.execute(ventes_query, all_params)
-            result = cur.fetchone()
-            total_ventes = result[0] if result and result[0] is not None else 0
-            
-            # 3) Articles Vendus (Proformas seulement)
-            articles_query = """
-                SELECT COALESCE(SUM(pa.quantite), 0) AS articles
-                FROM proforma_articles pa
-                JOIN proformas p ON p.proforma_id = pa.proforma_id
-                WHERE p.etat IN ('termine', 'terminé', 'partiel')
-            """
-            
-            if proforma_conditions:
-                articles_query += " AND " + " AND ".join(proforma_conditions)
-            
-            cur.execute(articles_query, proforma_params)
-            result = cur.fetchone()
-            articles_vendus = result[0] if result and result[0] is not None else 0
-            
-            # 4) Nouveaux Clients - Compter les clients uniques qui ont des commandes dans la période
-            clients_query = """
-                WITH clients_actifs AS (
-                    SELECT DISTINCT c.client_id
-                    FROM clients c
-                    WHERE EXISTS (
-                        SELECT 1 FROM proformas p 
-                        WHERE p.client_id = c.client_id 
-                        AND p.etat IN ('termine', 'terminé', 'partiel')
-                    )
-                    OR EXISTS (
-                        SELECT 1 FROM factures f 
-                        WHERE f.client_id = c.client_id 
-                        AND f.statut IN ('termine', 'terminé', 'partiel')
-                    )
-                )
-                SELECT COUNT(*) AS nouveaux_clients FROM clients_actifs
-            """
-            
-            clients_params = []
-            if filters.get('annee'):
-                clients_query = """
-                    WITH clients_actifs AS (
-                        SELECT DISTINCT c.client_id
-                        FROM clients c
-                        WHERE EXISTS (
-                            SELECT 1 FROM proformas p 
-                            WHERE p.client_id = c.client_id 
-                            AND p.etat IN ('termine', 'terminé', 'partiel')
-                            AND EXTRACT(YEAR FROM p.date_creation) = %s
-                        )
-                        OR EXISTS (
-                            SELECT 1 FROM factures f 
-                            WHERE f.client_id = c.client_id 
-                            AND f.statut IN ('termine', 'terminé', 'partiel')
-                            AND EXTRACT(YEAR FROM f.date_facture) = %s
-                        )
-                    )
-                    SELECT COUNT(*) AS nouveaux_clients FROM clients_actifs
-                """
-                clients_params = [filters['annee'], filters['annee']]
-            
-            cur.execute(clients_query, clients_params)
+            refresh_sales_rollup(cur)
+
+            # 1) CA, 2) ventes, 3) articles vendus (proformas seulement)
+            where_faits, params_faits = build_sales_rollup_conditions(filters)
+            cur.execute(f"""
+                SELECT 
+                    COALESCE(SUM(chiffre_affaires), 0),
+                    COALESCE(SUM(nb_ventes), 0),
+                    COALESCE(SUM(articles) FILTER (WHERE source = 'proforma'), 0)
+                FROM sales_daily_facts
+                WHERE {where_faits}
+            """, params_faits)
+            ca_total, total_ventes, articles_vendus = cur.fetchone()
+            
+            # 4) Nouveaux Clients - clients uniques ayant des commandes (seule l'année filtre)
+            where_clients, params_clients = build_sales_rollup_conditions(
+                {'annee': filters.get('annee')}, date_column="mois"
+            )
+            cur.execute(f"""
+                SELECT COUNT(DISTINCT client_id)
+                FROM sales_monthly_clients
+                WHERE {where_clients}
+            """, params_clients)
             result = cur.fetchone()
             nouveaux_clients = result[0] if result and result[0] is not None else 0
             
             return {
-                "ca": int(ca_total),
-                "ventes": int(total_ventes),
-                "articles": int(articles_vendus),
+                "ca": int(ca_total or 0),
+                "ventes": int(total_ventes or 0),
+                "articles": int(articles_vendus or 0),
                 "nouveaux_clients": int(nouveaux_clients)
             }
             
@@ -5150,45 +5023,29 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
             conn = get_db_connection()
             cur = conn.cursor()
             
-            # Requête pour les données mensuelles (12 derniers mois)
+            refresh_sales_rollup(cur)
+            
+            # Requête pour les données mensuelles (12 derniers mois) lue dans les agrégats
             monthly_query = """
-                WITH all_data AS (
-                    SELECT 
-                        TO_CHAR(p.date_creation, 'YYYY-MM') as mois,
-                            COALESCE(
-                                (SELECT SUM(pa.quantite * a.prix) 
-                                FROM proforma_articles pa 
-                                JOIN articles a ON a.article_id = pa.article_id 
-                                WHERE pa.proforma_id = p.proforma_id), 0
-                        ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0) AS ca,
-                        p.proforma_id AS id,
-                        p.client_id,
-                        (SELECT SUM(pa.quantite) FROM proforma_articles pa WHERE pa.proforma_id = p.proforma_id) AS articles
-                FROM proformas p
-                    WHERE p.etat IN ('termine', 'partiel')
-                    AND p.date_creation >= CURRENT_DATE - INTERVAL '12 months'
-                    
-                    UNION ALL
-                    
+                WITH monthly_stats AS (
                     SELECT 
-                        TO_CHAR(f.date_facture, 'YYYY-MM') as mois,
-                        COALESCE(f.montant_total, 0) AS ca,
-                        f.facture_id AS id,
-                        f.client_id,
-                        0 AS articles
-                FROM factures f
-                    WHERE f.statut IN ('termine', 'partiel')
-                    AND f.date_facture >= CURRENT_DATE - INTERVAL '12 months'
+                        TO_CHAR(jour, 'YYYY-MM') AS mois,
+                        SUM(chiffre_affaires) AS chiffre_affaires,
+                        SUM(nb_ventes) AS ventes,
+                        SUM(articles) AS articles
+                    FROM sales_daily_facts
+                    WHERE type_article = '*'
+                    AND jour >= CURRENT_DATE - INTERVAL '12 months'
+                    GROUP BY TO_CHAR(jour, 'YYYY-MM')
                 ),
-                monthly_stats AS (
+                monthly_clients AS (
                     SELECT 
-                        mois,
-                        SUM(ca) AS chiffre_affaires,
-                        COUNT(DISTINCT id) AS ventes,
-                        COUNT(DISTINCT client_id) AS clients,
-                        SUM(articles) AS articles
-                    FROM all_data
-                    GROUP BY mois
+                        TO_CHAR(mois, 'YYYY-MM') AS mois,
+                        COUNT(DISTINCT client_id) AS clients
+                    FROM sales_monthly_clients
+                    WHERE type_article = '*'
+                    AND mois >= date_trunc('month', CURRENT_DATE - INTERVAL '12 months')
+                    GROUP BY TO_CHAR(mois, 'YYYY-MM')
                 ),
                 nouveaux_clients AS (
                     SELECT 
@@ -5202,10 +5059,11 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                     ms.mois,
                     COALESCE(ms.chiffre_affaires, 0) AS chiffre_affaires,
                     COALESCE(ms.ventes, 0) AS ventes,
-                    COALESCE(ms.clients, 0) AS clients,
+                    COALESCE(mc.clients, 0) AS clients,
                     COALESCE(ms.articles, 0) AS articles,
                     COALESCE(nc.nouveaux_clients, 0) AS nouveaux_clients
                 FROM monthly_stats ms
+                LEFT JOIN monthly_clients mc ON ms.mois = mc.mois
                 LEFT JOIN nouveaux_clients nc ON ms.mois = nc.mois
                 ORDER BY ms.mois DESC
             """
@@ -5266,10 +5124,7 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                     c.telephone as client_telephone,
                     p.ville,
                     u.nom_utilisateur as agent_nom,
-                    (SELECT SUM(pa.quantite * a.prix) + COALESCE(p.frais,0) - COALESCE(p.remise,0)
-                              FROM proforma_articles pa
-                              JOIN articles a ON a.article_id = pa.article_id
-                    WHERE pa.proforma_id = p.proforma_id) AS montant,
+                    (SELECT pt.total_articles + COALESCE(p.frais,0) - COALESCE(p.remise,0) FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id) AS montant,
                     p.etat as statut,
                     'proforma' as type_document,
                     p.proforma_id as document_id
@@ -5462,14 +5317,19 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
             params = []
             
             if annee:
-                where_conditions.append("EXTRACT(YEAR FROM COALESCE(p.date_creation, f.date_facture)) = %s")
-                params.append(annee)
+                # Plage de dates : réécrite plus bas en p.date_creation / f.date_facture
+                year_conditions, year_params = date_range_conditions(
+                    "COALESCE(p.date_creation, f.date_facture)", annee=annee
+                )
+                where_conditions.extend(year_conditions)
+                params.extend(year_params)
             
             if ville:
                 where_conditions.append("COALESCE(p.ville, f.ville) = %s")
                 params.append(ville)
             
-            where_clause = "WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+            # Conditions ajoutées aux WHERE des deux branches de l'UNION
+            where_clause = "AND " + " AND ".join(where_conditions) if where_conditions else ""
             
             # Calculer le total des ventes pour la pagination
             count_query = f"""
@@ -5509,10 +5369,7 @@ Réponds uniquement par le titre, sans guillemets ni explications."""
                         c.ville as client_ville,
                         c.pays as client_pays,
                         COALESCE(
-                            (SELECT SUM(pa.quantite * a.prix) 
-                              FROM proforma_articles pa
-                              JOIN articles a ON a.article_id = pa.article_id
-                            WHERE pa.proforma_id = p.proforma_id), 0
+                            (SELECT pt.total_articles FROM proforma_totals pt WHERE pt.proforma_id = p.proforma_id), 0
                         ) + COALESCE(p.frais, 0) - COALESCE(p.remise, 0) AS total_ttc,
                         p.etat as statut,
                         u.nom_utilisateur as created_by,
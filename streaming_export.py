@@ -0,0 +1,134 @@
+# Exports CSV / XLSX en flux : curseur serveur + réponse produite au fil des lignes
+
+import io
+import os
+import csv
+import uuid
+import tempfile
+from datetime import datetime
+
+from flask import Response
+
+# Lignes lues par aller-retour sur le curseur serveur
+FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", 2000))
+# Lignes CSV regroupées par morceau envoyé au client
+CSV_CHUNK_ROWS = 500
+# Classeur XLSX gardé en mémoire jusqu'à cette taille, puis sur disque
+XLSX_SPOOL_SIZE = 8 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+MIMETYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def export_format(value):
+    """Format demandé (?format=) ramené à 'csv' ou 'xlsx'."""
+    value = (value or "csv").lower()
+    return "xlsx" if value in ("xlsx", "excel") else "csv"
+
+
+def open_server_cursor(conn, query, params=None, itersize=FETCH_SIZE):
+    """
+    Curseur nommé (DECLARE ... CURSOR côté Postgres) : les lignes arrivent par
+    paquets de `itersize` au lieu d'être toutes chargées par fetchall().
+    """
+    cur = conn.cursor(name=f"export_{uuid.uuid4().hex[:12]}")
+    cur.itersize = itersize
+    cur.execute(query, params or [])
+    return cur
+
+
+def _csv_chunks(cur, headers, format_row):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    pending = 0
+    for row in cur:
+        writer.writerow(format_row(row))
+        pending += 1
+        if pending >= CSV_CHUNK_ROWS:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _xlsx_chunks(cur, headers, format_row, sheet_title):
+    from openpyxl import Workbook
+
+    # write_only : chaque ligne est sérialisée dans un fichier temporaire dès son ajout
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title[:31])
+    sheet.append(headers)
+    for row in cur:
+        sheet.append(format_row(row))
+
+    # L'archive XLSX n'est complète qu'à la fin : envoi par morceaux depuis le fichier produit
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE) as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def stream_export(conn, query, params, headers, format_row, filename, fmt="csv", sheet_title="Export"):
+    """
+    Réponse Flask d'export lue sur un curseur serveur.
+
+    `conn` est empruntée par l'appelant et rendue au pool à la fin du flux (ou si
+    le client abandonne le téléchargement). Les erreurs SQL sont levées ici, avant
+    l'envoi des en-têtes, pour que la route puisse encore répondre en JSON.
+    `format_row` convertit une ligne de la requête en liste de cellules ;
+    `filename` est donné sans extension.
+    """
+    fmt = export_format(fmt)
+    try:
+        cur = open_server_cursor(conn, query, params)
+    except Exception:
+        conn.rollback()
+        conn.close()
+        raise
+
+    released = []
+
+    def release():
+        if released:
+            return
+        released.append(True)
+        try:
+            cur.close()
+        except Exception:
+            pass
+        conn.close()
+
+    def generate():
+        try:
+            if fmt == "xlsx":
+                yield from _xlsx_chunks(cur, headers, format_row, sheet_title)
+            else:
+                yield from _csv_chunks(cur, headers, format_row)
+        except Exception as e:
+            print(f"❌ Export {filename} interrompu: {e}")
+            raise
+        finally:
+            release()
+
+    response = Response(generate(), content_type=MIMETYPES[fmt])
+    # Générateur jamais démarré (client parti avant le premier morceau) : connexion rendue quand même
+    response.call_on_close(release)
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}.{fmt}"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def export_filename(prefix, with_time=False):
+    """Nom de fichier daté, sans extension (ex: proformas_export_20250101)."""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S" if with_time else "%Y%m%d")
+    return f"{prefix}_{stamp}"